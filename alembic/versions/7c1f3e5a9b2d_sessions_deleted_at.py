@@ -0,0 +1,36 @@
+"""sessions.deleted_at: cleared history waits here for the background purger
+
+DELETE /api/sessions/history marks the sessions instead of deleting them inside the
+request; api/services/session_purger.py deletes the marked ones in batches. The partial
+index holds only those few rows. Nothing to backfill.
+
+Revision ID: 7c1f3e5a9b2d
+Revises: 9d4e6f1a2b7c
+Create Date: 2026-10-19
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "7c1f3e5a9b2d"
+down_revision: Union[str, Sequence[str], None] = "9d4e6f1a2b7c"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("sessions", sa.Column("deleted_at", sa.DateTime(timezone=True), nullable=True))
+    op.create_index(
+        "ix_sessions_deleted_at",
+        "sessions",
+        ["deleted_at"],
+        postgresql_where=sa.text("deleted_at IS NOT NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_sessions_deleted_at", "sessions")
+    op.drop_column("sessions", "deleted_at")
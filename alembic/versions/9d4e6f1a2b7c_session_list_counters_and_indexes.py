@@ -0,0 +1,64 @@
+"""sessions.member_count/item_count and the indexes of the paginated session list
+
+GET /api/sessions/my counted members and items with two correlated subqueries per
+session and returned every session the user ever joined. It now pages by
+(created_at, id) and reads the counts off the session row:
+
+* sessions.member_count and sessions.item_count, backfilled here and maintained by
+  SessionService from then on;
+* ix_sessions_created_at_id, the page order;
+* ix_session_members_user_tg_id_session_id, which replaces ix_session_members_user_tg_id:
+  the join from a user to their sessions is answered from the index alone.
+
+Revision ID: 9d4e6f1a2b7c
+Revises: b3f6d0a81c5e
+Create Date: 2026-10-19
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "9d4e6f1a2b7c"
+down_revision: Union[str, Sequence[str], None] = "b3f6d0a81c5e"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "sessions",
+        sa.Column("member_count", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "sessions",
+        sa.Column("item_count", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.execute(
+        """
+        UPDATE sessions SET
+            member_count = (
+                SELECT count(*) FROM session_members m WHERE m.session_id = sessions.id
+            ),
+            item_count = (
+                SELECT count(*) FROM session_items i WHERE i.session_id = sessions.id
+            )
+        """
+    )
+    op.create_index("ix_sessions_created_at_id", "sessions", ["created_at", "id"])
+    op.create_index(
+        "ix_session_members_user_tg_id_session_id",
+        "session_members",
+        ["user_tg_id", "session_id"],
+    )
+    op.drop_index("ix_session_members_user_tg_id", "session_members")
+
+
+def downgrade() -> None:
+    op.create_index("ix_session_members_user_tg_id", "session_members", ["user_tg_id"])
+    op.drop_index("ix_session_members_user_tg_id_session_id", "session_members")
+    op.drop_index("ix_sessions_created_at_id", "sessions")
+    op.drop_column("sessions", "item_count")
+    op.drop_column("sessions", "member_count")
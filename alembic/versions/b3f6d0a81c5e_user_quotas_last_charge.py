@@ -0,0 +1,29 @@
+"""user_quotas.last_charge
+
+QuotaService.use_scan charges in a single INSERT ... ON CONFLICT DO UPDATE and needs
+its RETURNING to say which bucket paid. Nothing to backfill: it is written by the next
+charge.
+
+Revision ID: b3f6d0a81c5e
+Revises: e5b7c2a9d418
+Create Date: 2026-10-19
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "b3f6d0a81c5e"
+down_revision: Union[str, Sequence[str], None] = "e5b7c2a9d418"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("user_quotas", sa.Column("last_charge", sa.String(length=8), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("user_quotas", "last_charge")
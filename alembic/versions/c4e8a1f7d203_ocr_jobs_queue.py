@@ -0,0 +1,67 @@
+"""queue OCR as ocr_jobs rows
+
+POST /ocr held the request open for the whole LLM call (up to 240 s, just under nginx's
+300 s proxy_read_timeout), pinning a worker slot and a pooled connection for every scan in
+flight. The request now charges the scan and inserts a row here; background workers claim
+rows with FOR UPDATE SKIP LOCKED (core/services/ocr_jobs.py).
+
+Two indexes matter:
+
+* (status, created_at) — the claim query, FIFO over queued and lease-expired jobs;
+* a partial unique index on session_id over the live statuses, so a double-tapped "scan"
+  cannot charge twice: the second insert fails and takes its charge down with it.
+
+Revision ID: c4e8a1f7d203
+Revises: a7c3e91b40d2
+Create Date: 2026-10-19
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "c4e8a1f7d203"
+down_revision: Union[str, Sequence[str], None] = "a7c3e91b40d2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ocr_jobs",
+        sa.Column("id", sa.Uuid(), nullable=False),
+        sa.Column("session_id", sa.Uuid(), nullable=False),
+        sa.Column("user_tg_id", sa.BigInteger(), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False),
+        sa.Column("charged", sa.String(length=8), nullable=True),
+        sa.Column("attempts", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("claim_token", sa.Uuid(), nullable=True),
+        sa.Column("locked_until", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("progress_current", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("progress_total", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("result", sa.JSON(), nullable=True),
+        sa.Column("error_status", sa.Integer(), nullable=True),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["session_id"], ["sessions.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_ocr_jobs_session_id", "ocr_jobs", ["session_id"])
+    op.create_index("ix_ocr_jobs_status_created_at", "ocr_jobs", ["status", "created_at"])
+    op.create_index(
+        "uq_ocr_jobs_active_session",
+        "ocr_jobs",
+        ["session_id"],
+        unique=True,
+        postgresql_where=sa.text("status IN ('queued', 'running')"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("uq_ocr_jobs_active_session", "ocr_jobs")
+    op.drop_index("ix_ocr_jobs_status_created_at", "ocr_jobs")
+    op.drop_index("ix_ocr_jobs_session_id", "ocr_jobs")
+    op.drop_table("ocr_jobs")
@@ -0,0 +1,97 @@
+"""move receipt photo bytes into content-addressed photo_blobs
+
+session_photos.data (migration a7c3e91b40d2) put up to 25 MB of JPEG per session through
+WAL, TOAST and every base backup. Photos are now blobs named by the SHA-256 of their
+bytes (core/services/photo_store.py): session_photos keeps only ``blob_sha256``, and the
+bytes are files on disk (PHOTO_STORE=fs) or photo_blobs.data (PHOTO_STORE=db).
+
+Bytes already in session_photos.data are moved onto photo_blobs rows, deduplicated by
+hash, so photos waiting for OCR across the upgrade stay readable with either backend —
+the store reads a row's own bytes before looking for a file. They go away the usual way,
+after OCR or with their session.
+
+The foreign key has no ON DELETE action: reclaiming a blob that something still
+references must fail, not leave a photo pointing at nothing.
+
+Revision ID: d91f0b6c2e47
+Revises: c4e8a1f7d203
+Create Date: 2026-10-19
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "d91f0b6c2e47"
+down_revision: Union[str, Sequence[str], None] = "c4e8a1f7d203"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "photo_blobs",
+        sa.Column("sha256", sa.String(length=64), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("last_used_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("sha256"),
+    )
+    op.create_index("ix_photo_blobs_last_used_at", "photo_blobs", ["last_used_at"])
+
+    op.add_column("session_photos", sa.Column("blob_sha256", sa.String(length=64), nullable=True))
+    op.create_index("ix_session_photos_blob_sha256", "session_photos", ["blob_sha256"])
+
+    conn = op.get_bind()
+    conn.execute(
+        sa.text(
+            """
+            INSERT INTO photo_blobs (sha256, size, data, created_at, last_used_at)
+            SELECT DISTINCT ON (h) h, octet_length(data), data, now(), now()
+            FROM (
+                SELECT encode(sha256(data), 'hex') AS h, data
+                FROM session_photos WHERE data IS NOT NULL
+            ) AS pending
+            """
+        )
+    )
+    conn.execute(
+        sa.text(
+            """
+            UPDATE session_photos SET blob_sha256 = encode(sha256(data), 'hex')
+            WHERE data IS NOT NULL
+            """
+        )
+    )
+
+    op.create_foreign_key(
+        "session_photos_blob_sha256_fkey",
+        "session_photos",
+        "photo_blobs",
+        ["blob_sha256"],
+        ["sha256"],
+    )
+    op.drop_column("session_photos", "data")
+
+
+def downgrade() -> None:
+    op.add_column("session_photos", sa.Column("data", sa.LargeBinary(), nullable=True))
+    # Only bytes held on blob rows can be brought back by SQL. Files of the fs backend
+    # are not: those photos come back without bytes, and their sessions need a re-upload.
+    op.get_bind().execute(
+        sa.text(
+            """
+            UPDATE session_photos AS p SET data = b.data
+            FROM photo_blobs AS b
+            WHERE b.sha256 = p.blob_sha256 AND b.data IS NOT NULL
+            """
+        )
+    )
+    op.drop_constraint("session_photos_blob_sha256_fkey", "session_photos", type_="foreignkey")
+    op.drop_index("ix_session_photos_blob_sha256", "session_photos")
+    op.drop_column("session_photos", "blob_sha256")
+    op.drop_index("ix_photo_blobs_last_used_at", "photo_blobs")
+    op.drop_table("photo_blobs")
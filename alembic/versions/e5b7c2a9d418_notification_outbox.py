@@ -0,0 +1,52 @@
+"""notification outbox
+
+Telegram messages were sent inline from the request that caused them — one Bot API call
+per member before POST /settle answered — and lost on any failure or restart. They are
+rows now, written in the same transaction as the change they announce and sent by
+api/services/notification_sender.py.
+
+Revision ID: e5b7c2a9d418
+Revises: d91f0b6c2e47
+Create Date: 2026-10-19
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "e5b7c2a9d418"
+down_revision: Union[str, Sequence[str], None] = "d91f0b6c2e47"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "notification_outbox",
+        sa.Column("id", sa.Uuid(), nullable=False),
+        sa.Column("chat_id", sa.BigInteger(), nullable=False),
+        sa.Column("text", sa.String(), nullable=False),
+        sa.Column("reply_markup", sa.JSON(), nullable=True),
+        sa.Column("dedup_key", sa.String(length=128), nullable=True),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("attempts", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("available_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("claim_token", sa.Uuid(), nullable=True),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("sent_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("dedup_key"),
+    )
+    op.create_index(
+        "ix_notification_outbox_status_available_at",
+        "notification_outbox",
+        ["status", "available_at"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_notification_outbox_status_available_at", "notification_outbox")
+    op.drop_table("notification_outbox")
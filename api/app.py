@@ -1,4 +1,5 @@
 from contextlib import asynccontextmanager
+from datetime import timedelta
 from pathlib import Path
 
 from fastapi import FastAPI, HTTPException
@@ -6,22 +7,45 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 
+from api.metrics import HttpMetricsMiddleware, collect_db_pool
+from api.routes.auth import router as auth_router
+from api.routes.metrics import router as metrics_router
 from api.routes.ocr import router as ocr_router
 from api.routes.quota import router as quota_router
+from api.routes.sessions import NEXT_CURSOR_HEADER
 from api.routes.sessions import router as sessions_router
 from api.routes.voting import router as voting_router
 from api.routes.ws import router as ws_router
+from api.services.notification_sender import NotificationSender
+from api.services.notifications import NotificationService
+from api.services.ocr_worker import OcrWorkerPool
+from api.services.photo_sweeper import PhotoSweeper
+from api.services.session_purger import SessionPurger
+from api.sql_timing import SqlTimingMiddleware, instrument_engine
 from api.ws import ConnectionManager
 from core.config import get_settings
 from core.db import get_engine
+from core.metrics import metrics
 
 WEBAPP_DIST = Path(__file__).resolve().parent.parent / "webapp" / "dist"
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    get_engine()  # Initialize DB connection pool
+    engine = get_engine()  # Initialize DB connection pool
+    if get_settings().sql_instrumentation:
+        instrument_engine(engine.sync_engine)
+    metrics.add_collector(collect_db_pool)
+    app.state.ocr_workers.start()
+    app.state.photo_sweeper.start()
+    app.state.session_purger.start()
+    app.state.notification_sender.start()
     yield
+    await app.state.notification_sender.stop()
+    await app.state.notifier.aclose()
+    await app.state.photo_sweeper.stop()
+    await app.state.session_purger.stop()
+    await app.state.ocr_workers.stop()
 
 
 def create_app() -> FastAPI:
@@ -34,11 +58,42 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        # The session list's next-page cursor (api/routes/sessions.py); a cross-origin
+        # fetch() sees only the CORS-safelisted response headers otherwise.
+        expose_headers=[NEXT_CURSOR_HEADER],
     )
 
+    # Request counts and latency per route, for GET /metrics.
+    app.add_middleware(HttpMetricsMiddleware)
+
+    # Statement count and database time per request, as Server-Timing and a log of the
+    # requests over budget. The engine's listeners are attached in lifespan.
+    if settings.sql_instrumentation:
+        app.add_middleware(
+            SqlTimingMiddleware,
+            max_statements=settings.sql_log_max_statements,
+            slow_ms=settings.sql_log_slow_ms,
+        )
+
     # NOTE: uploaded receipt bytes used to live here in an unbounded process-local dict.
-    # They are columns on session_photos now (migration a7c3e91b40d2) — a restart no
-    # longer strands in-flight sessions, and nothing keeps growing in memory.
+    # They are in the photo store now (core/services/photo_store.py) — a restart no
+    # longer strands in-flight sessions, and nothing keeps growing in memory. The sweeper
+    # reclaims blobs whose sessions were deleted; OCR releases its own right away.
+    app.state.photo_sweeper = PhotoSweeper()
+
+    # Cleared history and the retention policy, deleted a batch at a time off the request
+    # path (core/services/retention.py).
+    app.state.session_purger = SessionPurger(
+        batch_size=settings.retention_batch_size,
+        pause=settings.retention_batch_pause_seconds,
+        interval=settings.retention_interval_seconds,
+        abandoned_after=timedelta(days=settings.retention_abandoned_days)
+        if settings.retention_abandoned_days
+        else None,
+        photos_after=timedelta(days=settings.retention_photo_days)
+        if settings.retention_photo_days
+        else None,
+    )
 
     # WebSocket connection manager for real-time updates.
     #
@@ -47,7 +102,29 @@ def create_app() -> FastAPI:
     # first. It is now the only thing standing in the way of scaling out.
     app.state.ws_manager = ConnectionManager()
 
+    # OCR runs off the request path: POST /ocr queues a job in ocr_jobs and these workers
+    # drain it. Started in lifespan, so merely building the app (tests) runs nothing.
+    app.state.ocr_workers = OcrWorkerPool(app.state.ws_manager, workers=settings.ocr_workers)
+
+    # The one Bot API client of the process: a keep-alive pool shared by the sender
+    # below and the routes that talk to Telegram directly (the invoice link).
+    app.state.notifier = NotificationService(
+        settings.bot_token, max_connections=settings.telegram_max_connections
+    )
+
+    # Telegram notifications are outbox rows written by the routes in the transaction
+    # they announce; this drains them under the Bot API rate limits.
+    app.state.notification_sender = NotificationSender(
+        app.state.notifier,
+        rate=settings.notify_rate_per_second,
+        chat_interval=settings.notify_chat_interval_seconds,
+        concurrency=settings.notify_concurrency,
+        timeout=settings.notify_timeout_seconds,
+    )
+
     # Routers
+    app.include_router(auth_router)
+    app.include_router(metrics_router)
     app.include_router(ocr_router)
     app.include_router(quota_router)
     app.include_router(sessions_router)
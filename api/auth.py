@@ -2,11 +2,14 @@
 
 from __future__ import annotations
 
+import base64
 import hashlib
 import hmac
 import json
 import time
+from collections import OrderedDict
 from dataclasses import dataclass
+from functools import lru_cache
 from urllib.parse import parse_qs
 
 from fastapi import Depends, HTTPException, Request
@@ -15,6 +18,10 @@ from core.config import get_settings
 
 _MAX_AUTH_AGE_SECONDS = 86400  # 24 hours
 
+# initData strings remembered as valid. One per open Mini App is plenty; past this the
+# least recently used go first.
+_VALIDATED_MAX_ENTRIES = 10_000
+
 
 @dataclass(frozen=True, slots=True)
 class TelegramUser:
@@ -28,6 +35,12 @@ class TelegramUser:
     photo_url: str | None = None
 
 
+@lru_cache(maxsize=4)
+def _secret_key(bot_token: str) -> bytes:
+    """secret_key = HMAC_SHA256(key="WebAppData", msg=bot_token) — fixed per bot token."""
+    return hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+
+
 def validate_init_data(init_data: str, bot_token: str) -> dict[str, str]:
     """Validate Telegram Mini App *initData* using HMAC-SHA256.
 
@@ -59,11 +72,10 @@ def validate_init_data(init_data: str, bot_token: str) -> dict[str, str]:
     # Build data-check-string: sorted key=value pairs joined by \n
     data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(params.items()))
 
-    # secret_key = HMAC_SHA256(key="WebAppData", msg=bot_token)
-    secret_key = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
-
     # computed_hash = HMAC_SHA256(key=secret_key, msg=data_check_string)
-    computed_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    computed_hash = hmac.new(
+        _secret_key(bot_token), data_check_string.encode(), hashlib.sha256
+    ).hexdigest()
 
     if not hmac.compare_digest(computed_hash, received_hash):
         raise ValueError("Invalid initData hash")
@@ -97,31 +109,60 @@ def _parse_telegram_user(user_json: str) -> TelegramUser:
     )
 
 
-async def get_current_user(request: Request) -> TelegramUser:
-    """FastAPI dependency: authenticate via Telegram Mini App *initData*.
+class _ValidatedInitData:
+    """initData strings already validated, with the user each one names.
 
-    Expects an ``Authorization`` header in the format::
+    The Mini App sends the same initData — the whole URL-encoded string, user JSON
+    included — with every request of a session, and each one used to be parsed, sorted,
+    HMAC'd twice and JSON-decoded again. A string that validated once names the same
+    user until ``auth_date`` plus :data:`_MAX_AUTH_AGE_SECONDS`, so that is how long it
+    is remembered. Keyed on the whole string, hash included, so nothing but the exact
+    bytes that were checked can hit; failures are never cached.
+    """
 
-        tma <initData>
+    def __init__(self, max_entries: int) -> None:
+        self._max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, str], tuple[TelegramUser, float]] = OrderedDict()
 
-    Returns a :class:`TelegramUser` on success; raises ``HTTPException(401)``
-    otherwise.
+    def get(self, init_data: str, bot_token: str) -> tuple[TelegramUser, float] | None:
+        """The user and when the string expires (epoch seconds), if remembered."""
+        key = (bot_token, init_data)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() > entry[1]:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, init_data: str, bot_token: str, user: TelegramUser, auth_date: int) -> None:
+        self._entries[(bot_token, init_data)] = (user, auth_date + _MAX_AUTH_AGE_SECONDS)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+_validated = _ValidatedInitData(_VALIDATED_MAX_ENTRIES)
+
+
+def authenticate_init_data(init_data: str, bot_token: str) -> TelegramUser:
+    """The user *init_data* vouches for; ``HTTPException(401)`` if it does not.
+
+    Shared by :func:`get_current_user` and the WebSocket endpoint.
     """
-    auth_header = request.headers.get("Authorization")
-    if not auth_header:
-        raise HTTPException(status_code=401, detail="Missing Authorization header")
+    return _authenticate_init_data(init_data, bot_token)[0]
 
-    parts = auth_header.split(" ", maxsplit=1)
-    if len(parts) != 2 or parts[0].lower() != "tma":
-        raise HTTPException(
-            status_code=401,
-            detail="Authorization header must use 'tma <initData>' format",
-        )
 
-    init_data = parts[1]
+def _authenticate_init_data(init_data: str, bot_token: str) -> tuple[TelegramUser, float]:
+    """:func:`authenticate_init_data`, plus when *init_data* expires (epoch seconds)."""
+    entry = _validated.get(init_data, bot_token)
+    if entry is not None:
+        return entry
 
     try:
-        bot_token = get_settings().bot_token
         params = validate_init_data(init_data, bot_token)
     except ValueError as exc:
         raise HTTPException(status_code=401, detail=str(exc)) from exc
@@ -131,10 +172,123 @@ async def get_current_user(request: Request) -> TelegramUser:
         raise HTTPException(status_code=401, detail="No user data in initData")
 
     try:
-        return _parse_telegram_user(user_json)
+        user = _parse_telegram_user(user_json)
     except (json.JSONDecodeError, KeyError, TypeError) as exc:
         raise HTTPException(status_code=401, detail=f"Invalid user data: {exc}") from exc
 
+    _validated.put(init_data, bot_token, user, int(params["auth_date"]))
+    return user, int(params["auth_date"]) + _MAX_AUTH_AGE_SECONDS
+
+
+# ---------------------------------------------------------------------------
+# Signed session tokens
+# ---------------------------------------------------------------------------
+#
+# initData is several hundred bytes of URL-encoded JSON, and the Mini App sent all of it
+# with every API call and WebSocket connect. POST /api/auth/token trades it, once, for
+#
+#     <payload>.<signature>
+#
+# both base64url without padding: the payload is "<user id>\n<expires at>\n<session
+# scope or nothing>\n<first name>", the signature HMAC-SHA256 over the encoded payload
+# with a key of its own derived from the bot token. Checking one is a single HMAC and a
+# constant-time compare over bytes exactly as they arrived — nothing is decoded or split
+# before the signature holds. A token never outlives the initData it was issued for.
+
+
+@lru_cache(maxsize=4)
+def _token_key(bot_token: str) -> bytes:
+    # Distinct from the initData secret key, so that neither can stand in for the other.
+    return hmac.new(b"CheckSplitterToken", bot_token.encode(), hashlib.sha256).digest()
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _sign(payload: str, bot_token: str) -> str:
+    return _b64encode(hmac.new(_token_key(bot_token), payload.encode(), hashlib.sha256).digest())
+
+
+def issue_token(
+    init_data: str, bot_token: str, ttl_seconds: int, session_id: str | None = None
+) -> tuple[str, int]:
+    """Trade valid *init_data* for a bearer token; returns it and its expiry (epoch s).
+
+    The token lasts *ttl_seconds*, or until *init_data* itself would expire if that is
+    sooner. With *session_id* it only opens routes of that session (see
+    :func:`verify_token`). Raises ``HTTPException(401)`` like
+    :func:`authenticate_init_data`.
+    """
+    user, init_data_expires_at = _authenticate_init_data(init_data, bot_token)
+    expires_at = int(min(time.time() + ttl_seconds, init_data_expires_at))
+    fields = (str(user.id), str(expires_at), session_id or "", user.first_name)
+    payload = _b64encode("\n".join(fields).encode())
+    return f"{payload}.{_sign(payload, bot_token)}", expires_at
+
+
+def verify_token(token: str, bot_token: str, session_id: str | None = None) -> TelegramUser:
+    """The user a token from :func:`issue_token` names.
+
+    Raises ``HTTPException(401)`` for a forged or expired token, and ``HTTPException(403)``
+    for a session-scoped one used anywhere but on *session_id*, the session the request is
+    about (``None`` for routes that are about no session in particular).
+    """
+    payload, _, signature = token.partition(".")
+    if not hmac.compare_digest(_sign(payload, bot_token).encode(), signature.encode()):
+        raise HTTPException(status_code=401, detail="Invalid token signature")
+
+    # Only what issue_token() wrote gets this far, so the payload is well-formed.
+    raw = base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+    user_id, expires_at, scope, first_name = raw.decode().split("\n", 3)
+    if time.time() > int(expires_at):
+        raise HTTPException(status_code=401, detail="Token has expired")
+    if scope and scope != session_id:
+        raise HTTPException(status_code=403, detail="Token is scoped to another session")
+    return TelegramUser(id=int(user_id), first_name=first_name)
+
+
+def authenticate_credentials(
+    credentials: str, bot_token: str, session_id: str | None = None
+) -> TelegramUser:
+    """A token, or initData — for where, as in the WebSocket ``?token=``, no scheme is named.
+
+    initData always has ``=`` in it (``hash=``); unpadded base64url never does.
+    """
+    if "=" in credentials:
+        return authenticate_init_data(credentials, bot_token)
+    return verify_token(credentials, bot_token, session_id)
+
+
+async def get_current_user(request: Request) -> TelegramUser:
+    """FastAPI dependency: authenticate via Telegram Mini App *initData* or a token.
+
+    Expects an ``Authorization`` header in one of the formats::
+
+        tma <initData>
+        Bearer <token from POST /api/auth/token>
+
+    Returns a :class:`TelegramUser` on success; raises ``HTTPException(401)``
+    otherwise, or ``HTTPException(403)`` for a token scoped to another session.
+    """
+    auth_header = request.headers.get("Authorization")
+    if not auth_header:
+        raise HTTPException(status_code=401, detail="Missing Authorization header")
+
+    parts = auth_header.split(" ", maxsplit=1)
+    scheme = parts[0].lower() if len(parts) == 2 else None
+    if scheme == "bearer":
+        return verify_token(
+            parts[1], get_settings().bot_token, request.path_params.get("session_id")
+        )
+    if scheme != "tma":
+        raise HTTPException(
+            status_code=401,
+            detail="Authorization header must use 'tma <initData>' or 'Bearer <token>' format",
+        )
+
+    return authenticate_init_data(parts[1], get_settings().bot_token)
+
 
 # Convenience type alias for use in route signatures
 CurrentUser = Depends(get_current_user)
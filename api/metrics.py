@@ -0,0 +1,76 @@
+"""Request metrics for ``GET /metrics`` (core/metrics.py holds the registry).
+
+Every HTTP request is counted by method, route and status, and timed into a histogram
+by method and route. The route is the template FastAPI matched —
+``/api/sessions/{session_id}`` — never the raw path, so one series stands for every
+session rather than one series per session.
+"""
+
+from __future__ import annotations
+
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.metrics import Metrics, metrics
+
+# Paths that matched no route share one label, whatever was asked for.
+_UNMATCHED = "<unmatched>"
+
+
+class HttpMetricsMiddleware:
+    """``http_requests_total`` and ``http_request_duration_seconds`` per route.
+
+    Plain ASGI, like api/sql_timing.py: it only has to see the status go past and the
+    route FastAPI wrote into the scope.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or _UNMATCHED
+            method = scope["method"]
+            metrics.inc("http_requests_total", method=method, route=route, status=status)
+            metrics.observe(
+                "http_request_duration_seconds",
+                time.perf_counter() - started,
+                method=method,
+                route=route,
+            )
+
+
+def collect_db_pool(registry: Metrics) -> None:
+    """Pool gauges for the engine of core/db.py, read at scrape time.
+
+    ``checkedout`` is connections lent out right now; ``overflow`` goes negative while the
+    pool is not yet full and positive once connections past DB_POOL_SIZE are open.
+    SQLite's pools (tests, scripts) keep no such counts and publish nothing.
+    """
+    from core.db import get_engine
+
+    pool = get_engine().pool
+    for name, read in (
+        ("db_pool_size", "size"),
+        ("db_pool_checked_out", "checkedout"),
+        ("db_pool_overflow", "overflow"),
+    ):
+        reader = getattr(pool, read, None)
+        if reader is not None:
+            registry.set(name, reader())
@@ -0,0 +1,42 @@
+"""JSON responses for the hot read paths, encoded without a Pydantic round trip.
+
+A route that returns ORM objects under ``response_model=`` pays twice per field:
+Pydantic validates the objects attribute by attribute (``from_attributes``, plus a
+``BeforeValidator`` per UUID), then serialises the validated model again. For a
+session with a few hundred dishes and votes that was most of the request's CPU.
+
+The routes that use :class:`FastJSONResponse` build plain dicts from row results and
+return this response directly, which FastAPI passes through untouched; their
+``response_model`` stays declared, so the OpenAPI schema is unchanged.
+
+orjson does the encoding: UUIDs, and datetimes with UTC written "Z" as Pydantic
+writes them, natively and several times faster than the standard library.
+"""
+
+from __future__ import annotations
+
+from typing import Any
+from uuid import UUID
+
+import orjson
+from starlette.responses import Response
+
+
+def _default(value: Any) -> Any:
+    # orjson takes only uuid.UUID itself, not the subclass asyncpg returns for uuid
+    # columns (asyncpg.pgproto.UUID).
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """*content* — dicts, lists, str/int/float/bool/None, UUID, datetime — as JSON."""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_UTC_Z)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
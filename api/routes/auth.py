@@ -0,0 +1,32 @@
+"""Trading initData for a short-lived signed token (see api/auth.py)."""
+
+import logging
+import time
+
+from fastapi import APIRouter, HTTPException, Request
+
+from api.auth import issue_token
+from api.schemas import TokenIn, TokenOut
+from core.config import get_settings
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/api/auth", tags=["auth"])
+
+
+@router.post("/token", response_model=TokenOut)
+async def create_token(request: Request, body: TokenIn | None = None) -> TokenOut:
+    """Exchange ``Authorization: tma <initData>`` for a bearer token.
+
+    Only initData is accepted here. A token that could buy its own successor would never
+    expire; this way it lives no longer than the initData behind it.
+    """
+    scheme, _, init_data = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "tma" or not init_data:
+        raise HTTPException(401, "Authorization header must use 'tma <initData>' format")
+
+    settings = get_settings()
+    session_id = str(body.session_id) if body and body.session_id else None
+    token, expires_at = issue_token(
+        init_data, settings.bot_token, settings.auth_token_ttl_seconds, session_id
+    )
+    return TokenOut(token=token, expires_in=max(0, expires_at - int(time.time())))
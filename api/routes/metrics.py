@@ -0,0 +1,31 @@
+"""Prometheus scrape endpoint."""
+
+import hmac
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+from core.config import get_settings
+from core.metrics import metrics
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def scrape(request: Request) -> PlainTextResponse:
+    """Every counter, gauge and histogram of this process, in the text format.
+
+    The scraper has to send ``Authorization: Bearer <METRICS_TOKEN>``: per-route
+    timings and Telegram outcome counts are nobody else's business, and this app is the
+    one users reach. Without a token configured the endpoint does not exist (404)
+    rather than being open to anyone.
+    """
+    expected = get_settings().metrics_token
+    if not expected:
+        raise HTTPException(404, "Not Found")
+    given = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not hmac.compare_digest(given.encode(), expected.encode()):
+        raise HTTPException(401, "Invalid metrics token")
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
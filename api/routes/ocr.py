@@ -1,29 +1,28 @@
 """OCR and item management routes."""
 
-import asyncio
 import logging
 from decimal import Decimal
 from uuid import UUID, uuid4
 
-import httpx
-from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.auth import TelegramUser, get_current_user
 from api.deps import get_db
+from api.uploads import MalformedUpload, PhotoTooLarge, TooManyPhotos, receive_photos
 from api.schemas import (
     ItemOut,
     ItemsUpdateIn,
     ItemUpdateIn,
-    OcrItemOut,
-    OcrResultOut,
+    OcrJobOut,
     PhotoOut,
 )
-from api.ws import EVENT_ITEMS_UPDATED, EVENT_OCR_PROGRESS
+from api.ws import EVENT_ITEMS_UPDATED
 from core.config import get_settings
 from core.models.session import Session
-from core.services.ocr import OcrService
-from core.services.quota import QuotaService
+from core.services.ocr_jobs import OcrJobService
+from core.services.ocr_resilience import provider_breaker
+from core.services.photo_store import get_photo_store
 from core.services.session import SessionService
 
 logger = logging.getLogger(__name__)
@@ -31,16 +30,11 @@ router = APIRouter(prefix="/api/sessions/{session_id}", tags=["ocr"])
 
 _MAX_PHOTO_SIZE = 5 * 1024 * 1024  # 5 MB
 
-# Photos per receipt. Bounds both the OCR bill and the in-memory photo store, and keeps
-# the worst-case recognition time inside the deadline below.
+# Photos per receipt. Bounds both the OCR bill and the photo store, and keeps the
+# worst-case recognition time inside the worker's deadline (_OCR_DEADLINE_SECONDS in
+# api/services/ocr_worker.py).
 _MAX_PHOTOS = 5
 
-# Hard ceiling on one OCR request, deliberately under nginx's proxy_read_timeout (300 s
-# in nginx/tg-check-splitter.conf). Exceeding that timeout produced a 504 from nginx
-# *after* the scan had been charged, with nothing left to refund it — the request was
-# already gone. Failing here instead keeps the refund path reachable.
-_OCR_DEADLINE_SECONDS = 240
-
 
 async def _get_session_require_admin(
     session_id: str, user: TelegramUser, db: AsyncSession, *, must_be_open: bool = True
@@ -63,138 +57,144 @@ async def _get_session_require_admin(
     return session
 
 
-@router.post("/photos", response_model=list[PhotoOut], status_code=201)
+# The body is parsed by api/uploads.py rather than declared as ``list[UploadFile]``,
+# so the schema FastAPI would have generated is spelled out for the docs.
+_PHOTOS_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["files"],
+                    "properties": {
+                        "files": {"type": "array", "items": {"type": "string", "format": "binary"}}
+                    },
+                }
+            }
+        },
+    }
+}
+
+
+@router.post("/photos", response_model=list[PhotoOut], status_code=201, openapi_extra=_PHOTOS_BODY)
 async def upload_photos(
     session_id: str,
     request: Request,
-    files: list[UploadFile],
     user: TelegramUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ) -> list[PhotoOut]:
-    """Upload receipt photos for a session (admin only)."""
-    logger.info("user_id=%s upload photos session=%s count=%d", user.id, session_id, len(files))
+    """Upload receipt photos for a session (admin only).
+
+    The files are streamed into the photo store as they arrive (api/uploads.py), after
+    the admin check — a stranger's 25 MB is refused before it is read, not after.
+    """
+    logger.info("user_id=%s upload photos session=%s", user.id, session_id)
     session = await _get_session_require_admin(session_id, user, db)
     svc = SessionService(db)
+    store = get_photo_store()
 
     # Cap the total, not just this batch — uploads are incremental. Rejecting here keeps
     # the OCR limit from becoming a dead end where a session can be filled with photos
     # that can never be recognised.
     already = len(session.photos)
-    if already + len(files) > _MAX_PHOTOS:
-        raise HTTPException(
-            400,
-            detail=(f"A receipt takes at most {_MAX_PHOTOS} photos ({already} already uploaded)."),
-        )
-
-    photos_out: list[PhotoOut] = []
-    for f in files:
-        data = await f.read()
-        if len(data) > _MAX_PHOTO_SIZE:
-            raise HTTPException(413, f"File {f.filename} exceeds 5 MB limit")
-
-        # Bytes go on the row, not into a process-local dict: see the migration
-        # a7c3e91b40d2 for why. tg_file_id stays a synthetic id — the column is NOT NULL
-        # and predates Mini App uploads, when it held a real Telegram file id.
-        photo = await svc.add_photo(session_id, f"miniapp-{uuid4()}", data=data)
-        photos_out.append(PhotoOut.model_validate(photo))
-
-    return photos_out
+    too_many = HTTPException(
+        400,
+        detail=(f"A receipt takes at most {_MAX_PHOTOS} photos ({already} already uploaded)."),
+    )
+    if already >= _MAX_PHOTOS:
+        raise too_many
+    # A phone on a slow uplink takes its time over 25 MB. Nothing is pending, so the
+    # commit just hands the pooled connection back for the duration of the upload.
+    await db.commit()
 
+    try:
+        writers = await receive_photos(
+            request, store, max_size=_MAX_PHOTO_SIZE, max_files=_MAX_PHOTOS - already
+        )
+    except PhotoTooLarge as exc:
+        raise HTTPException(413, f"File {exc.filename} exceeds 5 MB limit") from exc
+    except TooManyPhotos as exc:
+        raise too_many from exc
+    except MalformedUpload as exc:
+        raise HTTPException(422, f"Expected receipt photos as multipart files: {exc}") from exc
+    if not writers:
+        raise HTTPException(422, "No files uploaded")
 
-@router.post("/ocr", response_model=OcrResultOut)
+    try:
+        # All blobs and all rows in one transaction: the batch is recorded whole or not
+        # at all. tg_file_id stays a synthetic id — the column is NOT NULL and predates
+        # Mini App uploads, when it held a real Telegram file id.
+        keys = [await writer.save(db) for writer in writers]
+        photos = await svc.add_photos(session_id, [(f"miniapp-{uuid4()}", key) for key in keys])
+    except BaseException:
+        for writer in writers:
+            writer.abort()
+        raise
+    logger.info("user_id=%s uploaded %d photos session=%s", user.id, len(photos), session_id)
+    return [PhotoOut.model_validate(photo) for photo in photos]
+
+
+@router.post("/ocr", response_model=OcrJobOut, status_code=202)
 async def trigger_ocr(
     session_id: str,
     request: Request,
     user: TelegramUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
-) -> OcrResultOut:
-    """Trigger OCR on uploaded photos (admin only)."""
+) -> OcrJobOut:
+    """Queue OCR on uploaded photos (admin only).
+
+    Answers 202 with the job as soon as the scan is charged; recognition runs in the
+    background workers (api/services/ocr_worker.py). Progress and the outcome arrive as
+    ocr_progress / ocr_done / ocr_failed over the WebSocket, and from GET
+    /ocr/jobs/{job_id} for clients that poll. This request used to stay open for the
+    whole LLM call — up to four minutes, holding a worker slot and a DB connection.
+    """
     logger.info("user_id=%s OCR trigger session=%s", user.id, session_id)
-    # Authorization only — the photos are read below by explicit query, not off the
-    # session's (deferred) relationship.
     await _get_session_require_admin(session_id, user, db)
     svc = SessionService(db)
     settings = get_settings()
 
-    # Collect the photos BEFORE charging. This used to run after the scan was consumed,
-    # so a session with no usable bytes answered 400 and still cost the user a scan.
-    #
-    # Explicit select rather than photo.data: the column is deferred precisely so that
-    # ordinary session reads do not carry the JPEGs, and touching the attribute would
-    # emit a lazy load per photo (and raise MissingGreenlet in async context).
-    photos_bytes = await svc.get_photo_bytes(session_id)
-
-    if not photos_bytes:
+    # Check the photos BEFORE charging. A session with no usable bytes used to answer
+    # 400 after the scan was consumed and still cost the user a scan.
+    pending = await svc.count_pending_photos(session_id)
+    if not pending:
         raise HTTPException(400, detail="No photos available for OCR. Try uploading again.")
-    if len(photos_bytes) > _MAX_PHOTOS:
+    if pending > _MAX_PHOTOS:
         raise HTTPException(
             400,
-            detail=f"Too many photos ({len(photos_bytes)}); {_MAX_PHOTOS} is the maximum.",
+            detail=f"Too many photos ({pending}); {_MAX_PHOTOS} is the maximum.",
         )
 
-    quota_svc = QuotaService(db, settings.free_scans_per_month)
-    charged = await quota_svc.use_scan(user.id)
-    if charged is None:
-        raise HTTPException(402, detail="quota_exhausted")
-
-    manager = request.app.state.ws_manager
-    total_photos = len(photos_bytes)
-
-    async def report_progress(completed: int, total: int) -> None:
-        await manager.broadcast(
-            session_id,
-            {"type": EVENT_OCR_PROGRESS, "data": {"current": completed, "total": total}},
+    # With the provider known to be down, queueing would charge a scan only for the
+    # worker to fail and refund it. Say so before anything is charged.
+    if provider_breaker.is_open:
+        raise HTTPException(
+            503, detail="Recognition service is unavailable. Try again in a minute."
         )
 
-    if total_photos > 1:
-        await report_progress(0, total_photos)
+    jobs = OcrJobService(db, settings.free_scans_per_month)
+    job = await jobs.enqueue(session_id, user.id)
+    if job is None:
+        raise HTTPException(402, detail="quota_exhausted")
 
-    ocr_service = OcrService(settings.zai_api_key, settings.zai_model)
+    request.app.state.ocr_workers.wake()
+    return OcrJobOut.model_validate(job)
 
-    # Every exit from here that does not produce items refunds the scan: the user is
-    # charged for a parsed receipt, not for an attempt.
-    try:
-        async with asyncio.timeout(_OCR_DEADLINE_SECONDS):
-            result = await ocr_service.parse_receipt(photos_bytes, on_progress=report_progress)
-    except TimeoutError:
-        await quota_svc.refund_scan(user.id, charged)
-        logger.error("OCR timed out after %ss (%d photos)", _OCR_DEADLINE_SECONDS, total_photos)
-        raise HTTPException(504, detail="Recognition took too long. Try fewer photos.")
-    except httpx.HTTPError as exc:
-        await quota_svc.refund_scan(user.id, charged)
-        logger.error("OCR provider error: %s", exc)
-        raise HTTPException(502, detail="Recognition service is unavailable. Try again.")
-    except ValueError as exc:
-        await quota_svc.refund_scan(user.id, charged)
-        logger.error("OCR failed: %s", exc)
-        raise HTTPException(422, detail="Could not parse receipt. Try a clearer photo.")
-
-    if not result.items:
-        await quota_svc.refund_scan(user.id, charged)
-        raise HTTPException(422, detail="No items found on the receipt. Try a clearer photo.")
-
-    await svc.save_ocr_items(
-        session_id,
-        [{"name": i.name, "price": float(i.price), "quantity": i.quantity} for i in result.items],
-    )
 
-    if result.currency:
-        await svc.update_currency(session_id, result.currency)
-
-    # The receipt has been read; the bytes have no further use. Dropping them here is
-    # what keeps steady-state storage at roughly zero — the cascade on session delete is
-    # only the backstop for sessions that never got this far.
-    await svc.clear_photo_bytes(session_id)
-
-    return OcrResultOut(
-        items=[
-            OcrItemOut(name=i.name, price=float(i.price), quantity=i.quantity)
-            for i in result.items
-        ],
-        total=float(result.total),
-        currency=result.currency,
-        total_mismatch=result.total_mismatch,
-    )
+@router.get("/ocr/jobs/{job_id}", response_model=OcrJobOut)
+async def get_ocr_job(
+    session_id: str,
+    job_id: UUID,
+    user: TelegramUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> OcrJobOut:
+    """Status of a queued recognition (admin only) — the polling half of POST /ocr."""
+    await _get_session_require_admin(session_id, user, db, must_be_open=False)
+    job = await OcrJobService(db, get_settings().free_scans_per_month).get_job(job_id)
+    if job is None or str(job.session_id) != session_id:
+        raise HTTPException(404, "OCR job not found")
+    return OcrJobOut.model_validate(job)
 
 
 @router.put("/items", response_model=list[ItemOut])
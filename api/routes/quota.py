@@ -1,6 +1,6 @@
 import logging
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.auth import TelegramUser, get_current_user
@@ -8,7 +8,7 @@ from api.deps import get_db
 from api.schemas import InvoiceIn, InvoiceOut, QuotaOut
 from api.services.notifications import NotificationService
 from core.config import get_settings
-from core.services.quota import QuotaService
+from core.services.quota import QuotaService, quota_cache
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/quota", tags=["quota"])
@@ -17,6 +17,10 @@ router = APIRouter(prefix="/api/quota", tags=["quota"])
 # able to name its own price for a pack of scans.
 SCAN_PACKS: dict[int, int] = {5: 50, 20: 150}  # scans -> Stars
 
+# How long after asking for an invoice the buyer's quota is read past the cache: the
+# bot, a separate process, grants the scans, and this process would not hear of it.
+_PURCHASE_HOLD_SECONDS = 15 * 60
+
 
 @router.get("", response_model=QuotaOut)
 async def get_quota(
@@ -33,6 +37,7 @@ async def get_quota(
 @router.post("/invoice", response_model=InvoiceOut)
 async def create_invoice(
     body: InvoiceIn,
+    request: Request,
     user: TelegramUser = Depends(get_current_user),
 ) -> InvoiceOut:
     """Create a Telegram Stars invoice link for a pack of scans.
@@ -45,7 +50,8 @@ async def create_invoice(
         raise HTTPException(400, f"Unknown pack: {body.scans} scans")
 
     logger.info("user_id=%s invoice scans=%d stars=%d", user.id, body.scans, stars)
-    notifier = NotificationService(get_settings().bot_token)
+    quota_cache.hold(user.id, _PURCHASE_HOLD_SECONDS)
+    notifier: NotificationService = request.app.state.notifier
     link = await notifier.create_invoice_link(
         title=f"{body.scans} scans",
         description=f"{body.scans} receipt scans for Check Splitter",
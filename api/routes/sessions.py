@@ -2,16 +2,21 @@
 
 from __future__ import annotations
 
+import base64
 import logging
+import time
+from datetime import datetime
+from typing import Literal
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy import delete, func, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.auth import TelegramUser, get_current_user
 from api.ws import EVENT_MEMBER_JOINED, EVENT_SESSION_STATUS
 from api.deps import get_db
+from api.responses import FastJSONResponse
 from api.schemas import (
     MemberOut,
     SessionBrief,
@@ -19,10 +24,17 @@ from api.schemas import (
     SessionOut,
     ShareOut,
 )
-from api.services.notifications import NotificationService
+from api.services.notifications import (
+    member_joined_message,
+    settle_messages,
+    vote_reminder_message,
+)
+from api.session_view import load_session_rows, session_document
 from core.config import get_settings
-from core.models.session import Session, SessionItem, SessionMember
+from core.models.session import Session, SessionMember
 from core.services.calculator import calculate_shares, calculate_user_share
+from core.services.outbox import OutboxService
+from core.services.retention import RetentionService
 from core.services.session import SessionService
 
 logger = logging.getLogger(__name__)
@@ -31,22 +43,19 @@ router = APIRouter(prefix="/api/sessions", tags=["sessions"])
 
 @router.delete("/history", status_code=200)
 async def clear_history(
+    request: Request,
     user: TelegramUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    """Delete all settled sessions where the user is admin."""
+    """Delete all settled sessions where the user is admin (in the background)."""
     logger.info("user_id=%s clear history", user.id)
 
-    # One statement instead of a membership loop that re-loaded every session (and,
-    # through lazy="selectin", its photos, items and members) just to read two columns.
-    # Children go with the rows via ON DELETE CASCADE — see migration f1a2b3c4d5e6.
-    result = await db.execute(
-        delete(Session)
-        .where(Session.admin_tg_id == user.id, Session.status == "settled")
-        .returning(Session.id)
-    )
-    deleted = len(result.all())
-    await db.commit()
+    # Only marks them: they leave the list now, and the purger deletes them — with their
+    # items, votes, members and photos — a batch at a time in the background. Deleting
+    # a long history here held locks on all of it for the length of the request.
+    deleted = await RetentionService(db).mark_history_deleted(user.id)
+    if deleted:
+        request.app.state.session_purger.wake()
     return {"deleted": deleted}
 
 
@@ -60,11 +69,6 @@ def _require_admin(session, user: TelegramUser) -> None:
         raise HTTPException(403, "Admin access required")
 
 
-def _require_member(session, user: TelegramUser) -> None:
-    if user.id not in {m.user_tg_id for m in session.members}:
-        raise HTTPException(403, "Not a session member")
-
-
 # ---------------------------------------------------------------------------
 # Endpoints
 # ---------------------------------------------------------------------------
@@ -85,61 +89,92 @@ async def create_session(
     return session
 
 
+# Page through a user's sessions with GET /my?cursor=<this header>; absent on the last
+# page. A header rather than an envelope, so the body stays the list of SessionBrief
+# that Mini App builds already in users' hands expect.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+SessionStatus = Literal["created", "voting", "closed", "settled"]
+
+
+def _encode_cursor(created_at: datetime, session_id: UUID) -> str:
+    raw = f"{created_at.isoformat()}|{session_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, session_id = raw.split("|")
+        return datetime.fromisoformat(created_at), UUID(session_id)
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor") from None
+
+
 @router.get("/my", response_model=list[SessionBrief])
 async def my_sessions(
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=100),
+    status: list[SessionStatus] | None = Query(None),
     user: TelegramUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    # One statement, whatever the number of sessions.
+    """The user's sessions, newest first, *limit* at a time; optionally only *status*.
+
+    Keyset pagination on (created_at, id): the next page starts strictly after the last
+    row of this one, so a session created or deleted meanwhile neither shifts nor
+    repeats rows, and page 20 costs what page 1 does — an OFFSET would read and discard
+    everything before it.
+    """
+    # One statement per page, and no child table touched.
     #
-    # This used to load each membership, then each session through the ORM — and every
-    # session load pulls photos, items and members via lazy="selectin". That is 5n+1
-    # queries: measured at 251 queries and 505 ms for a user with 50 sessions, growing
-    # linearly. The counts are the only thing needed from those relationships, so they
-    # are computed in SQL and no child row is materialised at all.
-    # correlate(Session) is load-bearing: the outer query joins SessionMember too, and
-    # left to auto-correlation SQLAlchemy strips SessionMember from the subquery's FROM
-    # as well, leaving it with no FROM at all.
-    member_count = (
-        select(func.count())
-        .select_from(SessionMember)
-        .where(SessionMember.session_id == Session.id)
-        .correlate(Session)
-        .scalar_subquery()
-    )
-    item_count = (
-        select(func.count())
-        .select_from(SessionItem)
-        .where(SessionItem.session_id == Session.id)
-        .correlate(Session)
-        .scalar_subquery()
-    )
-
-    result = await db.execute(
+    # This used to load each membership, then each session through the ORM — 5n+1
+    # queries, measured at 251 queries and 505 ms for a user with 50 sessions. Then it
+    # was one statement with two correlated count subqueries per row, still reading
+    # every member and item of every session the user ever joined. The counts are now
+    # columns of the session (kept by SessionService), the join starts from
+    # ix_session_members_user_tg_id_session_id, and the page is bounded.
+    query = (
         select(
             Session.id,
             Session.invite_code,
             Session.status,
             Session.created_at,
-            member_count.label("member_count"),
-            item_count.label("item_count"),
+            Session.member_count,
+            Session.item_count,
         )
         .join(SessionMember, SessionMember.session_id == Session.id)
-        .where(SessionMember.user_tg_id == user.id)
-        .order_by(Session.created_at.desc())
+        .where(SessionMember.user_tg_id == user.id, Session.deleted_at.is_(None))
+        .order_by(Session.created_at.desc(), Session.id.desc())
+        # One row past the page says whether there is a next one.
+        .limit(limit + 1)
+    )
+    if status:
+        query = query.where(Session.status.in_(status))
+    if cursor is not None:
+        query = query.where(tuple_(Session.created_at, Session.id) < _decode_cursor(cursor))
+
+    rows = (await db.execute(query)).all()
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers[NEXT_CURSOR_HEADER] = _encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    # Rows straight to JSON (api/responses.py); SessionBrief documents the shape.
+    return FastJSONResponse(
+        [
+            {
+                "id": row.id,
+                "invite_code": row.invite_code,
+                "status": row.status,
+                "created_at": row.created_at,
+                "member_count": row.member_count,
+                "item_count": row.item_count,
+            }
+            for row in rows
+        ],
+        headers=headers,
     )
-
-    return [
-        SessionBrief(
-            id=str(row.id),
-            invite_code=row.invite_code,
-            status=row.status,
-            created_at=row.created_at,
-            member_count=row.member_count,
-            item_count=row.item_count,
-        )
-        for row in result.all()
-    ]
 
 
 @router.get("/invite/{invite_code}", response_model=SessionOut)
@@ -148,11 +183,10 @@ async def get_session_by_invite(
     user: TelegramUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    svc = SessionService(db)
-    session = await svc.get_session_by_invite(invite_code)
-    if session is None:
+    rows = await load_session_rows(db, invite_code=invite_code)
+    if rows is None:
         raise HTTPException(404, "Session not found")
-    return session
+    return FastJSONResponse(session_document(rows))
 
 
 @router.get("/{session_id}", response_model=SessionOut)
@@ -161,12 +195,13 @@ async def get_session(
     user: TelegramUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    svc = SessionService(db)
-    session = await svc.get_session_by_id(session_id)
-    if session is None:
+    # Read as rows and encoded without Pydantic: api/session_view.py.
+    rows = await load_session_rows(db, session_id=session_id)
+    if rows is None:
         raise HTTPException(404, "Session not found")
-    _require_member(session, user)
-    return session
+    if not rows.has_member(user.id):
+        raise HTTPException(403, "Not a session member")
+    return FastJSONResponse(session_document(rows))
 
 
 @router.post("/invite/{invite_code}/join", status_code=201, response_model=MemberOut)
@@ -188,8 +223,18 @@ async def join_session(
         raise HTTPException(409, "Already a session member")
 
     logger.info("user_id=%s join session invite=%s", user.id, invite_code)
-    member = await svc.join_session(invite_code, user.id, user.first_name)
+    member = await svc.join_session(invite_code, user.id, user.first_name, commit=False)
     # member should not be None here since we already checked above
+    if member is not None:
+        # Committed with the membership: the admin hears about a join that happened, and
+        # the request does not wait for Telegram to say so.
+        await OutboxService(db).enqueue(
+            [member_joined_message(session.id, session.admin_tg_id, user.id, user.first_name)],
+            commit=False,
+        )
+        await db.commit()
+        await db.refresh(member)
+        request.app.state.notification_sender.wake()
 
     manager = request.app.state.ws_manager
     await manager.broadcast(
@@ -200,11 +245,6 @@ async def join_session(
         },
     )
 
-    # Send push notification to admin
-    settings = get_settings()
-    notifier = NotificationService(settings.bot_token)
-    await notifier.notify_member_joined(session.admin_tg_id, user.first_name)
-
     return member
 
 
@@ -212,10 +252,15 @@ async def join_session(
 async def send_reminder(
     session_id: UUID,
     member_tg_id: int,
+    request: Request,
     user: TelegramUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    """Send a voting reminder to a specific member (admin only)."""
+    """Queue a voting reminder to a specific member (admin only).
+
+    ``sent`` means the reminder is on its way: it is in the outbox, and taps within the
+    same minute fold into the one message.
+    """
     logger.info("user_id=%s remind member=%s session=%s", user.id, member_tg_id, session_id)
     svc = SessionService(db)
     session = await svc.get_session_by_id(session_id)
@@ -228,11 +273,53 @@ async def send_reminder(
         raise HTTPException(404, "Member not found")
 
     settings = get_settings()
-    notifier = NotificationService(settings.bot_token)
-    sent = await notifier.send_vote_reminder(
-        member_tg_id, settings.webapp_url, session.invite_code
+    reminder = vote_reminder_message(
+        session_id,
+        member_tg_id,
+        settings.webapp_url,
+        session.invite_code,
+        bucket=int(time.time() // 60),
     )
-    return {"sent": sent}
+    await OutboxService(db).enqueue([reminder])
+    request.app.state.notification_sender.wake()
+    return {"sent": True}
+
+
+@router.post("/{session_id}/remind", status_code=200)
+async def remind_unconfirmed(
+    session_id: UUID,
+    request: Request,
+    user: TelegramUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Queue a voting reminder to every member who has not confirmed yet (admin only).
+
+    One call and one INSERT instead of a POST /remind/{member} per member. ``queued``
+    can be below ``members``: someone already reminded this minute is not reminded twice.
+    """
+    logger.info("user_id=%s remind all session=%s", user.id, session_id)
+    svc = SessionService(db)
+    session = await svc.get_session_by_id(session_id)
+    if session is None:
+        raise HTTPException(404, "Session not found")
+    _require_admin(session, user)
+
+    targets = [
+        m.user_tg_id for m in session.members if not m.confirmed and m.user_tg_id != user.id
+    ]
+    settings = get_settings()
+    bucket = int(time.time() // 60)
+    queued = await OutboxService(db).enqueue(
+        [
+            vote_reminder_message(
+                session_id, tg_id, settings.webapp_url, session.invite_code, bucket=bucket
+            )
+            for tg_id in targets
+        ]
+    )
+    if queued:
+        request.app.state.notification_sender.wake()
+    return {"members": len(targets), "queued": queued}
 
 
 @router.post("/{session_id}/finish", status_code=200)
@@ -265,6 +352,7 @@ async def finish_voting(
 @router.post("/{session_id}/settle", response_model=list[ShareOut])
 async def settle_session(
     session_id: UUID,
+    request: Request,
     user: TelegramUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
@@ -275,10 +363,13 @@ async def settle_session(
         raise HTTPException(404, "Session not found")
     _require_admin(session, user)
 
-    # Claim the settlement BEFORE reading the data. The transition is what freezes the
-    # session against further edits, so everything computed after it is computed from
-    # inputs that can no longer move — which is why a second call returns the same
-    # numbers without anything being stored. Exactly one caller gets True.
+    # Claim and commit the settlement BEFORE reading the data. The committed transition
+    # is what freezes the session: the vote and tip routes check the committed status
+    # (``_require_open``), so until this commits they still accept changes, and those
+    # would be missing from the amounts the notifications below carry. Everything
+    # computed after it is computed from inputs that can no longer move — which is why
+    # a second call returns the same numbers without anything being stored. Exactly one
+    # caller gets True.
     first_settlement = await svc.claim_settlement(session_id)
 
     # Refresh relationships to ensure items/votes/members are up-to-date
@@ -320,19 +411,26 @@ async def settle_session(
     # Notify once, on the call that actually settled. Retries — a flaky connection, an
     # impatient double tap, a refetch — return the same numbers silently instead of
     # telling everyone their total all over again.
+    #
+    # The messages are outbox rows, written in a second transaction: the response does
+    # not wait for one Bot API round trip per member. Their dedup keys
+    # (``settle:{session}:{user}``) make enqueueing them again a no-op.
     if first_settlement:
         settings = get_settings()
-        notifier = NotificationService(settings.bot_token)
         members_data = [
             {"user_tg_id": m.user_tg_id, "display_name": m.display_name} for m in session.members
         ]
-        await notifier.notify_settle(
-            members_data,
-            shares,
-            session.currency or "RUB",
-            settings.webapp_url,
-            session.invite_code,
+        await OutboxService(db).enqueue(
+            settle_messages(
+                session_id,
+                members_data,
+                shares,
+                session.currency or "RUB",
+                settings.webapp_url,
+                session.invite_code,
+            ),
         )
+        request.app.state.notification_sender.wake()
     else:
         logger.info("session=%s already settled, notifications skipped", session_id)
 
@@ -16,7 +16,9 @@ from api.ws import (
     EVENT_VOTE_UPDATED,
 )
 from api.deps import get_db
+from api.responses import FastJSONResponse
 from api.schemas import ShareOut, TipIn, UnvotedDecisionIn, VoteIn
+from api.session_view import load_session_rows
 from core.models.session import Session, SessionMember
 from core.services.calculator import calculate_shares, calculate_user_share
 from core.services.session import SessionService
@@ -202,53 +204,46 @@ async def get_shares(
     db: AsyncSession = Depends(get_db),
 ):
     """Get all participant shares for the session."""
-    session, _member = await _require_member(db, session_id, user)
-
-    # Refresh items and their votes to avoid stale data
-    for item in session.items:
-        await db.refresh(item, ["votes"])
+    # Rows, not the ORM graph: the same five statements as GET /{id} (api/session_view.py)
+    # instead of the session load plus one refresh per dish, and no Pydantic on the way
+    # out.
+    rows = await load_session_rows(db, session_id=session_id)
+    if rows is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if not rows.has_member(user.id):
+        raise HTTPException(status_code=403, detail="Not a member of this session")
 
-    items_data = [
-        {
-            "price": item.price,
-            "quantity": item.quantity,
-            "votes": {v.user_tg_id: v.quantity for v in item.votes},
-        }
-        for item in session.items
-    ]
+    items_data = rows.calculator_items()
+    session_tip = rows.session.tip_percent
     per_person_tips = {
-        m.user_tg_id: m.tip_percent for m in session.members if m.tip_percent is not None
+        m.user_tg_id: m.tip_percent for m in rows.members if m.tip_percent is not None
     }
 
     shares = calculate_shares(
         items_data,
-        tip_percent=session.tip_percent,
+        tip_percent=session_tip,
         per_person_tips=per_person_tips or None,
     )
 
     # Build display-name lookup
-    name_by_tg_id = {m.user_tg_id: m.display_name for m in session.members}
+    name_by_tg_id = {m.user_tg_id: m.display_name for m in rows.members}
 
-    result: list[ShareOut] = []
+    result = []
     for tg_id, grand_total in shares.items():
         # Compute per-user breakdown
-        tip_pct = (
-            per_person_tips.get(tg_id, session.tip_percent)
-            if per_person_tips
-            else session.tip_percent
-        )
+        tip_pct = per_person_tips.get(tg_id, session_tip)
         dishes_total, tip_amount, _ = calculate_user_share(items_data, tg_id, tip_pct)
         result.append(
-            ShareOut(
-                user_tg_id=tg_id,
-                display_name=name_by_tg_id.get(tg_id, "Unknown"),
-                dishes_total=float(dishes_total),
-                tip_amount=float(tip_amount),
-                grand_total=float(grand_total),
-            )
+            {
+                "user_tg_id": tg_id,
+                "display_name": name_by_tg_id.get(tg_id, "Unknown"),
+                "dishes_total": float(dishes_total),
+                "tip_amount": float(tip_amount),
+                "grand_total": float(grand_total),
+            }
         )
 
-    return result
+    return FastJSONResponse(result)
 
 
 @router.get("/api/sessions/{session_id}/my-share", response_model=ShareOut)
@@ -6,7 +6,7 @@ import logging
 
 from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect
 
-from api.auth import _parse_telegram_user, validate_init_data
+from api.auth import authenticate_credentials
 from core.config import get_settings
 from core.db import get_async_session
 
@@ -22,18 +22,15 @@ async def websocket_endpoint(
 ):
     """WebSocket endpoint for real-time session updates.
 
-    Auth via query param: /ws/{session_id}?token=<initData>
+    Auth via query param: /ws/{session_id}?token=<initData or token from /api/auth/token>
     """
     # Validate auth
     try:
-        settings = get_settings()
-        params = validate_init_data(token, settings.bot_token)
-    except (ValueError, Exception):
+        user = authenticate_credentials(token, get_settings().bot_token, session_id)
+    except Exception:
         await websocket.close(code=4001, reason="Invalid authentication")
         return
 
-    user = _parse_telegram_user(params.get("user", "{}"))
-
     # Verify user is a member of the session
     async_session_factory = get_async_session()
     async with async_session_factory() as db:
@@ -92,6 +92,24 @@ class OcrResultOut(BaseModel):
     total_mismatch: bool = False
 
 
+class OcrJobOut(BaseModel):
+    """A queued recognition. Poll GET .../ocr/jobs/{id} or wait for ocr_done/ocr_failed."""
+
+    model_config = ConfigDict(from_attributes=True)
+
+    id: StrUUID
+    status: str  # queued | running | done | failed
+    progress_current: int
+    progress_total: int
+    result: OcrResultOut | None = None
+    # Set on failure: the status the synchronous endpoint used to answer with (400, 422,
+    # 502, 504) and a message for the user. The scan has been refunded by then.
+    error_status: int | None = None
+    error: str | None = None
+    created_at: datetime
+    finished_at: datetime | None = None
+
+
 class ShareOut(BaseModel):
     user_tg_id: int
     display_name: str
@@ -110,6 +128,12 @@ class InvoiceOut(BaseModel):
     invoice_link: str
 
 
+class TokenOut(BaseModel):
+    # For "Authorization: Bearer <token>" and the WebSocket ?token=.
+    token: str
+    expires_in: int  # seconds
+
+
 # ---------------------------------------------------------------------------
 # Request schemas
 # ---------------------------------------------------------------------------
@@ -147,6 +171,11 @@ class SessionCreateIn(BaseModel):
     currency: str = Field(default="RUB", max_length=8)
 
 
+class TokenIn(BaseModel):
+    # Set to limit the token to this session's routes.
+    session_id: UUID | None = None
+
+
 class InvoiceIn(BaseModel):
     # Only the pack size — the Stars price is looked up server-side in SCAN_PACKS.
     scans: int
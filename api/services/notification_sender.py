@@ -0,0 +1,296 @@
+"""Background sender draining the notification outbox.
+
+Routes only write ``notification_outbox`` rows (core/services/outbox.py); this task
+sends them. Telegram limits a bot to about 30 messages a second overall and about one a
+second per chat, and answers 429 with a ``retry_after`` to anyone who pushes harder —
+which the inline sends of a big settlement used to do. Here every send first takes a
+token from a global bucket and waits for its chat's slot, and a 429 pauses the whole
+bucket for as long as Telegram asked, then puts the message back for later.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable, Sequence
+from contextlib import AbstractAsyncContextManager
+from dataclasses import dataclass
+from typing import TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.services.notifications import Delivery, NotificationService
+from api.services.ocr_worker import SessionFactory
+from core.db import get_async_session
+from core.metrics import metrics
+from core.models.notification import OutboxMessage
+from core.services.ocr_resilience import backoff_delay
+from core.services.outbox import MAX_ATTEMPTS, OutboxService
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Messages leased per claim. A batch is sent concurrently, paced by the buckets below.
+_BATCH = 100
+
+# Added to the longest a batch can take (see NotificationSender.__init__) for the lease.
+_LEASE_MARGIN_SECONDS = 30.0
+
+# How often an idle sender looks for messages queued by another process, or come due
+# after a backoff. Messages queued by this process wake it at once (see wake()).
+_POLL_INTERVAL_SECONDS = 2.0
+
+# Backoff for sends that failed without a retry_after (network, 5xx).
+_RETRY_BASE_SECONDS = 5.0
+_RETRY_CAP_SECONDS = 600.0
+
+_PURGE_INTERVAL_SECONDS = 3600.0
+
+
+class TokenBucket:
+    """*rate* tokens a second, up to *burst* saved up; :meth:`pause` stops the refill."""
+
+    def __init__(self, rate: float, burst: float | None = None) -> None:
+        self._rate = rate
+        self._burst = burst if burst is not None else rate
+        self._tokens = self._burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self._rate)
+
+    @property
+    def paused_until(self) -> float:
+        """``time.monotonic()`` at which a :meth:`pause` ends (in the past if none)."""
+        return self._paused_until
+
+    def pause(self, seconds: float) -> None:
+        """Hand out nothing for *seconds*, and start empty afterwards."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+        self._updated = self._paused_until
+
+
+class ChatPacer:
+    """At most one message per *interval* seconds to any one chat."""
+
+    def __init__(self, interval: float) -> None:
+        self._interval = interval
+        self._next: dict[int, float] = {}
+
+    async def wait(self, chat_id: int) -> None:
+        now = time.monotonic()
+        if len(self._next) > 10_000:
+            self._next = {chat: at for chat, at in self._next.items() if at > now}
+        # Reserve the slot before sleeping, so concurrent sends to one chat queue up.
+        at = max(now, self._next.get(chat_id, 0.0))
+        self._next[chat_id] = at + self._interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+
+@dataclass(frozen=True)
+class FanOutReport:
+    """One Delivery per recipient, in the order they were given."""
+
+    deliveries: list[Delivery]
+
+    @property
+    def sent(self) -> int:
+        return sum(d.ok for d in self.deliveries)
+
+    @property
+    def failed(self) -> int:
+        return len(self.deliveries) - self.sent
+
+
+async def fan_out(
+    recipients: Sequence[T],
+    send: Callable[[T], Awaitable[Delivery]],
+    *,
+    concurrency: int,
+    timeout: float,
+    wait: Callable[[T], Awaitable[None]] | None = None,
+) -> FanOutReport:
+    """``send`` to every recipient, at most *concurrency* at a time; never raises.
+
+    A settlement used to await one Bot API round trip per member, one after another, so
+    a table of twelve waited twelve round trips. Here they overlap, but boundedly, and a
+    recipient whose call hangs costs *timeout* seconds, not the whole batch. *wait* runs
+    first, outside both the slot and the timeout: pacing that may legitimately take
+    longer than any one call (a chat's next free second, the rate bucket).
+    """
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(recipient: T) -> Delivery:
+        try:
+            if wait is not None:
+                await wait(recipient)
+            async with slots:
+                return await asyncio.wait_for(send(recipient), timeout)
+        except TimeoutError:
+            return Delivery(ok=False, error=f"no answer in {timeout:g}s")
+        except Exception as exc:
+            logger.exception("Fan-out send failed")
+            return Delivery(ok=False, error=repr(exc))
+
+    return FanOutReport(list(await asyncio.gather(*(one(r) for r in recipients))))
+
+
+class NotificationSender:
+    def __init__(
+        self,
+        notifier: NotificationService,
+        session_factory: SessionFactory | None = None,
+        *,
+        rate: float = 25.0,
+        chat_interval: float = 1.0,
+        concurrency: int = 10,
+        timeout: float = 15.0,
+    ) -> None:
+        self._notifier = notifier
+        self._session_factory = session_factory
+        self._concurrency = concurrency
+        self._timeout = timeout
+        # Longer than the slowest batch can take: _BATCH messages to one chat, one per
+        # chat_interval, the last of them timing out. Flood control is not bounded by
+        # this — Telegram may ask for minutes — so sends that could no longer finish
+        # inside the lease are handed back instead (see _send).
+        self._lease_seconds = _BATCH * chat_interval + timeout + _LEASE_MARGIN_SECONDS
+        # The last moment a send of the current batch may start, by time.monotonic().
+        self._send_by = 0.0
+        self._bucket = TokenBucket(rate)
+        self._pacer = ChatPacer(chat_interval)
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._purged_at = 0.0
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._loop(), name="notification-sender")
+
+    async def stop(self) -> None:
+        """Cancel the sender. Leased messages go out after restart, once the lease ends."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def wake(self) -> None:
+        """Tell the sender messages have just been committed to the outbox."""
+        self._wakeup.set()
+
+    def _session(self) -> AbstractAsyncContextManager[AsyncSession]:
+        factory = self._session_factory or get_async_session()
+        return factory()
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                busy = await self.run_once()
+                if time.monotonic() - self._purged_at > _PURGE_INTERVAL_SECONDS:
+                    self._purged_at = time.monotonic()
+                    async with self._session() as db:
+                        await OutboxService(db).purge()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Whatever was leased goes out again once the lease runs out.
+                logger.exception("Notification sender iteration failed")
+                busy = 0
+            if busy:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), _POLL_INTERVAL_SECONDS)
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def run_once(self) -> int:
+        """Claim one batch of due messages and send it. Returns the batch size.
+
+        Like the OCR worker, no connection is held while Telegram is being talked to:
+        one session claims, the sends run, another session records the outcomes.
+        """
+        async with self._session() as db:
+            batch = await OutboxService(db).claim(_BATCH, self._lease_seconds)
+        if not batch:
+            return 0
+        # Half the margin stays as slack between our clock and the database's.
+        lease_left = self._lease_seconds - _LEASE_MARGIN_SECONDS / 2 - self._timeout
+        self._send_by = time.monotonic() + lease_left
+        report = await fan_out(
+            batch,
+            self._send,
+            concurrency=self._concurrency,
+            timeout=self._timeout,
+            wait=self._pace,
+        )
+        async with self._session() as db:
+            outbox = OutboxService(db)
+            for message, delivery in zip(batch, report.deliveries, strict=True):
+                await self._record(outbox, message, delivery)
+            await db.commit()
+        logger.info("Notifications: %d sent, %d not", report.sent, report.failed)
+        return len(batch)
+
+    async def _pace(self, message: OutboxMessage) -> None:
+        if self._bucket.paused_until > self._send_by:
+            return  # _send hands it back rather than wait out the pause.
+        await self._pacer.wait(message.chat_id)
+        await self._bucket.acquire()
+
+    async def _send(self, message: OutboxMessage) -> Delivery:
+        now = time.monotonic()
+        if now > self._send_by or self._bucket.paused_until > self._send_by:
+            # A 429 paused the bucket past our lease. Waiting it out, the send could
+            # overlap another sender that has reclaimed the message, and it would go out
+            # twice. It goes back to the outbox instead, due when the pause ends, without
+            # counting as an attempt.
+            return Delivery(
+                ok=False,
+                retry_after=max(0.0, self._bucket.paused_until - now),
+                error="flood control outlasted the lease",
+            )
+        delivery = await self._notifier.deliver(
+            message.chat_id, message.text, message.reply_markup
+        )
+        if delivery.retry_after is not None:
+            # Flood control is per bot, not per chat: everything else would get a 429 too.
+            self._bucket.pause(delivery.retry_after)
+        return delivery
+
+    async def _record(
+        self, outbox: OutboxService, message: OutboxMessage, delivery: Delivery
+    ) -> None:
+        if delivery.ok:
+            metrics.inc("notifications_sent_total")
+            await outbox.mark_sent(message, commit=False)
+        elif delivery.retry_after is not None:
+            metrics.inc("notifications_rate_limited_total")
+            await outbox.retry_later(
+                message,
+                delivery.retry_after,
+                delivery.error or "429",
+                count_attempt=False,
+                commit=False,
+            )
+        elif delivery.permanent or message.attempts >= MAX_ATTEMPTS:
+            metrics.inc("notifications_failed_total")
+            await outbox.mark_failed(message, delivery.error or "failed", commit=False)
+        else:
+            metrics.inc("notifications_retried_total")
+            delay = backoff_delay(message.attempts, _RETRY_BASE_SECONDS, _RETRY_CAP_SECONDS, None)
+            await outbox.retry_later(message, delay, delivery.error or "failed", commit=False)
@@ -1,39 +1,159 @@
-"""Push notifications via Telegram Bot API (no aiogram dependency)."""
+"""Push notifications via Telegram Bot API (no aiogram dependency).
+
+The messages themselves are built here; they reach Telegram through the outbox
+(core/services/outbox.py) and the sender that drains it
+(api/services/notification_sender.py), never from inside a request.
+"""
 
 from __future__ import annotations
 
+import asyncio
 import logging
+import time
+from dataclasses import dataclass
+from uuid import UUID
 
 import httpx
 
+from core.metrics import metrics
+from core.services.ocr_resilience import LatencyTracker
+from core.services.outbox import Notification
+
 logger = logging.getLogger(__name__)
 
+# Bot API answers that will not change on a retry: the user blocked the bot, never
+# started it, or the chat is gone.
+_PERMANENT_STATUSES = frozenset({400, 403})
+
+# Idle pooled connections are closed after this, before the far side is likely to
+# drop them under us.
+_KEEPALIVE_SECONDS = 30.0
+
+
+@dataclass(frozen=True)
+class Delivery:
+    """What became of one sendMessage call."""
+
+    ok: bool
+    # Set on a 429: Telegram's own ``parameters.retry_after``, in seconds.
+    retry_after: float | None = None
+    # Retrying cannot help (see _PERMANENT_STATUSES).
+    permanent: bool = False
+    error: str | None = None
+
 
 class NotificationService:
-    """Sends Telegram messages via Bot API using httpx."""
+    """Sends Telegram messages via Bot API using httpx.
+
+    One per process (``app.state.notifier``), holding one client with a keep-alive pool.
+    Every call used to open its own ``httpx.AsyncClient`` and close it again, paying DNS,
+    TCP and a TLS handshake to api.telegram.org — more than the call itself — for each
+    message a settlement sent. *max_connections* also caps calls in flight: past it they
+    queue here rather than in the pool, where the wait would eat into their timeout.
+    """
 
-    def __init__(self, bot_token: str):
+    def __init__(
+        self,
+        bot_token: str,
+        *,
+        max_connections: int = 10,
+        timeout: float = 10,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
         self.bot_token = bot_token
         self.base_url = f"https://api.telegram.org/bot{bot_token}"
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=_KEEPALIVE_SECONDS,
+        )
+        self._timeout = timeout
+        self._transport = transport
+        self._http: httpx.AsyncClient | None = None
+        self._slots = asyncio.Semaphore(max_connections)
+        self._latency = LatencyTracker()
 
-    async def send_message(
+    def _client(self) -> httpx.AsyncClient:
+        # Created on first use, so that building the app (tests, scripts) opens nothing.
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                timeout=self._timeout, limits=self._limits, transport=self._transport
+            )
+        return self._http
+
+    async def aclose(self) -> None:
+        """Close the pooled connections (app shutdown)."""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _call(self, method: str, body: dict) -> httpx.Response:
+        """POST one Bot API *method*; raises like ``raise_for_status()`` and httpx do."""
+        async with self._slots:
+            started = time.perf_counter()
+            try:
+                response = await self._client().post(f"{self.base_url}/{method}", json=body)
+                response.raise_for_status()
+            except httpx.HTTPStatusError as exc:
+                outcome = str(exc.response.status_code)
+                raise
+            except asyncio.CancelledError:
+                # fan_out's per-recipient timeout, or shutdown. Counted like any other
+                # outcome, and the cancellation goes on up untouched.
+                outcome = "cancelled"
+                raise
+            except Exception as exc:
+                outcome = type(exc).__name__
+                raise
+            else:
+                outcome = "ok"
+                return response
+            finally:
+                elapsed = time.perf_counter() - started
+                metrics.inc("telegram_api_requests_total", method=method, outcome=outcome)
+                metrics.inc("telegram_api_request_seconds_total", elapsed, method=method)
+                if outcome == "ok":
+                    self._latency.record(elapsed)
+                    p95 = self._latency.p95()
+                    if p95 is not None:
+                        metrics.set("telegram_api_latency_p95_seconds", p95)
+
+    async def deliver(
         self,
         chat_id: int,
         text: str,
         reply_markup: dict | None = None,
-    ) -> bool:
-        """Send a message. Returns True on success, False on failure (never raises)."""
+    ) -> Delivery:
+        """Send a message and say what happened, in enough detail to schedule a retry."""
         payload: dict = {"chat_id": chat_id, "text": text, "parse_mode": "HTML"}
         if reply_markup:
             payload["reply_markup"] = reply_markup
         try:
-            async with httpx.AsyncClient(timeout=10) as client:
-                resp = await client.post(f"{self.base_url}/sendMessage", json=payload)
-                resp.raise_for_status()
-                return True
-        except Exception:
-            logger.warning("Failed to send notification to %s", chat_id, exc_info=True)
-            return False
+            await self._call("sendMessage", payload)
+            return Delivery(ok=True)
+        except httpx.HTTPStatusError as exc:
+            status = exc.response.status_code
+            description, retry_after = _error_details(exc.response)
+            if status == 429:
+                return Delivery(ok=False, retry_after=retry_after or 1.0, error=description)
+            return Delivery(
+                ok=False, permanent=status in _PERMANENT_STATUSES, error=f"{status} {description}"
+            )
+        except Exception as exc:
+            # Network trouble, a timeout: worth another try.
+            return Delivery(ok=False, error=repr(exc))
+
+    async def send_message(
+        self,
+        chat_id: int,
+        text: str,
+        reply_markup: dict | None = None,
+    ) -> bool:
+        """Send a message. Returns True on success, False on failure (never raises)."""
+        delivery = await self.deliver(chat_id, text, reply_markup)
+        if not delivery.ok and delivery.error:
+            logger.warning("Failed to send notification to %s: %s", chat_id, delivery.error)
+        return delivery.ok
 
     async def create_invoice_link(
         self,
@@ -51,60 +171,78 @@ class NotificationService:
             "prices": [{"label": title, "amount": stars}],
         }
         try:
-            async with httpx.AsyncClient(timeout=10) as client:
-                resp = await client.post(f"{self.base_url}/createInvoiceLink", json=body)
-                resp.raise_for_status()
-                return resp.json()["result"]
+            resp = await self._call("createInvoiceLink", body)
+            return resp.json()["result"]
         except Exception:
             logger.warning("createInvoiceLink failed", exc_info=True)
             return None
 
-    async def notify_settle(
-        self,
-        members: list[dict],
-        shares: dict[int, float],
-        currency: str,
-        webapp_url: str,
-        invite_code: str,
-    ) -> None:
-        """Notify all members about settlement with their personal share."""
-        for member in members:
-            uid = member["user_tg_id"]
-            share = shares.get(uid, 0)
-            text = f"Чек рассчитан! Ваша доля: {share:.0f} {currency}"
-            reply_markup = {
-                "inline_keyboard": [
-                    [
-                        {
-                            "text": "Посмотреть детали",
-                            # Direct client-side route, not ?startapp=: the frontend
-                            # never read that parameter, so the button used to dump
-                            # everyone on the home screen.
-                            "web_app": {"url": f"{webapp_url}/session/{invite_code}/settle"},
-                        }
-                    ]
-                ]
-            }
-            await self.send_message(uid, text, reply_markup)
 
-    async def notify_member_joined(
-        self,
-        admin_tg_id: int,
-        member_name: str,
-    ) -> None:
-        """Notify admin when a new member joins."""
-        text = f"{member_name} присоединился к чеку"
-        await self.send_message(admin_tg_id, text)
-
-    async def send_vote_reminder(
-        self,
-        user_tg_id: int,
-        webapp_url: str,
-        invite_code: str,
-    ) -> bool:
-        """Send a voting reminder to a member."""
-        text = "Не забудьте выбрать свои позиции в чеке!"
-        reply_markup = {
+def _error_details(response: httpx.Response) -> tuple[str, float | None]:
+    try:
+        body = response.json()
+    except ValueError:
+        return response.reason_phrase, None
+    retry_after = (body.get("parameters") or {}).get("retry_after")
+    return body.get("description", response.reason_phrase), retry_after
+
+
+def settle_messages(
+    session_id: UUID,
+    members: list[dict],
+    shares: dict[int, float],
+    currency: str,
+    webapp_url: str,
+    invite_code: str,
+) -> list[Notification]:
+    """Every member's personal share, once per session and member."""
+    reply_markup = {
+        "inline_keyboard": [
+            [
+                {
+                    "text": "Посмотреть детали",
+                    # Direct client-side route, not ?startapp=: the frontend never read
+                    # that parameter, so the button used to dump everyone on the home
+                    # screen.
+                    "web_app": {"url": f"{webapp_url}/session/{invite_code}/settle"},
+                }
+            ]
+        ]
+    }
+    notifications = []
+    for member in members:
+        uid = member["user_tg_id"]
+        share = shares.get(uid, 0)
+        notifications.append(
+            Notification(
+                chat_id=uid,
+                text=f"Чек рассчитан! Ваша доля: {share:.0f} {currency}",
+                reply_markup=reply_markup,
+                dedup_key=f"settle:{session_id}:{uid}",
+            )
+        )
+    return notifications
+
+
+def member_joined_message(
+    session_id: UUID, admin_tg_id: int, member_tg_id: int, member_name: str
+) -> Notification:
+    """Tell the admin someone joined — once per member, however often they rejoin."""
+    return Notification(
+        chat_id=admin_tg_id,
+        text=f"{member_name} присоединился к чеку",
+        dedup_key=f"joined:{session_id}:{member_tg_id}",
+    )
+
+
+def vote_reminder_message(
+    session_id: UUID, user_tg_id: int, webapp_url: str, invite_code: str, bucket: int
+) -> Notification:
+    """A voting reminder. *bucket* (a minute number, say) folds repeated taps into one."""
+    return Notification(
+        chat_id=user_tg_id,
+        text="Не забудьте выбрать свои позиции в чеке!",
+        reply_markup={
             "inline_keyboard": [
                 [
                     {
@@ -113,5 +251,6 @@ class NotificationService:
                     }
                 ]
             ]
-        }
-        return await self.send_message(user_tg_id, text, reply_markup)
+        },
+        dedup_key=f"remind:{session_id}:{user_tg_id}:{bucket}",
+    )
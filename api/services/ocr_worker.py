@@ -0,0 +1,275 @@
+"""Background OCR workers draining the ``ocr_jobs`` queue.
+
+POST /ocr only charges the scan and queues a job (see core/services/ocr_jobs.py); the
+recognition itself runs here, in a fixed number of asyncio tasks per API process. The
+pool bounds how many LLM calls this process has in flight, however many users press
+"scan" at once, and nothing about a job lives only in memory: a restart leaves the rows
+behind and the next claim resumes them.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections.abc import Callable
+from contextlib import AbstractAsyncContextManager
+from uuid import UUID
+
+import httpx
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.schemas import OcrItemOut, OcrResultOut
+from api.ws import EVENT_OCR_DONE, EVENT_OCR_FAILED, EVENT_OCR_PROGRESS, ConnectionManager
+from core.config import get_settings
+from core.db import get_async_session
+from core.metrics import metrics
+from core.services.ocr import OcrService
+from core.services.ocr_jobs import OcrJobService
+from core.services.ocr_resilience import CircuitOpenError
+from core.services.photo_store import Photo, close_photos
+from core.services.session import SessionService
+
+logger = logging.getLogger(__name__)
+
+# Hard ceiling on one recognition. It used to sit under nginx's proxy_read_timeout, when
+# the request waited for the result; now it bounds how long a worker slot can be held.
+_OCR_DEADLINE_SECONDS = 240
+
+# The lease outlives the deadline, so a live worker never loses its job to a reclaim.
+# Progress reports extend it; a worker that dies stops extending it, and the job becomes
+# claimable again once it runs out.
+_LEASE_SECONDS = _OCR_DEADLINE_SECONDS + 60
+
+# How often an idle worker looks for jobs queued by *another* process. Jobs queued by
+# this one wake the pool immediately (see wake()).
+_POLL_INTERVAL_SECONDS = 2.0
+
+# ocr_jobs_total outcome per failure status (see _process).
+_FAILURE_OUTCOMES = {
+    400: "no_photos",
+    422: "unreadable",
+    502: "provider_error",
+    503: "circuit_open",
+    504: "timeout",
+}
+
+SessionFactory = Callable[[], AbstractAsyncContextManager[AsyncSession]]
+
+
+class OcrWorkerPool:
+    """A fixed set of workers that claim OCR jobs and report over the WebSocket."""
+
+    def __init__(
+        self,
+        manager: ConnectionManager,
+        session_factory: SessionFactory | None = None,
+        *,
+        workers: int = 4,
+    ) -> None:
+        self._manager = manager
+        self._session_factory = session_factory
+        self._workers = workers
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        for n in range(self._workers):
+            self._tasks.append(asyncio.create_task(self._loop(), name=f"ocr-worker-{n}"))
+        logger.info("OCR workers started: %d", self._workers)
+
+    async def stop(self) -> None:
+        """Cancel the workers. Jobs they held stay leased and are resumed after restart."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def wake(self) -> None:
+        """Tell idle workers a job has just been queued."""
+        self._wakeup.set()
+
+    def _session(self) -> AbstractAsyncContextManager[AsyncSession]:
+        factory = self._session_factory or get_async_session()
+        return factory()
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                busy = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # The job stays leased and is retried once the lease runs out — the same
+                # path as a crashed process, up to MAX_ATTEMPTS and then refunded.
+                logger.exception("OCR worker iteration failed")
+                busy = False
+            if busy:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), _POLL_INTERVAL_SECONDS)
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def run_once(self) -> bool:
+        """Claim and process one job. Returns False when the queue was empty.
+
+        The job runs in three phases, and only the first and last touch the database.
+        The LLM call in the middle can take minutes; holding a pooled connection across
+        it meant DB_POOL_SIZE concurrent scans starved every other endpoint. Each phase
+        opens its own session, so nothing is checked out while the provider works —
+        progress reports borrow a connection for one UPDATE and give it straight back.
+        """
+        settings = get_settings()
+        async with self._session() as db:
+            job = await OcrJobService(db, settings.free_scans_per_month).claim(_LEASE_SECONDS)
+            if job is None:
+                return False
+            session_id = str(job.session_id)
+            job_id, token = job.id, job.claim_token
+            logger.info(
+                "OCR job %s claimed session=%s attempt=%d", job_id, session_id, job.attempts
+            )
+            # Mapped, not read: the photos are held for the whole recognition, and the
+            # provider streams them out a slice at a time (core/services/ocr_providers.py).
+            photos = await SessionService(db).open_photos(job.session_id)
+
+        try:
+            await self._process(session_id, job_id, token, photos)
+        finally:
+            close_photos(photos)
+        return True
+
+    async def _process(
+        self, session_id: str, job_id: UUID, token: UUID, photos_bytes: list[Photo]
+    ) -> None:
+        settings = get_settings()
+        if not photos_bytes:
+            await self._fail(
+                session_id,
+                job_id,
+                token,
+                400,
+                "No photos available for OCR. Try uploading again.",
+            )
+            return
+        total_photos = len(photos_bytes)
+
+        async def report_progress(completed: int, total: int) -> None:
+            async with self._session() as db:
+                jobs = OcrJobService(db, settings.free_scans_per_month)
+                await jobs.report_progress(job_id, token, completed, total, _LEASE_SECONDS)
+            await self._manager.broadcast(
+                session_id,
+                {
+                    "type": EVENT_OCR_PROGRESS,
+                    "data": {"job_id": str(job_id), "current": completed, "total": total},
+                },
+            )
+
+        ocr_service = OcrService.from_settings(settings)
+        try:
+            async with asyncio.timeout(_OCR_DEADLINE_SECONDS):
+                result = await ocr_service.parse_receipt(photos_bytes, on_progress=report_progress)
+        except TimeoutError:
+            logger.error(
+                "OCR timed out after %ss (%d photos)", _OCR_DEADLINE_SECONDS, total_photos
+            )
+            await self._fail(
+                session_id,
+                job_id,
+                token,
+                504,
+                "Recognition took too long. Try fewer photos.",
+            )
+            return
+        except CircuitOpenError:
+            # The provider has been failing for everyone; do not spend the deadline
+            # finding that out again. The refund goes out with the failure, right away.
+            logger.warning("OCR job %s failed fast: provider circuit is open", job_id)
+            await self._fail(
+                session_id,
+                job_id,
+                token,
+                503,
+                "Recognition service is unavailable. Try again in a minute.",
+            )
+            return
+        except httpx.HTTPError as exc:
+            logger.error("OCR provider error: %s", exc)
+            await self._fail(
+                session_id,
+                job_id,
+                token,
+                502,
+                "Recognition service is unavailable. Try again.",
+            )
+            return
+        except ValueError as exc:
+            logger.error("OCR failed: %s", exc)
+            await self._fail(
+                session_id,
+                job_id,
+                token,
+                422,
+                "Could not parse receipt. Try a clearer photo.",
+            )
+            return
+
+        if not result.items:
+            await self._fail(
+                session_id,
+                job_id,
+                token,
+                422,
+                "No items found on the receipt. Try a clearer photo.",
+            )
+            return
+
+        result_out = OcrResultOut(
+            items=[
+                OcrItemOut(name=i.name, price=float(i.price), quantity=i.quantity)
+                for i in result.items
+            ],
+            total=float(result.total),
+            currency=result.currency,
+            total_mismatch=result.total_mismatch,
+        )
+        async with self._session() as db:
+            jobs = OcrJobService(db, settings.free_scans_per_month)
+            delivered = await jobs.complete(job_id, token, result, result_out.model_dump())
+        if not delivered:
+            logger.warning("OCR job %s lost its lease before delivery, result dropped", job_id)
+            return
+        logger.info("OCR job %s done: %d items", job_id, len(result.items))
+        metrics.inc("ocr_jobs_total", outcome="done")
+        await self._manager.broadcast(
+            session_id,
+            {"type": EVENT_OCR_DONE, "data": {"job_id": str(job_id), **result_out.model_dump()}},
+        )
+
+    async def _fail(
+        self,
+        session_id: str,
+        job_id: UUID,
+        token: UUID,
+        status: int,
+        detail: str,
+    ) -> None:
+        async with self._session() as db:
+            jobs = OcrJobService(db, get_settings().free_scans_per_month)
+            failed = await jobs.fail(job_id, token, status, detail)
+        if not failed:
+            logger.warning(
+                "OCR job %s lost its lease before failing, left to its new owner", job_id
+            )
+            return
+        # Every failure refunds the scan it was charged (OcrJobService.fail()).
+        metrics.inc("ocr_jobs_total", outcome=_FAILURE_OUTCOMES.get(status, str(status)))
+        await self._manager.broadcast(
+            session_id,
+            {
+                "type": EVENT_OCR_FAILED,
+                "data": {"job_id": str(job_id), "status": status, "detail": detail},
+            },
+        )
@@ -0,0 +1,66 @@
+"""Periodic sweep of photo blobs that nothing references any more.
+
+A successful OCR releases its photos on the spot (OcrJobService.complete). Everything
+else that lets go of a blob does so without telling the store: the ON DELETE CASCADE
+from sessions, ``tools/db_cleanup.sh``, an upload whose transaction rolled back after
+the bytes were written. This task reclaims those, once an hour per API process; running
+in several processes at once is harmless, they just find less to do.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import AbstractAsyncContextManager
+from datetime import timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.services.ocr_worker import SessionFactory
+from core.db import get_async_session
+from core.services.photo_store import GC_GRACE, get_photo_store
+
+logger = logging.getLogger(__name__)
+
+_SWEEP_INTERVAL_SECONDS = 3600.0
+
+
+class PhotoSweeper:
+    def __init__(
+        self,
+        session_factory: SessionFactory | None = None,
+        *,
+        interval: float = _SWEEP_INTERVAL_SECONDS,
+        grace: timedelta = GC_GRACE,
+    ) -> None:
+        self._session_factory = session_factory
+        self._interval = interval
+        self._grace = grace
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._loop(), name="photo-sweeper")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _session(self) -> AbstractAsyncContextManager[AsyncSession]:
+        factory = self._session_factory or get_async_session()
+        return factory()
+
+    async def run_once(self) -> int:
+        async with self._session() as db:
+            return await get_photo_store().gc(db, self._grace)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Photo store sweep failed")
+            await asyncio.sleep(self._interval)
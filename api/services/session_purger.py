@@ -0,0 +1,137 @@
+"""Background deletion of sessions: cleared history and the retention policy.
+
+What is deleted and why in batches: core/services/retention.py. This task runs the
+batches — cleared history first, then sessions abandoned in ``created``, then old
+photo bytes — each kind until a batch comes back short, pausing between batches so
+that a backlog of thousands of sessions is a steady trickle of small transactions
+rather than a burst that competes with live traffic. It runs once per
+``interval`` and as soon as DELETE /api/sessions/history has marked something
+(:meth:`SessionPurger.wake`).
+
+Progress goes to the log after every batch and to /metrics: ``retention_deleted_total``
+by kind, and ``retention_pending_sessions``, the cleared sessions still waiting.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from contextlib import AbstractAsyncContextManager
+from dataclasses import dataclass
+from datetime import timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.services.ocr_worker import SessionFactory
+from core.db import get_async_session
+from core.metrics import metrics
+from core.services.photo_store import get_photo_store
+from core.services.retention import RetentionService
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PurgeReport:
+    """What one run deleted."""
+
+    history: int = 0
+    abandoned: int = 0
+    photos: int = 0
+
+
+class SessionPurger:
+    def __init__(
+        self,
+        session_factory: SessionFactory | None = None,
+        *,
+        batch_size: int = 100,
+        pause: float = 1.0,
+        interval: float = 3600.0,
+        abandoned_after: timedelta | None = None,
+        photos_after: timedelta | None = None,
+    ) -> None:
+        self._session_factory = session_factory
+        self._batch_size = batch_size
+        self._pause = pause
+        self._interval = interval
+        self._abandoned_after = abandoned_after
+        self._photos_after = photos_after
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._loop(), name="session-purger")
+
+    async def stop(self) -> None:
+        """Cancel the purger. A batch in flight rolls back; the next run redoes it."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def wake(self) -> None:
+        """Tell the purger sessions have just been marked for deletion."""
+        self._wakeup.set()
+
+    def _session(self) -> AbstractAsyncContextManager[AsyncSession]:
+        factory = self._session_factory or get_async_session()
+        return factory()
+
+    async def _drain(self, kind: str, batch: Callable[[AsyncSession], Awaitable[int]]) -> int:
+        """Run *batch* until it comes back short of a full batch; the total it did."""
+        total = 0
+        while True:
+            async with self._session() as db:
+                done = await batch(db)
+                pending = await RetentionService(db).pending_deletion()
+            total += done
+            metrics.set("retention_pending_sessions", pending)
+            if done:
+                metrics.inc("retention_deleted_total", done, kind=kind)
+                logger.info(
+                    "Retention %s: %d in this batch, %d this run, %d cleared sessions pending",
+                    kind,
+                    done,
+                    total,
+                    pending,
+                )
+            if done < self._batch_size:
+                return total
+            await asyncio.sleep(self._pause)
+
+    async def run_once(self) -> PurgeReport:
+        report = PurgeReport()
+        limit = self._batch_size
+        report.history = await self._drain(
+            "history", lambda db: RetentionService(db).purge_deleted(limit)
+        )
+        if self._abandoned_after is not None:
+            after = self._abandoned_after
+            report.abandoned = await self._drain(
+                "abandoned", lambda db: RetentionService(db).purge_abandoned(after, limit)
+            )
+        if self._photos_after is not None:
+            report.photos = await self._drain("photos", self._release_photos)
+        return report
+
+    async def _release_photos(self, db: AsyncSession) -> int:
+        keys = await RetentionService(db).release_old_photos(self._photos_after, self._batch_size)
+        if keys:
+            await get_photo_store().release(db, keys)
+        return len(keys)
+
+    async def _loop(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Session purge failed")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._interval)
+            except TimeoutError:
+                pass
@@ -0,0 +1,145 @@
+"""The session document of GET /api/sessions/{id} and /invite/{code}, read as plain rows.
+
+These two are the most frequent reads of the Mini App — every screen refetches the
+session after a WebSocket event — and they used to load the whole ORM graph
+(``lazy="selectin"`` photos, items, votes, members), validate it into ``SessionOut``
+with ``from_attributes`` and serialise that again. Here the same five statements select
+only the columns the response has, and the rows become the response's dicts directly;
+api/responses.py encodes them. ``SessionOut`` remains the declared response model and
+the document is the same, field for field (tests/test_api/test_session_view.py).
+
+GET /shares reads through here too: its calculator input is the same rows.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any
+from uuid import UUID
+
+from sqlalchemy import Row, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.models.session import ItemVote, Session, SessionItem, SessionMember, SessionPhoto
+
+
+@dataclass
+class SessionRows:
+    session: Row
+    photos: list[Row]
+    items: list[Row]
+    votes: list[Row]
+    members: list[Row]
+
+    def has_member(self, user_tg_id: int) -> bool:
+        return any(m.user_tg_id == user_tg_id for m in self.members)
+
+    def calculator_items(self) -> list[dict]:
+        """Items in the shape core/services/calculator.py takes."""
+        votes: dict[UUID, dict[int, int]] = {item.id: {} for item in self.items}
+        for vote in self.votes:
+            votes[vote.item_id][vote.user_tg_id] = vote.quantity
+        return [
+            {"price": Decimal(item.price), "quantity": item.quantity, "votes": votes[item.id]}
+            for item in self.items
+        ]
+
+
+async def load_session_rows(
+    db: AsyncSession, *, session_id: UUID | str | None = None, invite_code: str | None = None
+) -> SessionRows | None:
+    """The session with *session_id* or *invite_code*; None if missing or being deleted."""
+    if isinstance(session_id, str):
+        session_id = UUID(session_id)
+    condition = (
+        Session.id == session_id if session_id is not None else Session.invite_code == invite_code
+    )
+    session = (
+        await db.execute(
+            select(
+                Session.id,
+                Session.admin_tg_id,
+                Session.invite_code,
+                Session.status,
+                Session.currency,
+                Session.tip_percent,
+                Session.created_at,
+                Session.closed_at,
+            ).where(condition, Session.deleted_at.is_(None))
+        )
+    ).one_or_none()
+    if session is None:
+        return None
+
+    photos = await db.execute(
+        select(SessionPhoto.id, SessionPhoto.tg_file_id, SessionPhoto.created_at).where(
+            SessionPhoto.session_id == session.id
+        )
+    )
+    items = await db.execute(
+        select(SessionItem.id, SessionItem.name, SessionItem.price, SessionItem.quantity).where(
+            SessionItem.session_id == session.id
+        )
+    )
+    votes = await db.execute(
+        select(ItemVote.id, ItemVote.item_id, ItemVote.user_tg_id, ItemVote.quantity)
+        .join(SessionItem, SessionItem.id == ItemVote.item_id)
+        .where(SessionItem.session_id == session.id)
+    )
+    members = await db.execute(
+        select(
+            SessionMember.id,
+            SessionMember.user_tg_id,
+            SessionMember.display_name,
+            SessionMember.tip_percent,
+            SessionMember.confirmed,
+            SessionMember.joined_at,
+        ).where(SessionMember.session_id == session.id)
+    )
+    return SessionRows(session, photos.all(), items.all(), votes.all(), members.all())
+
+
+def session_document(rows: SessionRows) -> dict[str, Any]:
+    """*rows* as the ``SessionOut`` JSON document."""
+    votes_by_item: dict[UUID, list[dict]] = {item.id: [] for item in rows.items}
+    for v in rows.votes:
+        votes_by_item[v.item_id].append(
+            {"id": v.id, "item_id": v.item_id, "user_tg_id": v.user_tg_id, "quantity": v.quantity}
+        )
+    s = rows.session
+    return {
+        "id": s.id,
+        "admin_tg_id": s.admin_tg_id,
+        "invite_code": s.invite_code,
+        "status": s.status,
+        "currency": s.currency,
+        "tip_percent": s.tip_percent,
+        "created_at": s.created_at,
+        "closed_at": s.closed_at,
+        "photos": [
+            {"id": p.id, "tg_file_id": p.tg_file_id, "created_at": p.created_at}
+            for p in rows.photos
+        ],
+        "items": [
+            {
+                "id": i.id,
+                "name": i.name,
+                "price": float(i.price),
+                "quantity": i.quantity,
+                "votes": votes_by_item[i.id],
+            }
+            for i in rows.items
+        ],
+        "members": [
+            {
+                "id": m.id,
+                "user_tg_id": m.user_tg_id,
+                "display_name": m.display_name,
+                "tip_percent": m.tip_percent,
+                "confirmed": m.confirmed,
+                "joined_at": m.joined_at,
+            }
+            for m in rows.members
+        ],
+    }
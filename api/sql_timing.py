@@ -0,0 +1,164 @@
+"""Per-request SQL statistics: a Server-Timing header and a log of requests over budget.
+
+N+1 regressions used to surface only where someone had written a ``count_queries``
+test for the endpoint (tests/test_api/test_query_counts.py). With
+``SQL_INSTRUMENTATION=true`` every HTTP request counts its statements and their time
+on the engine from core/db.py, and
+
+* answers with ``Server-Timing: db;dur=<ms>;desc="<n> statements", db-slowest;dur=<ms>``,
+  which the browser's network panel shows next to the request;
+* logs a warning when it ran more than ``SQL_LOG_MAX_STATEMENTS`` statements or took
+  longer than ``SQL_LOG_SLOW_MS``, naming the slowest and the most repeated statement
+  by fingerprint — the SQL with its literals and IN lists folded, so that the same
+  query with different ids reads the same.
+
+Off by default: two listeners on every cursor execute are cheap, not free.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Fingerprints are for reading in a log line; past this they are cut.
+_FINGERPRINT_MAX_CHARS = 300
+
+
+@dataclass
+class RequestSql:
+    """What one request asked of the database."""
+
+    statements: int = 0
+    seconds: float = 0.0
+    slowest_seconds: float = 0.0
+    slowest: str | None = None
+    # Raw statement text → executions. Compiled statements are cached, so a repeated
+    # query is the same string and counting it costs a dict lookup.
+    executed: Counter[str] = field(default_factory=Counter)
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.statements += 1
+        self.seconds += seconds
+        self.executed[statement] += 1
+        if seconds >= self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest = statement
+
+    def most_repeated(self) -> tuple[str, int] | None:
+        return self.executed.most_common(1)[0] if self.executed else None
+
+
+# Set by the middleware for the length of a request. SQLAlchemy runs the listeners in a
+# greenlet that shares the request task's context, so they see it.
+_current: ContextVar[RequestSql | None] = ContextVar("request_sql", default=None)
+
+_LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    # asyncpg's $1, psycopg's %(name)s, named :name (not a ::cast), expanding IN.
+    (re.compile(r"\$\d+|%\(\w+\)s|(?<!:):\w+|__\[POSTCOMPILE_\w+\]"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(...)"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+def fingerprint(statement: str) -> str:
+    """*statement* with literals, placeholders and IN lists folded, whitespace collapsed."""
+    for pattern, replacement in _LITERALS:
+        statement = pattern.sub(replacement, statement)
+    statement = statement.strip()
+    if len(statement) > _FINGERPRINT_MAX_CHARS:
+        statement = statement[: _FINGERPRINT_MAX_CHARS - 1] + "…"
+    return statement
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("sql_timing_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = conn.info.get("sql_timing_started")
+    if stats is not None and started:
+        stats.record(statement, time.perf_counter() - started.pop())
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Time every statement *engine* (a sync engine: ``AsyncEngine.sync_engine``) runs."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class SqlTimingMiddleware:
+    """Collects :class:`RequestSql` per HTTP request; see the module docstring.
+
+    A plain ASGI middleware rather than ``BaseHTTPMiddleware``: the header has to go
+    into ``http.response.start`` as it passes, and the context variable has to be set in
+    the task that runs the endpoint.
+    """
+
+    def __init__(self, app: ASGIApp, *, max_statements: int, slow_ms: float) -> None:
+        self.app = app
+        self.max_statements = max_statements
+        self.slow_ms = slow_ms
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestSql()
+        token = _current.set(stats)
+        started = time.perf_counter()
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", _server_timing(stats).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            self._log_if_over_budget(scope, stats, time.perf_counter() - started)
+
+    def _log_if_over_budget(self, scope: Scope, stats: RequestSql, elapsed: float) -> None:
+        if stats.statements <= self.max_statements and elapsed * 1000 <= self.slow_ms:
+            return
+        route = scope.get("route")
+        path = getattr(route, "path", None) or scope["path"]
+        repeated = stats.most_repeated()
+        logger.warning(
+            "%s %s over budget: %d statements, %.1f ms in the database, %.1f ms in all; "
+            "slowest %.1f ms: %s; most repeated ×%d: %s",
+            scope["method"],
+            path,
+            stats.statements,
+            stats.seconds * 1000,
+            elapsed * 1000,
+            stats.slowest_seconds * 1000,
+            fingerprint(stats.slowest) if stats.slowest else "-",
+            repeated[1] if repeated else 0,
+            fingerprint(repeated[0]) if repeated else "-",
+        )
+
+
+def _server_timing(stats: RequestSql) -> str:
+    return (
+        f'db;dur={stats.seconds * 1000:.1f};desc="{stats.statements} statements", '
+        f"db-slowest;dur={stats.slowest_seconds * 1000:.1f}"
+    )
@@ -0,0 +1,146 @@
+"""Receipt photos streamed from a multipart body straight into the photo store.
+
+``list[UploadFile]`` made Starlette parse the whole form before the route ran: every
+file was spooled (in memory up to 1 MB, then to a temporary file), and the route then
+read each one back whole with ``await f.read()`` — a batch of five photos was 25 MB
+per request before the 5 MB limit was even looked at, and an oversized file was
+accepted in full only to be refused.
+
+Here the body is parsed as it arrives. Each file part goes chunk by chunk into a
+:class:`~core.services.photo_store.BlobWriter`, which hashes it as it goes; a part that
+would cross the size limit, or one file too many, stops the parse on the spot. What is
+held in memory is one network chunk, whatever the size of the batch.
+"""
+
+from __future__ import annotations
+
+from fastapi import Request
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from core.services.photo_store import BlobWriter, PhotoStore
+
+
+class UploadError(Exception):
+    """The body was refused; the route decides how to answer."""
+
+
+class PhotoTooLarge(UploadError):
+    def __init__(self, filename: str) -> None:
+        super().__init__(filename)
+        self.filename = filename
+
+
+class TooManyPhotos(UploadError):
+    pass
+
+
+class MalformedUpload(UploadError):
+    pass
+
+
+class _PhotoParts:
+    """MultipartParser callbacks: file parts of *field* become blob writers."""
+
+    def __init__(self, store: PhotoStore, field: str, max_size: int, max_files: int) -> None:
+        self._store = store
+        self._field = field.encode()
+        self._max_size = max_size
+        self._max_files = max_files
+        self.photos: list[BlobWriter] = []
+        self.complete = False
+        self._current: BlobWriter | None = None
+        self._filename = ""
+        self._headers: dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_end": self.on_end,
+        }
+
+    def on_part_begin(self) -> None:
+        self._current = None
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _disposition, options = parse_options_header(self._headers.get(b"content-disposition"))
+        # Other fields, and values without a filename, are not photos; their bytes are
+        # skipped as they pass rather than collected.
+        if options.get(b"name") != self._field or b"filename" not in options:
+            return
+        if len(self.photos) == self._max_files:
+            raise TooManyPhotos()
+        self._filename = options[b"filename"].decode("utf-8", "replace")
+        self._current = self._store.writer()
+        self.photos.append(self._current)
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._current is None:
+            return
+        # Checked before the write: not one byte past the limit reaches the store.
+        if self._current.size + (end - start) > self._max_size:
+            raise PhotoTooLarge(self._filename)
+        self._current.write(data[start:end])
+
+    def on_part_end(self) -> None:
+        self._current = None
+
+    def on_end(self) -> None:
+        self.complete = True
+
+
+async def receive_photos(
+    request: Request,
+    store: PhotoStore,
+    *,
+    field: str = "files",
+    max_size: int,
+    max_files: int,
+) -> list[BlobWriter]:
+    """Stream the files of *field* into *store*, in the order they were sent.
+
+    The returned writers are not saved: the caller saves them inside the transaction
+    that records the photos, and aborts them if that fails. On any error here — a
+    refusal, a malformed body, the client going away — they are aborted already.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type"))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise MalformedUpload("expected a multipart/form-data body")
+
+    parts = _PhotoParts(store, field, max_size, max_files)
+    parser = MultipartParser(boundary, parts.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+        if not parts.complete:
+            raise MalformedUpload("the multipart body ends early")
+    except MultipartParseError as exc:
+        for writer in parts.photos:
+            writer.abort()
+        raise MalformedUpload(str(exc)) from exc
+    except BaseException:
+        for writer in parts.photos:
+            writer.abort()
+        raise
+    return parts.photos
@@ -3,9 +3,12 @@
 from __future__ import annotations
 
 import logging
+import time
 
 from fastapi import WebSocket
 
+from core.metrics import metrics
+
 logger = logging.getLogger(__name__)
 
 # Event type constants
@@ -17,6 +20,8 @@ EVENT_TIP_CHANGED = "tip_changed"
 EVENT_SESSION_STATUS = "session_status"
 EVENT_ITEMS_UPDATED = "items_updated"
 EVENT_OCR_PROGRESS = "ocr_progress"
+EVENT_OCR_DONE = "ocr_done"
+EVENT_OCR_FAILED = "ocr_failed"
 
 
 class ConnectionManager:
@@ -24,11 +29,17 @@ class ConnectionManager:
 
     def __init__(self) -> None:
         self._connections: dict[str, set[WebSocket]] = {}
+        # Kept alongside rather than summed over _connections on every change.
+        self._total = 0
 
     async def connect(self, session_id: str, websocket: WebSocket) -> None:
         """Accept and register a WebSocket connection for a session."""
         await websocket.accept()
-        self._connections.setdefault(session_id, set()).add(websocket)
+        connections = self._connections.setdefault(session_id, set())
+        if websocket not in connections:
+            connections.add(websocket)
+            self._total += 1
+            self._publish()
         logger.info(
             "WS connected: session=%s, total=%d",
             session_id,
@@ -37,21 +48,37 @@ class ConnectionManager:
 
     def disconnect(self, session_id: str, websocket: WebSocket) -> None:
         """Remove a WebSocket connection."""
-        if session_id in self._connections:
-            self._connections[session_id].discard(websocket)
-            if not self._connections[session_id]:
-                del self._connections[session_id]
+        connections = self._connections.get(session_id)
+        # A connection whose send failed is dropped by broadcast() and again when its
+        # receive loop ends: only the first counts.
+        if connections is None or websocket not in connections:
+            return
+        connections.discard(websocket)
+        self._total -= 1
+        if not connections:
+            del self._connections[session_id]
+        self._publish()
 
     async def broadcast(self, session_id: str, event: dict) -> None:
         """Send an event to all connected clients in a session."""
         connections = self._connections.get(session_id, set()).copy()
+        started = time.perf_counter()
+        sent = 0
         for ws in connections:
             try:
                 await ws.send_json(event)
+                sent += 1
             except Exception:
                 logger.warning("WS send failed, disconnecting")
+                metrics.inc("ws_send_failures_total")
                 self.disconnect(session_id, ws)
+        metrics.inc("ws_messages_sent_total", sent, event=event.get("type"))
+        metrics.observe("ws_broadcast_seconds", time.perf_counter() - started)
 
     def get_connection_count(self, session_id: str) -> int:
         """Return the number of active connections for a session."""
         return len(self._connections.get(session_id, set()))
+
+    def _publish(self) -> None:
+        metrics.set("ws_connections", self._total)
+        metrics.set("ws_sessions", len(self._connections))
@@ -0,0 +1,44 @@
+"""Helpers shared by the benchmark scripts."""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import math
+import time
+from urllib.parse import urlencode
+
+BENCH_BOT_TOKEN = "1234567890:bench-token-not-for-production"
+
+
+def init_data(user_id: int, bot_token: str = BENCH_BOT_TOKEN, first_name: str = "Bench") -> str:
+    """A validly signed Telegram Mini App initData string, as the client would send it."""
+    params = {
+        "user": json.dumps({"id": user_id, "first_name": first_name}, separators=(",", ":")),
+        "auth_date": str(int(time.time())),
+        "query_id": f"bench-{user_id}",
+    }
+    data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(params.items()))
+    secret_key = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    params["hash"] = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(params)
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """Nearest-rank percentile; 0 for an empty sample."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def latency_summary(samples: list[float]) -> dict[str, float]:
+    """p50/p95/p99/max in milliseconds."""
+    return {
+        "p50_ms": round(percentile(samples, 50) * 1000, 1),
+        "p95_ms": round(percentile(samples, 95) * 1000, 1),
+        "p99_ms": round(percentile(samples, 99) * 1000, 1),
+        "max_ms": round(max(samples, default=0) * 1000, 1),
+    }
@@ -0,0 +1,76 @@
+"""Cost of authenticating one request: initData cold, initData remembered, a token.
+
+Every API request and WebSocket connect carries the Mini App's credentials. Three ways
+of turning them into a user are timed for the same users:
+
+* ``cold`` — what each request used to pay: parse the query string, derive the secret
+  key, HMAC the data-check string, decode the user JSON (the cache is emptied first);
+* ``remembered`` — initData seen before: one dictionary lookup in ``api.auth``'s cache
+  of validated strings;
+* ``token`` — the bearer token from POST /api/auth/token the Mini App now sends instead:
+  one HMAC over ~100 bytes and a constant-time compare.
+
+    uv run python -m bench.auth
+    uv run python -m bench.auth --users 1000 --rounds 20 --json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+from bench._common import BENCH_BOT_TOKEN, init_data
+
+
+def _time(strings: list[str], rounds: int, mode: str) -> float:
+    """Mean seconds per authentication over *rounds* passes through *strings*."""
+    from api.auth import (
+        _secret_key,
+        _validated,
+        authenticate_init_data,
+        issue_token,
+        verify_token,
+    )
+
+    _validated.clear()
+    _secret_key.cache_clear()
+    if mode == "token":
+        strings = [issue_token(s, BENCH_BOT_TOKEN, 3600)[0] for s in strings]
+        authenticate = verify_token
+    else:
+        authenticate = authenticate_init_data
+    for s in strings:
+        authenticate(s, BENCH_BOT_TOKEN)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for s in strings:
+            if mode == "cold":
+                _validated.clear()
+                _secret_key.cache_clear()
+            authenticate(s, BENCH_BOT_TOKEN)
+    return (time.perf_counter() - started) / (rounds * len(strings))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=500, help="distinct initData strings")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    strings = [init_data(user_id) for user_id in range(1, args.users + 1)]
+    reports = [
+        {"mode": mode, "us_per_request": round(_time(strings, args.rounds, mode) * 1e6, 2)}
+        for mode in ("cold", "remembered", "token")
+    ]
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+    print(f"{args.users} users × {args.rounds} rounds")
+    for r in reports:
+        print(f"  {r['mode']:<10} {r['us_per_request']:>8} µs/request")
+
+
+if __name__ == "__main__":
+    main()
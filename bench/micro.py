@@ -0,0 +1,242 @@
+"""Microbenchmarks of the pure-CPU code every settle and every scan runs, with a baseline.
+
+Timed over generated inputs from a three-dish snack to a 500-line, 50-guest banquet:
+
+* ``calculate_shares`` and ``calculate_user_share`` — the latter once per member, as
+  POST /settle calls it for the breakdown;
+* ``OcrService._merge_results`` — a receipt photographed in overlapping parts;
+* ``OcrService._parse_llm_response`` — the model's reply in code fences;
+* ``OcrService._try_repair_json`` — the same reply cut off by max_tokens.
+
+Each case is the best of ``--repeat`` runs of as many calls as fill ~0.2 s. Absolute
+times depend on the machine, so every result is also expressed in *units*: multiples of
+a fixed calibration workload (Decimal arithmetic and dict updates, the same kind of work)
+timed alongside it. The baseline compares units, which carry over between a
+laptop and a CI runner far better than microseconds do.
+
+    uv run python -m bench.micro                  # print the table
+    uv run python -m bench.micro --check          # exit 1 on a regression past --threshold
+    uv run python -m bench.micro --save           # rewrite bench/micro_baseline.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import timeit
+from collections.abc import Callable
+from decimal import Decimal
+from pathlib import Path
+
+BASELINE = Path(__file__).with_name("micro_baseline.json")
+
+# (name, dishes, members, photos). Five photos is the most a scan takes.
+SIZES = [
+    ("tiny", 3, 2, 1),
+    ("table", 15, 6, 1),
+    ("party", 80, 20, 2),
+    ("banquet", 500, 50, 5),
+]
+
+# Lines printed on two consecutive photos of one receipt.
+OVERLAP_LINES = 3
+
+_WORDS = [
+    "Пицца", "Маргарита", "Том", "Ям", "Лимонад", "Паста", "Карбонара", "Цезарь",
+    "Борщ", "Салат", "Греческий", "Стейк", "Рибай", "Чай", "Чёрный", "Эспрессо",
+    "Тирамису", "Хинкали", "Хачапури", "Сырный", "Суп", "Грибной", "Морс", "Пиво",
+]  # fmt: skip
+
+
+def _dish_name(rng: random.Random, index: int) -> str:
+    return f"{' '.join(rng.sample(_WORDS, 2))} {index}"
+
+
+def make_items(rng: random.Random, dishes: int, members: int) -> list[dict]:
+    """Items in the shape POST /settle builds: price, quantity, {member: claimed}."""
+    guests = list(range(1, members + 1))
+    items = []
+    for _ in range(dishes):
+        quantity = rng.choice((1, 1, 1, 2, 3, 4))
+        votes: dict[int, int] = {}
+        for guest in rng.sample(guests, min(len(guests), rng.randint(1, 4))):
+            left = quantity - sum(votes.values())
+            if left == 0:
+                break
+            votes[guest] = rng.randint(1, left)
+        items.append(
+            {"price": Decimal(rng.randrange(90, 3000, 10)), "quantity": quantity, "votes": votes}
+        )
+    return items
+
+
+def make_receipt(rng: random.Random, dishes: int) -> dict:
+    """The JSON a vision model returns for one receipt of *dishes* lines."""
+    items = [
+        {
+            "name": _dish_name(rng, i),
+            "price": rng.randrange(90, 3000, 10),
+            "quantity": rng.choice((1, 1, 2)),
+        }
+        for i in range(dishes)
+    ]
+    return {"items": items, "total": sum(i["price"] for i in items), "currency": "RUB"}
+
+
+def make_photo_results(rng: random.Random, dishes: int, photos: int) -> list:
+    """One receipt cut into *photos* parts that overlap by OVERLAP_LINES lines."""
+    from core.services.ocr import OcrItem, OcrResult
+
+    lines = [
+        OcrItem(name=i["name"], price=Decimal(i["price"]), quantity=i["quantity"])
+        for i in make_receipt(rng, dishes)["items"]
+    ]
+    size = -(-len(lines) // photos)
+    results = []
+    for k in range(photos):
+        start = max(0, k * size - (OVERLAP_LINES if k else 0))
+        part = lines[start : (k + 1) * size]
+        # Every part but the last shows at most a running subtotal.
+        subtotal = sum(line.price for line in lines[: (k + 1) * size])
+        results.append(OcrResult(items=part, total=subtotal, currency="RUB"))
+    return results
+
+
+def cases(seed: int) -> dict[str, Callable[[], object]]:
+    """Benchmark name → a zero-argument call over inputs built once, up front."""
+    from core.services.calculator import calculate_shares, calculate_user_share
+    from core.services.ocr import OcrService
+
+    out: dict[str, Callable[[], object]] = {}
+    for name, dishes, members, photos in SIZES:
+        rng = random.Random(f"{seed}-{name}")
+        items = make_items(rng, dishes, members)
+        tips = {m: rng.choice((0, 5, 10, 15)) for m in range(1, members + 1, 2)}
+        guests = list(range(1, members + 1))
+        results = make_photo_results(rng, dishes, photos)
+        reply = json.dumps(make_receipt(rng, dishes), ensure_ascii=False)
+        fenced = f"```json\n{reply}\n```"
+        # Cut inside the last item, the way max_tokens cuts a long receipt.
+        truncated = reply[: reply.rfind('{"name"') + 20]
+
+        out[f"calculate_shares/{name}"] = lambda i=items, t=tips: calculate_shares(i, 10, t)
+        out[f"calculate_user_share×members/{name}"] = lambda i=items, g=guests: [
+            calculate_user_share(i, uid, 10) for uid in g
+        ]
+        out[f"merge_results/{name}"] = lambda r=results: OcrService._merge_results(r)
+        out[f"parse_llm_response/{name}"] = lambda f=fenced: OcrService._parse_llm_response(f, {})
+        out[f"try_repair_json/{name}"] = lambda t=truncated: OcrService._try_repair_json(t)
+    return out
+
+
+def _calibration() -> None:
+    """Fixed reference work: Decimal arithmetic into a dict, as the calculator does."""
+    totals: dict[int, Decimal] = {}
+    price = Decimal("123.45")
+    for i in range(200):
+        totals[i % 17] = totals.get(i % 17, Decimal(0)) + price / Decimal(i % 3 + 1)
+
+
+def measure(call: Callable[[], object], unit: timeit.Timer, unit_number: int, repeat: int):
+    """Best seconds per call and per calibration run, interleaved *repeat* times.
+
+    The calibration is timed next to every case rather than once per process: on a
+    shared runner the speed of the machine drifts within a run, and a unit measured a
+    minute earlier would turn that drift into a regression.
+    """
+    timer = timeit.Timer(call)
+    number, _ = timer.autorange()
+    best = best_unit = float("inf")
+    for _ in range(repeat):
+        best = min(best, timer.timeit(number) / number)
+        best_unit = min(best_unit, unit.timeit(unit_number) / unit_number)
+    return best, best_unit
+
+
+def run(args: argparse.Namespace) -> dict:
+    import logging
+
+    # _try_repair_json logs a warning per repaired reply; thousands of them would time
+    # the logging, not the repair.
+    logging.disable(logging.WARNING)
+    unit = timeit.Timer(_calibration)
+    unit_number, _ = unit.autorange()
+    results = {}
+    units = []
+    for name, call in cases(args.seed).items():
+        if args.only and not any(part in name for part in args.only):
+            continue
+        seconds, unit_seconds = measure(call, unit, unit_number, args.repeat)
+        units.append(unit_seconds)
+        results[name] = {
+            "us": round(seconds * 1e6, 2),
+            "units": round(seconds / unit_seconds, 4),
+        }
+    return {
+        "python": ".".join(map(str, sys.version_info[:3])),
+        "calibration_us": round(statistics.median(units) * 1e6, 2) if units else None,
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list[str]:
+    """Cases slower than the baseline by more than *threshold*, in calibration units."""
+    regressions = []
+    for name, now in report["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        ratio = now["units"] / before["units"]
+        if ratio > 1 + threshold:
+            regressions.append(f"{name}: {before['units']} → {now['units']} units (×{ratio:.2f})")
+    return regressions
+
+
+def _print_report(report: dict, baseline: dict | None) -> None:
+    print(f"Python {report['python']}, calibration ~{report['calibration_us']} µs = 1 unit")
+    for name, r in report["results"].items():
+        line = f"  {name:<44} {r['us']:>11} µs {r['units']:>10} units"
+        before = baseline["results"].get(name) if baseline else None
+        if before:
+            line += f"   ×{r['units'] / before['units']:.2f} vs baseline"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", help="run the cases whose name contains any")
+    parser.add_argument("--check", action="store_true", help="fail on a regression")
+    parser.add_argument(
+        "--threshold", type=float, default=0.3, help="allowed slowdown, 0.3 = 30%%"
+    )
+    parser.add_argument("--save", action="store_true", help=f"write {BASELINE.name}")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = run(args)
+    baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else None
+    if args.save:
+        BASELINE.write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n")
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        _print_report(report, baseline)
+
+    if args.check:
+        if baseline is None:
+            sys.exit(f"no baseline at {BASELINE}; run with --save first")
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\nslower than the baseline by more than {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
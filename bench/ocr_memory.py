@@ -0,0 +1,213 @@
+"""Peak memory of the OCR path for one scan of large photos.
+
+Stores N photos of M MB in a file-backed photo store, then runs the worker's half of a
+scan — load the session's photos, send each to a chat-completions provider — and
+reports how much the process grew. The provider is real (ChatCompletionsProvider) but
+its transport drains the request body and answers with a fixed receipt, so no network
+is needed and nothing on the receiving side holds the body.
+
+Two ways of loading and sending are compared, each in a fresh interpreter so that one
+run's peak does not hide the other's:
+
+* ``streamed`` — the current path: photos mapped by PhotoStore.open(), the JSON body
+  streamed around them with the base64 produced a slice at a time;
+* ``buffered`` — the path it replaced: PhotoStore.get() reads every photo onto the
+  heap, and each request is built with ``json=`` around ``b64encode(photo).decode()``.
+
+    uv run python -m bench.ocr_memory
+    uv run python -m bench.ocr_memory --photos 5 --photo-mb 5 --json
+
+RSS growth is read from ``ru_maxrss`` against the RSS before the scan (Linux, /proc).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import httpx
+
+_STUB_REPLY = {
+    "choices": [
+        {
+            "message": {
+                "content": json.dumps(
+                    {
+                        "items": [{"name": "Пицца", "price": 650, "quantity": 1}],
+                        "total": 650,
+                        "currency": "RUB",
+                    },
+                    ensure_ascii=False,
+                )
+            }
+        }
+    ]
+}
+
+
+class _DrainTransport(httpx.AsyncBaseTransport):
+    """Reads the request body chunk by chunk and throws it away, like a socket would."""
+
+    def __init__(self) -> None:
+        self.bytes_sent = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        async for chunk in request.stream:
+            self.bytes_sent += len(chunk)
+        return httpx.Response(200, json=_STUB_REPLY)
+
+
+def _rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _max_rss_bytes() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def _measure(args: argparse.Namespace) -> dict:
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+    from core.models.base import Base
+    from core.services.ocr import OcrService
+    from core.services.ocr_providers import ChatCompletionsProvider, ProviderReply
+    from core.services.ocr_resilience import CircuitBreaker, LatencyTracker
+    from core.services.photo_store import FsPhotoStore, close_photos
+    from core.services.session import SessionService
+
+    class BufferedProvider(ChatCompletionsProvider):
+        """The request as it was built before the body was streamed."""
+
+        async def complete(self, photo) -> ProviderReply:
+            b64 = base64.b64encode(photo).decode()
+            content = [
+                {"type": "text", "text": "Parse this receipt:"},
+                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}"}},
+            ]
+            async with httpx.AsyncClient(transport=self._transport) as client:
+                response = await client.post(
+                    self._url,
+                    json={
+                        "model": self._model,
+                        "max_tokens": 4096,
+                        "messages": [{"role": "user", "content": content}],
+                    },
+                )
+            body = response.json()
+            return ProviderReply(body["choices"][0]["message"]["content"], body)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp}/bench.db")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        store = FsPhotoStore(f"{tmp}/photos")
+        factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+        async with factory() as db:
+            svc = SessionService(db, store)
+            session = await svc.create_session(admin_tg_id=1, admin_display_name="Bench")
+            keys = []
+            for _ in range(args.photos):
+                # Written a slice at a time, so setting up does not raise the peak itself.
+                writer = store.writer()
+                for _ in range(args.photo_mb * 16):
+                    writer.write(os.urandom(64 * 1024))
+                keys.append(await writer.save(db))
+            await svc.add_photos(session.id, [(f"bench-{n}", k) for n, k in enumerate(keys)])
+
+        transport = _DrainTransport()
+        provider_cls = ChatCompletionsProvider if args.mode == "streamed" else BufferedProvider
+        provider = provider_cls("bench", "bench", transport=transport)
+        ocr = OcrService(
+            provider=provider, retries=0, breaker=CircuitBreaker(), latency=LatencyTracker()
+        )
+
+        rss_before = _rss_bytes()
+        tracemalloc.start()
+        started = time.perf_counter()
+        async with factory() as db:
+            svc = SessionService(db, store)
+            if args.mode == "streamed":
+                photos = await svc.open_photos(session.id)
+            else:
+                photos = await svc.get_photo_bytes(session.id)
+        try:
+            result = await ocr.parse_receipt(photos)
+        finally:
+            close_photos(photos)
+        elapsed = time.perf_counter() - started
+        _current, heap_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss_peak = _max_rss_bytes()
+        await engine.dispose()
+
+    assert len(result.items) == 1
+    mb = 1024 * 1024
+    return {
+        "mode": args.mode,
+        "photos": args.photos,
+        "photo_mb": args.photo_mb,
+        "sent_mb": round(transport.bytes_sent / mb, 1),
+        "elapsed_ms": round(elapsed * 1000, 1),
+        "heap_peak_mb": round(heap_peak / mb, 1),
+        "rss_growth_mb": round(max(0, rss_peak - rss_before) / mb, 1),
+    }
+
+
+def _child(mode: str, args: argparse.Namespace) -> dict:
+    command = [
+        sys.executable,
+        "-m",
+        "bench.ocr_memory",
+        "--mode",
+        mode,
+        "--photos",
+        str(args.photos),
+        "--photo-mb",
+        str(args.photo_mb),
+        "--json",
+    ]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output)[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--photos", type=int, default=5)
+    parser.add_argument("--photo-mb", type=int, default=5)
+    parser.add_argument(
+        "--mode",
+        choices=["streamed", "buffered"],
+        help="run one mode in this process (default: both, each in a fresh one)",
+    )
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    if args.mode:
+        reports = [asyncio.run(_measure(args))]
+    else:
+        reports = [_child(mode, args) for mode in ("buffered", "streamed")]
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+    print(f"{args.photos} photos × {args.photo_mb} MB, one scan")
+    for r in reports:
+        print(
+            f"  {r['mode']:<9} heap peak {r['heap_peak_mb']:>6} MB   "
+            f"RSS growth {r['rss_growth_mb']:>6} MB   sent {r['sent_mb']} MB   "
+            f"{r['elapsed_ms']} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""CPU per request of the session reads: the ORM and Pydantic path against rows.
+
+GET /api/sessions/{id} (and /invite/{code}, the same document) and GET /shares are what
+every Mini App screen refetches after a WebSocket event. Both are timed two ways over
+the same generated sessions, from a 15-dish table to a 500-line, 50-guest banquet:
+
+* ``orm`` — what the routes did: ``db.get(Session)`` with its ``lazy="selectin"``
+  graph, then ``SessionOut.model_validate`` (``from_attributes``) and the JSON
+  FastAPI renders from it; for /shares, the session plus one ``refresh`` per dish
+  and a ``ShareOut`` per voter;
+* ``rows`` — api/session_view.py: five column-only selects, dicts, and
+  api/responses.py's encoder.
+
+Each request runs in a fresh AsyncSession, as a request does, so nothing is served from
+the identity map. Reported per path are the process CPU time per request (the app's
+share; with PostgreSQL the server's CPU is not in it), the wall time, and the size of
+the body. The two bodies are checked to decode to the same document first.
+
+    uv run python -m bench.session_read
+    uv run python -m bench.session_read --database-url postgresql+asyncpg://... --json
+
+Without --database-url a throwaway SQLite file is used, where the driver runs in this
+process and its CPU is counted too.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import secrets
+import statistics
+import tempfile
+import time
+from collections.abc import Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from bench.micro import _dish_name, make_items
+
+# (name, dishes, members, photos)
+SIZES = [
+    ("table", 15, 6, 1),
+    ("party", 80, 20, 2),
+    ("banquet", 500, 50, 5),
+]
+
+
+async def _seed(sessionmaker, rng: random.Random, dishes: int, members: int, photos: int):
+    from core.models.session import ItemVote, Session, SessionItem, SessionMember, SessionPhoto
+
+    admin = 1
+    async with sessionmaker() as db:
+        session = Session(admin_tg_id=admin, invite_code=secrets.token_urlsafe(6)[:8])
+        db.add(session)
+        await db.flush()
+        db.add_all(
+            SessionMember(
+                session_id=session.id,
+                user_tg_id=uid,
+                display_name=f"Гость {uid}",
+                tip_percent=rng.choice((None, None, 5, 10, 15)),
+                confirmed=rng.random() < 0.5,
+            )
+            for uid in range(admin, members + 1)
+        )
+        db.add_all(
+            SessionPhoto(session_id=session.id, tg_file_id=f"file-{n}") for n in range(photos)
+        )
+        for n, item in enumerate(make_items(rng, dishes, members)):
+            row = SessionItem(
+                session_id=session.id,
+                name=_dish_name(rng, n),
+                price=item["price"],
+                quantity=item["quantity"],
+            )
+            row.votes = [ItemVote(user_tg_id=uid, quantity=q) for uid, q in item["votes"].items()]
+            db.add(row)
+        await db.commit()
+        return session.id
+
+
+def _fastapi_json(content) -> bytes:
+    # starlette.responses.JSONResponse.render, which FastAPI uses for response_model.
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode()
+
+
+async def _session_orm(db: AsyncSession, session_id) -> bytes:
+    from api.schemas import SessionOut
+    from core.services.session import SessionService
+
+    session = await SessionService(db).get_session_by_id(session_id)
+    return _fastapi_json(SessionOut.model_validate(session).model_dump(mode="json"))
+
+
+async def _session_rows(db: AsyncSession, session_id) -> bytes:
+    from api.responses import dumps
+    from api.session_view import load_session_rows, session_document
+
+    return dumps(session_document(await load_session_rows(db, session_id=session_id)))
+
+
+async def _shares_orm(db: AsyncSession, session_id) -> bytes:
+    from api.schemas import ShareOut
+    from core.services.calculator import calculate_shares, calculate_user_share
+    from core.services.session import SessionService
+
+    session = await SessionService(db).get_session_by_id(session_id)
+    for item in session.items:
+        await db.refresh(item, ["votes"])
+    items = [
+        {
+            "price": item.price,
+            "quantity": item.quantity,
+            "votes": {v.user_tg_id: v.quantity for v in item.votes},
+        }
+        for item in session.items
+    ]
+    tips = {m.user_tg_id: m.tip_percent for m in session.members if m.tip_percent is not None}
+    names = {m.user_tg_id: m.display_name for m in session.members}
+    out = []
+    for uid, grand_total in calculate_shares(items, session.tip_percent, tips or None).items():
+        dishes, tip, _ = calculate_user_share(items, uid, tips.get(uid, session.tip_percent))
+        out.append(
+            ShareOut(
+                user_tg_id=uid,
+                display_name=names.get(uid, "Unknown"),
+                dishes_total=float(dishes),
+                tip_amount=float(tip),
+                grand_total=float(grand_total),
+            ).model_dump(mode="json")
+        )
+    return _fastapi_json(out)
+
+
+async def _shares_rows(db: AsyncSession, session_id) -> bytes:
+    from api.responses import dumps
+    from api.session_view import load_session_rows
+    from core.services.calculator import calculate_shares, calculate_user_share
+
+    rows = await load_session_rows(db, session_id=session_id)
+    items = rows.calculator_items()
+    session_tip = rows.session.tip_percent
+    tips = {m.user_tg_id: m.tip_percent for m in rows.members if m.tip_percent is not None}
+    names = {m.user_tg_id: m.display_name for m in rows.members}
+    out = []
+    for uid, grand_total in calculate_shares(items, session_tip, tips or None).items():
+        dishes, tip, _ = calculate_user_share(items, uid, tips.get(uid, session_tip))
+        out.append(
+            {
+                "user_tg_id": uid,
+                "display_name": names.get(uid, "Unknown"),
+                "dishes_total": float(dishes),
+                "tip_amount": float(tip),
+                "grand_total": float(grand_total),
+            }
+        )
+    return dumps(out)
+
+
+ENDPOINTS: dict[str, dict[str, Callable[[AsyncSession, object], Awaitable[bytes]]]] = {
+    "session": {"orm": _session_orm, "rows": _session_rows},
+    "shares": {"orm": _shares_orm, "rows": _shares_rows},
+}
+
+
+async def _time(sessionmaker, read, session_id, requests: int) -> dict:
+    cpu, wall = [], []
+    body = b""
+    for _ in range(requests):
+        started_cpu, started = time.process_time(), time.perf_counter()
+        async with sessionmaker() as db:
+            body = await read(db, session_id)
+        cpu.append(time.process_time() - started_cpu)
+        wall.append(time.perf_counter() - started)
+    return {
+        "cpu_us": round(statistics.mean(cpu) * 1e6),
+        "wall_p50_ms": round(statistics.median(wall) * 1000, 2),
+        "bytes": len(body),
+    }
+
+
+async def run(args: argparse.Namespace) -> list[dict]:
+    from core.models.base import Base
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        url = args.database_url or f"sqlite+aiosqlite:///{db_dir}/bench.db"
+        engine = create_async_engine(url)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        sessionmaker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        reports = []
+        try:
+            for name, dishes, members, photos in SIZES:
+                if args.only and name not in args.only:
+                    continue
+                rng = random.Random(f"{args.seed}-{name}")
+                session_id = await _seed(sessionmaker, rng, dishes, members, photos)
+                for endpoint, paths in ENDPOINTS.items():
+                    bodies = {}
+                    for path, read in paths.items():
+                        async with sessionmaker() as db:
+                            bodies[path] = json.loads(await read(db, session_id))
+                    if bodies["orm"] != bodies["rows"]:
+                        raise SystemExit(f"{endpoint}/{name}: the two paths disagree")
+                    report = {"endpoint": endpoint, "size": name}
+                    for path, read in paths.items():
+                        report[path] = await _time(sessionmaker, read, session_id, args.requests)
+                    report["cpu_saved"] = round(
+                        1 - report["rows"]["cpu_us"] / report["orm"]["cpu_us"], 2
+                    )
+                    reports.append(report)
+        finally:
+            await engine.dispose()
+    return reports
+
+
+def _print_report(reports: list[dict]) -> None:
+    print(
+        f"{'endpoint':<8} {'size':<8} {'orm CPU µs':>11} {'rows CPU µs':>12} {'saved':>6} "
+        f"{'orm p50 ms':>11} {'rows p50 ms':>12} {'bytes':>8}"
+    )
+    for r in reports:
+        print(
+            f"{r['endpoint']:<8} {r['size']:<8} {r['orm']['cpu_us']:>11} "
+            f"{r['rows']['cpu_us']:>12} {r['cpu_saved']:>6.0%} "
+            f"{r['orm']['wall_p50_ms']:>11} {r['rows']['wall_p50_ms']:>12} "
+            f"{r['rows']['bytes']:>8}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--database-url", help="default: a temporary SQLite file")
+    parser.add_argument("--requests", type=int, default=50, help="per path and size")
+    parser.add_argument("--only", nargs="*", choices=[s[0] for s in SIZES])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    reports = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        _print_report(reports)
+
+
+if __name__ == "__main__":
+    main()
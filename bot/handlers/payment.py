@@ -11,12 +11,10 @@ import logging
 from aiogram import F, Router
 from aiogram.types import Message, PreCheckoutQuery
 from aiogram.utils.i18n import gettext as _
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from core.config import get_settings
-from core.models.payment import Payment
-from core.services.quota import QuotaService
+from core.services.payment import PaymentService
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -44,33 +42,17 @@ async def successful_payment(message: Message, db: AsyncSession):
         payment_info.invoice_payload,
     )
     settings = get_settings()
-
-    # Telegram can redeliver a successful_payment update. telegram_payment_charge_id is
-    # unique per charge, so an already-recorded id means the scans were already granted
-    # and re-granting would hand out free quota on every retry.
-    charge_id = payment_info.telegram_payment_charge_id
-    existing = await db.execute(select(Payment).where(Payment.telegram_charge_id == charge_id))
-    if existing.scalar_one_or_none() is not None:
-        logger.info("Duplicate successful_payment for charge %s ignored", charge_id)
-        return
-
     scans = _scans_from_payload(payment_info.invoice_payload)
-
-    db.add(
-        Payment(
-            user_tg_id=message.from_user.id,
-            session_id=None,
-            stars_amount=payment_info.total_amount,
-            telegram_charge_id=payment_info.telegram_payment_charge_id,
-        )
+    # Recording the charge and granting the pack are one transaction, and a redelivered
+    # update is turned away by the same statement that records it (see PaymentService).
+    credited = await PaymentService(db, settings.free_scans_per_month).credit(
+        user_tg_id=message.from_user.id,
+        stars_amount=payment_info.total_amount,
+        telegram_charge_id=payment_info.telegram_payment_charge_id,
+        scans=scans,
     )
-
-    quota_svc = QuotaService(db, settings.free_scans_per_month)
-    for _i in range(scans):
-        await quota_svc.grant_paid_scan(message.from_user.id)
-
-    await db.commit()
-    await message.answer(_("Payment success"))
+    if credited:
+        await message.answer(_("Payment success"))
 
 
 def _scans_from_payload(payload: str) -> int:
@@ -17,6 +17,75 @@ class Settings(BaseSettings):
     db_pool_size: int = 20
     db_max_overflow: int = 10
 
+    # Background OCR workers per API process (api/services/ocr_worker.py): the number of
+    # receipts this process recognises at once. Each holds up to five LLM calls.
+    ocr_workers: int = 4
+    # Extra attempts per photo on timeouts, connection errors, 429 and 5xx
+    # (core/services/ocr_resilience.py).
+    ocr_retries: int = 2
+    # Duplicate a provider call that outlives the recent p95. Cuts tail latency at the
+    # price of paying for the duplicate, hence off unless asked for.
+    ocr_hedge: bool = False
+    # Cut photos taller than ocr_tile_aspect × width into overlapping strips recognised
+    # in parallel (core/services/ocr_tiling.py): for receipts too long for one reply.
+    ocr_tiling: bool = False
+    ocr_tile_aspect: float = 1.5
+    ocr_tile_overlap: float = 0.25
+    ocr_tile_max_strips: int = 5
+
+    # Telegram notifications go out through an outbox drained by one sender per API
+    # process (api/services/notification_sender.py), paced under the Bot API limits of
+    # ~30 messages/s per bot and ~1/s per chat.
+    notify_rate_per_second: float = 25.0
+    notify_chat_interval_seconds: float = 1.0
+    # Bot API calls one sender makes at once, and how long one recipient may take.
+    notify_concurrency: int = 10
+    notify_timeout_seconds: float = 15.0
+    # Kept-alive connections to api.telegram.org, and Bot API calls in flight at once,
+    # per API process. The sender, /quota/invoice and anything else share them.
+    telegram_max_connections: int = 10
+
+    # Lifetime of the bearer tokens POST /api/auth/token trades initData for (api/auth.py).
+    # Capped by the initData's own 24 hours either way.
+    auth_token_ttl_seconds: int = 3600
+
+    # Per-request SQL statistics (api/sql_timing.py): a Server-Timing header on every
+    # response, and a warning for requests past either budget. Off unless asked for.
+    sql_instrumentation: bool = False
+    sql_log_max_statements: int = 20
+    sql_log_slow_ms: float = 500
+
+    # GET /metrics wants "Authorization: Bearer <metrics_token>"; unset, it answers 404.
+    metrics_token: str | None = None
+
+    # Sessions are deleted in the background, a batch at a time (core/services/retention.py):
+    # history users cleared, sessions never taken past "created" within
+    # retention_abandoned_days, and receipt photo bytes left after retention_photo_days
+    # (0 turns either policy off). The purger pauses retention_batch_pause_seconds between
+    # batches, so a large backlog drains as a trickle beside live traffic.
+    retention_abandoned_days: int = 30
+    retention_photo_days: int = 7
+    retention_batch_size: int = 100
+    retention_batch_pause_seconds: float = 1.0
+    retention_interval_seconds: float = 3600
+
+    # Where receipt photos wait for OCR (core/services/photo_store.py): "fs", content-
+    # addressed files under photo_store_dir, or "db", rows of photo_blobs.
+    photo_store: str = "fs"
+    photo_store_dir: str = "data/photos"
+
+    # Which backend reads the photos (core/services/ocr_providers.py): "chat_completions"
+    # (ocr_api_url, zai_api_key, zai_model) or "stub", a local fake for load tests.
+    ocr_provider: str = "chat_completions"
+    ocr_api_url: str = "https://api.z.ai/api/paas/v4/chat/completions"
+    # Stub only: median latency and log-normal spread, share of calls failing with 503,
+    # an optional JSON receipt to answer with, and the seed that makes a run repeatable.
+    ocr_stub_latency_ms: float = 800
+    ocr_stub_latency_sigma: float = 0.3
+    ocr_stub_failure_rate: float = 0.0
+    ocr_stub_fixture: str | None = None
+    ocr_stub_seed: int = 0
+
     model_config = {"env_file": ".env"}
 
 
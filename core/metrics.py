@@ -0,0 +1,157 @@
+"""Process-wide counters, gauges and histograms.
+
+Deliberately tiny: a dict keyed by metric name and label set, no client library. Every
+value lives in one process and one event loop, so plain increments are safe — nothing
+on the hot path takes a lock. Names follow Prometheus conventions (``*_total`` for
+counters, ``*_seconds`` for durations) and :meth:`Metrics.render` writes them in its
+text format for ``GET /metrics``.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections.abc import Callable
+
+LabelSet = tuple[tuple[str, str], ...]
+
+# Upper bounds, in seconds, for latency histograms that do not name their own: from a
+# fast query to a slow LLM call.
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def _labels(labels: dict[str, object]) -> LabelSet:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    """Counts per bucket plus sum and count, for one series."""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self.bounds = bounds
+        # One slot per bound, plus one for +Inf. Not cumulative; render() adds them up.
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self._counters: dict[tuple[str, LabelSet], float] = {}
+        self._gauges: dict[tuple[str, LabelSet], float] = {}
+        self._histograms: dict[tuple[str, LabelSet], Histogram] = {}
+        self._collectors: list[Callable[[Metrics], None]] = []
+
+    def inc(self, name: str, amount: float = 1, **labels: object) -> None:
+        key = (name, _labels(labels))
+        self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels: object) -> None:
+        self._gauges[(name, _labels(labels))] = value
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        *,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        **labels: object,
+    ) -> None:
+        """Add *value* to a histogram; *buckets* applies when the series is first seen."""
+        key = (name, _labels(labels))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def value(self, name: str, **labels: object) -> float:
+        """Current value of one series; 0 if it was never touched."""
+        key = (name, _labels(labels))
+        return self._counters.get(key, self._gauges.get(key, 0))
+
+    def histogram(self, name: str, **labels: object) -> Histogram | None:
+        return self._histograms.get((name, _labels(labels)))
+
+    def counters(self) -> dict[tuple[str, LabelSet], float]:
+        return dict(self._counters)
+
+    def gauges(self) -> dict[tuple[str, LabelSet], float]:
+        return dict(self._gauges)
+
+    def add_collector(self, collect: Callable[[Metrics], None]) -> None:
+        """Run *collect* before every :meth:`render`: for gauges read off something else
+        (a connection pool) that would cost to keep current on every change."""
+        if collect not in self._collectors:
+            self._collectors.append(collect)
+
+    def reset(self) -> None:
+        self._counters.clear()
+        self._gauges.clear()
+        self._histograms.clear()
+
+    def render(self) -> str:
+        """Every series in the Prometheus text exposition format (version 0.0.4)."""
+        for collect in self._collectors:
+            collect(self)
+        lines: list[str] = []
+        for kind, series in (("counter", self._counters), ("gauge", self._gauges)):
+            for name, group in _by_name(series):
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(
+                    f"{name}{_format(labels)} {_number(value)}" for labels, value in group
+                )
+        for name, group in _by_name(self._histograms):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, h in group:
+                cumulative = 0
+                for bound, count in zip((*h.bounds, float("inf")), h.counts, strict=True):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{name}_bucket{_format(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format(labels)} {_number(h.sum)}")
+                lines.append(f"{name}_count{_format(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _by_name(series: dict) -> list[tuple[str, list]]:
+    grouped: dict[str, list] = {}
+    for (name, labels), value in sorted(series.items(), key=lambda item: item[0]):
+        grouped.setdefault(name, []).append((labels, value))
+    return list(grouped.items())
+
+
+def _number(value: float) -> str:
+    # Not :g, which rounds a counter past a million to six significant digits.
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format(labels: LabelSet) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+metrics = Metrics()
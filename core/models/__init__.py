@@ -1,12 +1,18 @@
 from core.models.base import Base
+from core.models.notification import OutboxMessage
+from core.models.ocr_job import OcrJob
 from core.models.payment import Payment
+from core.models.photo_blob import PhotoBlob
 from core.models.session import ItemVote, Session, SessionItem, SessionMember, SessionPhoto
 from core.models.user_quota import UserQuota
 
 __all__ = [
     "Base",
     "ItemVote",
+    "OcrJob",
+    "OutboxMessage",
     "Payment",
+    "PhotoBlob",
     "Session",
     "SessionItem",
     "SessionMember",
@@ -0,0 +1,49 @@
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import JSON, BigInteger, DateTime, Index, Integer, String, Uuid
+from sqlalchemy.orm import Mapped, mapped_column
+
+from core.models.base import Base
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class OutboxMessage(Base):
+    """A Telegram message waiting to be sent, or the record that it was.
+
+    Notifications used to be sent inline: POST /settle awaited one Bot API call per
+    member before it answered, and a message that failed — or was still in flight when
+    the process restarted — was simply lost. They are now rows written in the same
+    transaction as the state change they announce, and a background sender
+    (api/services/notification_sender.py) drains them at the rate Telegram accepts.
+
+    ``dedup_key`` names what a message is about ("settle:<session>:<user>"); the unique
+    constraint turns a second enqueue of the same notification into a no-op.
+    """
+
+    __tablename__ = "notification_outbox"
+    __table_args__ = (
+        # The sender's claim: due pending messages, oldest first.
+        Index("ix_notification_outbox_status_available_at", "status", "available_at"),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True, default=uuid.uuid4)
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    text: Mapped[str] = mapped_column(String, nullable=False)
+    reply_markup: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    dedup_key: Mapped[str | None] = mapped_column(String(128), nullable=True, unique=True)
+    # pending -> sent | failed
+    status: Mapped[str] = mapped_column(String(16), default="pending", nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    # Not to be sent before this: a retry's backoff, a 429's retry_after, or — while a
+    # sender holds the message — the end of its lease.
+    available_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=_utcnow)
+    # Fresh per claim, like ocr_jobs: a sender whose lease ran out cannot record an
+    # outcome over the sender that took the message over.
+    claim_token: Mapped[uuid.UUID | None] = mapped_column(Uuid, nullable=True)
+    error: Mapped[str | None] = mapped_column(String, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=_utcnow)
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
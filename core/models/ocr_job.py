@@ -0,0 +1,83 @@
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Uuid,
+    text,
+)
+from sqlalchemy.orm import Mapped, mapped_column
+
+from core.models.base import Base
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class OcrJob(Base):
+    """One queued receipt recognition.
+
+    POST /ocr used to hold the HTTP request open for the whole LLM call — up to four
+    minutes, under nginx's five-minute proxy timeout — pinning a worker slot and a
+    pooled connection the entire time. The request now only charges the scan and writes
+    this row; a background worker (api/services/ocr_worker.py) claims it with
+    ``FOR UPDATE SKIP LOCKED`` and does the recognition.
+
+    The row is also the ledger that keeps billing exactly-once: ``charged`` is written
+    in the same transaction as the charge, and every terminal transition (``done`` with
+    the items, ``failed`` with the refund) is a conditional UPDATE that only the current
+    lease holder can win. A worker that dies mid-call leaves the job ``running`` with an
+    expired ``locked_until``; the next claim picks it up again.
+    """
+
+    __tablename__ = "ocr_jobs"
+    __table_args__ = (
+        # The claim query scans by status in FIFO order.
+        Index("ix_ocr_jobs_status_created_at", "status", "created_at"),
+        # At most one live job per session. A double-tapped "scan" would otherwise
+        # charge twice and recognise the same photos twice; the loser of that race
+        # rolls back its charge along with its row.
+        Index(
+            "uq_ocr_jobs_active_session",
+            "session_id",
+            unique=True,
+            postgresql_where=text("status IN ('queued', 'running')"),
+            sqlite_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True, default=uuid.uuid4)
+    session_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    user_tg_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    # queued -> running -> done | failed
+    status: Mapped[str] = mapped_column(String(20), default="queued", nullable=False)
+    # Bucket the scan was charged from ("free" / "paid"); what a refund must put back.
+    charged: Mapped[str | None] = mapped_column(String(8), nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    # Lease: a fresh token per claim, so a worker that lost its lease cannot finish a job
+    # another worker has since taken over.
+    claim_token: Mapped[uuid.UUID | None] = mapped_column(Uuid, nullable=True)
+    locked_until: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    progress_current: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0", nullable=False
+    )
+    progress_total: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0", nullable=False
+    )
+    # OcrResultOut as a dict once done; what GET /ocr/jobs/{id} hands back.
+    result: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    # HTTP-style status and user-facing message of a failure (422, 502, 504 ...) — the
+    # same codes the synchronous endpoint used to answer with.
+    error_status: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    error: Mapped[str | None] = mapped_column(String, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=_utcnow)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,41 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import BigInteger, DateTime, LargeBinary, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from core.models.base import Base
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class PhotoBlob(Base):
+    """One distinct receipt image, named by the SHA-256 of its bytes.
+
+    session_photos rows point here through ``blob_sha256`` — the same picture uploaded
+    to two sessions (a re-scan, a forwarded photo) is stored once. There is no counter:
+    the references *are* the session_photos rows, counted when space is reclaimed (see
+    core/services/photo_store.py). A counter would have to be kept in step by every
+    DELETE, including the ON DELETE CASCADE from sessions and the raw SQL in
+    tools/db_cleanup.sh, and would drift the first time one of them forgot.
+
+    The foreign key from session_photos has no ON DELETE action on purpose: deleting a
+    blob that something still references fails instead of leaving a dangling photo.
+    """
+
+    __tablename__ = "photo_blobs"
+
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    # The bytes themselves, for the "db" backend only; the "fs" backend leaves this NULL
+    # and keeps a file instead. Deferred like the column it replaces: nothing but the
+    # store should ever load it.
+    data: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True, deferred=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=_utcnow)
+    # Bumped by every upload of these bytes. The periodic sweep leaves recently used
+    # blobs alone, so it never races an upload that has stored the bytes but not yet
+    # committed the photo row pointing at them.
+    last_used_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=_utcnow, index=True
+    )
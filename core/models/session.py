@@ -6,12 +6,13 @@ from sqlalchemy import (
     BigInteger,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
-    LargeBinary,
     Numeric,
     String,
     UniqueConstraint,
     Uuid,
+    text,
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -24,6 +25,19 @@ def _utcnow() -> datetime:
 
 class Session(Base):
     __tablename__ = "sessions"
+    # GET /api/sessions/my pages through a user's sessions newest first, keyed on
+    # (created_at, id); the id breaks ties between sessions created in the same
+    # microsecond, so a page boundary never skips or repeats one.
+    __table_args__ = (
+        Index("ix_sessions_created_at_id", "created_at", "id"),
+        # The purger's queue: only the few sessions waiting to be deleted are in it.
+        Index(
+            "ix_sessions_deleted_at",
+            "deleted_at",
+            postgresql_where=text("deleted_at IS NOT NULL"),
+            sqlite_where=text("deleted_at IS NOT NULL"),
+        ),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True, default=uuid.uuid4)
     admin_tg_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
@@ -34,6 +48,21 @@ class Session(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=_utcnow)
     closed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
+    # Denormalised counts for the session list, which used to count members and items
+    # with two correlated subqueries per row. SessionService keeps them in step: every
+    # method that adds or removes a member or an item adjusts them in the same
+    # transaction, relative to the stored value (count = count + n), so concurrent
+    # joins cannot overwrite each other's increment. Backfilled by migration
+    # 9d4e6f1a2b7c.
+    member_count: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0", nullable=False
+    )
+    item_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    # Set when the user clears their history: the session is gone from the list at once
+    # and deleted, children and all, by the background purger a batch at a time
+    # (core/services/retention.py) rather than inside the request.
+    deleted_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
     # cascade + passive_deletes: children go away with the session. The DB-level
     # ON DELETE CASCADE (see migration f1a2b3c4d5e6) does the actual work; the ORM
     # cascade keeps in-session state consistent without emitting per-row DELETEs.
@@ -67,18 +96,17 @@ class SessionPhoto(Base):
     tg_file_id: Mapped[str] = mapped_column(String, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=_utcnow)
 
-    # Receipt bytes, held only between upload and a successful OCR.
+    # The receipt image, held only between upload and a successful OCR: a reference to
+    # its content-addressed blob, NULL once the receipt has been read.
     #
-    # They used to live in a process-local dict, which meant a restart orphaned every
-    # in-flight session ("No photos available for OCR", unrecoverable) and the API could
-    # never run more than one worker. Storing them here makes the bytes visible to any
-    # process and, because session_id cascades, they are deleted with the session for
-    # free — no sweeper, no TTL job, no disk budget.
-    #
-    # deferred: Session.photos is lazy="selectin", so without this EVERY session load
-    # — every poll of GET /api/sessions/{id} — would drag megabytes of JPEG along.
-    # Read it with an explicit select(SessionPhoto.data), never via the attribute.
-    data: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True, deferred=True)
+    # The bytes used to live in a process-local dict (a restart orphaned every in-flight
+    # session), then in a bytea column on this row — which fixed that, but put up to
+    # 25 MB per session through WAL, TOAST and every backup. They now live in the photo
+    # store (core/services/photo_store.py): files on disk by default, photo_blobs rows
+    # if PHOTO_STORE=db. Either way this row carries only the hash.
+    blob_sha256: Mapped[str | None] = mapped_column(
+        ForeignKey("photo_blobs.sha256"), nullable=True, index=True
+    )
 
     session: Mapped["Session"] = relationship(back_populates="photos")
 
@@ -110,13 +138,16 @@ class SessionMember(Base):
     # get_member() raises MultipleResultsFound for that user, permanently.
     __table_args__ = (
         UniqueConstraint("session_id", "user_tg_id", name="uq_session_members_session_user"),
+        # "Sessions of user X": the list's join starts here and never needs the heap.
+        # Replaces the single-column index on user_tg_id, which it leads with.
+        Index("ix_session_members_user_tg_id_session_id", "user_tg_id", "session_id"),
     )
 
     id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True, default=uuid.uuid4)
     session_id: Mapped[uuid.UUID] = mapped_column(
         ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False, index=True
     )
-    user_tg_id: Mapped[int] = mapped_column(BigInteger, nullable=False, index=True)
+    user_tg_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
     display_name: Mapped[str] = mapped_column(String, nullable=False)
     tip_percent: Mapped[int | None] = mapped_column(Integer, nullable=True, default=None)
     confirmed: Mapped[bool] = mapped_column(default=False, server_default="false", nullable=False)
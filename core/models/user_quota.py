@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import BigInteger, DateTime, Integer
+from sqlalchemy import BigInteger, DateTime, Integer, String
 from sqlalchemy.orm import Mapped, mapped_column
 
 from core.models.base import Base
@@ -13,3 +13,7 @@ class UserQuota(Base):
     free_scans_used: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
     paid_scans: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
     quota_reset_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    # Which bucket paid for the most recent scan, "free" or "paid". The charge is one
+    # INSERT ... ON CONFLICT DO UPDATE, and its RETURNING only sees the row as updated:
+    # without this it could not tell "the last free scan" from "a paid one".
+    last_charge: Mapped[str | None] = mapped_column(String(8), nullable=True)
@@ -1,43 +1,51 @@
 import asyncio
-import base64
 import json
 import logging
 import re
+import time
 from collections.abc import Awaitable, Callable
 from dataclasses import dataclass
 from decimal import Decimal
+from typing import TYPE_CHECKING
 
 import httpx
 
-logger = logging.getLogger(__name__)
+from core.metrics import metrics
+from core.services.ocr_providers import (
+    ChatCompletionsProvider,
+    OcrProvider,
+    ProviderReply,
+    build_ocr_provider,
+)
+from core.services.ocr_resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LatencyTracker,
+    backoff_delay,
+    is_retryable,
+    provider_breaker,
+    provider_latency,
+)
+from core.services.ocr_tiling import Tiling
+from core.services.photo_store import Photo
+from core.services.receipt_merge import stitch
+
+if TYPE_CHECKING:
+    from core.config import Settings
 
-ZAI_URL = "https://api.z.ai/api/paas/v4/chat/completions"
+logger = logging.getLogger(__name__)
 
-# Photos are sent to the LLM in parallel; this bounds how many calls are in flight at
-# once so a long receipt cannot fan out into a burst the provider rate-limits.
+# Photos (and the strips of tiled photos) are sent to the LLM in parallel; this bounds
+# how many calls are in flight at once so a long receipt cannot fan out into a burst the
+# provider rate-limits.
 _MAX_CONCURRENT_PHOTOS = 5
 
-# Awaited with (completed, total) after each photo finishes.
-ProgressCallback = Callable[[int, int], Awaitable[None]]
-
-SYSTEM_PROMPT = """\
-You are a receipt parser. Extract all line items from the receipt photo.
-
-Return ONLY valid JSON (no markdown, no explanation):
-{
-  "items": [{"name": "Item name", "price": 123.45, "quantity": 1}],
-  "total": 1234.56,
-  "currency": "RUB"
-}
+# Backoff between retries of one photo: full jitter over base * 2**attempt, capped.
+_BACKOFF_BASE_SECONDS = 1.0
+_BACKOFF_CAP_SECONDS = 8.0
 
-Currency codes: RUB, EUR, USD, GBP, UAH, etc. Use the code from the receipt.
-
-Rules:
-- price is the total price for that line (price × quantity already multiplied)
-- quantity is how many of that item
-- total is the receipt grand total
-- If you can't read a value, make your best guess and note it in the name with (?)
-"""
+# Awaited with (completed, total) after each photo — or strip of a tiled photo — finishes.
+ProgressCallback = Callable[[int, int], Awaitable[None]]
 
 
 @dataclass
@@ -56,13 +64,50 @@ class OcrResult:
 
 
 class OcrService:
-    def __init__(self, api_key: str, model: str):
-        self._api_key = api_key
-        self._model = model
+    def __init__(
+        self,
+        api_key: str = "",
+        model: str = "",
+        *,
+        provider: OcrProvider | None = None,
+        retries: int = 2,
+        hedge: bool = False,
+        transport: httpx.AsyncBaseTransport | None = None,
+        breaker: CircuitBreaker | None = None,
+        latency: LatencyTracker | None = None,
+        tiling: Tiling | None = None,
+    ):
+        # Without an explicit provider this is the chat-completions one, which is what
+        # api_key/model (and a test's MockTransport) configure.
+        self._provider = provider or ChatCompletionsProvider(api_key, model, transport=transport)
+        self._retries = retries
+        self._hedge = hedge
+        self._breaker = breaker or provider_breaker
+        self._latency = latency or provider_latency
+        # None: every photo goes to the provider whole.
+        self._tiling = tiling
+
+    @classmethod
+    def from_settings(cls, settings: "Settings") -> "OcrService":
+        """The service as configured by OCR_PROVIDER and the OCR_* knobs."""
+        return cls(
+            provider=build_ocr_provider(settings),
+            retries=settings.ocr_retries,
+            hedge=settings.ocr_hedge,
+            tiling=(
+                Tiling(
+                    aspect=settings.ocr_tile_aspect,
+                    overlap=settings.ocr_tile_overlap,
+                    max_strips=settings.ocr_tile_max_strips,
+                )
+                if settings.ocr_tiling
+                else None
+            ),
+        )
 
     async def parse_receipt(
         self,
-        photos: list[bytes],
+        photos: list[Photo],
         on_progress: ProgressCallback | None = None,
     ) -> OcrResult:
         """Parse receipt photos concurrently, then merge the results.
@@ -73,65 +118,193 @@ class OcrService:
         been charged. Sending them together makes the wall-clock cost of a multi-photo
         receipt roughly that of a single photo.
 
-        *on_progress* is awaited with ``(completed, total)`` as each photo lands, so
-        callers can stream progress; completions are not ordered, but the merged
-        result is assembled in the original photo order.
+        With tiling on, a tall photo is first cut into overlapping strips
+        (core/services/ocr_tiling.py) that are recognised alongside the other photos and
+        stitched back into one before the photos are merged — a 1.5 m receipt takes
+        about as long as one of its strips.
+
+        *on_progress* is awaited with ``(completed, total)`` as each photo or strip
+        lands, so callers can stream progress; completions are not ordered, but the
+        merged result is assembled in the original photo order. When there is more than
+        one part it is awaited with ``(0, total)`` first, once the photos are cut: only
+        here is ``total`` known, and a caller counting photos would report a total that
+        changes under the Mini App's progress bar.
         """
-        total = len(photos)
+        if self._tiling is None:
+            parts = [[photo] for photo in photos]
+        else:
+            parts = await asyncio.gather(
+                *(asyncio.to_thread(self._tiling.split, photo) for photo in photos)
+            )
+        units = [(index, strip) for index, strips in enumerate(parts) for strip in strips]
+        total = len(units)
         if total == 1:
-            result = await self._parse_single_photo(photos[0])
+            result = await self._parse_single_photo(units[0][1])
             if on_progress:
                 await on_progress(1, 1)
             return result
 
+        if on_progress:
+            await on_progress(0, total)
         semaphore = asyncio.Semaphore(_MAX_CONCURRENT_PHOTOS)
         completed = 0
         counter_lock = asyncio.Lock()
 
-        async def parse_one(index: int, photo: bytes) -> tuple[int, OcrResult]:
+        async def parse_one(photo: Photo) -> OcrResult:
             nonlocal completed
             async with semaphore:
                 result = await self._parse_single_photo(photo)
             async with counter_lock:
                 completed += 1
                 done = completed
-            logger.info("OCR: photo %d/%d done", done, total)
+            logger.info("OCR: part %d/%d done", done, total)
             if on_progress:
                 await on_progress(done, total)
-            return index, result
-
-        pairs = await asyncio.gather(*(parse_one(i, p) for i, p in enumerate(photos)))
-        ordered = [result for _index, result in sorted(pairs, key=lambda pair: pair[0])]
-        return self._merge_results(ordered)
-
-    async def _parse_single_photo(self, photo: bytes) -> OcrResult:
-        """Send a single photo to the LLM and parse the response."""
-        b64 = base64.b64encode(photo).decode()
-        content: list[dict] = [
-            {"type": "text", "text": "Parse this receipt:"},
-            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}"}},
+            return result
+
+        # gather() returns results in argument order, whatever order they finished in.
+        results = await asyncio.gather(*(parse_one(strip) for _index, strip in units))
+        per_photo: list[list[OcrResult]] = [[] for _ in photos]
+        for (index, _strip), result in zip(units, results, strict=True):
+            per_photo[index].append(result)
+        merged = [
+            strips[0] if len(strips) == 1 else self._merge_strips(strips) for strips in per_photo
         ]
+        if len(merged) == 1:
+            return merged[0]
+        return self._merge_results(merged)
 
-        async with httpx.AsyncClient(timeout=120) as client:
-            response = await client.post(
-                ZAI_URL,
-                headers={"Authorization": f"Bearer {self._api_key}"},
-                json={
-                    "model": self._model,
-                    "max_tokens": 4096,
-                    "messages": [
-                        {"role": "system", "content": SYSTEM_PROMPT},
-                        {"role": "user", "content": content},
-                    ],
-                },
-            )
-            response.raise_for_status()
+    async def _parse_single_photo(self, photo: Photo) -> OcrResult:
+        """Send a single photo to the provider and parse the response.
 
-        body = response.json()
-        raw = body["choices"][0]["message"]["content"]
-        logger.info("OCR raw response: %s", raw[:500] if raw else "<empty>")
+        Timed and counted per photo (or strip), retries included, by what became of it:
+        ``ocr_photo_seconds`` and ``ocr_photos_total`` with outcome ``success``,
+        ``timeout``, ``provider_error`` (including an open circuit) or ``parse_error``.
+        A photo abandoned because the job ran out of time is ``cancelled``.
+        """
+        started = time.perf_counter()
+        outcome = "success"
+        try:
+            reply = await self._call_provider(photo)
+            raw = reply.content
+            logger.info("OCR raw response: %s", raw[:500] if raw else "<empty>")
+            return self._parse_llm_response(raw, reply.body)
+        except httpx.TimeoutException:
+            outcome = "timeout"
+            raise
+        except (httpx.HTTPError, CircuitOpenError):
+            outcome = "provider_error"
+            raise
+        except (ValueError, KeyError, TypeError):
+            outcome = "parse_error"
+            raise
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            metrics.inc("ocr_photos_total", outcome=outcome)
+            metrics.observe("ocr_photo_seconds", time.perf_counter() - started, outcome=outcome)
+
+    async def _call_provider(self, photo: Photo) -> ProviderReply:
+        """Ask the provider about one photo, retrying transient failures.
+
+        Each attempt first asks the breaker for admission, so once the provider is known
+        to be down the remaining photos and retries fail at once with CircuitOpenError
+        instead of each waiting out its own timeout.
+        """
+        for attempt in range(self._retries + 1):
+            probe = self._breaker.before_call()
+            try:
+                reply = await self._attempt_hedged(photo)
+            except asyncio.CancelledError:
+                # The job's deadline, or the scan failing elsewhere. This says nothing
+                # about the provider, but a half-open probe that is never given back
+                # keeps the circuit rejecting every call until the process restarts.
+                if probe:
+                    self._breaker.release_probe()
+                raise
+            except httpx.HTTPError as exc:
+                if not is_retryable(exc):
+                    # The provider answered; it just refused this request.
+                    self._breaker.record_success()
+                    raise
+                self._breaker.record_failure()
+                if attempt == self._retries:
+                    raise
+                delay = backoff_delay(attempt, _BACKOFF_BASE_SECONDS, _BACKOFF_CAP_SECONDS, exc)
+                logger.warning(
+                    "OCR provider call failed (%r), retry %d/%d in %.1fs",
+                    exc,
+                    attempt + 1,
+                    self._retries,
+                    delay,
+                )
+                metrics.inc("ocr_provider_retries_total")
+                await asyncio.sleep(delay)
+                continue
+            except Exception:
+                # A 200 that is not a chat completion — not JSON, no "choices". Another
+                # attempt is unlikely to fare better, but it is the provider misbehaving,
+                # and it must settle a half-open probe like any other failure.
+                self._breaker.record_failure()
+                raise
+            self._breaker.record_success()
+            return reply
+        raise AssertionError("unreachable")  # pragma: no cover
+
+    async def _attempt_hedged(self, photo: Photo) -> ProviderReply:
+        """One attempt, duplicated if it runs past the recent p95.
+
+        The slowest few percent of provider calls are far slower than the median, and a
+        fresh request usually lands on a faster replica. Whichever copy succeeds first
+        wins and the other is cancelled; only if both fail does the attempt fail.
+        """
+        hedge_after = self._latency.p95() if self._hedge else None
+        if hedge_after is None:
+            return await self._attempt(photo)
 
-        return self._parse_llm_response(raw, body)
+        primary = asyncio.create_task(self._attempt(photo))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if done:
+                return primary.result()
+            metrics.inc("ocr_provider_hedges_total")
+            hedge = asyncio.create_task(self._attempt(photo))
+            tasks.add(hedge)
+            pending = set(tasks)
+            error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            metrics.inc("ocr_provider_hedge_wins_total")
+                        return task.result()
+                    error = error or task.exception()
+            assert error is not None
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _attempt(self, photo: Photo) -> ProviderReply:
+        started = time.monotonic()
+        try:
+            reply = await self._provider.complete(photo)
+        except httpx.HTTPError as exc:
+            outcome = "error" if is_retryable(exc) else "rejected"
+            metrics.inc("ocr_provider_requests_total", outcome=outcome)
+            raise
+        except Exception:
+            metrics.inc("ocr_provider_requests_total", outcome="malformed")
+            raise
+        self._latency.record(time.monotonic() - started)
+        metrics.inc("ocr_provider_requests_total", outcome="ok")
+        return reply
 
     @staticmethod
     def _parse_llm_response(raw: str | None, body: dict) -> OcrResult:
@@ -219,32 +392,73 @@ class OcrService:
             pass
         return None
 
+    @staticmethod
+    def _merge_strips(results: list["OcrResult"]) -> "OcrResult":
+        """Stitch the strips of one tiled photo back into that photo's result.
+
+        Unlike separate photos, strips are known to overlap, so a single line matched
+        across a boundary is enough to join them, and a boundary with no match at all
+        still concatenates rather than making them separate receipts. The grand total
+        is printed at the bottom and is the largest any strip reports; the others see
+        at most a subtotal.
+        """
+        lines, _joined = stitch([result.items for result in results], min_matched=1)
+        total = max(result.total for result in results)
+        items_sum = sum(i.price for i in lines)
+        mismatch = abs(items_sum - total) > total * Decimal("0.05") if total else False
+        return OcrResult(
+            items=list(lines),
+            total=total,
+            currency=results[0].currency,
+            total_mismatch=mismatch,
+        )
+
     @staticmethod
     def _merge_results(results: list["OcrResult"]) -> "OcrResult":
-        """Merge multiple per-photo OCR results, deduplicating items by name."""
-        merged_items: dict[str, OcrItem] = {}
-        total = Decimal(0)
+        """Merge per-photo OCR results into one receipt.
+
+        Consecutive photos are first stitched on their overlap (core/services/
+        receipt_merge.py), so a line visible on both is counted once however the LLM
+        spelled it each time. Identical names that remain after that are genuine
+        repeats and are folded into one line with the quantities added up.
+
+        Photos joined by an overlap are parts of one receipt, whose grand total is the
+        largest any part shows (the last one, normally; the others show subtotals at
+        most). Photos that do not overlap are separate receipts and their totals add.
+        """
         currency = results[0].currency if results else "RUB"
+        lines, joined = stitch([result.items for result in results])
+
+        total = Decimal(0)
         any_mismatch = False
+        group: list[OcrResult] = []
+        for index, result in enumerate(results):
+            group.append(result)
+            if index < len(joined) and joined[index]:
+                continue
+            total += max(part.total for part in group)
+            # A part of a longer receipt never adds up to the grand total on its own;
+            # only a standalone photo's own check is meaningful.
+            if len(group) == 1:
+                any_mismatch = any_mismatch or result.total_mismatch
+            group = []
 
-        for result in results:
-            total += result.total
-            any_mismatch = any_mismatch or result.total_mismatch
-            for item in result.items:
-                key = item.name.strip().lower()
-                if key in merged_items:
-                    existing = merged_items[key]
-                    merged_items[key] = OcrItem(
-                        name=existing.name,
-                        price=existing.price + item.price,
-                        quantity=existing.quantity + item.quantity,
-                    )
-                else:
-                    merged_items[key] = OcrItem(
-                        name=item.name,
-                        price=item.price,
-                        quantity=item.quantity,
-                    )
+        merged_items: dict[str, OcrItem] = {}
+        for item in lines:
+            key = item.name.strip().lower()
+            if key in merged_items:
+                existing = merged_items[key]
+                merged_items[key] = OcrItem(
+                    name=existing.name,
+                    price=existing.price + item.price,
+                    quantity=existing.quantity + item.quantity,
+                )
+            else:
+                merged_items[key] = OcrItem(
+                    name=item.name,
+                    price=item.price,
+                    quantity=item.quantity,
+                )
 
         all_items = list(merged_items.values())
         items_sum = sum(i.price for i in all_items)
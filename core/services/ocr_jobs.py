@@ -0,0 +1,242 @@
+"""Durable OCR job queue on top of PostgreSQL.
+
+No broker: the queue is the ``ocr_jobs`` table, and workers claim rows with
+``SELECT … FOR UPDATE SKIP LOCKED`` so that any number of them — in one process or
+several — can pull from it without handing the same job out twice.
+
+Billing rides on the same rows. The scan is charged in the transaction that creates the
+job, and refunded in the transaction that marks it failed; both transitions are
+conditional on the caller still holding the lease, so a job can be refunded or delivered
+at most once however many workers crash or time out around it.
+"""
+
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timedelta, timezone
+from uuid import UUID, uuid4
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.models.ocr_job import OcrJob
+from core.services.ocr import OcrResult
+from core.services.quota import QuotaService
+from core.services.session import SessionService
+
+logger = logging.getLogger(__name__)
+
+# A job whose worker keeps dying (OOM on a huge photo, a deploy loop) is retried this many
+# times, then failed and refunded rather than retried forever.
+MAX_ATTEMPTS = 3
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class OcrJobService:
+    def __init__(self, db: AsyncSession, free_limit: int):
+        self._db = db
+        self._free_limit = free_limit
+
+    async def get_job(self, job_id: UUID | str) -> OcrJob | None:
+        if isinstance(job_id, str):
+            job_id = UUID(job_id)
+        result = await self._db.execute(
+            select(OcrJob).where(OcrJob.id == job_id).execution_options(populate_existing=True)
+        )
+        return result.scalar_one_or_none()
+
+    async def get_active_job(self, session_id: UUID | str) -> OcrJob | None:
+        if isinstance(session_id, str):
+            session_id = UUID(session_id)
+        result = await self._db.execute(
+            select(OcrJob)
+            .where(OcrJob.session_id == session_id, OcrJob.status.in_(ACTIVE_STATUSES))
+            .execution_options(populate_existing=True)
+        )
+        return result.scalar_one_or_none()
+
+    async def enqueue(self, session_id: UUID | str, user_tg_id: int) -> OcrJob | None:
+        """Charge one scan and queue the recognition, in one transaction.
+
+        Returns the new job, the session's already-running job if there is one (a
+        repeated tap must not pay twice), or ``None`` when the user has no scans left.
+        """
+        if isinstance(session_id, str):
+            session_id = UUID(session_id)
+        active = await self.get_active_job(session_id)
+        if active is not None:
+            return active
+
+        quota = QuotaService(self._db, self._free_limit)
+        charged = await quota.use_scan(user_tg_id, commit=False)
+        if charged is None:
+            await self._db.rollback()
+            return None
+
+        job = OcrJob(session_id=session_id, user_tg_id=user_tg_id, charged=charged)
+        self._db.add(job)
+        try:
+            await self._db.commit()
+        except IntegrityError:
+            # A concurrent tap queued first (uq_ocr_jobs_active_session). Rolling back
+            # takes our charge with it; report the job that won.
+            await self._db.rollback()
+            return await self.get_active_job(session_id)
+        return job
+
+    async def claim(self, lease_seconds: float) -> OcrJob | None:
+        """Take the oldest runnable job and lease it to the caller.
+
+        Runnable means queued, or running under a lease that has expired — its worker
+        died. A job that has already used up its attempts is failed and refunded here
+        instead of being handed out again.
+
+        SKIP LOCKED lets concurrent workers pass over each other's candidate rows rather
+        than queue behind them. The lease itself is then taken with a compare-and-set on
+        (status, attempts), so correctness does not rest on the row lock: on SQLite,
+        which emits no FOR UPDATE, two workers used to pick the same row and the second
+        claim silently overwrote the first one's token.
+        """
+        while True:
+            now = _utcnow()
+            result = await self._db.execute(
+                select(OcrJob.id, OcrJob.status, OcrJob.attempts)
+                .where(
+                    or_(
+                        OcrJob.status == "queued",
+                        and_(OcrJob.status == "running", OcrJob.locked_until < now),
+                    )
+                )
+                .order_by(OcrJob.created_at)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            candidate = result.one_or_none()
+            if candidate is None:
+                await self._db.commit()
+                return None
+
+            job_id, status, attempts = candidate
+            seen = (OcrJob.id == job_id, OcrJob.status == status, OcrJob.attempts == attempts)
+            if attempts >= MAX_ATTEMPTS:
+                if await self._fail_where(
+                    seen, 504, "Recognition did not finish. The scan was not charged."
+                ):
+                    logger.error("OCR job %s abandoned after %d attempts", job_id, attempts)
+                continue
+
+            won = await self._db.execute(
+                update(OcrJob)
+                .where(*seen)
+                .values(
+                    status="running",
+                    attempts=attempts + 1,
+                    claim_token=uuid4(),
+                    locked_until=now + timedelta(seconds=lease_seconds),
+                )
+                .returning(OcrJob.id)
+            )
+            if won.scalar_one_or_none() is None:
+                # Another worker took it between our read and our write.
+                await self._db.rollback()
+                continue
+            await self._db.commit()
+            return await self.get_job(job_id)
+
+    async def report_progress(
+        self, job_id: UUID, claim_token: UUID, current: int, total: int, lease_seconds: float
+    ) -> None:
+        """Record progress and extend the lease — a job that reports is not dead."""
+        await self._db.execute(
+            update(OcrJob)
+            .where(OcrJob.id == job_id, OcrJob.claim_token == claim_token)
+            .values(
+                progress_current=current,
+                progress_total=total,
+                locked_until=_utcnow() + timedelta(seconds=lease_seconds),
+            )
+        )
+        await self._db.commit()
+
+    async def complete(
+        self, job_id: UUID, claim_token: UUID, result: OcrResult, result_out: dict
+    ) -> bool:
+        """Deliver a recognised receipt: job, items, currency and photo bytes together.
+
+        Returns False — and writes nothing — if the lease was lost in the meantime; the
+        worker that holds it now is the one that delivers.
+        """
+        won = await self._db.execute(
+            update(OcrJob)
+            .where(
+                OcrJob.id == job_id,
+                OcrJob.claim_token == claim_token,
+                OcrJob.status == "running",
+            )
+            .values(status="done", result=result_out, finished_at=_utcnow(), locked_until=None)
+            .returning(OcrJob.session_id)
+        )
+        session_id = won.scalar_one_or_none()
+        if session_id is None:
+            await self._db.rollback()
+            return False
+
+        svc = SessionService(self._db)
+        if result.currency:
+            await svc.update_currency(session_id, result.currency, commit=False)
+        # The receipt has been read; the bytes have no further use. Dropping them here is
+        # what keeps steady-state storage at roughly zero — the periodic photo sweep is
+        # only the backstop for sessions that never got this far.
+        released = await svc.clear_photo_bytes(session_id, commit=False)
+        # save_ocr_items commits, and with it everything staged above.
+        await svc.save_ocr_items(
+            session_id,
+            [
+                {"name": i.name, "price": float(i.price), "quantity": i.quantity}
+                for i in result.items
+            ],
+        )
+        # Only after that commit are the blobs unreferenced and safe to reclaim.
+        await svc.release_photo_blobs(released)
+        return True
+
+    async def fail(self, job_id: UUID, claim_token: UUID, status: int, detail: str) -> bool:
+        """Fail the job and refund its scan, once. False if the lease was lost."""
+        return await self._fail_where(
+            (OcrJob.id == job_id, OcrJob.claim_token == claim_token, OcrJob.status == "running"),
+            status,
+            detail,
+        )
+
+    async def _fail_where(self, conditions: tuple, status: int, detail: str) -> bool:
+        # Every exit that does not produce items refunds the scan: the user is charged
+        # for a parsed receipt, not for an attempt. The transition is conditional and
+        # shares a commit with the refund, so the refund cannot happen twice or not at
+        # all — whichever caller's UPDATE matches is the only one that refunds.
+        won = await self._db.execute(
+            update(OcrJob)
+            .where(*conditions)
+            .values(
+                status="failed",
+                error_status=status,
+                error=detail,
+                finished_at=_utcnow(),
+                locked_until=None,
+            )
+            .returning(OcrJob.user_tg_id, OcrJob.charged)
+        )
+        row = won.one_or_none()
+        if row is None:
+            await self._db.rollback()
+            return False
+        user_tg_id, charged = row
+        quota = QuotaService(self._db, self._free_limit)
+        await quota.refund_scan(user_tg_id, charged, commit=False)
+        await self._db.commit()
+        return True
@@ -0,0 +1,241 @@
+"""Where receipt photos are sent to be read.
+
+OcrService used to hardcode the provider: the Z.AI URL, the chat-completions request
+shape and the system prompt all lived inside it, so nothing above the HTTP layer could
+run without the network. A provider now only turns one photo into the model's raw
+reply; everything generic — retries, hedging, the circuit breaker, JSON repair, the
+multi-photo merge — stays in OcrService and runs the same for every provider.
+
+``OCR_PROVIDER`` selects one:
+
+* ``chat_completions`` — an OpenAI-compatible vision chat endpoint (Z.AI by default,
+  ``OCR_API_URL`` for anything else);
+* ``stub`` — a local, deterministic fake that answers with fixture JSON after a
+  configurable latency, failing at a configurable rate. For load tests of the whole
+  pipeline on a laptop (bench/ocr_pipeline.py), never for production.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import math
+import mmap
+import random
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Protocol
+
+import httpx
+
+if TYPE_CHECKING:
+    from core.config import Settings
+    from core.services.photo_store import Photo
+
+ZAI_URL = "https://api.z.ai/api/paas/v4/chat/completions"
+
+SYSTEM_PROMPT = """\
+You are a receipt parser. Extract all line items from the receipt photo.
+
+Return ONLY valid JSON (no markdown, no explanation):
+{
+  "items": [{"name": "Item name", "price": 123.45, "quantity": 1}],
+  "total": 1234.56,
+  "currency": "RUB"
+}
+
+Currency codes: RUB, EUR, USD, GBP, UAH, etc. Use the code from the receipt.
+
+Rules:
+- price is the total price for that line (price × quantity already multiplied)
+- quantity is how many of that item
+- total is the receipt grand total
+- If you can't read a value, make your best guess and note it in the name with (?)
+"""
+
+# The photo is base64-encoded this many bytes at a time: a multiple of 3, so the slices
+# encode independently, and of the page size, so the pages behind a mapped photo can be
+# dropped as soon as they have been sent.
+_ENCODE_CHUNK = 3 * 64 * 1024
+
+# Where the base64 goes in the serialised request; never produced by json.dumps itself.
+_PLACEHOLDER = "@@receipt-photo-base64@@"
+
+_MADV_DONTNEED = getattr(mmap, "MADV_DONTNEED", None)
+
+# What the stub answers with when no fixture file is configured.
+STUB_RECEIPT = {
+    "items": [
+        {"name": "Пицца Маргарита", "price": 650, "quantity": 1},
+        {"name": "Том Ям", "price": 900, "quantity": 2},
+        {"name": "Лимонад", "price": 250, "quantity": 1},
+    ],
+    "total": 1800,
+    "currency": "RUB",
+}
+
+
+@dataclass
+class ProviderReply:
+    """The model's text, plus the full response body for error messages."""
+
+    content: str | None
+    body: dict
+
+
+class OcrProvider(Protocol):
+    name: str
+
+    async def complete(self, photo: Photo) -> ProviderReply:
+        """Send one photo; raise an httpx.HTTPError if the provider failed."""
+        ...
+
+
+class ChatCompletionsProvider:
+    """A vision model behind an OpenAI-compatible ``/chat/completions`` endpoint."""
+
+    name = "chat_completions"
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        *,
+        url: str = ZAI_URL,
+        timeout: float = 120,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        self._api_key = api_key
+        self._model = model
+        self._url = url
+        self._timeout = timeout
+        # Tests hand in an httpx.MockTransport; production uses the real network.
+        self._transport = transport
+        self._envelope_parts: tuple[bytes, bytes] | None = None
+
+    async def complete(self, photo: Photo) -> ProviderReply:
+        async with httpx.AsyncClient(timeout=self._timeout, transport=self._transport) as client:
+            length, body = self._request_body(photo)
+            response = await client.post(
+                self._url,
+                headers={
+                    "Authorization": f"Bearer {self._api_key}",
+                    "Content-Type": "application/json",
+                    "Content-Length": str(length),
+                },
+                content=body,
+            )
+            response.raise_for_status()
+        body = response.json()
+        return ProviderReply(body["choices"][0]["message"]["content"], body)
+
+    def _request_body(self, photo: Photo) -> tuple[int, AsyncIterator[bytes]]:
+        """The chat-completions JSON for *photo*, as a stream of chunks, and its length.
+
+        ``json=`` built the request from ``b64encode(photo).decode()`` — a third as big
+        again as the photo, copied once more into the data URL, the JSON string and the
+        encoded body. Only the base64 is photo-sized, and base64 of consecutive 3-byte
+        groups concatenates, so the envelope is serialised once around a placeholder and
+        the photo is encoded into the gap one slice at a time.
+        """
+        head, tail = self._envelope()
+        size = len(photo)
+        length = len(head) + 4 * math.ceil(size / 3) + len(tail)
+
+        async def stream() -> AsyncIterator[bytes]:
+            yield head
+            with memoryview(photo) as view:
+                for start in range(0, size, _ENCODE_CHUNK):
+                    yield base64.b64encode(view[start : start + _ENCODE_CHUNK])
+                    if isinstance(photo, mmap.mmap) and _MADV_DONTNEED is not None:
+                        # Sent: give the pages back. They stay in the page cache, so a
+                        # retry or a hedge maps them in again without touching the disk.
+                        photo.madvise(_MADV_DONTNEED, start, min(_ENCODE_CHUNK, size - start))
+            yield tail
+
+        return length, stream()
+
+    def _envelope(self) -> tuple[bytes, bytes]:
+        if self._envelope_parts is None:
+            payload = {
+                "model": self._model,
+                "max_tokens": 4096,
+                "messages": [
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": "Parse this receipt:"},
+                            {
+                                "type": "image_url",
+                                "image_url": {"url": f"data:image/jpeg;base64,{_PLACEHOLDER}"},
+                            },
+                        ],
+                    },
+                ],
+            }
+            head, _, tail = json.dumps(payload).encode().partition(_PLACEHOLDER.encode())
+            self._envelope_parts = (head, tail)
+        return self._envelope_parts
+
+
+class StubOcrProvider:
+    """Answers every photo with the same fixture, on a seeded random schedule.
+
+    Latency is log-normal around *latency_ms* (real LLM latencies have a long right
+    tail, which is what hedging and the worker deadline exist for); *failure_rate* of
+    the calls fail with a 503 so retries and the breaker get exercised as well. The
+    seed makes a run repeatable.
+    """
+
+    name = "stub"
+
+    def __init__(
+        self,
+        *,
+        latency_ms: float = 800,
+        latency_sigma: float = 0.3,
+        failure_rate: float = 0.0,
+        fixture: dict | None = None,
+        seed: int = 0,
+    ) -> None:
+        self._latency_ms = latency_ms
+        self._latency_sigma = latency_sigma
+        self._failure_rate = failure_rate
+        self._content = json.dumps(fixture or STUB_RECEIPT, ensure_ascii=False)
+        self._rng = random.Random(seed)
+
+    async def complete(self, photo: Photo) -> ProviderReply:
+        if self._latency_ms > 0:
+            mu = math.log(self._latency_ms / 1000)
+            await asyncio.sleep(self._rng.lognormvariate(mu, self._latency_sigma))
+        if self._rng.random() < self._failure_rate:
+            request = httpx.Request("POST", "http://ocr-stub.invalid/chat/completions")
+            response = httpx.Response(503, request=request)
+            raise httpx.HTTPStatusError(
+                "stub provider failure", request=request, response=response
+            )
+        body = {"choices": [{"message": {"content": self._content}}]}
+        return ProviderReply(self._content, body)
+
+
+def build_ocr_provider(settings: Settings) -> OcrProvider:
+    """The provider ``OCR_PROVIDER`` names, configured from settings."""
+    if settings.ocr_provider == "stub":
+        fixture = None
+        if settings.ocr_stub_fixture:
+            fixture = json.loads(Path(settings.ocr_stub_fixture).read_text(encoding="utf-8"))
+        return StubOcrProvider(
+            latency_ms=settings.ocr_stub_latency_ms,
+            latency_sigma=settings.ocr_stub_latency_sigma,
+            failure_rate=settings.ocr_stub_failure_rate,
+            fixture=fixture,
+            seed=settings.ocr_stub_seed,
+        )
+    if settings.ocr_provider == "chat_completions":
+        return ChatCompletionsProvider(
+            settings.zai_api_key, settings.zai_model, url=settings.ocr_api_url
+        )
+    raise ValueError(f"Unknown OCR_PROVIDER {settings.ocr_provider!r}")
@@ -0,0 +1,190 @@
+"""Retry, hedging and circuit-breaking for calls to the OCR provider.
+
+A single slow or 5xx response used to fail a whole multi-photo scan, and a provider
+outage cost every user a worker slot for the full 120 s timeout before the refund. The
+pieces here are wired together in ``OcrService._call_provider``:
+
+* transient failures (timeouts, connection errors, 429, 5xx) are retried per photo with
+  full-jitter exponential backoff, honouring ``Retry-After`` on 429;
+* optionally, a second identical request is fired once the first has run longer than
+  the recent p95 — a tail-latency hedge, off by default because it can double the bill;
+* a process-wide breaker watches the provider's error rate and, once it crosses the
+  threshold, rejects calls outright until a cool-down has passed.
+"""
+
+from __future__ import annotations
+
+import logging
+import random
+import time
+from collections import deque
+
+import httpx
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_RETRYABLE_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class CircuitOpenError(Exception):
+    """The provider is failing; the call was not attempted."""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Whether another attempt could plausibly succeed.
+
+    A 4xx other than 408/429 is our request's fault (bad key, oversized image) and will
+    fail the same way again; it is not a sign of provider trouble either.
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in _RETRYABLE_STATUSES
+    return isinstance(exc, (httpx.TimeoutException, httpx.TransportError))
+
+
+def backoff_delay(attempt: int, base: float, cap: float, exc: BaseException | None) -> float:
+    """Full-jitter backoff: uniform in [0, min(cap, base * 2**attempt)].
+
+    Jitter spreads the retries of photos that failed together (one provider hiccup hits
+    all of a receipt's parallel calls) instead of sending them back in lockstep. A 429
+    with a Retry-After header wins over the computed delay, still bounded by *cap*.
+    """
+    if isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code == 429:
+        retry_after = exc.response.headers.get("Retry-After")
+        if retry_after is not None:
+            try:
+                return min(cap, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class LatencyTracker:
+    """Rolling window of successful call durations, for the hedge delay."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20) -> None:
+        self._samples: deque[float] = deque(maxlen=window)
+        self._min_samples = min_samples
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def p95(self) -> float | None:
+        """The 95th percentile, or None until there are enough samples to trust it."""
+        if len(self._samples) < self._min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class CircuitBreaker:
+    """Error-rate breaker over the last *window* provider calls.
+
+    closed → open when at least *min_calls* of the recent calls are recorded and the
+    failure share reaches *threshold*; open → half-open after *cooldown* seconds, when a
+    single probe is let through; the probe's outcome closes or re-opens the circuit.
+    Only provider-health failures are recorded (see :func:`is_retryable`) — an
+    unreadable photo says nothing about whether the provider is up.
+    """
+
+    def __init__(
+        self,
+        *,
+        threshold: float = 0.5,
+        window: int = 20,
+        min_calls: int = 10,
+        cooldown: float = 30.0,
+        name: str = "ocr",
+    ) -> None:
+        self._threshold = threshold
+        self._min_calls = min_calls
+        self._cooldown = cooldown
+        self._name = name
+        self._outcomes: deque[bool] = deque(maxlen=window)
+        self._opened_at: float | None = None
+        self._probe_in_flight = False
+        self._publish()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self._cooldown:
+            return "open"
+        return "half_open"
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls are being rejected. Does not consume the half-open probe."""
+        return self.state == "open" or (self.state == "half_open" and self._probe_in_flight)
+
+    def before_call(self) -> bool:
+        """Admit a call or raise :class:`CircuitOpenError`; True if it is the probe.
+
+        The caller must end an admitted probe with :meth:`record_success`,
+        :meth:`record_failure` or :meth:`release_probe` — until then every other call
+        is rejected.
+        """
+        state = self.state
+        if state == "closed":
+            return False
+        if state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        metrics.inc("ocr_circuit_rejections_total", breaker=self._name)
+        raise CircuitOpenError(f"{self._name} circuit is open")
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            logger.info("Circuit %s closed after a successful probe", self._name)
+            self._opened_at = None
+            self._outcomes.clear()
+        self._probe_in_flight = False
+        self._outcomes.append(True)
+        self._publish()
+
+    def record_failure(self) -> None:
+        if self._opened_at is not None:
+            # The half-open probe failed: another full cool-down. A straggler admitted
+            # before the trip failing now changes nothing — the circuit is open already.
+            if self._probe_in_flight:
+                self._trip()
+            return
+        self._outcomes.append(False)
+        calls = len(self._outcomes)
+        if calls >= self._min_calls and self._outcomes.count(False) / calls >= self._threshold:
+            self._trip()
+
+    def release_probe(self) -> None:
+        """The probe ended without a verdict (it was cancelled): let the next call probe."""
+        self._probe_in_flight = False
+
+    def reset(self) -> None:
+        self._outcomes.clear()
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._publish()
+
+    def _trip(self) -> None:
+        logger.error(
+            "Circuit %s opened: %d/%d recent calls failed",
+            self._name,
+            self._outcomes.count(False),
+            len(self._outcomes),
+        )
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        metrics.inc("ocr_circuit_opened_total", breaker=self._name)
+        self._publish()
+
+    def _publish(self) -> None:
+        metrics.set(
+            "ocr_circuit_open", 1 if self._opened_at is not None else 0, breaker=self._name
+        )
+
+
+# One breaker and one latency window per process: every OcrService shares the view of
+# how the provider is doing, and POST /ocr consults the breaker before charging.
+provider_breaker = CircuitBreaker()
+provider_latency = LatencyTracker()
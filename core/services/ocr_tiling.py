@@ -0,0 +1,102 @@
+"""Cutting a very tall receipt photo into overlapping horizontal strips.
+
+A supermarket or banquet receipt photographed in one shot is a problem twice over: the
+model downsamples the image until the small print is illegible, and the JSON for a
+hundred lines does not fit into ``max_tokens`` — the reply is cut off and only the
+truncation repair in ``OcrService._try_repair_json`` saves part of it. A strip about as
+tall as the receipt is wide is what a phone shot of a normal receipt looks like, so the
+model reads it as well as it reads those.
+
+Neighbouring strips overlap, so a line cut by one strip's edge is whole in the next,
+and the per-strip results are stitched on that overlap by core/services/receipt_merge.py
+— the same alignment that joins a receipt photographed in parts.
+"""
+
+from __future__ import annotations
+
+import io
+import logging
+import math
+import mmap
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+if TYPE_CHECKING:
+    from core.services.photo_store import Photo
+
+logger = logging.getLogger(__name__)
+
+# JPEG quality of the re-encoded strips. Receipt text survives 85 well; the strips of a
+# photo together stay within the size of the original.
+_STRIP_QUALITY = 85
+
+
+def _reader(photo: mmap.mmap) -> mmap.mmap:
+    # An mmap is a file object too; Pillow reads it from wherever it was left.
+    photo.seek(0)
+    return photo
+
+
+@dataclass(frozen=True)
+class Tiling:
+    """How tall photos are cut.
+
+    *aspect* is the height of a strip relative to the photo's width, *overlap* the share
+    of a strip repeated at the top of the next one. A photo is only cut when it is taller
+    than one strip, and into at most *max_strips*; a longer receipt gets proportionally
+    taller strips rather than more calls than OcrService runs at once.
+    """
+
+    aspect: float = 1.5
+    overlap: float = 0.25
+    max_strips: int = 5
+
+    def plan(self, width: int, height: int) -> list[tuple[int, int]]:
+        """The (top, bottom) rows of each strip; a single span for a photo not cut."""
+        strip = width * self.aspect
+        if width <= 0 or height <= strip:
+            return [(0, height)]
+        step = strip * (1 - self.overlap)
+        count = math.ceil((height - strip) / step) + 1
+        if count > self.max_strips:
+            count = self.max_strips
+            # n strips of height s overlapping by o·s cover s + (n-1)(1-o)s rows.
+            strip = height / (1 + (count - 1) * (1 - self.overlap))
+            step = strip * (1 - self.overlap)
+        spans = []
+        for n in range(count):
+            top = round(n * step)
+            bottom = height if n == count - 1 else min(height, round(n * step + strip))
+            spans.append((top, bottom))
+        return spans
+
+    def split(self, photo: Photo) -> list[Photo]:
+        """Cut *photo* into strips; a photo that is not tall, or not an image, is kept.
+
+        CPU-bound (decode, crop, re-encode): call it off the event loop. A mapped photo
+        is decoded from the mapping, not copied into a BytesIO first.
+        """
+        try:
+            image = Image.open(io.BytesIO(photo) if isinstance(photo, bytes) else _reader(photo))
+            image = ImageOps.exif_transpose(image)
+        except (UnidentifiedImageError, OSError) as exc:
+            # The provider gets the original and reports on it the way it always has.
+            logger.warning("OCR tiling skipped, photo not decodable: %s", exc)
+            return [photo]
+        spans = self.plan(image.width, image.height)
+        if len(spans) == 1:
+            return [photo]
+        image = image.convert("RGB")
+        strips = []
+        for top, bottom in spans:
+            buffer = io.BytesIO()
+            image.crop((0, top, image.width, bottom)).save(
+                buffer, format="JPEG", quality=_STRIP_QUALITY
+            )
+            strips.append(buffer.getvalue())
+        logger.info(
+            "OCR tiling: %dx%d photo cut into %d strips", image.width, image.height, len(strips)
+        )
+        return strips
@@ -0,0 +1,187 @@
+"""The notification outbox: Telegram messages as rows, sent after the fact.
+
+A route that changes state — a settlement, a join, a reminder — enqueues its messages
+with ``commit=False`` and commits them together with the change: either both happen or
+neither does, and nothing waits on Telegram inside the request. The sender
+(api/services/notification_sender.py) claims due rows, sends them at the rate Telegram
+allows and records the outcome here.
+
+Delivery is at least once. A sender that dies between the Bot API call and recording
+it leaves the row leased; once the lease runs out the message goes again. A duplicate
+"your share is 500 ₽" after a crash beats a lost one.
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.models.notification import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+# Attempts before a message that keeps failing for other reasons than flood control is
+# given up on. A 429 is Telegram asking us to wait, not a failure, and never counts.
+MAX_ATTEMPTS = 5
+
+# Sent and failed messages are kept this long for inspection, then purged.
+RETENTION = timedelta(days=7)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+@dataclass(frozen=True)
+class Notification:
+    """One message to enqueue. *dedup_key* makes a repeated enqueue a no-op."""
+
+    chat_id: int
+    text: str
+    reply_markup: dict | None = None
+    dedup_key: str | None = None
+
+
+class OutboxService:
+    def __init__(self, db: AsyncSession):
+        self._db = db
+
+    async def enqueue(self, notifications: list[Notification], *, commit: bool = True) -> int:
+        """Queue *notifications*; returns how many were new (not deduplicated away)."""
+        if not notifications:
+            return 0
+        now = _utcnow()
+        insert = (
+            postgresql.insert
+            if self._db.get_bind().dialect.name == "postgresql"
+            else sqlite.insert
+        )
+        result = await self._db.execute(
+            insert(OutboxMessage)
+            .values(
+                [
+                    {
+                        "id": uuid4(),
+                        "chat_id": n.chat_id,
+                        "text": n.text,
+                        "reply_markup": n.reply_markup,
+                        "dedup_key": n.dedup_key,
+                        "status": "pending",
+                        "attempts": 0,
+                        "available_at": now,
+                        "created_at": now,
+                    }
+                    for n in notifications
+                ]
+            )
+            .on_conflict_do_nothing(index_elements=[OutboxMessage.dedup_key])
+        )
+        if commit:
+            await self._db.commit()
+        return result.rowcount
+
+    async def claim(self, limit: int, lease_seconds: float) -> list[OutboxMessage]:
+        """Lease up to *limit* due messages to the caller, oldest first; commits.
+
+        As with ocr_jobs, SKIP LOCKED only keeps concurrent senders from queueing on
+        each other's rows. Correctness comes from the UPDATE re-checking that the row is
+        still pending and due: a row another sender leased in the meantime has moved
+        its ``available_at`` past now and drops out — on SQLite too, which emits no
+        FOR UPDATE.
+        """
+        now = _utcnow()
+        candidates = (
+            select(OutboxMessage.id)
+            .where(OutboxMessage.status == "pending", OutboxMessage.available_at <= now)
+            .order_by(OutboxMessage.available_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        ids = list((await self._db.execute(candidates)).scalars().all())
+        if not ids:
+            await self._db.commit()
+            return []
+        token = uuid4()
+        result = await self._db.execute(
+            update(OutboxMessage)
+            .where(
+                OutboxMessage.id.in_(ids),
+                OutboxMessage.status == "pending",
+                OutboxMessage.available_at <= now,
+            )
+            .values(
+                available_at=now + timedelta(seconds=lease_seconds),
+                attempts=OutboxMessage.attempts + 1,
+                claim_token=token,
+            )
+            .returning(OutboxMessage)
+            # The returned rows refresh whatever is already loaded; evaluating the WHERE
+            # in Python instead trips over SQLite handing back naive datetimes.
+            .execution_options(populate_existing=True, synchronize_session=False)
+        )
+        claimed = sorted(result.scalars().all(), key=lambda m: m.created_at)
+        await self._db.commit()
+        return claimed
+
+    async def mark_sent(self, message: OutboxMessage, *, commit: bool = True) -> None:
+        await self._record(message, commit, status="sent", sent_at=_utcnow(), error=None)
+
+    async def retry_later(
+        self,
+        message: OutboxMessage,
+        delay: float,
+        error: str,
+        *,
+        count_attempt: bool = True,
+        commit: bool = True,
+    ) -> None:
+        """Put the message back, due again in *delay* seconds.
+
+        ``count_attempt=False`` hands back the attempt the claim took: for a 429, which
+        says nothing about whether the message can be delivered.
+        """
+        values: dict = {"available_at": _utcnow() + timedelta(seconds=delay), "error": error}
+        if not count_attempt:
+            values["attempts"] = OutboxMessage.attempts - 1
+        await self._record(message, commit, **values)
+
+    async def mark_failed(
+        self, message: OutboxMessage, error: str, *, commit: bool = True
+    ) -> None:
+        logger.warning(
+            "Notification to %s failed for good after %d attempts: %s",
+            message.chat_id,
+            message.attempts,
+            error,
+        )
+        await self._record(message, commit, status="failed", error=error)
+
+    async def _record(self, message: OutboxMessage, commit: bool, **values) -> None:
+        # Conditional on the lease, like every ocr_jobs transition: a sender that lost the
+        # message to a reclaim records nothing.
+        await self._db.execute(
+            update(OutboxMessage)
+            .where(
+                OutboxMessage.id == message.id, OutboxMessage.claim_token == message.claim_token
+            )
+            .values(claim_token=None, **values)
+        )
+        if commit:
+            await self._db.commit()
+
+    async def purge(self, older_than: timedelta = RETENTION) -> int:
+        """Delete sent and failed messages created more than *older_than* ago; commits."""
+        result = await self._db.execute(
+            delete(OutboxMessage).where(
+                OutboxMessage.status.in_(("sent", "failed")),
+                OutboxMessage.created_at < _utcnow() - older_than,
+            )
+        )
+        await self._db.commit()
+        return result.rowcount
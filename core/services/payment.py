@@ -0,0 +1,57 @@
+"""Crediting a Telegram Stars payment: the record and the scans it bought, exactly once."""
+
+from __future__ import annotations
+
+import logging
+from uuid import uuid4
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.models.payment import Payment
+from core.services.quota import QuotaService
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentService:
+    def __init__(self, db: AsyncSession, free_limit: int):
+        self._db = db
+        self._free_limit = free_limit
+
+    async def credit(
+        self, user_tg_id: int, stars_amount: int, telegram_charge_id: str, scans: int
+    ) -> bool:
+        """Record the payment and grant its *scans*; False if the charge was seen before.
+
+        Telegram can redeliver a successful_payment update. The handler used to look the
+        charge id up, add the Payment and then grant the pack one scan and one commit at a
+        time — so a crash in between could keep the payment and lose part of the pack,
+        and a redelivery racing the first could pass the lookup as well. Now the insert
+        is the duplicate check (ON CONFLICT on the unique ``telegram_charge_id``), and
+        the grant commits with it or not at all.
+        """
+        insert = (
+            postgresql.insert
+            if self._db.get_bind().dialect.name == "postgresql"
+            else sqlite.insert
+        )
+        result = await self._db.execute(
+            insert(Payment)
+            .values(
+                id=uuid4(),
+                user_tg_id=user_tg_id,
+                session_id=None,
+                stars_amount=stars_amount,
+                telegram_charge_id=telegram_charge_id,
+            )
+            .on_conflict_do_nothing(index_elements=[Payment.telegram_charge_id])
+        )
+        if result.rowcount == 0:
+            await self._db.rollback()
+            logger.info("Duplicate successful_payment for charge %s ignored", telegram_charge_id)
+            return False
+        quota = QuotaService(self._db, self._free_limit)
+        await quota.grant_paid_scans(user_tg_id, scans, commit=False)
+        await self._db.commit()
+        return True
@@ -0,0 +1,445 @@
+"""Where receipt photos wait between upload and OCR.
+
+Up to five 5 MB JPEGs per session used to sit in a bytea column on session_photos: all
+of it went through WAL and TOAST, into every base backup, and ``get_photo_bytes``
+pulled it through the database connection. Photos are now content-addressed blobs —
+named by the SHA-256 of their bytes, recorded in ``photo_blobs`` — behind a small store
+interface with two backends, chosen by ``PHOTO_STORE``:
+
+* ``fs`` (default) — one file per blob under ``PHOTO_STORE_DIR``, written to a temporary
+  name and renamed into place, so a reader never sees half a photo;
+* ``db`` — the bytes on the photo_blobs row, for deployments without a persistent
+  volume. Still deduplicated, and still out of the hot session_photos table.
+
+Space is reclaimed by reference counting, where the references are the session_photos
+rows that point at a blob: :meth:`PhotoStore.release` right after OCR clears a
+session's photos, :meth:`PhotoStore.gc` periodically for everything else — sessions
+deleted by the cascade, uploads that never committed, files without a row.
+
+Races with an upload of the same bytes are settled by the database. An upload locks
+the blob row (the upsert in :meth:`BlobWriter.save`) before it writes the payload, and
+reclaiming deletes the row — taking the same lock — before it removes the payload and
+commits. The foreign key from session_photos rejects the delete of a blob that gained
+a reference in the meantime.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO
+
+from sqlalchemy import delete, exists, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.metrics import metrics
+from core.models.photo_blob import PhotoBlob
+from core.models.session import SessionPhoto
+
+logger = logging.getLogger(__name__)
+
+# What open() hands out: the bytes themselves, or a read-only mapping of the blob's file.
+# Both are buffers — len(), slicing and memoryview() work on either.
+Photo = bytes | mmap.mmap
+
+# Unreferenced blobs unused for this long are swept by gc(). It only has to outlast an
+# upload's transaction; a referenced blob is never swept, however old.
+GC_GRACE = timedelta(hours=1)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def content_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class PhotoStore(ABC):
+    """The shared bookkeeping; backends decide where the bytes themselves go."""
+
+    name = ""
+
+    @abstractmethod
+    def writer(self) -> BlobWriter:
+        """A blob that arrives in chunks; see :class:`BlobWriter`."""
+
+    async def put(self, db: AsyncSession, data: bytes) -> str:
+        """Store *data* and return its key. Flushes, does not commit.
+
+        The caller commits the session_photos row that references the key in the same
+        transaction — until then the blob row stays locked against reclaiming.
+        """
+        writer = self.writer()
+        try:
+            writer.write(data)
+            return await writer.save(db)
+        except BaseException:
+            writer.abort()
+            raise
+
+    async def _upsert(self, db: AsyncSession, key: str, size: int, payload: bytes | None) -> None:
+        now = _utcnow()
+        insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        stmt = insert(PhotoBlob).values(
+            sha256=key,
+            size=size,
+            data=payload,
+            created_at=now,
+            last_used_at=now,
+        )
+        await db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[PhotoBlob.sha256],
+                set_={
+                    "last_used_at": now,
+                    # A blob first stored by the other backend gains its payload here.
+                    "data": func.coalesce(PhotoBlob.data, stmt.excluded.data),
+                },
+            )
+        )
+
+    async def get(self, db: AsyncSession, keys: list[str]) -> list[bytes]:
+        """The bytes for *keys*, in order. A blob that cannot be found is skipped."""
+        return await self._load(db, keys, self._read)
+
+    async def open(self, db: AsyncSession, keys: list[str]) -> list[Photo]:
+        """Like :meth:`get`, but the fs backend maps the files instead of reading them.
+
+        A read copies the whole photo onto the heap, where it stays for the minutes an
+        OCR job takes; a mapping leaves the bytes in the page cache, and the provider
+        pulls in and drops a slice at a time as it sends them. Hand the result to
+        :func:`close_photos` when done.
+        """
+        return await self._load(db, keys, self._map)
+
+    async def _load(self, db: AsyncSession, keys: list[str], fetch) -> list:
+        if not keys:
+            return []
+        rows = await db.execute(
+            select(PhotoBlob.sha256, PhotoBlob.data).where(PhotoBlob.sha256.in_(keys))
+        )
+        on_rows = dict(rows.all())
+        photos = []
+        for key in keys:
+            # Rows migrated from session_photos.data carry their bytes whatever the
+            # backend; everything else is wherever this backend put it.
+            data = on_rows.get(key) or await fetch(key)
+            if data is None:
+                logger.error("Photo blob %s is missing from the %s store", key, self.name)
+                continue
+            photos.append(data)
+        return photos
+
+    async def release(self, db: AsyncSession, keys: list[str]) -> int:
+        """Reclaim the blobs among *keys* that nothing references any more; commits.
+
+        Called once the references have been committed away, so the space of a scanned
+        receipt goes right after OCR instead of waiting for the next sweep.
+        """
+        if not keys:
+            return 0
+        return await self._reclaim(db, PhotoBlob.sha256.in_(set(keys)))
+
+    async def gc(self, db: AsyncSession, grace: timedelta = GC_GRACE) -> int:
+        """Reclaim every unreferenced blob unused for *grace*; commits."""
+        return await self._reclaim(db, PhotoBlob.last_used_at < _utcnow() - grace)
+
+    async def _reclaim(self, db: AsyncSession, condition) -> int:
+        referenced = exists().where(SessionPhoto.blob_sha256 == PhotoBlob.sha256)
+        try:
+            result = await db.execute(
+                delete(PhotoBlob)
+                .where(condition, ~referenced)
+                .returning(PhotoBlob.sha256, PhotoBlob.size)
+            )
+            gone = result.all()
+            # Before the commit, while the deleted rows are still locked: an upload of
+            # the same bytes waits for us, then writes its payload afresh.
+            await self._remove([key for key, _size in gone])
+            await db.commit()
+        except IntegrityError:
+            # An upload referenced one of them between our check and our delete. Leave
+            # the lot to the next sweep rather than pick the batch apart.
+            await db.rollback()
+            logger.info("Photo store sweep raced an upload; retrying on the next one")
+            return 0
+        if gone:
+            freed = sum(size for _key, size in gone)
+            metrics.inc("photo_store_reclaimed_blobs_total", len(gone), store=self.name)
+            metrics.inc("photo_store_reclaimed_bytes_total", freed, store=self.name)
+            logger.info("Photo store reclaimed %d blobs, %d bytes", len(gone), freed)
+        return len(gone)
+
+    async def usage(self, db: AsyncSession) -> tuple[int, int]:
+        """(blobs, bytes) currently stored."""
+        result = await db.execute(select(func.count(), func.coalesce(func.sum(PhotoBlob.size), 0)))
+        blobs, size = result.one()
+        return int(blobs), int(size)
+
+    async def _read(self, key: str) -> bytes | None:
+        return None
+
+    async def _map(self, key: str) -> Photo | None:
+        return await self._read(key)
+
+    async def _remove(self, keys: list[str]) -> None:
+        pass
+
+
+class BlobWriter(ABC):
+    """One blob arriving in chunks, hashed and measured as it goes.
+
+    An upload used to be read whole into memory before its size was even checked; a
+    writer lets the caller feed it network chunks, look at :attr:`size` after each one
+    and give up early. Nothing is visible to readers or reclaimable until :meth:`save`;
+    :meth:`abort` throws the bytes away.
+    """
+
+    def __init__(self, store: PhotoStore) -> None:
+        self._store = store
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    @property
+    def key(self) -> str:
+        return self._hash.hexdigest()
+
+    def write(self, chunk: bytes) -> None:
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        self._append(chunk)
+
+    async def save(self, db: AsyncSession) -> str:
+        """Record the blob and return its key. Flushes, does not commit — as put()."""
+        key = self.key
+        # The row first: its lock is what keeps a concurrent reclaim off the payload.
+        await self._store._upsert(db, key, self.size, self._row_payload())
+        await self._finish(key)
+        metrics.inc("photo_store_puts_total", store=self._store.name)
+        return key
+
+    def abort(self) -> None:
+        pass
+
+    @abstractmethod
+    def _append(self, chunk: bytes) -> None:
+        """Keep *chunk* wherever this backend keeps the bytes until :meth:`save`."""
+
+    def _row_payload(self) -> bytes | None:
+        return None
+
+    async def _finish(self, key: str) -> None:
+        pass
+
+
+class _RowWriter(BlobWriter):
+    # bytea is written in one piece, so this backend holds the whole photo in memory
+    # regardless; the chunking still buys the early size check.
+    def __init__(self, store: PhotoStore) -> None:
+        super().__init__(store)
+        self._data = bytearray()
+
+    def _append(self, chunk: bytes) -> None:
+        self._data += chunk
+
+    def _row_payload(self) -> bytes | None:
+        return bytes(self._data)
+
+    def abort(self) -> None:
+        self._data = bytearray()
+
+
+class _FileWriter(BlobWriter):
+    """Chunks go straight to a temporary file; the hash names it only at the end.
+
+    The temporary file lives under ``<root>/.incoming`` — same filesystem, so the rename
+    into place is atomic — and an upload that dies without abort() leaves it to gc().
+    Chunk writes stay on the event loop: a network chunk into the page cache is cheaper
+    than the thread hop. The fsync is not, and runs in a thread in :meth:`_finish`.
+    """
+
+    def __init__(self, store: FsPhotoStore) -> None:
+        super().__init__(store)
+        self._fs = store
+        self._tmp: Path | None = None
+        self._file: BinaryIO | None = None
+
+    def _open(self) -> BinaryIO:
+        if self._file is None:
+            incoming = self._fs.incoming
+            incoming.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=incoming, prefix=".upload-", suffix=".tmp")
+            self._tmp = Path(tmp)
+            self._file = os.fdopen(fd, "wb")
+        return self._file
+
+    def _append(self, chunk: bytes) -> None:
+        self._open().write(chunk)
+
+    async def _finish(self, key: str) -> None:
+        self._open()
+        try:
+            await asyncio.to_thread(self._finish_sync, key)
+        except BaseException:
+            self.abort()
+            raise
+
+    def _finish_sync(self, key: str) -> None:
+        assert self._file is not None and self._tmp is not None
+        path = self._fs.path(key)
+        if path.exists():
+            # Same name, same bytes: the deduplication, for free. The touch keeps an old
+            # file from looking orphaned to gc() while our row is not yet committed.
+            self.abort()
+            os.utime(path)
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self._tmp, path)
+        self._file = self._tmp = None
+
+    def abort(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        if self._tmp is not None:
+            self._tmp.unlink(missing_ok=True)
+        self._file = self._tmp = None
+
+
+class DbPhotoStore(PhotoStore):
+    """Bytes on the photo_blobs row. Deleting the row is reclaiming them."""
+
+    name = "db"
+
+    def writer(self) -> BlobWriter:
+        return _RowWriter(self)
+
+
+class FsPhotoStore(PhotoStore):
+    """One file per blob: ``<root>/<first two hex digits>/<sha256>``."""
+
+    name = "fs"
+
+    def __init__(self, root: str | Path) -> None:
+        self._root = Path(root)
+
+    def path(self, key: str) -> Path:
+        return self._root / key[:2] / key
+
+    @property
+    def incoming(self) -> Path:
+        return self._root / ".incoming"
+
+    def writer(self) -> BlobWriter:
+        return _FileWriter(self)
+
+    async def _read(self, key: str) -> bytes | None:
+        try:
+            return await asyncio.to_thread(self.path(key).read_bytes)
+        except FileNotFoundError:
+            return None
+
+    async def _map(self, key: str) -> Photo | None:
+        return await asyncio.to_thread(self._map_sync, key)
+
+    def _map_sync(self, key: str) -> Photo | None:
+        try:
+            with open(self.path(key), "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return b""  # mmap refuses empty files
+                # The mapping outlives the descriptor, and an unlink by gc() meanwhile:
+                # the inode stays until the mapping is closed.
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+
+    async def _remove(self, keys: list[str]) -> None:
+        if keys:
+            await asyncio.to_thread(self._remove_sync, keys)
+
+    def _remove_sync(self, keys: list[str]) -> None:
+        for key in keys:
+            self.path(key).unlink(missing_ok=True)
+
+    async def gc(self, db: AsyncSession, grace: timedelta = GC_GRACE) -> int:
+        """Also sweep files that have no row: uploads rolled back after the write,
+        temporary files of a write that crashed half-way."""
+        reclaimed = await super().gc(db, grace)
+        cutoff = time.time() - grace.total_seconds()
+        stale = await asyncio.to_thread(self._stale_files, cutoff)
+        if not stale:
+            return reclaimed
+        named = [p.name for p in stale if not p.name.startswith(".")]
+        known: set[str] = set()
+        for start in range(0, len(named), 500):
+            rows = await db.execute(
+                select(PhotoBlob.sha256).where(PhotoBlob.sha256.in_(named[start : start + 500]))
+            )
+            known.update(rows.scalars().all())
+        await db.rollback()
+        orphans = [p for p in stale if p.name not in known]
+        orphans = await asyncio.to_thread(self._remove_stale, orphans, cutoff)
+        if orphans:
+            logger.info("Photo store removed %d orphaned files", len(orphans))
+        return reclaimed + len(orphans)
+
+    @staticmethod
+    def _remove_stale(paths: list[Path], cutoff: float) -> list[Path]:
+        removed = []
+        for path in paths:
+            try:
+                # Looked at again: an upload may have touched it since the listing.
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed.append(path)
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def _stale_files(self, cutoff: float) -> list[Path]:
+        if not self._root.is_dir():
+            return []
+        return [p for p in self._root.glob("*/*") if p.is_file() and p.stat().st_mtime < cutoff]
+
+
+def close_photos(photos: list[Photo]) -> None:
+    """Unmap what :meth:`PhotoStore.open` mapped."""
+    for photo in photos:
+        if isinstance(photo, mmap.mmap):
+            try:
+                photo.close()
+            except BufferError:
+                # A request body abandoned mid-stream still holds a view; the mapping
+                # goes when that is collected.
+                logger.debug("Photo mapping still in use, left to the collector")
+
+
+def build_photo_store(kind: str, directory: str) -> PhotoStore:
+    if kind == "fs":
+        return FsPhotoStore(directory)
+    if kind == "db":
+        return DbPhotoStore()
+    raise ValueError(f"Unknown PHOTO_STORE {kind!r}")
+
+
+@lru_cache(maxsize=1)
+def get_photo_store() -> PhotoStore:
+    """The store PHOTO_STORE names, built on first use like get_settings()."""
+    from core.config import get_settings
+
+    settings = get_settings()
+    return build_photo_store(settings.photo_store, settings.photo_store_dir)
@@ -1,8 +1,15 @@
 import logging
+import time
+from collections import OrderedDict
+from collections.abc import Callable
 from datetime import datetime, timezone
 
+from sqlalchemy import DateTime, case, event, literal, or_, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, SessionTransaction
 
+from core.metrics import metrics
 from core.models.user_quota import UserQuota
 
 logger = logging.getLogger(__name__)
@@ -17,10 +24,120 @@ def _next_month_start() -> datetime:
     return now.replace(month=now.month + 1, day=1, hour=0, minute=0, second=0, microsecond=0)
 
 
+QuotaInfo = tuple[int, int, datetime]
+
+_ON_COMMIT = "quota_on_commit"
+
+
+def _on_commit(db: AsyncSession, callback: Callable[[], None]) -> None:
+    """Run *callback* once the transaction *db* is in commits; forget it on a rollback.
+
+    The callbacks are held in the session's ``info`` and run or dropped when the outer
+    transaction ends, by one pair of listeners per session, attached on first use. A
+    bare ``once=True`` after_commit listener per call stayed attached through a
+    rollback and fired on some later, unrelated commit, and every call added another.
+    """
+    sync = db.sync_session
+    pending = sync.info.get(_ON_COMMIT)
+    if pending is None:
+        pending = sync.info[_ON_COMMIT] = []
+        event.listen(sync, "after_commit", _run_on_commit)
+        event.listen(sync, "after_transaction_end", _drop_on_commit)
+    pending.append(callback)
+
+
+def _run_on_commit(session: Session) -> None:
+    pending = session.info[_ON_COMMIT]
+    callbacks, pending[:] = list(pending), []
+    for callback in callbacks:
+        callback()
+
+
+def _drop_on_commit(session: Session, transaction: SessionTransaction) -> None:
+    # After a commit the list is empty already; after a rollback this is what forgets.
+    # A savepoint ending decides nothing: the outer transaction can still go either way.
+    if transaction.parent is None:
+        session.info[_ON_COMMIT].clear()
+
+
+class QuotaCache:
+    """``(free_left, paid_scans, reset_at)`` per user, for the screens that only show it.
+
+    The Mini App asks GET /api/quota on every screen, and each ask was a get-or-create
+    and sometimes a reset commit. A hit here costs no SQL at all.
+
+    Every QuotaService write in this process drops the user's entry — after the commit
+    when the caller owns the transaction, so a read in between cannot put the old value
+    back. Writes in *another* process cannot: the API and the bot each have their own
+    cache, and the bot grants purchased scans. Entries therefore live at most *ttl*
+    seconds, never past the monthly reset, and a user with a purchase in flight is not
+    cached at all (see :meth:`hold`).
+    """
+
+    def __init__(self, ttl: float = 60.0, max_entries: int = 10_000) -> None:
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._entries: OrderedDict[int, tuple[int, QuotaInfo, float]] = OrderedDict()
+        self._held: dict[int, float] = {}
+
+    def get(self, user_tg_id: int, free_limit: int) -> QuotaInfo | None:
+        entry = self._entries.get(user_tg_id)
+        if entry is None:
+            return None
+        limit, info, expires = entry
+        if limit != free_limit or time.monotonic() >= expires or self._is_held(user_tg_id):
+            del self._entries[user_tg_id]
+            return None
+        self._entries.move_to_end(user_tg_id)
+        return info
+
+    def put(self, user_tg_id: int, free_limit: int, info: QuotaInfo) -> None:
+        if self._is_held(user_tg_id):
+            return
+        until_reset = (info[2] - datetime.now(timezone.utc)).total_seconds()
+        expires = time.monotonic() + min(self._ttl, until_reset)
+        self._entries[user_tg_id] = (free_limit, info, expires)
+        self._entries.move_to_end(user_tg_id)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_tg_id: int) -> None:
+        self._entries.pop(user_tg_id, None)
+
+    def hold(self, user_tg_id: int, seconds: float) -> None:
+        """Read *user_tg_id* from the database for the next *seconds*.
+
+        For a change this process will not see happen: the invoice route holds the
+        buyer, because the bot — another process — grants the scans once they pay.
+        """
+        self.invalidate(user_tg_id)
+        now = time.monotonic()
+        if len(self._held) > self._max_entries:
+            self._held = {uid: until for uid, until in self._held.items() if until > now}
+        self._held[user_tg_id] = now + seconds
+
+    def _is_held(self, user_tg_id: int) -> bool:
+        until = self._held.get(user_tg_id)
+        if until is None:
+            return False
+        if time.monotonic() < until:
+            return True
+        del self._held[user_tg_id]
+        return False
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._held.clear()
+
+
+quota_cache = QuotaCache()
+
+
 class QuotaService:
-    def __init__(self, db: AsyncSession, free_limit: int):
+    def __init__(self, db: AsyncSession, free_limit: int, cache: QuotaCache | None = None):
         self._db = db
         self._free_limit = free_limit
+        self._cache = cache if cache is not None else quota_cache
 
     async def _get_or_create(self, user_tg_id: int) -> UserQuota:
         quota = await self._db.get(UserQuota, user_tg_id)
@@ -47,22 +164,80 @@ class QuotaService:
             await self._db.commit()
         return quota.free_scans_used < self._free_limit
 
-    async def use_free_scan(self, user_tg_id: int) -> None:
+    async def _finish(
+        self, user_tg_id: int, commit: bool, counted: Callable[[], None] | None = None
+    ) -> None:
+        """Commit, or only flush when the caller owns the transaction.
+
+        ``commit=False`` lets a charge or refund land in the same transaction as the
+        state it pays for — see OcrJobService, where the scan and the job row that
+        records it must be committed together or not at all.
+
+        Either way the cached quota is dropped, and *counted* — the metric for the
+        change — runs, once the change is committed: a charge rolled back with the
+        caller's enqueue was never made and must not show in /metrics.
+        """
+
+        def committed() -> None:
+            self._cache.invalidate(user_tg_id)
+            if counted is not None:
+                counted()
+
+        if commit:
+            await self._db.commit()
+            committed()
+        else:
+            await self._db.flush()
+            # Now as well: this transaction's own reads must not be served the old value.
+            self._cache.invalidate(user_tg_id)
+            _on_commit(self._db, committed)
+
+    async def use_free_scan(self, user_tg_id: int, *, commit: bool = True) -> None:
         quota = await self._get_or_create(user_tg_id)
         quota.free_scans_used += 1
-        await self._db.commit()
+        await self._finish(user_tg_id, commit)
 
     async def grant_paid_scan(self, user_tg_id: int) -> None:
-        quota = await self._get_or_create(user_tg_id)
-        quota.paid_scans += 1
-        await self._db.commit()
+        await self.grant_paid_scans(user_tg_id, 1)
+
+    async def grant_paid_scans(self, user_tg_id: int, scans: int, *, commit: bool = True) -> None:
+        """Add *scans* paid scans in one upsert, creating the quota row if needed.
+
+        A pack used to be granted one grant_paid_scan() — a get-or-create and a commit —
+        per scan: forty statements and twenty commits for twenty scans, and a crash half
+        way left half a pack. With ``commit=False`` it lands in the caller's transaction
+        (see PaymentService).
+        """
+        quota = UserQuota.__table__.c
+        stmt = (
+            self._insert()(UserQuota)
+            .values(
+                user_tg_id=user_tg_id,
+                free_scans_used=0,
+                paid_scans=scans,
+                quota_reset_at=_next_month_start(),
+            )
+            .on_conflict_do_update(
+                index_elements=[quota.user_tg_id],
+                set_={"paid_scans": quota.paid_scans + scans},
+            )
+        )
+        await self._db.execute(stmt)
+        await self._finish(user_tg_id, commit)
 
-    async def use_paid_scan(self, user_tg_id: int) -> bool:
+    def _insert(self):
+        return (
+            postgresql.insert
+            if self._db.get_bind().dialect.name == "postgresql"
+            else sqlite.insert
+        )
+
+    async def use_paid_scan(self, user_tg_id: int, *, commit: bool = True) -> bool:
         """Try to use a paid scan. Returns True if successful."""
         quota = await self._get_or_create(user_tg_id)
         if quota.paid_scans > 0:
             quota.paid_scans -= 1
-            await self._db.commit()
+            await self._finish(user_tg_id, commit)
             return True
         return False
 
@@ -73,22 +248,66 @@ class QuotaService:
         quota = await self._get_or_create(user_tg_id)
         return quota.paid_scans > 0
 
-    async def use_scan(self, user_tg_id: int) -> str | None:
+    async def use_scan(self, user_tg_id: int, *, commit: bool = True) -> str | None:
         """Charge one scan — free allowance first, then a paid one.
 
         Returns which bucket paid for it (``"free"`` or ``"paid"``), or ``None`` if the
         user had nothing left. The caller must keep that value: refunding a failed scan
         has to put it back where it came from, or a paid scan silently turns into a free
         one (or vanishes once the month rolls over).
+
+        One statement: create the row if missing, apply a due monthly reset, and take
+        from whichever bucket has a scan, all under the row lock of the upsert. This used
+        to be can_scan_free() — a get-or-create and a reset with commits of their own —
+        then a second read to charge: up to five round trips and three commits, and two
+        concurrent scans could both pass the free check with one free scan left.
+
+        With ``commit=False`` the charge is only flushed; the caller commits it together
+        with whatever it bought.
         """
-        if await self.can_scan_free(user_tg_id):
-            await self.use_free_scan(user_tg_id)
-            return "free"
-        if await self.use_paid_scan(user_tg_id):
-            return "paid"
-        return None
+        quota = UserQuota.__table__.c
+        now = datetime.now(timezone.utc)
+        next_reset = literal(_next_month_start(), DateTime(timezone=True))
+        due = quota.quota_reset_at <= now
+        # The row as the lazy monthly reset leaves it, then the bucket that pays.
+        used = case((due, 0), else_=quota.free_scans_used)
+        free = used < self._free_limit
+        first_free = self._free_limit > 0
+        stmt = (
+            self._insert()(UserQuota)
+            .values(
+                user_tg_id=user_tg_id,
+                free_scans_used=1 if first_free else 0,
+                paid_scans=0,
+                quota_reset_at=_next_month_start(),
+                last_charge="free" if first_free else None,
+            )
+            .on_conflict_do_update(
+                index_elements=[quota.user_tg_id],
+                set_={
+                    "free_scans_used": case((free, used + 1), else_=used),
+                    "paid_scans": case((free, quota.paid_scans), else_=quota.paid_scans - 1),
+                    "quota_reset_at": case((due, next_reset), else_=quota.quota_reset_at),
+                    "last_charge": case((free, "free"), else_="paid"),
+                },
+                # Nothing to take from: no update, no row returned.
+                where=or_(free, quota.paid_scans > 0),
+            )
+            .returning(UserQuota)
+            .execution_options(populate_existing=True)
+        )
+        charged = (await self._db.execute(stmt)).scalar_one_or_none()
+        bucket = charged.last_charge if charged is not None else None
+        await self._finish(
+            user_tg_id,
+            commit,
+            lambda: metrics.inc("quota_charges_total", bucket=bucket or "none"),
+        )
+        return bucket
 
-    async def refund_scan(self, user_tg_id: int, charged: str | None) -> None:
+    async def refund_scan(
+        self, user_tg_id: int, charged: str | None, *, commit: bool = True
+    ) -> None:
         """Give back a scan charged by :meth:`use_scan` that produced no result.
 
         The OCR call is billed before the LLM is contacted, so a provider timeout, a
@@ -96,22 +315,37 @@ class QuotaService:
 
         A free refund clamps at zero: if the monthly boundary passed between the charge
         and the refund the counter has already been reset, and decrementing it would
-        hand out an extra scan.
+        hand out an extra scan. One UPDATE, relative to the row as it is.
         """
         if charged is None:
             return
-        quota = await self._get_or_create(user_tg_id)
+        quota = UserQuota.__table__.c
         if charged == "free":
-            quota.free_scans_used = max(0, quota.free_scans_used - 1)
+            values = {
+                "free_scans_used": case(
+                    (quota.free_scans_used > 0, quota.free_scans_used - 1), else_=0
+                )
+            }
         elif charged == "paid":
-            quota.paid_scans += 1
+            values = {"paid_scans": quota.paid_scans + 1}
         else:
             logger.warning("Unknown scan charge kind %r, not refunding", charged)
             return
-        await self._db.commit()
+        await self._db.execute(
+            update(UserQuota)
+            .where(UserQuota.user_tg_id == user_tg_id)
+            .values(**values)
+            .execution_options(synchronize_session="fetch")
+        )
+        await self._finish(
+            user_tg_id, commit, lambda: metrics.inc("quota_refunds_total", bucket=charged)
+        )
 
-    async def get_quota_info(self, user_tg_id: int) -> tuple[int, int, datetime]:
-        """Return (free_left, paid_scans, reset_at)."""
+    async def get_quota_info(self, user_tg_id: int) -> QuotaInfo:
+        """Return (free_left, paid_scans, reset_at), from :class:`QuotaCache` if it can."""
+        cached = self._cache.get(user_tg_id, self._free_limit)
+        if cached is not None:
+            return cached
         quota = await self._get_or_create(user_tg_id)
         now = datetime.now(timezone.utc)
         reset_at = quota.quota_reset_at
@@ -123,5 +357,9 @@ class QuotaService:
             await self._db.commit()
             await self._db.refresh(quota)
             reset_at = quota.quota_reset_at
+            if reset_at.tzinfo is None:
+                reset_at = reset_at.replace(tzinfo=timezone.utc)
         free_left = max(0, self._free_limit - quota.free_scans_used)
-        return free_left, quota.paid_scans, reset_at
+        info = (free_left, quota.paid_scans, reset_at)
+        self._cache.put(user_tg_id, self._free_limit, info)
+        return info
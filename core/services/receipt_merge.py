@@ -0,0 +1,179 @@
+"""Stitching the per-photo line lists of one long receipt back together.
+
+A receipt too long for one shot is photographed in parts, and people overlap the parts
+so nothing falls between them. The old merge keyed lines by exact lower-cased name
+across all photos, which was wrong both ways: an overlapping line read as "Пицца
+Маргарита" in one photo and "Пица Маргарита" in the next stayed as two dishes (the
+admin deleted the copy by hand, a round trip and a broadcast each), while the same line
+read identically was *summed* — the overlap counted twice.
+
+Here consecutive photos are aligned instead. The overlap between photo k and photo k+1
+is the suffix of k that matches a prefix of k+1, found by semi-global sequence
+alignment over (normalised name, price): an O(n·m) dynamic programme, a few
+milliseconds for two 200-line halves. Lines matched by the alignment are the same
+physical line and are kept once; lines outside the overlap — including a dish that
+genuinely appears twice — are all kept.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from decimal import Decimal
+from difflib import SequenceMatcher
+from typing import Protocol, TypeVar
+
+# Scores of the alignment. A match must outweigh the gaps around it, or a single
+# misread line in the middle of an overlap would end the overlap early.
+_MATCH = 3
+_GAP = -1
+
+# Below this many matched lines an "overlap" is indistinguishable from a dish that is
+# simply ordered again on the next photo, and the lines are kept as repeats.
+MIN_OVERLAP_LINES = 2
+
+# Names are similar enough to be the same printed line (after normalisation). Chosen
+# on tests/fixtures/receipt_overlap.json: OCR variants of one line score 0.8–0.95,
+# different dishes on the same receipt rarely above 0.6.
+NAME_SIMILARITY = 0.75
+
+_UNCERTAIN = re.compile(r"\(\?\)")
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+class Line(Protocol):
+    name: str
+    price: Decimal
+    quantity: int
+
+
+L = TypeVar("L", bound=Line)
+
+
+def normalize_name(name: str) -> str:
+    """Lower-case, ё→е, without the "(?)" uncertainty marker and punctuation."""
+    name = _UNCERTAIN.sub(" ", name.lower().replace("ё", "е"))
+    return " ".join(_NON_WORD.sub(" ", name).split())
+
+
+def names_match(a: str, b: str) -> bool:
+    """Whether two normalised names are plausibly the same printed text."""
+    if a == b:
+        return True
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    # quick_ratio() is an upper bound and an order of magnitude cheaper; most pairs
+    # that reach here (equal prices, different dishes) are rejected by it alone.
+    return matcher.quick_ratio() >= NAME_SIMILARITY and matcher.ratio() >= NAME_SIMILARITY
+
+
+@dataclass
+class Overlap:
+    """How photo k+1 continues photo k."""
+
+    start: int  # first line of the earlier photo inside the overlap
+    end: int  # lines of the later photo covered by the overlap (its prefix length)
+    matched: int
+    # The merged overlap region in receipt order, each line taken once.
+    lines: list
+
+
+def find_overlap(
+    before: list[L], after: list[L], min_matched: int = MIN_OVERLAP_LINES
+) -> Overlap | None:
+    """Align a suffix of *before* with a prefix of *after*; None if they do not overlap.
+
+    Semi-global alignment: skipping a prefix of *before* and a suffix of *after* is
+    free, everything else is scored — a matching (name, price) pair earns _MATCH, a
+    line present in only one of the photos (the LLM dropped or merged it) costs _GAP.
+    Only match/gap moves exist; two different lines facing each other are two gaps,
+    so both survive into the result. Parts known to overlap (the strips of one tiled
+    photo) lower *min_matched*, since there even one shared line is the overlap.
+    """
+    n, m = len(before), len(after)
+    if n == 0 or m == 0:
+        return None
+
+    keys_before = [(normalize_name(line.name), line.price) for line in before]
+    keys_after = [(normalize_name(line.name), line.price) for line in after]
+    # Bucket by price: only lines with equal prices can match, which leaves the
+    # (comparatively slow) name comparison for a handful of pairs per row.
+    by_price: dict[Decimal, list[int]] = {}
+    for j, (_name, price) in enumerate(keys_after):
+        by_price.setdefault(price, []).append(j)
+
+    matches: list[set[int]] = []
+    for name, price in keys_before:
+        matches.append({j for j in by_price.get(price, ()) if names_match(name, keys_after[j][0])})
+
+    # score[i][j]: best alignment of before[:i] (any suffix) with after[:j] (all of it).
+    score = [[0] * (m + 1) for _ in range(n + 1)]
+    for j in range(1, m + 1):
+        score[0][j] = score[0][j - 1] + _GAP
+    for i in range(1, n + 1):
+        row, prev = score[i], score[i - 1]
+        row_matches = matches[i - 1]
+        for j in range(1, m + 1):
+            best = max(prev[j], row[j - 1]) + _GAP
+            if (j - 1) in row_matches and prev[j - 1] + _MATCH > best:
+                best = prev[j - 1] + _MATCH
+            row[j] = best
+
+    # The overlap must run to the end of *before*; where it stops in *after* is free.
+    end = max(range(1, m + 1), key=lambda j: score[n][j])
+    if score[n][end] <= 0:
+        return None
+
+    # Trace back from (n, end) to column 0, collecting the region in reverse.
+    region: list = []
+    matched = 0
+    i, j = n, end
+    while j > 0 and i > 0:
+        if (j - 1) in matches[i - 1] and score[i][j] == score[i - 1][j - 1] + _MATCH:
+            region.append(before[i - 1])
+            matched += 1
+            i, j = i - 1, j - 1
+        elif score[i][j] == score[i - 1][j] + _GAP:
+            region.append(before[i - 1])
+            i -= 1
+        else:
+            region.append(after[j - 1])
+            j -= 1
+    while j > 0:  # lines of *after* that precede everything in *before*
+        region.append(after[j - 1])
+        j -= 1
+
+    if matched < min_matched:
+        return None
+    region.reverse()
+    return Overlap(start=i, end=end, matched=matched, lines=region)
+
+
+def stitch(
+    pages: list[list[L]], min_matched: int = MIN_OVERLAP_LINES
+) -> tuple[list[L], list[bool]]:
+    """Merge the line lists of consecutive photos.
+
+    Returns the merged lines in receipt order and, for every boundary between photo k
+    and k+1, whether they overlapped — i.e. whether they are parts of the same receipt.
+    """
+    if not pages:
+        return [], []
+    merged: list[L] = list(pages[0])
+    # Where the previous photo's span begins in *merged*. Photo k+1 is aligned against
+    # that span only — aligning against everything merged so far would let photo 3
+    # "overlap" lines of photo 1 that merely repeat.
+    window = 0
+    joined: list[bool] = []
+    for page in pages[1:]:
+        overlap = find_overlap(merged[window:], page, min_matched)
+        if overlap is None:
+            window = len(merged)
+            merged.extend(page)
+            joined.append(False)
+        else:
+            window += overlap.start
+            del merged[window:]
+            merged.extend(overlap.lines)
+            merged.extend(page[overlap.end :])
+            joined.append(True)
+    return merged, joined
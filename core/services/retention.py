@@ -0,0 +1,123 @@
+"""Deleting sessions a batch at a time: cleared history and the retention policy.
+
+DELETE /api/sessions/history used to delete all of a user's settled sessions in one
+statement inside the request, cascading synchronously into their items, votes, members
+and photos. For a long history that held row locks on all of it until the commit and
+wrote the WAL for it in one burst, while the user waited. The request now only marks
+the sessions (``sessions.deleted_at``), which takes them out of the list, and the
+purger (api/services/session_purger.py) deletes them in the background.
+
+The same batches carry out the retention policy that used to be manual runs of
+tools/db_cleanup.sh:
+
+* sessions still ``created`` — never scanned to the end, never voted on — older than
+  ``retention_abandoned_days`` are deleted;
+* photos older than ``retention_photo_days`` drop their reference to the receipt
+  bytes, as a successful OCR does; the photo store reclaims the blobs.
+
+Every batch is one statement over at most *limit* rows, chosen with
+``FOR UPDATE SKIP LOCKED``: a row a live request holds is passed over rather than
+waited for, and the next batch or run picks it up. Purgers in several processes split
+the work the same way. SQLite emits no FOR UPDATE; it serialises writers anyway.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.models.session import Session, SessionPhoto
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class RetentionService:
+    def __init__(self, db: AsyncSession) -> None:
+        self._db = db
+
+    async def mark_history_deleted(self, admin_tg_id: int) -> int:
+        """Queue the user's settled sessions for deletion; commits. Returns how many."""
+        result = await self._db.execute(
+            update(Session)
+            .where(
+                Session.admin_tg_id == admin_tg_id,
+                Session.status == "settled",
+                Session.deleted_at.is_(None),
+            )
+            .values(deleted_at=_utcnow())
+            .returning(Session.id)
+            .execution_options(synchronize_session=False)
+        )
+        marked = len(result.all())
+        await self._db.commit()
+        return marked
+
+    async def pending_deletion(self) -> int:
+        """Sessions marked for deletion and not yet deleted."""
+        return await self._db.scalar(
+            select(func.count()).select_from(Session).where(Session.deleted_at.is_not(None))
+        )
+
+    async def _delete_sessions(self, condition, order_by, limit: int) -> int:
+        batch = (
+            select(Session.id)
+            .where(condition)
+            .order_by(order_by)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        result = await self._db.execute(
+            delete(Session)
+            .where(Session.id.in_(batch))
+            .returning(Session.id)
+            .execution_options(synchronize_session=False)
+        )
+        deleted = len(result.all())
+        await self._db.commit()
+        return deleted
+
+    async def purge_deleted(self, limit: int) -> int:
+        """Delete up to *limit* sessions marked by :meth:`mark_history_deleted`; commits."""
+        return await self._delete_sessions(
+            Session.deleted_at.is_not(None), Session.deleted_at, limit
+        )
+
+    async def purge_abandoned(self, older_than: timedelta, limit: int) -> int:
+        """Delete up to *limit* sessions left ``created`` for *older_than*; commits."""
+        return await self._delete_sessions(
+            (Session.status == "created") & (Session.created_at < _utcnow() - older_than),
+            Session.created_at,
+            limit,
+        )
+
+    async def release_old_photos(self, older_than: timedelta, limit: int) -> list[str]:
+        """Drop the bytes of up to *limit* photos uploaded over *older_than* ago; commits.
+
+        Returns the blob keys let go of, for the photo store to reclaim those no other
+        photo uses (``PhotoStore.release``).
+        """
+        rows = (
+            await self._db.execute(
+                select(SessionPhoto.id, SessionPhoto.blob_sha256)
+                .where(
+                    SessionPhoto.blob_sha256.is_not(None),
+                    SessionPhoto.created_at < _utcnow() - older_than,
+                )
+                .order_by(SessionPhoto.created_at)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+        ).all()
+        if rows:
+            await self._db.execute(
+                update(SessionPhoto)
+                .where(SessionPhoto.id.in_([row.id for row in rows]))
+                .values(blob_sha256=None)
+                .execution_options(synchronize_session=False)
+            )
+        await self._db.commit()
+        return [row.blob_sha256 for row in rows]
@@ -2,7 +2,7 @@ import secrets
 from decimal import Decimal
 from uuid import UUID
 
-from sqlalchemy import select, update
+from sqlalchemy import func, select, update
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -14,16 +14,25 @@ from core.models.session import (
     SessionPhoto,
     _utcnow,
 )
+from core.services.photo_store import Photo, PhotoStore, get_photo_store
 
 
 class SessionService:
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, photos: PhotoStore | None = None):
         self._db = db
+        self._photos_override = photos
+
+    @property
+    def _photos(self) -> PhotoStore:
+        # Resolved on use: most callers never touch photos, and building the default
+        # store reads the settings.
+        return self._photos_override or get_photo_store()
 
     async def create_session(self, admin_tg_id: int, admin_display_name: str) -> Session:
         session = Session(
             admin_tg_id=admin_tg_id,
             invite_code=secrets.token_urlsafe(6)[:8],
+            member_count=1,
         )
         self._db.add(session)
         await self._db.flush()
@@ -38,17 +47,23 @@ class SessionService:
         await self._db.refresh(session)
         return session
 
+    # Both lookups pass over sessions marked for deletion (core/services/retention.py):
+    # cleared history is gone for every route and for joining the moment it is cleared,
+    # not when the purger reaches it.
     async def get_session_by_invite(self, invite_code: str) -> Session | None:
-        result = await self._db.execute(select(Session).where(Session.invite_code == invite_code))
+        result = await self._db.execute(
+            select(Session).where(Session.invite_code == invite_code, Session.deleted_at.is_(None))
+        )
         return result.scalar_one_or_none()
 
     async def get_session_by_id(self, session_id: UUID | str) -> Session | None:
         if isinstance(session_id, str):
             session_id = UUID(session_id)
-        return await self._db.get(Session, session_id)
+        session = await self._db.get(Session, session_id)
+        return session if session is not None and session.deleted_at is None else None
 
     async def join_session(
-        self, invite_code: str, user_tg_id: int, display_name: str
+        self, invite_code: str, user_tg_id: int, display_name: str, *, commit: bool = True
     ) -> SessionMember | None:
         session = await self.get_session_by_invite(invite_code)
         if session is None:
@@ -68,7 +83,10 @@ class SessionService:
         )
         self._db.add(member)
         try:
-            await self._db.commit()
+            await self._adjust_counts(session.id, members=1)
+            # With commit=False the flush still surfaces the constraint, and the caller
+            # commits the member together with whatever it adds (the admin's notification).
+            await (self._db.commit() if commit else self._db.flush())
         except IntegrityError:
             # Lost the race against a concurrent join (uq_session_members_session_user).
             # Same outcome as the check above: already a member, nothing to do.
@@ -82,48 +100,106 @@ class SessionService:
     ) -> SessionPhoto:
         if isinstance(session_id, str):
             session_id = UUID(session_id)
-        photo = SessionPhoto(session_id=session_id, tg_file_id=tg_file_id, data=data)
+        blob_sha256 = await self._photos.put(self._db, data) if data is not None else None
+        photo = SessionPhoto(session_id=session_id, tg_file_id=tg_file_id, blob_sha256=blob_sha256)
         self._db.add(photo)
         await self._db.commit()
         await self._db.refresh(photo)
         return photo
 
+    async def add_photos(
+        self, session_id: UUID | str, photos: list[tuple[str, str]]
+    ) -> list[SessionPhoto]:
+        """Record already-stored blobs as the session's photos: (tg_file_id, blob key) each.
+
+        One INSERT batch and one commit for the lot — add_photo's commit and refresh per
+        photo were two round trips each, and a batch that failed half-way left half of
+        it uploaded. Columns are filled in Python, so nothing needs reloading.
+        """
+        if isinstance(session_id, str):
+            session_id = UUID(session_id)
+        rows = [
+            SessionPhoto(session_id=session_id, tg_file_id=tg_file_id, blob_sha256=key)
+            for tg_file_id, key in photos
+        ]
+        self._db.add_all(rows)
+        await self._db.commit()
+        return rows
+
     async def get_photo_bytes(self, session_id: UUID | str) -> list[bytes]:
-        """Receipt bytes for a session, oldest first, skipping already-cleared rows.
+        """Receipt bytes for a session, oldest first, skipping already-cleared rows."""
+        return await self._photos.get(self._db, await self._pending_photo_keys(session_id))
+
+    async def open_photos(self, session_id: UUID | str) -> list[Photo]:
+        """The same photos, mapped rather than read where the store allows it.
 
-        Selects the column explicitly: SessionPhoto.data is deferred so that ordinary
-        session reads do not carry the JPEGs, and reading it through the ORM attribute
-        would emit one lazy load per photo.
+        For OCR, which holds them for the length of a job; release them with
+        :func:`~core.services.photo_store.close_photos`.
         """
+        return await self._photos.open(self._db, await self._pending_photo_keys(session_id))
+
+    async def _pending_photo_keys(self, session_id: UUID | str) -> list[str]:
         if isinstance(session_id, str):
             session_id = UUID(session_id)
         result = await self._db.execute(
-            select(SessionPhoto.data)
-            .where(SessionPhoto.session_id == session_id, SessionPhoto.data.is_not(None))
+            select(SessionPhoto.blob_sha256)
+            .where(SessionPhoto.session_id == session_id, SessionPhoto.blob_sha256.is_not(None))
             .order_by(SessionPhoto.created_at)
         )
-        return [row[0] for row in result.all()]
+        return list(result.scalars().all())
+
+    async def count_pending_photos(self, session_id: UUID | str) -> int:
+        """How many photos still carry bytes — what an OCR run would have to read."""
+        if isinstance(session_id, str):
+            session_id = UUID(session_id)
+        result = await self._db.execute(
+            select(func.count())
+            .select_from(SessionPhoto)
+            .where(SessionPhoto.session_id == session_id, SessionPhoto.blob_sha256.is_not(None))
+        )
+        return result.scalar_one()
 
-    async def clear_photo_bytes(self, session_id: UUID | str) -> None:
-        """Drop the stored bytes once the receipt has been recognised.
+    async def clear_photo_bytes(self, session_id: UUID | str, *, commit: bool = True) -> list[str]:
+        """Drop the session's references to its photo bytes once the receipt is read.
 
         The rows stay — they are the record that photos were uploaded — but the payload
-        is what costs storage, and it is dead the moment OCR succeeds.
+        is what costs storage, and it is dead the moment OCR succeeds. Returns the blob
+        keys let go of; with ``commit=False`` the caller hands them to
+        :meth:`release_photo_blobs` after its own commit.
         """
         if isinstance(session_id, str):
             session_id = UUID(session_id)
+        result = await self._db.execute(
+            select(SessionPhoto.blob_sha256).where(
+                SessionPhoto.session_id == session_id, SessionPhoto.blob_sha256.is_not(None)
+            )
+        )
+        keys = list(result.scalars().all())
         await self._db.execute(
-            update(SessionPhoto).where(SessionPhoto.session_id == session_id).values(data=None)
+            update(SessionPhoto)
+            .where(SessionPhoto.session_id == session_id)
+            .values(blob_sha256=None)
         )
-        await self._db.commit()
+        if commit:
+            await self._db.commit()
+            await self.release_photo_blobs(keys)
+        return keys
+
+    async def release_photo_blobs(self, keys: list[str]) -> None:
+        """Reclaim the blobs among *keys* no other photo still uses (a duplicate upload
+        in another session keeps its blob)."""
+        await self._photos.release(self._db, keys)
 
-    async def update_currency(self, session_id: UUID | str, currency: str) -> None:
+    async def update_currency(
+        self, session_id: UUID | str, currency: str, *, commit: bool = True
+    ) -> None:
         if isinstance(session_id, str):
             session_id = UUID(session_id)
         session = await self._db.get(Session, session_id)
         if session:
             session.currency = currency[:8] if currency else "RUB"
-            await self._db.commit()
+            if commit:
+                await self._db.commit()
 
     async def save_ocr_items(
         self, session_id: UUID | str, items_data: list[dict]
@@ -140,11 +216,29 @@ class SessionService:
             )
             self._db.add(item)
             items.append(item)
+        await self._adjust_counts(session_id, items=len(items))
         await self._db.commit()
         for item in items:
             await self._db.refresh(item)
         return items
 
+    async def _adjust_counts(self, session_id: UUID, *, members: int = 0, items: int = 0) -> None:
+        """Move sessions.member_count/item_count by the rows this transaction adds or removes.
+
+        Relative to the stored value, not recounted: a recount inside READ COMMITTED
+        does not see a concurrent join that has not committed yet, and whichever of the
+        two committed last would write its stale total. ``count + 1`` is re-evaluated
+        against the latest row version once the row lock is granted.
+        """
+        await self._db.execute(
+            update(Session)
+            .where(Session.id == session_id)
+            .values(
+                member_count=Session.member_count + members,
+                item_count=Session.item_count + items,
+            )
+        )
+
     async def _lock_item(self, item_id: UUID) -> None:
         """Take a row lock on the dish for the rest of this transaction.
 
@@ -352,7 +446,7 @@ class SessionService:
         )
         return {row.item_id: row.quantity for row in result.all()}
 
-    async def claim_settlement(self, session_id: UUID | str) -> bool:
+    async def claim_settlement(self, session_id: UUID | str, *, commit: bool = True) -> bool:
         """Move a session to ``settled``, once and only once.
 
         Returns True for the caller that performed the transition and False for every
@@ -373,7 +467,8 @@ class SessionService:
             .returning(Session.id)
         )
         claimed = result.scalar_one_or_none() is not None
-        await self._db.commit()
+        if commit:
+            await self._db.commit()
         return claimed
 
     async def update_status(self, session_id: UUID | str, status: str) -> None:
@@ -388,6 +483,7 @@ class SessionService:
         item = await self._db.get(SessionItem, item_id)
         if item:
             await self._db.delete(item)
+            await self._adjust_counts(item.session_id, items=-1)
             await self._db.commit()
 
     async def update_item(self, item_id: UUID, name: str, price: Decimal) -> None:
@@ -398,9 +494,12 @@ class SessionService:
             await self._db.commit()
 
     async def delete_unvoted_items(self, session_id: UUID | str) -> None:
+        if isinstance(session_id, str):
+            session_id = UUID(session_id)
         unvoted = await self.get_unvoted_items(session_id)
         for item in unvoted:
             await self._db.delete(item)
+        await self._adjust_counts(session_id, items=-len(unvoted))
         await self._db.commit()
 
     async def clear_photos(self, session_id: UUID | str) -> None:
@@ -409,9 +508,12 @@ class SessionService:
         result = await self._db.execute(
             select(SessionPhoto).where(SessionPhoto.session_id == session_id)
         )
-        for photo in result.scalars().all():
+        photos = result.scalars().all()
+        keys = [photo.blob_sha256 for photo in photos if photo.blob_sha256]
+        for photo in photos:
             await self._db.delete(photo)
         await self._db.commit()
+        await self.release_photo_blobs(keys)
 
     async def clear_items(self, session_id: UUID | str) -> None:
         if isinstance(session_id, str):
@@ -419,8 +521,10 @@ class SessionService:
         result = await self._db.execute(
             select(SessionItem).where(SessionItem.session_id == session_id)
         )
-        for item in result.scalars().all():
+        items = result.scalars().all()
+        for item in items:
             await self._db.delete(item)
+        await self._adjust_counts(session_id, items=-len(items))
         await self._db.commit()
 
     async def get_members(self, session_id: UUID | str) -> list[SessionMember]:
@@ -7,13 +7,17 @@ from tests.env import apply_test_env
 
 
 @pytest.fixture(autouse=True)
-def _hermetic_env(monkeypatch):
+def _hermetic_env(monkeypatch, tmp_path):
     """No test may read the developer's own .env — see tests/env.py for the bug."""
-    apply_test_env(monkeypatch)
+    apply_test_env(monkeypatch, tmp_path)
     yield
     from core.config import get_settings
+    from core.services.photo_store import get_photo_store
+    from core.services.quota import quota_cache
 
     get_settings.cache_clear()
+    get_photo_store.cache_clear()
+    quota_cache.clear()
 
 
 @pytest.fixture
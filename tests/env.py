@@ -32,11 +32,18 @@ TEST_ENV: dict[str, str] = {
 }
 
 
-def apply_test_env(monkeypatch) -> None:
-    """Pin the environment and drop any settings cached from a previous value."""
+def apply_test_env(monkeypatch, tmp_path) -> None:
+    """Pin the environment and drop any settings cached from a previous value.
+
+    Photos go to a per-test directory: the default PHOTO_STORE_DIR is relative to the
+    working directory, and one test's files must not satisfy another's reads.
+    """
     from core.config import get_settings
+    from core.services.photo_store import get_photo_store
 
     for key, value in TEST_ENV.items():
         monkeypatch.setenv(key, value)
+    monkeypatch.setenv("PHOTO_STORE_DIR", str(tmp_path / "photos"))
     # get_settings() is lru_cached; a value built before this fixture ran would survive.
     get_settings.cache_clear()
+    get_photo_store.cache_clear()
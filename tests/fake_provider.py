@@ -0,0 +1,59 @@
+"""A scriptable stand-in for the OCR provider's chat-completions endpoint.
+
+Plugs into ``OcrService(transport=...)`` through ``httpx.MockTransport``, so the real
+request/response path — status handling, retries, hedging — runs unchanged; only the
+network is fake. Each call consumes the next step of the script (the last step repeats):
+
+* an ``int`` — answer with that status (200 carries a parseable receipt);
+* ``"timeout"`` / ``"connect"`` — raise the matching httpx transport error;
+* ``"garbage"`` — a 200 whose body is not JSON, as a misconfigured proxy sends;
+* a ``(delay, step)`` tuple — sleep *delay* seconds, then behave like *step*.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+
+import httpx
+
+RECEIPT = {
+    "items": [{"name": "Pizza", "price": 500, "quantity": 1}],
+    "total": 500,
+    "currency": "RUB",
+}
+
+Step = int | str | tuple[float, "Step"]
+
+
+class FakeProvider:
+    def __init__(self, *script: Step, retry_after: str | None = None) -> None:
+        self._script = list(script) or [200]
+        self._retry_after = retry_after
+        self.calls = 0
+
+    @property
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self._handle)
+
+    async def _handle(self, request: httpx.Request) -> httpx.Response:
+        step = self._script[min(self.calls, len(self._script) - 1)]
+        self.calls += 1
+        return await self._play(step, request)
+
+    async def _play(self, step: Step, request: httpx.Request) -> httpx.Response:
+        if isinstance(step, tuple):
+            delay, then = step
+            await asyncio.sleep(delay)
+            return await self._play(then, request)
+        if step == "timeout":
+            raise httpx.ReadTimeout("fake provider timed out", request=request)
+        if step == "connect":
+            raise httpx.ConnectError("fake provider unreachable", request=request)
+        if step == "garbage":
+            return httpx.Response(200, text="<html>Bad Gateway</html>")
+        if step == 200:
+            content = json.dumps(RECEIPT)
+            return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+        headers = {"Retry-After": self._retry_after} if self._retry_after else {}
+        return httpx.Response(step, headers=headers, json={"error": "fake"})
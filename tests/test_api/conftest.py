@@ -6,6 +6,7 @@ Provides:
 - db_session: async SQLAlchemy session backed by in-memory SQLite
 - client: httpx.AsyncClient wired to the FastAPI app with dependency overrides
 - auth_headers: Authorization headers with valid initData for the default test user
+- ocr_worker: the OCR worker pool, driven by hand via run_once() on the test session
 """
 
 from __future__ import annotations
@@ -14,6 +15,7 @@ import hashlib
 import hmac
 import json
 import time
+from contextlib import asynccontextmanager
 from unittest.mock import patch
 from urllib.parse import urlencode
 
@@ -51,13 +53,19 @@ def make_init_data(
 
 
 @pytest.fixture(autouse=True)
-def _hermetic_env(monkeypatch):
+def _hermetic_env(monkeypatch, tmp_path):
     """Keep the developer's own .env out of every test. See tests/env.py."""
-    apply_test_env(monkeypatch)
+    apply_test_env(monkeypatch, tmp_path)
     yield
+    from api.auth import _validated
     from core.config import get_settings
+    from core.services.photo_store import get_photo_store
+    from core.services.quota import quota_cache
 
     get_settings.cache_clear()
+    get_photo_store.cache_clear()
+    quota_cache.clear()
+    _validated.clear()
 
 
 @pytest.fixture
@@ -108,16 +116,11 @@ async def client(db_session, test_settings):
     # We patch both `core.config` (canonical location) and `api.auth`
     # (already-imported reference) to ensure the test settings are used
     # regardless of import order.
-    from unittest.mock import AsyncMock
-
-    mock_notifier = AsyncMock()
-    mock_notifier.notify_member_joined = AsyncMock(return_value=True)
-    mock_notifier.notify_settle = AsyncMock()
-
+    # Notifications only reach the outbox table: the sender is started by the app's
+    # lifespan, which these tests do not run, so nothing is sent to Telegram.
     with (
         patch("core.config.get_settings", return_value=test_settings),
         patch("api.auth.get_settings", return_value=test_settings),
-        patch("api.routes.sessions.NotificationService", return_value=mock_notifier),
     ):
         app = create_app()
 
@@ -136,3 +139,35 @@ def auth_headers():
     """Authorization headers with valid initData for the default test user."""
     init_data = make_init_data()
     return {"Authorization": f"tma {init_data}"}
+
+
+@pytest.fixture
+def ocr_worker(db_session):
+    """An OCR worker pool that is never started: tests call ``run_once()`` themselves.
+
+    It shares ``db_session`` with the ``client`` fixture, so a job queued through the API
+    is visible to the worker and its outcome is visible to the next request.
+    """
+    from api.services.ocr_worker import OcrWorkerPool
+    from api.ws import ConnectionManager
+
+    @asynccontextmanager
+    async def shared_session():
+        yield db_session
+
+    return OcrWorkerPool(ConnectionManager(), session_factory=shared_session)
+
+
+@pytest.fixture
+def session_purger(db_session):
+    """A session purger that is never started: tests call ``run_once()`` themselves.
+
+    Like ``ocr_worker`` it shares ``db_session``, and it does not pause between batches.
+    """
+    from api.services.session_purger import SessionPurger
+
+    @asynccontextmanager
+    async def shared_session():
+        yield db_session
+
+    return SessionPurger(session_factory=shared_session, pause=0)
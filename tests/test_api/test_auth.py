@@ -6,11 +6,20 @@ import hashlib
 import hmac
 import json
 import time
+from unittest.mock import patch
 from urllib.parse import urlencode
 
 import pytest
+from fastapi import HTTPException
 
-from api.auth import TelegramUser, _parse_telegram_user, validate_init_data
+from api.auth import (
+    TelegramUser,
+    _parse_telegram_user,
+    _secret_key,
+    _validated,
+    authenticate_init_data,
+    validate_init_data,
+)
 
 TEST_BOT_TOKEN = "1234567890:ABCdefGHIjklMNOpqrsTUVwxyz"
 
@@ -128,3 +137,64 @@ class TestParseTelegramUser:
         user_json = json.dumps({"first_name": "NoId"})
         with pytest.raises(KeyError):
             _parse_telegram_user(user_json)
+
+
+class TestAuthenticateInitData:
+    """The same initData arrives with every request of a Mini App session.
+
+    It used to be parsed, HMAC'd twice and JSON-decoded each time; a string that
+    validated once is now remembered until it would have expired anyway.
+    """
+
+    @pytest.fixture(autouse=True)
+    def _fresh_cache(self):
+        _validated.clear()
+        yield
+        _validated.clear()
+
+    def test_a_repeated_init_data_is_validated_once(self) -> None:
+        init_data = make_init_data(user_id=7, first_name="Ann")
+
+        with patch("api.auth.validate_init_data", wraps=validate_init_data) as validate:
+            users = [authenticate_init_data(init_data, TEST_BOT_TOKEN) for _ in range(3)]
+
+        assert validate.call_count == 1
+        assert users == [TelegramUser(id=7, first_name="Ann")] * 3
+
+    def test_the_secret_key_is_derived_once_per_token(self) -> None:
+        _secret_key.cache_clear()
+        for user_id in range(3):
+            validate_init_data(make_init_data(user_id=user_id), TEST_BOT_TOKEN)
+
+        assert _secret_key.cache_info().misses == 1
+
+    def test_a_remembered_init_data_still_expires(self, monkeypatch) -> None:
+        auth_date = int(time.time()) - 86400 + 5
+        init_data = make_init_data(auth_date=auth_date)
+        authenticate_init_data(init_data, TEST_BOT_TOKEN)
+
+        monkeypatch.setattr("api.auth.time.time", lambda: auth_date + 86400 + 1)
+
+        with pytest.raises(HTTPException) as exc:
+            authenticate_init_data(init_data, TEST_BOT_TOKEN)
+        assert exc.value.status_code == 401
+
+    def test_only_the_exact_string_hits(self) -> None:
+        init_data = make_init_data()
+        authenticate_init_data(init_data, TEST_BOT_TOKEN)
+
+        with pytest.raises(HTTPException):
+            authenticate_init_data(init_data.replace("hash=", "hash=0000"), TEST_BOT_TOKEN)
+        with pytest.raises(HTTPException):
+            authenticate_init_data(init_data, "wrong:token")
+
+    def test_failures_are_not_remembered(self) -> None:
+        init_data = make_init_data()
+
+        with pytest.raises(HTTPException):
+            authenticate_init_data(init_data, "wrong:token")
+        with patch("api.auth.validate_init_data", wraps=validate_init_data) as validate:
+            with pytest.raises(HTTPException):
+                authenticate_init_data(init_data, "wrong:token")
+
+        assert validate.call_count == 1
@@ -0,0 +1,97 @@
+"""Bearer tokens traded for initData once, instead of initData on every request.
+
+The Mini App used to send its whole initData — several hundred bytes of URL-encoded
+JSON — in every Authorization header and WebSocket URL, and the server parsed and
+re-validated it each time. POST /api/auth/token now issues a compact signed token that
+both accept alongside ``tma``.
+"""
+
+from __future__ import annotations
+
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from api.auth import authenticate_credentials, issue_token, verify_token
+from tests.env import TEST_BOT_TOKEN
+from tests.test_api.conftest import make_init_data
+
+
+async def _token(client, init_data: str | None = None, **body) -> dict:
+    resp = await client.post(
+        "/api/auth/token",
+        json=body or None,
+        headers={"Authorization": f"tma {init_data or make_init_data()}"},
+    )
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def _bearer(token: str) -> dict[str, str]:
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def test_a_token_stands_in_for_init_data(client, auth_headers):
+    issued = await _token(client, make_init_data(first_name="Ann"))
+
+    created = await client.post("/api/sessions", json={}, headers=_bearer(issued["token"]))
+
+    assert created.status_code == 201
+    assert created.json()["members"][0]["display_name"] == "Ann"
+    assert issued["expires_in"] == pytest.approx(3600, abs=5)
+    assert len(issued["token"]) < len(auth_headers["Authorization"]) / 2
+
+
+async def test_a_token_does_not_buy_another(client):
+    issued = await _token(client)
+
+    resp = await client.post("/api/auth/token", headers=_bearer(issued["token"]))
+
+    assert resp.status_code == 401
+
+
+async def test_a_token_never_outlives_its_init_data(client):
+    nearly_stale = make_init_data(auth_date=int(time.time()) - 86400 + 60)
+
+    issued = await _token(client, nearly_stale)
+
+    assert issued["expires_in"] <= 60
+
+
+async def test_tampered_foreign_and_expired_tokens_are_refused(client, monkeypatch):
+    token = (await _token(client))["token"]
+    payload, signature = token.split(".")
+    forged = f"{payload[:-2]}AA.{signature}"
+
+    for bad in (forged, token + "x", "garbage"):
+        resp = await client.get("/api/sessions/my", headers=_bearer(bad))
+        assert resp.status_code == 401, bad
+    with pytest.raises(HTTPException):
+        verify_token(token, "other:bot-token")
+
+    later = time.time() + 3601
+    monkeypatch.setattr("api.auth.time.time", lambda: later)
+    resp = await client.get("/api/sessions/my", headers=_bearer(token))
+    assert resp.status_code == 401
+
+
+async def test_a_scoped_token_opens_its_own_session_only(client, auth_headers):
+    mine = (await client.post("/api/sessions", json={}, headers=auth_headers)).json()["id"]
+    other = (await client.post("/api/sessions", json={}, headers=auth_headers)).json()["id"]
+    token = (await _token(client, session_id=mine))["token"]
+
+    assert (await client.get(f"/api/sessions/{mine}", headers=_bearer(token))).status_code == 200
+    assert (await client.get(f"/api/sessions/{other}", headers=_bearer(token))).status_code == 403
+    assert (await client.get("/api/sessions/my", headers=_bearer(token))).status_code == 403
+
+
+def test_the_websocket_takes_either_credential():
+    init_data = make_init_data(user_id=7)
+    token, _ = issue_token(init_data, TEST_BOT_TOKEN, 60, session_id="s1")
+
+    assert authenticate_credentials(init_data, TEST_BOT_TOKEN, "s1").id == 7
+    assert authenticate_credentials(token, TEST_BOT_TOKEN, "s1").id == 7
+    with pytest.raises(HTTPException) as exc:
+        authenticate_credentials(token, TEST_BOT_TOKEN, "s2")
+    assert exc.value.status_code == 403
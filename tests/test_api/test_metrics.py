@@ -0,0 +1,158 @@
+"""GET /metrics and the series behind it.
+
+There used to be nothing to look at but /api/health: no request rates or latencies, no
+WebSocket or pool occupancy. The registry in core/metrics.py now keeps counters, gauges
+and histograms without a lock on the hot path, and /metrics renders them for Prometheus.
+"""
+
+from __future__ import annotations
+
+import re
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from api.metrics import collect_db_pool
+from api.ws import ConnectionManager
+from core.metrics import Metrics, metrics
+from core.services.quota import QuotaService
+from tests.env import TEST_FREE_SCANS
+
+
+TOKEN = {"Authorization": "Bearer s3cret"}
+
+
+@pytest.fixture(autouse=True)
+def _fresh_metrics():
+    metrics.reset()
+
+
+@pytest.fixture
+def metrics_token(test_settings, monkeypatch):
+    with_token = test_settings.model_copy(update={"metrics_token": "s3cret"})
+    monkeypatch.setattr("api.routes.metrics.get_settings", lambda: with_token)
+
+
+def _sample(text: str, series: str) -> float:
+    match = re.search(rf"^{re.escape(series)} (\S+)$", text, re.MULTILINE)
+    assert match, f"{series} not in\n{text}"
+    return float(match[1])
+
+
+async def test_requests_are_counted_and_timed_per_route_template(
+    client, auth_headers, metrics_token
+):
+    for _ in range(2):
+        await client.get(
+            "/api/sessions/00000000-0000-0000-0000-000000000000", headers=auth_headers
+        )
+    await client.get("/api/nope")
+
+    body = (await client.get("/metrics", headers=TOKEN)).text
+
+    route = 'method="GET",route="/api/sessions/{session_id}"'
+    assert _sample(body, f'http_requests_total{{{route},status="404"}}') == 2
+    assert _sample(body, f"http_request_duration_seconds_count{{{route}}}") == 2
+    assert _sample(body, f'http_request_duration_seconds_bucket{{{route},le="+Inf"}}') == 2
+    assert 'route="/api/nope"' not in body, "raw paths would be one series per URL"
+
+
+async def test_metrics_token_is_enforced(client, metrics_token):
+    assert (await client.get("/metrics")).status_code == 401
+    ok = await client.get("/metrics", headers=TOKEN)
+    assert ok.status_code == 200
+    assert ok.headers["content-type"].startswith("text/plain; version=0.0.4")
+
+
+async def test_without_a_token_there_is_no_endpoint(client):
+    """Unconfigured must not mean public: this is the app users talk to."""
+    resp = await client.get("/metrics", headers=TOKEN)
+
+    assert resp.status_code == 404
+
+
+def test_histograms_render_cumulative_buckets():
+    registry = Metrics()
+    for value in (0.01, 0.2, 0.2, 7):
+        registry.observe("x_seconds", value, buckets=(0.01, 0.1, 1.0), route="/a")
+
+    body = registry.render()
+
+    assert body.startswith("# TYPE x_seconds histogram\n")
+    buckets = [
+        _sample(body, f'x_seconds_bucket{{route="/a",le="{le}"}}')
+        for le in ("0.01", "0.1", "1", "+Inf")
+    ]
+    assert buckets == [1, 1, 3, 4]
+    assert _sample(body, 'x_seconds_sum{route="/a"}') == pytest.approx(7.41)
+
+
+def test_large_counters_are_not_rounded():
+    registry = Metrics()
+    registry.inc("big_total", 12_345_678)
+
+    assert "big_total 12345678\n" in registry.render()
+
+
+async def test_websocket_gauges_follow_connections_and_broadcasts_are_timed():
+    manager = ConnectionManager()
+    a, b, broken = AsyncMock(), AsyncMock(), AsyncMock()
+    broken.send_json.side_effect = RuntimeError("gone")
+    await manager.connect("s1", a)
+    await manager.connect("s1", broken)
+    await manager.connect("s2", b)
+    assert (metrics.value("ws_connections"), metrics.value("ws_sessions")) == (3, 2)
+
+    await manager.broadcast("s1", {"type": "vote_updated"})
+    # The receive loop of the broken socket ends too, and disconnects it again.
+    manager.disconnect("s1", broken)
+
+    assert (metrics.value("ws_connections"), metrics.value("ws_sessions")) == (2, 2)
+    assert metrics.value("ws_messages_sent_total", event="vote_updated") == 1
+    assert metrics.value("ws_send_failures_total") == 1
+    assert metrics.histogram("ws_broadcast_seconds").count == 1
+
+
+async def test_scan_charges_and_refunds_are_counted_by_bucket(db_session):
+    quota = QuotaService(db_session, TEST_FREE_SCANS)
+    await quota.grant_paid_scans(1, 1)
+
+    charges = [await quota.use_scan(1) for _ in range(TEST_FREE_SCANS + 2)]
+    await quota.refund_scan(1, "paid")
+
+    assert charges[-1] is None
+    assert metrics.value("quota_charges_total", bucket="free") == TEST_FREE_SCANS
+    assert metrics.value("quota_charges_total", bucket="paid") == 1
+    assert metrics.value("quota_charges_total", bucket="none") == 1
+    assert metrics.value("quota_refunds_total", bucket="paid") == 1
+
+
+async def test_a_charge_counts_only_once_the_caller_commits(db_session):
+    """With commit=False the charge shares the enqueue's fate, and so does its metric."""
+    quota = QuotaService(db_session, TEST_FREE_SCANS)
+
+    assert await quota.use_scan(1, commit=False) == "free"
+    assert metrics.value("quota_charges_total", bucket="free") == 0
+    await db_session.rollback()
+    assert metrics.value("quota_charges_total", bucket="free") == 0
+
+    await quota.use_scan(1, commit=False)
+    await db_session.commit()
+    assert metrics.value("quota_charges_total", bucket="free") == 1
+
+
+async def test_pool_gauges_are_read_at_scrape_time(monkeypatch):
+    engine = create_async_engine(
+        "postgresql+asyncpg://user@localhost/none", pool_size=7, max_overflow=3
+    )
+    monkeypatch.setattr("core.db._engine", engine)
+    registry = Metrics()
+    registry.add_collector(collect_db_pool)
+
+    body = registry.render()
+
+    assert _sample(body, "db_pool_size") == 7
+    assert _sample(body, "db_pool_checked_out") == 0
+    assert _sample(body, "db_pool_overflow") == -7
+    await engine.dispose()
@@ -0,0 +1,320 @@
+"""The notification outbox and the sender that drains it.
+
+Notifications used to be sent from inside the request: POST /settle awaited one Bot API
+call per member, a big settlement ran straight into Telegram's 429 flood control, and a
+message that failed — or was in flight when the process restarted — was lost without a
+trace. Routes now only write outbox rows in the transaction of the change they announce;
+the sender paces, retries and records them.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select, update
+
+from api.services.notification_sender import (
+    ChatPacer,
+    NotificationSender,
+    TokenBucket,
+    fan_out,
+)
+from api.services.notifications import Delivery
+from core.models.notification import OutboxMessage
+from core.services.outbox import MAX_ATTEMPTS, Notification, OutboxService
+from core.services.session import SessionService
+from tests.test_api.conftest import make_init_data
+
+ADMIN = 12345
+GUEST = 54321
+
+
+class FakeNotifier:
+    """Answers every send with the next scripted Delivery (the last one repeats)."""
+
+    def __init__(self, *deliveries: Delivery) -> None:
+        self._deliveries = list(deliveries) or [Delivery(ok=True)]
+        self.sent: list[tuple[int, str]] = []
+
+    async def deliver(self, chat_id: int, text: str, reply_markup: dict | None = None):
+        self.sent.append((chat_id, text))
+        if len(self._deliveries) > 1:
+            return self._deliveries.pop(0)
+        return self._deliveries[0]
+
+
+def _sender(db_session, notifier: FakeNotifier, **options) -> NotificationSender:
+    @asynccontextmanager
+    async def shared_session():
+        yield db_session
+
+    return NotificationSender(
+        notifier, session_factory=shared_session, rate=1000.0, chat_interval=0.0, **options
+    )
+
+
+async def _rows(db_session) -> list[OutboxMessage]:
+    result = await db_session.execute(
+        select(OutboxMessage)
+        .order_by(OutboxMessage.created_at)
+        .execution_options(populate_existing=True)
+    )
+    return list(result.scalars().all())
+
+
+async def _make_due(db_session) -> None:
+    """Skip whatever backoff the sender scheduled."""
+    await db_session.execute(
+        update(OutboxMessage).values(available_at=datetime.now(timezone.utc) - timedelta(1))
+    )
+    await db_session.commit()
+
+
+async def test_joining_queues_one_message_for_the_admin(client, db_session):
+    session = await SessionService(db_session).create_session(ADMIN, "Admin")
+    headers = {"Authorization": f"tma {make_init_data(user_id=GUEST, first_name='Guest')}"}
+
+    resp = await client.post(f"/api/sessions/invite/{session.invite_code}/join", headers=headers)
+
+    assert resp.status_code == 201
+    [row] = await _rows(db_session)
+    assert (row.chat_id, row.text, row.status) == (ADMIN, "Guest присоединился к чеку", "pending")
+
+
+async def test_a_double_tapped_reminder_is_queued_once(client, auth_headers, db_session):
+    svc = SessionService(db_session)
+    session = await svc.create_session(ADMIN, "Admin")
+    await svc.join_session(session.invite_code, GUEST, "Guest")
+    session_id = session.id
+    # The route reads session.members; in production every request has its own session.
+    db_session.expire_all()
+
+    for _ in range(2):
+        resp = await client.post(
+            f"/api/sessions/{session_id}/remind/{GUEST}", headers=auth_headers
+        )
+        assert resp.json() == {"sent": True}
+
+    reminders = [row for row in await _rows(db_session) if row.chat_id == GUEST]
+    assert len(reminders) == 1
+
+
+async def test_remind_all_queues_one_reminder_per_unconfirmed_member(
+    client, auth_headers, db_session
+):
+    svc = SessionService(db_session)
+    session = await svc.create_session(ADMIN, "Admin")
+    for tg_id in (GUEST, 3, 4):
+        await svc.join_session(session.invite_code, tg_id, f"Guest {tg_id}")
+    await svc.confirm_member(session.id, 4)
+    session_id = session.id
+    db_session.expire_all()
+
+    first = await client.post(f"/api/sessions/{session_id}/remind", headers=auth_headers)
+    again = await client.post(f"/api/sessions/{session_id}/remind", headers=auth_headers)
+
+    assert first.json() == {"members": 2, "queued": 2}
+    assert again.json() == {"members": 2, "queued": 0}
+    reminded = sorted(row.chat_id for row in await _rows(db_session) if row.chat_id != ADMIN)
+    assert reminded == [3, GUEST]
+
+
+async def test_remind_all_is_for_the_admin_only(client, db_session):
+    session = await SessionService(db_session).create_session(ADMIN, "Admin")
+    headers = {"Authorization": f"tma {make_init_data(user_id=GUEST, first_name='Guest')}"}
+
+    resp = await client.post(f"/api/sessions/{session.id}/remind", headers=headers)
+
+    assert resp.status_code == 403
+
+
+async def test_the_sender_delivers_and_marks_messages_sent(db_session):
+    await OutboxService(db_session).enqueue(
+        [Notification(chat_id=1, text="a"), Notification(chat_id=2, text="b")]
+    )
+    notifier = FakeNotifier()
+
+    assert await _sender(db_session, notifier).run_once() == 2
+
+    assert sorted(notifier.sent) == [(1, "a"), (2, "b")]
+    rows = await _rows(db_session)
+    assert {row.status for row in rows} == {"sent"}
+    assert all(row.sent_at is not None and row.claim_token is None for row in rows)
+    assert await _sender(db_session, notifier).run_once() == 0
+
+
+async def test_flood_control_pauses_sending_and_reschedules_at_retry_after(db_session):
+    await OutboxService(db_session).enqueue([Notification(chat_id=1, text="a")])
+    sender = _sender(db_session, FakeNotifier(Delivery(ok=False, retry_after=30)))
+
+    await sender.run_once()
+
+    [row] = await _rows(db_session)
+    assert (row.status, row.attempts) == ("pending", 0)
+    due_in = row.available_at.replace(tzinfo=timezone.utc) - datetime.now(timezone.utc)
+    assert timedelta(seconds=25) < due_in <= timedelta(seconds=30)
+    assert sender._bucket._paused_until - time.monotonic() > 25
+
+
+async def test_flood_control_longer_than_the_lease_hands_the_batch_back(db_session):
+    """Waiting out a long 429 would let another sender reclaim and resend the batch."""
+    await OutboxService(db_session).enqueue(
+        [Notification(chat_id=chat, text="a") for chat in (1, 2, 3)]
+    )
+    notifier = FakeNotifier(Delivery(ok=False, retry_after=600), Delivery(ok=True))
+    sender = _sender(db_session, notifier, concurrency=1)
+
+    started = time.monotonic()
+    assert await sender.run_once() == 3
+
+    assert time.monotonic() - started < 5, "waited out the flood control"
+    assert len(notifier.sent) == 1, "sent during the pause"
+    rows = await _rows(db_session)
+    assert {(row.status, row.attempts, row.claim_token) for row in rows} == {("pending", 0, None)}
+    soonest = min(row.available_at.replace(tzinfo=timezone.utc) for row in rows)
+    assert soonest - datetime.now(timezone.utc) > timedelta(seconds=590)
+
+
+async def test_a_blocked_bot_is_not_retried(db_session):
+    await OutboxService(db_session).enqueue([Notification(chat_id=1, text="a")])
+    notifier = FakeNotifier(Delivery(ok=False, permanent=True, error="403 Forbidden"))
+
+    await _sender(db_session, notifier).run_once()
+    await _make_due(db_session)
+    await _sender(db_session, notifier).run_once()
+
+    [row] = await _rows(db_session)
+    assert (row.status, row.attempts, row.error) == ("failed", 1, "403 Forbidden")
+    assert len(notifier.sent) == 1
+
+
+async def test_transient_failures_back_off_and_give_up_after_max_attempts(db_session):
+    await OutboxService(db_session).enqueue([Notification(chat_id=1, text="a")])
+    notifier = FakeNotifier(Delivery(ok=False, error="ReadTimeout"))
+    sender = _sender(db_session, notifier)
+
+    await sender.run_once()
+    [row] = await _rows(db_session)
+    assert row.status == "pending"
+    assert row.available_at.replace(tzinfo=timezone.utc) > datetime.now(timezone.utc)
+    assert await sender.run_once() == 0, "retried before the backoff ran out"
+
+    for _ in range(MAX_ATTEMPTS - 1):
+        await _make_due(db_session)
+        await sender.run_once()
+
+    [row] = await _rows(db_session)
+    assert (row.status, row.attempts) == ("failed", MAX_ATTEMPTS)
+    assert len(notifier.sent) == MAX_ATTEMPTS
+
+
+async def test_a_message_leased_by_a_dead_sender_goes_out_after_the_lease(db_session):
+    outbox = OutboxService(db_session)
+    await outbox.enqueue([Notification(chat_id=1, text="a")])
+    [lost] = await outbox.claim(10, lease_seconds=0)
+    # Its own copy, as the dead sender would have: the shared session would refresh it.
+    db_session.expunge(lost)
+
+    notifier = FakeNotifier()
+    assert await _sender(db_session, notifier).run_once() == 1
+    # The first sender coming back to life cannot overwrite the outcome.
+    await outbox.retry_later(lost, 60, "late")
+
+    [row] = await _rows(db_session)
+    assert (row.status, row.attempts, row.error) == ("sent", 2, None)
+    assert notifier.sent == [(1, "a")]
+
+
+async def test_dedup_key_makes_a_second_enqueue_a_no_op(db_session):
+    outbox = OutboxService(db_session)
+    message = Notification(chat_id=1, text="a", dedup_key="settle:x:1")
+
+    assert await outbox.enqueue([message]) == 1
+    assert await outbox.enqueue([message]) == 0
+    assert len(await _rows(db_session)) == 1
+
+
+async def test_purge_keeps_pending_and_recent_messages(db_session):
+    outbox = OutboxService(db_session)
+    await outbox.enqueue([Notification(chat_id=n, text=str(n)) for n in (1, 2, 3)])
+    await db_session.execute(
+        update(OutboxMessage)
+        .where(OutboxMessage.chat_id.in_((1, 2)))
+        .values(created_at=datetime.now(timezone.utc) - timedelta(days=30))
+    )
+    await db_session.execute(
+        update(OutboxMessage).where(OutboxMessage.chat_id.in_((1, 3))).values(status="sent")
+    )
+    await db_session.commit()
+
+    assert await outbox.purge() == 1
+    assert sorted(row.chat_id for row in await _rows(db_session)) == [2, 3]
+
+
+async def test_fan_out_overlaps_sends_up_to_its_concurrency():
+    in_flight = peak = 0
+
+    async def send(n: int) -> Delivery:
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.02)
+        in_flight -= 1
+        return Delivery(ok=True)
+
+    started = time.monotonic()
+    report = await fan_out(range(12), send, concurrency=4, timeout=1)
+
+    assert (report.sent, report.failed, peak) == (12, 0, 4)
+    assert time.monotonic() - started < 12 * 0.02 / 2, "sends did not overlap"
+
+
+async def test_fan_out_reports_hung_and_crashed_recipients_without_failing_the_rest():
+    async def send(n: int) -> Delivery:
+        if n == 1:
+            await asyncio.sleep(10)
+        if n == 2:
+            raise RuntimeError("boom")
+        return Delivery(ok=True)
+
+    report = await fan_out([0, 1, 2, 3], send, concurrency=4, timeout=0.05)
+
+    assert [d.ok for d in report.deliveries] == [True, False, False, True]
+    assert (report.sent, report.failed) == (2, 2)
+    assert report.deliveries[1].error == "no answer in 0.05s"
+    assert not report.deliveries[1].permanent, "a timeout is worth another try"
+
+
+async def test_fan_out_waits_outside_the_timeout():
+    async def pace(n: int) -> None:
+        await asyncio.sleep(0.05 * n)
+
+    async def send(n: int) -> Delivery:
+        return Delivery(ok=True)
+
+    report = await fan_out([0, 1, 2], send, concurrency=1, timeout=0.03, wait=pace)
+
+    assert report.sent == 3
+
+
+async def test_token_bucket_spreads_sends_at_its_rate():
+    bucket = TokenBucket(rate=100, burst=1)
+    started = time.monotonic()
+    for _ in range(6):
+        await bucket.acquire()
+    assert time.monotonic() - started == pytest.approx(0.05, abs=0.03)
+
+
+async def test_chat_pacer_spaces_one_chat_but_not_others():
+    pacer = ChatPacer(interval=0.05)
+    started = time.monotonic()
+    await pacer.wait(1)
+    await pacer.wait(2)
+    assert time.monotonic() - started < 0.02
+    await pacer.wait(1)
+    await pacer.wait(1)
+    assert time.monotonic() - started >= 0.1
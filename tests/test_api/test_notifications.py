@@ -1,104 +1,203 @@
 """Tests for push notification service."""
 
-from unittest.mock import AsyncMock, MagicMock, patch
+import asyncio
+import json
+from unittest.mock import patch
+from uuid import UUID
+
+import httpx
 
 import pytest
 
-from api.services.notifications import NotificationService
+from api.services.notification_sender import fan_out
+from api.services.notifications import (
+    Delivery,
+    NotificationService,
+    member_joined_message,
+    settle_messages,
+)
+from core.metrics import metrics
 
 
-@pytest.fixture
-def notifier():
-    return NotificationService("fake:token")
+def _notifier(handler, **kwargs) -> NotificationService:
+    return NotificationService("fake:token", transport=httpx.MockTransport(handler), **kwargs)
 
 
 class TestSendMessage:
     @pytest.mark.asyncio
-    async def test_send_message_success(self, notifier):
-        mock_resp = MagicMock()
-        mock_resp.raise_for_status = MagicMock()
+    async def test_send_message_success(self):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, json={"ok": True})
+
+        result = await _notifier(handler).send_message(123, "Hello")
+        assert result is True
+        assert len(requests) == 1
+        assert requests[0].url.path == "/botfake:token/sendMessage"
+
+    @pytest.mark.asyncio
+    async def test_send_message_with_reply_markup(self):
+        payloads = []
+
+        def handler(request):
+            payloads.append(json.loads(request.content))
+            return httpx.Response(200, json={"ok": True})
+
+        markup = {"inline_keyboard": [[{"text": "Click", "url": "https://example.com"}]]}
+        result = await _notifier(handler).send_message(123, "Hello", reply_markup=markup)
+        assert result is True
+        assert payloads[0]["reply_markup"] == markup
+
+    @pytest.mark.asyncio
+    async def test_send_message_failure(self):
+        def handler(request):
+            raise httpx.ConnectError("Network error")
 
-        with patch("httpx.AsyncClient") as mock_client_cls:
-            mock_client = AsyncMock()
-            mock_client.post = AsyncMock(return_value=mock_resp)
-            mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-            mock_client.__aexit__ = AsyncMock(return_value=False)
-            mock_client_cls.return_value = mock_client
+        result = await _notifier(handler).send_message(123, "Hello")
+        assert result is False
 
-            result = await notifier.send_message(123, "Hello")
-            assert result is True
-            mock_client.post.assert_called_once()
+
+class TestSharedClient:
+    """One pooled client per process, instead of a fresh one — and handshake — per call."""
 
     @pytest.mark.asyncio
-    async def test_send_message_with_reply_markup(self, notifier):
-        mock_resp = MagicMock()
-        mock_resp.raise_for_status = MagicMock()
+    async def test_calls_share_one_client(self):
+        created = []
+        real = httpx.AsyncClient
 
-        with patch("httpx.AsyncClient") as mock_client_cls:
-            mock_client = AsyncMock()
-            mock_client.post = AsyncMock(return_value=mock_resp)
-            mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-            mock_client.__aexit__ = AsyncMock(return_value=False)
-            mock_client_cls.return_value = mock_client
+        def counting_client(**kwargs):
+            created.append(kwargs)
+            return real(**kwargs)
 
-            markup = {"inline_keyboard": [[{"text": "Click", "url": "https://example.com"}]]}
-            result = await notifier.send_message(123, "Hello", reply_markup=markup)
-            assert result is True
+        notifier = _notifier(lambda r: httpx.Response(200, json={"ok": True, "result": "l"}))
+        with patch("api.services.notifications.httpx.AsyncClient", counting_client):
+            for n in range(5):
+                assert await notifier.send_message(n, "hi")
+            assert await notifier.create_invoice_link("t", "d", "p", 1) == "l"
+        await notifier.aclose()
 
-            call_kwargs = mock_client.post.call_args
-            payload = call_kwargs.kwargs.get("json") or call_kwargs[1].get("json")
-            assert payload["reply_markup"] == markup
+        assert len(created) == 1
+        assert created[0]["limits"].max_keepalive_connections == 10
 
     @pytest.mark.asyncio
-    async def test_send_message_failure(self, notifier):
-        with patch("httpx.AsyncClient") as mock_client_cls:
-            mock_client = AsyncMock()
-            mock_client.post = AsyncMock(side_effect=Exception("Network error"))
-            mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-            mock_client.__aexit__ = AsyncMock(return_value=False)
-            mock_client_cls.return_value = mock_client
+    async def test_calls_in_flight_are_capped(self):
+        in_flight = peak = 0
+
+        async def handler(request):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return httpx.Response(200, json={"ok": True})
 
-            result = await notifier.send_message(123, "Hello")
-            assert result is False
+        notifier = _notifier(handler, max_connections=3)
+        results = await asyncio.gather(*(notifier.send_message(n, "hi") for n in range(12)))
 
+        assert all(results)
+        assert peak == 3
 
-class TestNotifySettle:
     @pytest.mark.asyncio
-    async def test_notify_settle(self, notifier):
-        notifier.send_message = AsyncMock(return_value=True)
+    async def test_calls_are_counted_and_timed(self):
+        metrics.reset()
+        statuses = iter([200, 403])
+        notifier = _notifier(lambda r: httpx.Response(next(statuses), json={}))
+
+        await notifier.send_message(1, "hi")
+        await notifier.send_message(1, "hi")
+
+        labels = {"method": "sendMessage"}
+        assert metrics.value("telegram_api_requests_total", outcome="ok", **labels) == 1
+        assert metrics.value("telegram_api_requests_total", outcome="403", **labels) == 1
+        assert metrics.value("telegram_api_request_seconds_total", **labels) > 0
+
+    @pytest.mark.asyncio
+    async def test_a_send_timed_out_by_fan_out_is_a_timeout(self):
+        metrics.reset()
+
+        async def handler(request):
+            await asyncio.sleep(5)
+            return httpx.Response(200, json={"ok": True})
+
+        notifier = _notifier(handler)
+        report = await fan_out(
+            [1], lambda chat_id: notifier.deliver(chat_id, "hi"), concurrency=1, timeout=0.05
+        )
+
+        assert report.deliveries == [Delivery(ok=False, error="no answer in 0.05s")]
+        labels = {"method": "sendMessage"}
+        assert metrics.value("telegram_api_requests_total", outcome="cancelled", **labels) == 1
+
+
+SESSION = UUID("00000000-0000-0000-0000-000000000001")
+
+
+class TestSettleMessages:
+    def test_settle_messages(self):
         members = [
             {"user_tg_id": 111, "display_name": "Alice"},
             {"user_tg_id": 222, "display_name": "Bob"},
         ]
         shares = {111: 500.0, 222: 300.0}
-        await notifier.notify_settle(members, shares, "RUB", "https://app.example.com", "abc123")
-        assert notifier.send_message.call_count == 2
+        messages = settle_messages(
+            SESSION, members, shares, "RUB", "https://app.example.com", "abc123"
+        )
+        assert [m.chat_id for m in messages] == [111, 222]
+        assert len({m.dedup_key for m in messages}) == 2
 
-    @pytest.mark.asyncio
-    async def test_notify_settle_includes_share_amount(self, notifier):
-        notifier.send_message = AsyncMock(return_value=True)
+    def test_settle_messages_include_share_amount(self):
         members = [{"user_tg_id": 111, "display_name": "Alice"}]
         shares = {111: 500.0}
-        await notifier.notify_settle(members, shares, "RUB", "https://app.example.com", "abc123")
-        call_args = notifier.send_message.call_args
-        text = call_args[0][1]
-        assert "500" in text
-        assert "RUB" in text
+        (message,) = settle_messages(
+            SESSION, members, shares, "RUB", "https://app.example.com", "abc123"
+        )
+        assert "500" in message.text
+        assert "RUB" in message.text
 
-    @pytest.mark.asyncio
-    async def test_notify_settle_missing_share_defaults_to_zero(self, notifier):
-        notifier.send_message = AsyncMock(return_value=True)
+    def test_settle_messages_missing_share_defaults_to_zero(self):
         members = [{"user_tg_id": 999, "display_name": "Ghost"}]
         shares = {}  # no share for this user
-        await notifier.notify_settle(members, shares, "RUB", "https://app.example.com", "abc123")
-        call_args = notifier.send_message.call_args
-        text = call_args[0][1]
-        assert "0" in text
+        (message,) = settle_messages(
+            SESSION, members, shares, "RUB", "https://app.example.com", "abc123"
+        )
+        assert "0" in message.text
+
+
+class TestMemberJoinedMessage:
+    def test_member_joined_message(self):
+        message = member_joined_message(
+            SESSION, admin_tg_id=111, member_tg_id=7, member_name="Bob"
+        )
+        assert message.chat_id == 111
+        assert message.text == "Bob присоединился к чеку"
+
 
+class TestDeliver:
+    """What the sender needs to know about a failure to schedule the retry."""
 
-class TestNotifyMemberJoined:
     @pytest.mark.asyncio
-    async def test_notify_member_joined(self, notifier):
-        notifier.send_message = AsyncMock(return_value=True)
-        await notifier.notify_member_joined(admin_tg_id=111, member_name="Bob")
-        notifier.send_message.assert_called_once_with(111, "Bob присоединился к чеку")
+    @pytest.mark.parametrize(
+        ("response", "expected"),
+        [
+            (httpx.Response(200, json={"ok": True}), Delivery(ok=True)),
+            (
+                httpx.Response(
+                    429,
+                    json={"description": "Too Many Requests", "parameters": {"retry_after": 7}},
+                ),
+                Delivery(ok=False, retry_after=7, error="Too Many Requests"),
+            ),
+            (
+                httpx.Response(403, json={"description": "bot was blocked by the user"}),
+                Delivery(ok=False, permanent=True, error="403 bot was blocked by the user"),
+            ),
+            (
+                httpx.Response(502, json={"description": "Bad Gateway"}),
+                Delivery(ok=False, error="502 Bad Gateway"),
+            ),
+        ],
+    )
+    async def test_deliver_classifies_the_answer(self, response, expected):
+        assert await _notifier(lambda r: response).deliver(1, "hi") == expected
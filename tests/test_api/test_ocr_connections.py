@@ -0,0 +1,121 @@
+"""The OCR worker must not hold a pooled DB connection while the provider works.
+
+Recognition used to run with the request's session open across the whole
+``parse_receipt`` await — minutes, in the worst case. Every scan in flight pinned one of
+DB_POOL_SIZE connections, so twenty concurrent scans starved every other endpoint.
+
+The in-memory fixtures use a single StaticPool connection and cannot show this; these
+tests run on a file-backed SQLite database, whose engine gets a real queue pool with a
+check-out count to assert against.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from api.services.ocr_worker import OcrWorkerPool
+from api.ws import ConnectionManager
+from core.models.base import Base
+from core.services.ocr import OcrItem, OcrResult
+from core.services.ocr_jobs import OcrJobService
+from core.services.session import SessionService
+from tests.db import make_test_engine
+
+
+@pytest.fixture
+async def file_engine(tmp_path):
+    engine = make_test_engine(f"sqlite+aiosqlite:///{tmp_path / 'ocr.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+async def queued_job(file_engine):
+    """A one-photo session with a charged, queued OCR job — nothing checked out.
+
+    One photo on purpose: with several, the worker's initial progress report commits
+    before the call and happened to release the connection, hiding the leak.
+    """
+    maker = async_sessionmaker(file_engine, class_=AsyncSession, expire_on_commit=False)
+    async with maker() as db:
+        svc = SessionService(db)
+        session = await svc.create_session(admin_tg_id=12345, admin_display_name="Test")
+        await svc.add_photo(session.id, "p1", data=b"photo-1")
+        job = await OcrJobService(db, 3).enqueue(session.id, 12345)
+    assert file_engine.pool.checkedout() == 0
+    return maker, job.id
+
+
+async def test_no_connection_is_held_during_the_provider_call(file_engine, queued_job):
+    maker, job_id = queued_job
+    seen: list[int] = []
+
+    async def provider(_self, photos, on_progress=None):
+        seen.append(file_engine.pool.checkedout())
+        await on_progress(1, len(photos))  # borrows a connection for one UPDATE ...
+        seen.append(file_engine.pool.checkedout())  # ... and has given it back
+        return OcrResult(
+            items=[OcrItem(name="Pizza", price=Decimal("500"), quantity=1)],
+            total=Decimal("500"),
+            currency="RUB",
+        )
+
+    worker = OcrWorkerPool(ConnectionManager(), session_factory=maker)
+    with patch("api.services.ocr_worker.OcrService.parse_receipt", provider):
+        assert await worker.run_once()
+
+    assert seen == [0, 0], f"connections checked out during the LLM call: {seen}"
+    assert file_engine.pool.checkedout() == 0
+
+    async with maker() as db:
+        job = await OcrJobService(db, 3).get_job(job_id)
+        assert job.status == "done"
+        assert job.progress_current == 1
+
+
+async def test_a_failing_call_also_holds_nothing(file_engine, queued_job):
+    maker, job_id = queued_job
+    seen: list[int] = []
+
+    async def provider(_self, photos, on_progress=None):
+        seen.append(file_engine.pool.checkedout())
+        raise ValueError("unreadable")
+
+    worker = OcrWorkerPool(ConnectionManager(), session_factory=maker)
+    with patch("api.services.ocr_worker.OcrService.parse_receipt", provider):
+        assert await worker.run_once()
+
+    assert seen == [0]
+    assert file_engine.pool.checkedout() == 0
+    async with maker() as db:
+        job = await OcrJobService(db, 3).get_job(job_id)
+        assert (job.status, job.error_status) == ("failed", 422)
+
+
+async def test_racing_claims_hand_a_job_out_once_even_without_row_locks(file_engine, queued_job):
+    """SQLite emits no FOR UPDATE; the compare-and-set claim must hold on its own.
+
+    Found by bench/ocr_pipeline.py: with several workers on SQLite the same job was
+    claimed twice and the first claimant's result was dropped as "lease lost".
+    """
+
+    maker, job_id = queued_job
+
+    async def claim():
+        async with maker() as db:
+            job = await OcrJobService(db, 3).claim(lease_seconds=60)
+            return job.claim_token if job else None
+
+    tokens = [t for t in await asyncio.gather(*(claim() for _ in range(8))) if t]
+
+    assert len(tokens) == 1
+    async with maker() as db:
+        job = await OcrJobService(db, 3).get_job(job_id)
+        assert (job.claim_token, job.attempts) == (tokens[0], 1)
@@ -0,0 +1,44 @@
+"""The whole scan pipeline on the stub provider: upload, charge, parse, save, broadcast.
+
+This is what bench/ocr_pipeline.py drives at scale; here it runs once, to keep the
+benchmark's path from rotting.
+"""
+
+from __future__ import annotations
+
+from core.config import get_settings
+from core.services.quota import QuotaService
+
+
+async def test_a_scan_completes_end_to_end_on_the_stub(
+    client, auth_headers, ocr_worker, db_session, monkeypatch
+):
+    monkeypatch.setenv("OCR_PROVIDER", "stub")
+    monkeypatch.setenv("OCR_STUB_LATENCY_MS", "0")
+    get_settings.cache_clear()
+
+    resp = await client.post("/api/sessions", json={"currency": "RUB"}, headers=auth_headers)
+    session_id = resp.json()["id"]
+    await client.post(
+        f"/api/sessions/{session_id}/photos",
+        files=[
+            ("files", ("a.jpg", b"one", "image/jpeg")),
+            ("files", ("b.jpg", b"two", "image/jpeg")),
+        ],
+        headers=auth_headers,
+    )
+    resp = await client.post(f"/api/sessions/{session_id}/ocr", headers=auth_headers)
+    assert resp.status_code == 202
+    job_id = resp.json()["id"]
+
+    assert await ocr_worker.run_once()
+
+    job = (
+        await client.get(f"/api/sessions/{session_id}/ocr/jobs/{job_id}", headers=auth_headers)
+    ).json()
+    assert job["status"] == "done"
+    assert job["progress_current"] == job["progress_total"] == 2
+    session = (await client.get(f"/api/sessions/{session_id}", headers=auth_headers)).json()
+    assert len(session["items"]) == 3
+    free_left, _paid, _reset = await QuotaService(db_session, 3).get_quota_info(12345)
+    assert free_left == 2
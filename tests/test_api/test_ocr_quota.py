@@ -3,21 +3,31 @@
 The scan used to be consumed before the LLM was contacted and never given back, so a
 provider timeout, a rate limit, an unreadable photo — or even a session whose photo
 bytes had been lost — cost the user a scan and produced nothing.
+
+Recognition now runs as a queued job (core/services/ocr_jobs.py): POST /ocr charges and
+answers 202, a worker does the work, and the refund happens in the worker's failure
+transition. These tests drive the worker by hand with ``run_once()``.
 """
 
 from __future__ import annotations
 
 import asyncio
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 from unittest.mock import AsyncMock, patch
 
 import httpx
 import pytest
+from sqlalchemy import select
 
+from core.models.ocr_job import OcrJob
 from core.services.ocr import OcrItem, OcrResult
+from core.services.ocr_jobs import MAX_ATTEMPTS
 from core.services.quota import QuotaService
 from core.services.session import SessionService
 
+_PARSE = "api.services.ocr_worker.OcrService.parse_receipt"
+
 
 @pytest.fixture
 async def session_id(db_session):
@@ -50,6 +60,17 @@ async def _free_left(db_session, user_id=12345) -> int:
     return free_left
 
 
+async def _scan(client, auth_headers, ocr_worker, session_id) -> dict:
+    """Queue a scan, let one worker iteration run it, and return the finished job."""
+    resp = await client.post(f"/api/sessions/{session_id}/ocr", headers=auth_headers)
+    assert resp.status_code == 202, resp.text
+    job_id = resp.json()["id"]
+    assert await ocr_worker.run_once()
+    resp = await client.get(f"/api/sessions/{session_id}/ocr/jobs/{job_id}", headers=auth_headers)
+    assert resp.status_code == 200
+    return resp.json()
+
+
 # ---------------------------------------------------------------------------
 # Refunds
 # ---------------------------------------------------------------------------
@@ -64,24 +85,25 @@ async def _free_left(db_session, user_id=12345) -> int:
     ],
 )
 async def test_failed_ocr_refunds_the_scan(
-    client, auth_headers, session_with_photo, db_session, failure, expected_status
+    client, auth_headers, ocr_worker, session_with_photo, db_session, failure, expected_status
 ):
     before = await _free_left(db_session)
 
-    with patch("api.routes.ocr.OcrService.parse_receipt", AsyncMock(side_effect=failure)):
-        resp = await client.post(f"/api/sessions/{session_with_photo}/ocr", headers=auth_headers)
+    with patch(_PARSE, AsyncMock(side_effect=failure)):
+        job = await _scan(client, auth_headers, ocr_worker, session_with_photo)
 
-    assert resp.status_code == expected_status
+    assert job["status"] == "failed"
+    assert job["error_status"] == expected_status
     assert await _free_left(db_session) == before, "a failed scan must not be billed"
 
 
 async def test_the_deadline_itself_fires_and_refunds(
-    client, auth_headers, session_with_photo, db_session
+    client, auth_headers, ocr_worker, session_with_photo, db_session
 ):
     """Not just "a TimeoutError maps to 504" — the asyncio.timeout guard must trip.
 
-    The guard exists so the request fails *before* nginx's proxy_read_timeout kills it;
-    once nginx has cut the connection there is no handler left to issue the refund.
+    The guard bounds how long one job can hold a worker slot; without it a provider that
+    never answers would park the worker (and the user's scan) indefinitely.
     """
     before = await _free_left(db_session)
 
@@ -89,41 +111,44 @@ async def test_the_deadline_itself_fires_and_refunds(
         await asyncio.sleep(30)
 
     with (
-        patch("api.routes.ocr._OCR_DEADLINE_SECONDS", 0.05),
-        patch("api.routes.ocr.OcrService.parse_receipt", never_finishes),
+        patch("api.services.ocr_worker._OCR_DEADLINE_SECONDS", 0.05),
+        patch(_PARSE, never_finishes),
     ):
-        resp = await client.post(f"/api/sessions/{session_with_photo}/ocr", headers=auth_headers)
+        job = await _scan(client, auth_headers, ocr_worker, session_with_photo)
 
-    assert resp.status_code == 504
+    assert job["error_status"] == 504
     assert await _free_left(db_session) == before
 
 
 async def test_receipt_with_no_items_is_refunded(
-    client, auth_headers, session_with_photo, db_session
+    client, auth_headers, ocr_worker, session_with_photo, db_session
 ):
     """A parse that succeeds but finds nothing gave the user nothing to pay for."""
     empty = OcrResult(items=[], total=Decimal("0"), currency="RUB")
     before = await _free_left(db_session)
 
-    with patch("api.routes.ocr.OcrService.parse_receipt", AsyncMock(return_value=empty)):
-        resp = await client.post(f"/api/sessions/{session_with_photo}/ocr", headers=auth_headers)
+    with patch(_PARSE, AsyncMock(return_value=empty)):
+        job = await _scan(client, auth_headers, ocr_worker, session_with_photo)
 
-    assert resp.status_code == 422
+    assert job["error_status"] == 422
     assert await _free_left(db_session) == before
 
 
-async def test_successful_ocr_is_billed(client, auth_headers, session_with_photo, db_session):
+async def test_successful_ocr_is_billed(
+    client, auth_headers, ocr_worker, session_with_photo, db_session
+):
     before = await _free_left(db_session)
 
-    with patch("api.routes.ocr.OcrService.parse_receipt", AsyncMock(return_value=_good_result())):
-        resp = await client.post(f"/api/sessions/{session_with_photo}/ocr", headers=auth_headers)
+    with patch(_PARSE, AsyncMock(return_value=_good_result())):
+        job = await _scan(client, auth_headers, ocr_worker, session_with_photo)
 
-    assert resp.status_code == 200
+    assert job["status"] == "done"
+    assert job["result"]["items"][0]["name"] == "Pizza"
     assert await _free_left(db_session) == before - 1
 
 
 async def test_missing_photo_bytes_are_not_billed(client, auth_headers, session_id, db_session):
-    """Photo bytes live in process memory; a restart loses them. That is not billable."""
+    """A session with nothing to recognise is turned away before the charge."""
     before = await _free_left(db_session)
 
     resp = await client.post(f"/api/sessions/{session_id}/ocr", headers=auth_headers)
@@ -138,7 +163,7 @@ async def test_missing_photo_bytes_are_not_billed(client, auth_headers, session_
 
 
 async def test_paid_scan_is_refunded_as_paid_not_free(
-    client, auth_headers, session_with_photo, db_session
+    client, auth_headers, ocr_worker, session_with_photo, db_session
 ):
     """With the free allowance gone the charge is paid — the refund must be too."""
     quota = QuotaService(db_session, 3)
@@ -146,32 +171,126 @@ async def test_paid_scan_is_refunded_as_paid_not_free(
         await quota.use_free_scan(12345)
     await quota.grant_paid_scan(12345)
 
-    with patch(
-        "api.routes.ocr.OcrService.parse_receipt", AsyncMock(side_effect=ValueError("nope"))
-    ):
-        resp = await client.post(f"/api/sessions/{session_with_photo}/ocr", headers=auth_headers)
+    with patch(_PARSE, AsyncMock(side_effect=ValueError("nope"))):
+        job = await _scan(client, auth_headers, ocr_worker, session_with_photo)
 
-    assert resp.status_code == 422
+    assert job["error_status"] == 422
     free_left, paid, _reset = await quota.get_quota_info(12345)
     assert paid == 1, "the paid scan must come back as paid"
     assert free_left == 0, "and must not be converted into free allowance"
 
 
 async def test_exhausted_quota_is_rejected_before_any_ocr(
-    client, auth_headers, session_with_photo, db_session
+    client, auth_headers, ocr_worker, session_with_photo, db_session
 ):
     quota = QuotaService(db_session, 3)
     for _ in range(3):
         await quota.use_free_scan(12345)
 
     parse = AsyncMock(return_value=_good_result())
-    with patch("api.routes.ocr.OcrService.parse_receipt", parse):
+    with patch(_PARSE, parse):
         resp = await client.post(f"/api/sessions/{session_with_photo}/ocr", headers=auth_headers)
+        assert not await ocr_worker.run_once(), "nothing may be queued"
 
     assert resp.status_code == 402
     parse.assert_not_awaited()
 
 
+# ---------------------------------------------------------------------------
+# Exactly-once: repeated taps, dead workers
+# ---------------------------------------------------------------------------
+
+
+async def test_a_repeated_tap_is_charged_once(
+    client, auth_headers, session_with_photo, db_session
+):
+    """The second POST while the first job is queued returns that job, not a new charge."""
+    before = await _free_left(db_session)
+
+    first = await client.post(f"/api/sessions/{session_with_photo}/ocr", headers=auth_headers)
+    second = await client.post(f"/api/sessions/{session_with_photo}/ocr", headers=auth_headers)
+
+    assert first.status_code == second.status_code == 202
+    assert first.json()["id"] == second.json()["id"]
+    assert await _free_left(db_session) == before - 1
+
+
+async def _expire_lease(db_session, job_id: str) -> None:
+    job = (await db_session.execute(select(OcrJob))).scalar_one()
+    assert str(job.id) == job_id
+    job.locked_until = datetime.now(timezone.utc) - timedelta(seconds=1)
+    await db_session.commit()
+
+
+async def test_a_job_left_by_a_dead_worker_is_reclaimed(
+    client, auth_headers, ocr_worker, session_with_photo, db_session
+):
+    """A worker that dies mid-call leaves the job running; the lease runs out and the next
+    claim finishes it — with no second charge."""
+    from core.services.ocr_jobs import OcrJobService
+
+    before = await _free_left(db_session)
+    resp = await client.post(f"/api/sessions/{session_with_photo}/ocr", headers=auth_headers)
+    job_id = resp.json()["id"]
+
+    # "Worker 1" claims and then vanishes without reporting anything.
+    stale = await OcrJobService(db_session, 3).claim(lease_seconds=60)
+    stale_token = stale.claim_token
+    await _expire_lease(db_session, job_id)
+
+    with patch(_PARSE, AsyncMock(return_value=_good_result())):
+        assert await ocr_worker.run_once()
+
+    resp = await client.get(
+        f"/api/sessions/{session_with_photo}/ocr/jobs/{job_id}", headers=auth_headers
+    )
+    assert resp.json()["status"] == "done"
+    assert await _free_left(db_session) == before - 1
+
+    # The original worker coming back to life cannot fail — and refund — a delivered job.
+    assert not await OcrJobService(db_session, 3).fail(stale.id, stale_token, 502, "late")
+    assert await _free_left(db_session) == before - 1
+
+
+async def test_a_job_that_keeps_dying_is_refunded_once(
+    client, auth_headers, ocr_worker, session_with_photo, db_session
+):
+    from core.services.ocr_jobs import OcrJobService
+
+    before = await _free_left(db_session)
+    resp = await client.post(f"/api/sessions/{session_with_photo}/ocr", headers=auth_headers)
+    job_id = resp.json()["id"]
+
+    for _ in range(MAX_ATTEMPTS):
+        assert await OcrJobService(db_session, 3).claim(lease_seconds=60) is not None
+        await _expire_lease(db_session, job_id)
+
+    parse = AsyncMock(return_value=_good_result())
+    with patch(_PARSE, parse):
+        assert not await ocr_worker.run_once(), "an exhausted job is not handed out again"
+        assert not await ocr_worker.run_once()
+
+    parse.assert_not_awaited()
+    resp = await client.get(
+        f"/api/sessions/{session_with_photo}/ocr/jobs/{job_id}", headers=auth_headers
+    )
+    assert resp.json()["status"] == "failed"
+    assert await _free_left(db_session) == before
+
+
+async def test_job_of_another_session_is_not_found(
+    client, auth_headers, session_with_photo, db_session
+):
+    resp = await client.post(f"/api/sessions/{session_with_photo}/ocr", headers=auth_headers)
+    job_id = resp.json()["id"]
+    other = await SessionService(db_session).create_session(
+        admin_tg_id=12345, admin_display_name="Test"
+    )
+
+    resp = await client.get(f"/api/sessions/{other.id}/ocr/jobs/{job_id}", headers=auth_headers)
+    assert resp.status_code == 404
+
+
 # ---------------------------------------------------------------------------
 # Photo count cap
 # ---------------------------------------------------------------------------
@@ -198,3 +317,46 @@ async def test_upload_rejects_more_photos_than_a_receipt_may_have(
     )
     assert resp.status_code == 400
     assert str(_MAX_PHOTOS) in resp.json()["detail"]
+
+
+# ---------------------------------------------------------------------------
+# Provider circuit breaker
+# ---------------------------------------------------------------------------
+
+
+@pytest.fixture
+def open_circuit():
+    from core.services.ocr_resilience import provider_breaker
+
+    provider_breaker.reset()
+    for _ in range(20):
+        provider_breaker.record_failure()
+    assert provider_breaker.is_open
+    yield provider_breaker
+    provider_breaker.reset()
+
+
+async def test_open_circuit_is_refused_before_charging(
+    client, auth_headers, session_with_photo, db_session, open_circuit
+):
+    before = await _free_left(db_session)
+
+    resp = await client.post(f"/api/sessions/{session_with_photo}/ocr", headers=auth_headers)
+
+    assert resp.status_code == 503
+    assert await _free_left(db_session) == before
+
+
+async def test_circuit_opening_mid_queue_fails_the_job_fast_and_refunds(
+    client, auth_headers, ocr_worker, session_with_photo, db_session
+):
+    """Queued while the provider looked fine, run after it was declared down."""
+    from core.services.ocr_resilience import CircuitOpenError
+
+    before = await _free_left(db_session)
+
+    with patch(_PARSE, AsyncMock(side_effect=CircuitOpenError("ocr circuit is open"))):
+        job = await _scan(client, auth_headers, ocr_worker, session_with_photo)
+
+    assert (job["status"], job["error_status"]) == ("failed", 503)
+    assert await _free_left(db_session) == before
@@ -1,19 +1,25 @@
-"""Receipt bytes live on the row, and only until the receipt has been read.
+"""Receipt bytes are stored durably, and only until the receipt has been read.
 
 They used to sit in a process-local dict with no eviction: a restart stranded every
 in-flight session, the API could not run a second worker, and nothing ever freed them.
+Then they sat in a bytea column on the row; now the row references a blob in the photo
+store (core/services/photo_store.py), files on disk under the test settings.
 """
 
 from __future__ import annotations
 
+from contextlib import asynccontextmanager
+from datetime import timedelta
 from decimal import Decimal
 from unittest.mock import AsyncMock, patch
 
 import pytest
 from sqlalchemy import select
 
+from api.services.photo_sweeper import PhotoSweeper
 from core.models.session import SessionPhoto
 from core.services.ocr import OcrItem, OcrResult
+from core.services.photo_store import get_photo_store
 from core.services.session import SessionService
 
 
@@ -36,14 +42,13 @@ async def _stored_bytes(db_session, session_id) -> list[bytes | None]:
     from uuid import UUID
 
     rows = await db_session.execute(
-        select(SessionPhoto.data).where(SessionPhoto.session_id == UUID(session_id))
+        select(SessionPhoto.blob_sha256).where(SessionPhoto.session_id == UUID(session_id))
     )
-    return [r[0] for r in rows.all()]
+    store = get_photo_store()
+    return [(await store.get(db_session, [key]))[0] if key else None for key in rows.scalars()]
 
 
-async def test_uploaded_bytes_are_persisted_on_the_row(
-    client, auth_headers, session_id, db_session
-):
+async def test_uploaded_bytes_are_persisted(client, auth_headers, session_id, db_session):
     resp = await client.post(
         f"/api/sessions/{session_id}/photos",
         files={"files": ("r.jpg", b"receipt-bytes", "image/jpeg")},
@@ -69,7 +74,7 @@ async def test_bytes_survive_a_process_restart(client, auth_headers, session_id,
 
 
 async def test_bytes_are_dropped_after_a_successful_ocr(
-    client, auth_headers, session_id, db_session
+    client, auth_headers, ocr_worker, session_id, db_session
 ):
     """Where essentially all of the storage goes: the payload dies with its purpose."""
     await client.post(
@@ -78,14 +83,19 @@ async def test_bytes_are_dropped_after_a_successful_ocr(
         headers=auth_headers,
     )
 
-    with patch("api.routes.ocr.OcrService.parse_receipt", AsyncMock(return_value=_good_result())):
+    parse = AsyncMock(return_value=_good_result())
+    with patch("api.services.ocr_worker.OcrService.parse_receipt", parse):
         resp = await client.post(f"/api/sessions/{session_id}/ocr", headers=auth_headers)
+        assert await ocr_worker.run_once()
 
-    assert resp.status_code == 200
+    assert resp.status_code == 202
     assert await _stored_bytes(db_session, session_id) == [None], "bytes outlived their use"
+    assert await get_photo_store().usage(db_session) == (0, 0), "blob outlived its use"
 
 
-async def test_bytes_are_kept_when_ocr_fails(client, auth_headers, session_id, db_session):
+async def test_bytes_are_kept_when_ocr_fails(
+    client, auth_headers, ocr_worker, session_id, db_session
+):
     """A failed scan is refunded and retryable — throwing the photos away would not be."""
     await client.post(
         f"/api/sessions/{session_id}/photos",
@@ -93,12 +103,13 @@ async def test_bytes_are_kept_when_ocr_fails(client, auth_headers, session_id, d
         headers=auth_headers,
     )
 
-    with patch(
-        "api.routes.ocr.OcrService.parse_receipt", AsyncMock(side_effect=ValueError("nope"))
-    ):
+    parse = AsyncMock(side_effect=ValueError("nope"))
+    with patch("api.services.ocr_worker.OcrService.parse_receipt", parse):
         resp = await client.post(f"/api/sessions/{session_id}/ocr", headers=auth_headers)
+        assert await ocr_worker.run_once()
 
-    assert resp.status_code == 422
+    assert resp.status_code == 202
+    parse.assert_awaited_once()
     assert await _stored_bytes(db_session, session_id) == [b"receipt-bytes"]
 
 
@@ -119,7 +130,8 @@ async def test_cleared_rows_are_not_offered_to_ocr_again(
 
 
 async def test_deleting_a_session_takes_its_photo_bytes_with_it(db_session):
-    """The backstop for sessions that never reached OCR — no sweeper needed."""
+    """The backstop for sessions that never reached OCR: the cascade drops the rows, the
+    sweep the bytes they referenced."""
     svc = SessionService(db_session)
     session = await svc.create_session(admin_tg_id=777, admin_display_name="A")
     await svc.add_photo(session.id, "miniapp-1", data=b"bytes")
@@ -132,6 +144,14 @@ async def test_deleting_a_session_takes_its_photo_bytes_with_it(db_session):
     )
     assert rows.scalars().all() == []
 
+    @asynccontextmanager
+    async def shared_session():
+        yield db_session
+
+    # No grace period: it protects uploads that have not committed yet, none here.
+    assert await PhotoSweeper(shared_session, grace=timedelta(0)).run_once() == 1
+    assert await get_photo_store().usage(db_session) == (0, 0)
+
 
 async def test_session_reads_do_not_carry_the_jpegs(client, auth_headers, session_id):
     """The column is deferred; a session read must not drag megabytes along."""
@@ -0,0 +1,178 @@
+"""Photo uploads are streamed into the store, not read whole into memory.
+
+``upload_photos`` used to take ``list[UploadFile]`` and ``await f.read()`` each file: the
+whole 5 MB was in memory before the size check, a batch of five was 25 MB per request,
+an oversized file was received in full only to be refused, and every photo cost its own
+commit and refresh. The body is now parsed as it arrives (api/uploads.py).
+
+The streamed tests feed the body to the app one chunk at a time, the way a slow client
+does, and count what the app pulled.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import tracemalloc
+from uuid import UUID
+
+import pytest
+from sqlalchemy import event, func, select
+
+from core.models.photo_blob import PhotoBlob
+from core.models.session import SessionPhoto
+from core.services.photo_store import get_photo_store
+from core.services.session import SessionService
+
+_LIMIT = 5 * 1024 * 1024
+_CHUNK = 64 * 1024
+_BOUNDARY = "receipt-boundary"
+
+
+@pytest.fixture
+async def session_id(db_session):
+    svc = SessionService(db_session)
+    session = await svc.create_session(admin_tg_id=12345, admin_display_name="Test")
+    return str(session.id)
+
+
+class StreamedBody:
+    """A multipart body of *sizes*-byte files, produced chunk by chunk on demand."""
+
+    def __init__(self, *sizes: int) -> None:
+        self.sizes = sizes
+        self.sent = 0
+
+    def _pieces(self):
+        for n, size in enumerate(self.sizes):
+            yield (
+                f"--{_BOUNDARY}\r\n"
+                f'Content-Disposition: form-data; name="files"; filename="p{n}.jpg"\r\n'
+                "Content-Type: image/jpeg\r\n\r\n"
+            ).encode()
+            fill = bytes([n + 1]) * _CHUNK
+            for start in range(0, size, _CHUNK):
+                yield fill[: min(_CHUNK, size - start)]
+            yield b"\r\n"
+        yield f"--{_BOUNDARY}--\r\n".encode()
+
+    async def __aiter__(self):
+        for piece in self._pieces():
+            self.sent += len(piece)
+            yield piece
+
+
+async def _post(client, auth_headers, session_id, body: StreamedBody):
+    return await client.post(
+        f"/api/sessions/{session_id}/photos",
+        content=body,
+        headers={
+            **auth_headers,
+            "Content-Type": f"multipart/form-data; boundary={_BOUNDARY}",
+        },
+    )
+
+
+async def _counts(db_session, session_id) -> tuple[int, int]:
+    photos = await db_session.scalar(
+        select(func.count())
+        .select_from(SessionPhoto)
+        .where(SessionPhoto.session_id == UUID(session_id))
+    )
+    blobs = await db_session.scalar(select(func.count()).select_from(PhotoBlob))
+    return photos, blobs
+
+
+async def test_a_photo_of_exactly_the_limit_is_accepted(client, auth_headers, session_id):
+    resp = await _post(client, auth_headers, session_id, StreamedBody(_LIMIT))
+
+    assert resp.status_code == 201
+
+
+async def test_one_byte_over_is_refused_without_reading_the_rest(
+    client, auth_headers, session_id, db_session
+):
+    body = StreamedBody(_LIMIT + 1, 4 * _LIMIT)
+
+    resp = await _post(client, auth_headers, session_id, body)
+
+    assert resp.status_code == 413
+    assert resp.json()["detail"] == "File p0.jpg exceeds 5 MB limit"
+    assert body.sent < _LIMIT + 2 * _CHUNK
+    # Nothing half-written is left behind: no rows, no blob, no temporary file.
+    assert await _counts(db_session, session_id) == (0, 0)
+    assert not any(get_photo_store().incoming.iterdir())
+
+
+async def test_a_refused_file_takes_the_whole_batch_with_it(
+    client, auth_headers, session_id, db_session
+):
+    resp = await _post(client, auth_headers, session_id, StreamedBody(1000, _LIMIT + 1))
+
+    assert resp.status_code == 413
+    assert await _counts(db_session, session_id) == (0, 0)
+
+
+async def test_one_file_too_many_stops_the_upload(client, auth_headers, session_id):
+    body = StreamedBody(*[_CHUNK] * 5, _LIMIT)
+
+    resp = await _post(client, auth_headers, session_id, body)
+
+    assert resp.status_code == 400
+    assert body.sent < 7 * _CHUNK
+
+
+async def test_memory_is_bounded_by_the_chunk_not_the_batch(client, auth_headers, session_id):
+    tracemalloc.start()
+    try:
+        resp = await _post(client, auth_headers, session_id, StreamedBody(*[_LIMIT] * 5))
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert resp.status_code == 201
+    assert peak < 2 * 1024 * 1024, f"{peak} bytes at peak for a 25 MB batch"
+
+
+async def test_the_key_is_the_hash_of_the_streamed_bytes(
+    client, auth_headers, session_id, db_session
+):
+    resp = await client.post(
+        f"/api/sessions/{session_id}/photos",
+        files=[
+            ("files", ("a.jpg", b"same receipt", "image/jpeg")),
+            ("files", ("b.jpg", b"same receipt", "image/jpeg")),
+        ],
+        headers=auth_headers,
+    )
+
+    assert resp.status_code == 201
+    keys = (await db_session.execute(select(SessionPhoto.blob_sha256))).scalars().all()
+    assert keys == [hashlib.sha256(b"same receipt").hexdigest()] * 2
+    assert await _counts(db_session, session_id) == (2, 1)
+
+
+async def test_the_batch_is_recorded_with_one_insert(client, auth_headers, session_id, db_session):
+    engine = db_session.get_bind().engine
+    statements: list[str] = []
+
+    def listener(_conn, _cursor, statement, *_args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        resp = await _post(client, auth_headers, session_id, StreamedBody(*[1000] * 5))
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert resp.status_code == 201
+    assert len(resp.json()) == 5
+    inserts = [s for s in statements if s.startswith("INSERT INTO session_photos")]
+    assert len(inserts) == 1, inserts
+
+
+async def test_a_body_that_is_not_multipart_is_refused(client, auth_headers, session_id):
+    resp = await client.post(
+        f"/api/sessions/{session_id}/photos", json={"files": []}, headers=auth_headers
+    )
+
+    assert resp.status_code == 422
@@ -80,7 +80,7 @@ async def test_my_sessions_still_reports_the_right_counts(client, auth_headers,
 
 
 async def test_clear_history_is_a_single_statement(
-    client, auth_headers, db_session, count_queries
+    client, auth_headers, db_session, count_queries, session_purger
 ):
     await _seed(db_session, n_sessions=5)
     await db_session.execute(
@@ -93,15 +93,22 @@ async def test_clear_history_is_a_single_statement(
 
     assert resp.status_code == 200
     assert resp.json()["deleted"] == 5
-    # One DELETE ... RETURNING, plus the transaction's COMMIT.
+    # One UPDATE ... RETURNING, plus the transaction's COMMIT.
     assert counter["n"] <= 2, f"{counter['n']} queries — clear_history is looping again"
+    listed = await client.get("/api/sessions/my", headers=auth_headers)
+    assert listed.json() == []
 
+    report = await session_purger.run_once()
+
+    assert report.history == 5
     left = await db_session.execute(select(Session).where(Session.admin_tg_id == USER))
     assert left.scalars().all() == []
 
 
-async def test_clear_history_leaves_other_peoples_sessions_alone(client, db_session):
-    """The bulk DELETE must stay scoped to the caller's own settled sessions."""
+async def test_clear_history_leaves_other_peoples_sessions_alone(
+    client, db_session, session_purger
+):
+    """The bulk mark must stay scoped to the caller's own settled sessions."""
     svc = SessionService(db_session)
     mine = await svc.create_session(USER, "Me")
     theirs = await svc.create_session(999, "Someone else")
@@ -110,6 +117,7 @@ async def test_clear_history_leaves_other_peoples_sessions_alone(client, db_sess
 
     headers = {"Authorization": f"tma {make_init_data(user_id=USER)}"}
     resp = await client.request("DELETE", "/api/sessions/history", headers=headers)
+    await session_purger.run_once()
 
     assert resp.json()["deleted"] == 1
     remaining = (await db_session.execute(select(Session.id))).scalars().all()
@@ -117,18 +125,23 @@ async def test_clear_history_leaves_other_peoples_sessions_alone(client, db_sess
     assert mine.id not in remaining
 
 
-async def test_unsettled_sessions_are_not_deleted(client, auth_headers, db_session):
+async def test_unsettled_sessions_are_not_deleted(
+    client, auth_headers, db_session, session_purger
+):
     await _seed(db_session, n_sessions=2)
 
     resp = await client.request("DELETE", "/api/sessions/history", headers=auth_headers)
+    await session_purger.run_once()
 
     assert resp.json()["deleted"] == 0
     rows = await db_session.execute(select(SessionMember).where(SessionMember.user_tg_id == USER))
     assert len(rows.scalars().all()) == 2
 
 
-async def test_items_are_removed_with_the_session(client, auth_headers, db_session):
-    """clear_history relies on ON DELETE CASCADE now that it no longer loads children."""
+async def test_items_are_removed_with_the_session(
+    client, auth_headers, db_session, session_purger
+):
+    """The purger relies on ON DELETE CASCADE: it never loads the children."""
     await _seed(db_session, n_sessions=1, items_per_session=4)
     await db_session.execute(
         Session.__table__.update().where(Session.admin_tg_id == USER).values(status="settled")
@@ -136,6 +149,8 @@ async def test_items_are_removed_with_the_session(client, auth_headers, db_sessi
     await db_session.commit()
 
     await client.request("DELETE", "/api/sessions/history", headers=auth_headers)
+    assert (await db_session.execute(select(SessionItem))).scalars().all() != []
+    await session_purger.run_once()
 
     items = await db_session.execute(select(SessionItem))
     assert items.scalars().all() == []
@@ -1,6 +1,17 @@
 """Tests for GET /api/quota endpoint."""
 
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
+
 import pytest
+from sqlalchemy import event, update
+
+from core.models.user_quota import UserQuota
+from core.services.quota import QuotaCache, QuotaService
+from tests.env import TEST_FREE_SCANS
+
+USER = 12345
 
 
 @pytest.mark.asyncio
@@ -24,3 +35,104 @@ async def test_get_quota_no_auth(client):
     """GET /api/quota without Authorization header returns 401."""
     response = await client.get("/api/quota")
     assert response.status_code == 401
+
+
+# The Mini App asks for the quota on every screen. Answers come from QuotaCache until
+# something in this process changes the quota, or a purchase is under way.
+
+
+@pytest.fixture
+def statements(db_session):
+    engine = db_session.get_bind().engine
+    seen: list[str] = []
+
+    def record(_conn, _cursor, statement, *_args):
+        seen.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield seen
+    event.remove(engine, "before_cursor_execute", record)
+
+
+async def test_a_repeated_quota_read_issues_no_sql(client, auth_headers, statements):
+    first = await client.get("/api/quota", headers=auth_headers)
+    statements.clear()
+
+    again = await client.get("/api/quota", headers=auth_headers)
+
+    assert again.json() == first.json()
+    assert statements == []
+
+
+async def test_a_charge_and_its_refund_are_seen_at_once(client, auth_headers, db_session):
+    await client.get("/api/quota", headers=auth_headers)
+    quota = QuotaService(db_session, TEST_FREE_SCANS)
+
+    charged = await quota.use_scan(USER, commit=False)
+    await db_session.commit()
+    after_charge = (await client.get("/api/quota", headers=auth_headers)).json()
+    await quota.refund_scan(USER, charged, commit=False)
+    await db_session.commit()
+    after_refund = (await client.get("/api/quota", headers=auth_headers)).json()
+
+    assert after_charge["free_scans_left"] == TEST_FREE_SCANS - 1
+    assert after_refund["free_scans_left"] == TEST_FREE_SCANS
+
+
+async def test_a_rolled_back_charge_leaves_nothing_behind(db_session):
+    """Its after-commit invalidation must not fire on some later, unrelated commit."""
+    cache = QuotaCache()
+    quota = QuotaService(db_session, TEST_FREE_SCANS, cache=cache)
+    await quota.get_quota_info(USER)
+
+    await quota.use_scan(USER, commit=False)
+    await db_session.rollback()
+    info = await quota.get_quota_info(USER)
+    await db_session.commit()
+
+    assert info[0] == TEST_FREE_SCANS, "the rolled-back charge is not counted"
+    assert cache.get(USER, TEST_FREE_SCANS) == info
+
+
+async def test_a_charge_in_the_callers_transaction_is_invalidated_on_commit(db_session):
+    cache = QuotaCache()
+    quota = QuotaService(db_session, TEST_FREE_SCANS, cache=cache)
+
+    await quota.use_scan(USER, commit=False)
+    info = await quota.get_quota_info(USER)
+    assert cache.get(USER, TEST_FREE_SCANS) == info
+    await db_session.commit()
+
+    assert cache.get(USER, TEST_FREE_SCANS) is None
+
+
+async def test_a_purchase_in_flight_is_read_from_the_database(
+    client, auth_headers, db_session, statements
+):
+    """The bot grants paid scans in its own process; this one's cache never hears of it."""
+    await client.get("/api/quota", headers=auth_headers)
+    with patch(
+        "api.routes.quota.NotificationService.create_invoice_link",
+        AsyncMock(return_value="https://t.me/invoice/x"),
+    ):
+        await client.post("/api/quota/invoice", json={"scans": 5}, headers=auth_headers)
+    await db_session.execute(update(UserQuota).values(paid_scans=5))
+    await db_session.commit()
+    statements.clear()
+
+    for _ in range(2):
+        resp = await client.get("/api/quota", headers=auth_headers)
+        assert resp.json()["paid_scans"] == 5
+    assert statements, "served from the cache"
+
+
+async def test_cached_quota_expires_at_the_monthly_reset():
+    cache = QuotaCache(ttl=60)
+    cache.put(1, 3, (0, 0, datetime.now(timezone.utc) + timedelta(milliseconds=20)))
+    cache.put(2, 3, (0, 0, datetime.now(timezone.utc) + timedelta(days=1)))
+
+    await asyncio.sleep(0.03)
+
+    assert cache.get(1, 3) is None
+    assert cache.get(2, 3) is not None
+    assert cache.get(2, 5) is None, "a different free limit is a different answer"
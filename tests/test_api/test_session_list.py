@@ -0,0 +1,104 @@
+"""GET /api/sessions/my, one keyset page at a time.
+
+The list used to return every session a user had ever joined, each with two
+correlated count subqueries; someone who splits every lunch has hundreds. It now
+pages on (created_at, id) with the next cursor in a response header. A keyset page
+must neither skip nor repeat a session — including sessions created in the same
+instant, which only the id tells apart.
+"""
+
+from __future__ import annotations
+
+from datetime import UTC, datetime
+from uuid import UUID
+
+import pytest
+from sqlalchemy import update
+
+from api.routes.sessions import NEXT_CURSOR_HEADER
+from core.models.session import Session
+from core.services.session import SessionService
+
+USER = 12345
+
+
+async def _sessions(db_session, n: int, *, same_instant: bool = False) -> list[UUID]:
+    svc = SessionService(db_session)
+    ids = [(await svc.create_session(USER, "Owner")).id for _ in range(n)]
+    if same_instant:
+        await db_session.execute(
+            update(Session).values(created_at=datetime(2026, 5, 1, 12, tzinfo=UTC))
+        )
+        await db_session.commit()
+    return ids
+
+
+async def _walk(client, headers, **params) -> list[list[dict]]:
+    pages = []
+    cursor = None
+    while True:
+        query = {**params, **({"cursor": cursor} if cursor else {})}
+        resp = await client.get("/api/sessions/my", params=query, headers=headers)
+        assert resp.status_code == 200
+        pages.append(resp.json())
+        cursor = resp.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize("same_instant", [False, True])
+async def test_pages_cover_every_session_once_newest_first(
+    client, auth_headers, db_session, same_instant
+):
+    ids = await _sessions(db_session, 7, same_instant=same_instant)
+
+    pages = await _walk(client, auth_headers, limit=3)
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    listed = [s for page in pages for s in page]
+    assert sorted(s["id"] for s in listed) == sorted(map(str, ids))
+    keys = [(s["created_at"], s["id"]) for s in listed]
+    assert keys == sorted(keys, reverse=True)
+
+
+async def test_last_full_page_has_no_cursor(client, auth_headers, db_session):
+    await _sessions(db_session, 4)
+
+    pages = await _walk(client, auth_headers, limit=2)
+
+    assert [len(page) for page in pages] == [2, 2]
+
+
+async def test_status_filter(client, auth_headers, db_session):
+    ids = await _sessions(db_session, 5)
+    await db_session.execute(
+        update(Session).where(Session.id.in_(ids[:2])).values(status="settled")
+    )
+    await db_session.execute(update(Session).where(Session.id == ids[2]).values(status="voting"))
+    await db_session.commit()
+
+    settled = await _walk(client, auth_headers, status="settled", limit=1)
+    active = await _walk(client, auth_headers, status=["created", "voting"])
+
+    assert sorted(s["id"] for page in settled for s in page) == sorted(map(str, ids[:2]))
+    assert sorted(s["id"] for page in active for s in page) == sorted(map(str, ids[2:]))
+    resp = await client.get("/api/sessions/my?status=archived", headers=auth_headers)
+    assert resp.status_code == 422
+
+
+async def test_counts_come_from_the_session_row(client, auth_headers, db_session):
+    svc = SessionService(db_session)
+    session = await svc.create_session(USER, "Owner")
+    await svc.join_session(session.invite_code, 777, "Guest")
+    await svc.save_ocr_items(session.id, [{"name": "Tea", "price": 90, "quantity": 1}] * 3)
+
+    (brief,) = (await client.get("/api/sessions/my", headers=auth_headers)).json()
+
+    assert (brief["member_count"], brief["item_count"]) == (2, 3)
+
+
+@pytest.mark.parametrize("cursor", ["garbage", "bm90IGEgY3Vyc29y", "%%%"])
+async def test_invalid_cursor_is_a_400(client, auth_headers, cursor):
+    resp = await client.get("/api/sessions/my", params={"cursor": cursor}, headers=auth_headers)
+
+    assert resp.status_code == 400
@@ -0,0 +1,143 @@
+"""Sessions are deleted in the background, a batch at a time.
+
+Clearing history used to delete every settled session in one statement inside the
+request, and the retention policy — abandoned sessions, old receipt photos — was a shell
+script someone had to remember to run. Both are now batches of the session purger: a
+backlog drains in small transactions, and what each run did shows in /metrics.
+"""
+
+from __future__ import annotations
+
+from contextlib import asynccontextmanager
+from datetime import UTC, datetime, timedelta
+from uuid import UUID
+
+import pytest
+from sqlalchemy import select, update
+
+from api.services.session_purger import SessionPurger
+from core.metrics import metrics
+from core.models.session import Session, SessionPhoto
+from core.services.photo_store import get_photo_store
+from core.services.retention import RetentionService
+from core.services.session import SessionService
+from tests.test_api.conftest import make_init_data
+
+USER = 12345
+LONG_AGO = datetime(2020, 1, 1, tzinfo=UTC)
+
+
+@pytest.fixture(autouse=True)
+def _fresh_metrics():
+    metrics.reset()
+
+
+async def _sessions(db_session, n: int, **values) -> list[UUID]:
+    svc = SessionService(db_session)
+    ids = [(await svc.create_session(USER, "Owner")).id for _ in range(n)]
+    if values:
+        await db_session.execute(update(Session).where(Session.id.in_(ids)).values(**values))
+        await db_session.commit()
+    return ids
+
+
+def _purger(db_session, **options) -> SessionPurger:
+    @asynccontextmanager
+    async def shared_session():
+        yield db_session
+
+    return SessionPurger(session_factory=shared_session, pause=0, **options)
+
+
+async def _remaining(db_session) -> set[str]:
+    return {str(i) for i in (await db_session.execute(select(Session.id))).scalars()}
+
+
+async def test_cleared_history_drains_in_batches(db_session, monkeypatch):
+    await _sessions(db_session, 5, status="settled")
+    assert await RetentionService(db_session).mark_history_deleted(USER) == 5
+
+    batches = []
+    purge_deleted = RetentionService.purge_deleted
+
+    async def counting(self, limit):
+        batches.append(await purge_deleted(self, limit))
+        return batches[-1]
+
+    monkeypatch.setattr(RetentionService, "purge_deleted", counting)
+    report = await _purger(db_session, batch_size=2).run_once()
+
+    assert batches == [2, 2, 1]
+    assert report.history == 5
+    assert await _remaining(db_session) == set()
+    assert metrics.value("retention_deleted_total", kind="history") == 5
+    assert metrics.value("retention_pending_sessions") == 0
+
+
+async def test_a_marked_session_cannot_be_opened_or_joined(client, auth_headers, db_session):
+    """Cleared history is gone at once, not only once the purger gets to it."""
+    (session_id,) = await _sessions(db_session, 1, status="settled")
+    invite = await db_session.scalar(select(Session.invite_code).where(Session.id == session_id))
+    await RetentionService(db_session).mark_history_deleted(USER)
+    guest = {"Authorization": f"tma {make_init_data(user_id=777)}"}
+
+    opened = await client.get(f"/api/sessions/{session_id}", headers=auth_headers)
+    shares = await client.get(f"/api/sessions/{session_id}/shares", headers=auth_headers)
+    by_invite = await client.get(f"/api/sessions/invite/{invite}", headers=guest)
+    joined = await client.post(f"/api/sessions/invite/{invite}/join", headers=guest)
+
+    assert [r.status_code for r in (opened, shares, by_invite, joined)] == [404] * 4
+    assert await SessionService(db_session).join_session(invite, 778, "Guest") is None
+
+
+async def test_marking_twice_counts_each_session_once(db_session):
+    await _sessions(db_session, 2, status="settled")
+    service = RetentionService(db_session)
+
+    assert await service.mark_history_deleted(USER) == 2
+    assert await service.mark_history_deleted(USER) == 0
+    assert await service.pending_deletion() == 2
+
+
+async def test_abandoned_sessions_past_the_cutoff_are_deleted(db_session):
+    await _sessions(db_session, 2, created_at=LONG_AGO)
+    fresh = await _sessions(db_session, 1)
+    finished = await _sessions(db_session, 1, created_at=LONG_AGO, status="settled")
+
+    report = await _purger(db_session, abandoned_after=timedelta(days=30)).run_once()
+
+    assert report.abandoned == 2
+    assert await _remaining(db_session) == {str(i) for i in fresh + finished}
+    assert metrics.value("retention_deleted_total", kind="abandoned") == 2
+
+
+async def test_old_photo_bytes_are_released(db_session):
+    (session_id,) = await _sessions(db_session, 1)
+    svc = SessionService(db_session)
+    old = await svc.add_photo(session_id, "old", b"old-receipt")
+    new = await svc.add_photo(session_id, "new", b"new-receipt")
+    await db_session.execute(
+        update(SessionPhoto).where(SessionPhoto.id == old.id).values(created_at=LONG_AGO)
+    )
+    await db_session.commit()
+    old_key = old.blob_sha256
+
+    report = await _purger(db_session, photos_after=timedelta(days=7)).run_once()
+
+    assert report.photos == 1
+    keys = dict(
+        (await db_session.execute(select(SessionPhoto.id, SessionPhoto.blob_sha256))).all()
+    )
+    assert keys == {old.id: None, new.id: new.blob_sha256}
+    store = get_photo_store()
+    assert await store.get(db_session, [old_key]) == []
+    assert await store.get(db_session, [new.blob_sha256]) == [b"new-receipt"]
+
+
+async def test_policies_off_by_default(db_session):
+    await _sessions(db_session, 1, created_at=LONG_AGO)
+
+    report = await _purger(db_session).run_once()
+
+    assert (report.history, report.abandoned, report.photos) == (0, 0, 0)
+    assert len(await _remaining(db_session)) == 1
@@ -0,0 +1,149 @@
+"""The row-built session documents against the Pydantic models they replaced.
+
+GET /api/sessions/{id}, /invite/{code}, /my and /shares no longer pass through their
+``response_model``: api/session_view.py builds the JSON from column rows and
+api/responses.py encodes it. Nothing validates the output any more, so a renamed
+column, a Decimal left unconverted or a datetime written differently would reach the
+Mini App unnoticed — these tests hold every document to what ``SessionOut``,
+``SessionBrief`` and ``ShareOut`` produce for the same data.
+"""
+
+from __future__ import annotations
+
+import json
+from datetime import UTC, datetime
+from decimal import Decimal
+from uuid import UUID, uuid4
+
+import pytest
+
+from api.responses import dumps
+from api.schemas import SessionBrief, SessionOut
+from core.services.session import SessionService
+from tests.test_api.conftest import make_init_data
+
+ADMIN = 12345
+GUEST = 777
+
+
+@pytest.fixture
+async def busy_session(db_session):
+    """A session with everything the document carries: photos, votes, tips, a confirmation."""
+    svc = SessionService(db_session)
+    session = await svc.create_session(ADMIN, "Owner")
+    await svc.add_photos(session.id, [("file-1", None), ("file-2", None)])
+    items = await svc.save_ocr_items(
+        session.id,
+        [
+            {"name": "Пицца Маргарита", "price": Decimal("549.90"), "quantity": 2},
+            {"name": "Лимонад", "price": 250, "quantity": 3},
+            {"name": "Тирамису", "price": Decimal("390.50"), "quantity": 1},
+        ],
+    )
+    await svc.join_session(session.invite_code, GUEST, "Гость")
+    await svc.set_vote(items[0].id, ADMIN, 1, items[0].quantity)
+    await svc.set_vote(items[0].id, GUEST, 1, items[0].quantity)
+    await svc.set_vote(items[1].id, GUEST, 3, items[1].quantity)
+    await svc.set_member_tip(session.id, GUEST, 15)
+    await svc.confirm_member(session.id, GUEST)
+    return session
+
+
+async def _pydantic_document(db_session, session_id) -> dict:
+    db_session.expire_all()
+    session = await SessionService(db_session).get_session_by_id(session_id)
+    return SessionOut.model_validate(session).model_dump(mode="json")
+
+
+@pytest.mark.asyncio
+async def test_session_document_matches_session_out(
+    client, auth_headers, db_session, busy_session
+):
+    resp = await client.get(f"/api/sessions/{busy_session.id}", headers=auth_headers)
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/json"
+    data = resp.json()
+    assert data == await _pydantic_document(db_session, busy_session.id)
+    assert len(data["photos"]) == 2
+    assert sum(len(item["votes"]) for item in data["items"]) == 3
+
+
+@pytest.mark.asyncio
+async def test_invite_document_matches_session_out(client, auth_headers, db_session, busy_session):
+    resp = await client.get(
+        f"/api/sessions/invite/{busy_session.invite_code}", headers=auth_headers
+    )
+
+    assert resp.status_code == 200
+    assert resp.json() == await _pydantic_document(db_session, busy_session.id)
+
+
+@pytest.mark.asyncio
+async def test_my_sessions_match_session_brief(client, auth_headers, busy_session):
+    resp = await client.get("/api/sessions/my", headers=auth_headers)
+
+    assert resp.status_code == 200
+    (brief,) = resp.json()
+    assert SessionBrief.model_validate(brief).model_dump(mode="json") == brief
+    assert brief["id"] == str(busy_session.id)
+    assert (brief["member_count"], brief["item_count"]) == (2, 3)
+
+
+@pytest.mark.asyncio
+async def test_shares_from_rows(client, auth_headers, busy_session):
+    resp = await client.get(f"/api/sessions/{busy_session.id}/shares", headers=auth_headers)
+
+    assert resp.status_code == 200
+    shares = {s["user_tg_id"]: s for s in resp.json()}
+    # A price is the line's total: one of the two pizzas each, and the guest also has all
+    # the lemonade and tips 15%. Grand totals are rounded up to whole units.
+    assert shares[ADMIN]["display_name"] == "Owner"
+    assert shares[ADMIN]["dishes_total"] == 274.95
+    assert shares[ADMIN]["tip_amount"] == 0
+    assert shares[GUEST]["display_name"] == "Гость"
+    assert shares[GUEST]["dishes_total"] == 524.95
+    assert shares[GUEST]["tip_amount"] == pytest.approx(78.74, abs=0.01)
+    assert shares[GUEST]["grand_total"] == 604
+
+
+@pytest.mark.asyncio
+async def test_outsider_and_missing_session(client, busy_session):
+    outsider = {"Authorization": f"tma {make_init_data(user_id=999)}"}
+
+    for path in ("", "/shares"):
+        resp = await client.get(f"/api/sessions/{busy_session.id}{path}", headers=outsider)
+        assert resp.status_code == 403
+        resp = await client.get(f"/api/sessions/{uuid4()}{path}", headers=outsider)
+        assert resp.status_code == 404
+    resp = await client.get("/api/sessions/invite/NOPE0000", headers=outsider)
+    assert resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_openapi_still_documents_the_models(client):
+    paths = (await client.get("/openapi.json")).json()["paths"]
+
+    schema = paths["/api/sessions/{session_id}"]["get"]["responses"]["200"]["content"]
+    assert schema["application/json"]["schema"]["$ref"].endswith("/SessionOut")
+
+
+class DriverUUID(UUID):
+    """Stands in for asyncpg.pgproto.UUID, the subclass asyncpg returns for uuid columns."""
+
+
+def test_driver_uuids_and_datetimes_are_written_as_pydantic_writes_them():
+    document = {
+        "id": uuid4(),
+        "session_id": DriverUUID(int=42),
+        "name": "Хачапури",
+        "price": 549.9,
+        "created_at": datetime(2026, 3, 1, 19, 30, 5, 120000, tzinfo=UTC),
+        "closed_at": None,
+    }
+
+    written = json.loads(dumps(document))
+
+    assert written["session_id"] == str(UUID(int=42))
+    assert written["created_at"] == "2026-03-01T19:30:05.120000Z"
+    assert written["name"] == "Хачапури"
@@ -13,6 +13,7 @@ from decimal import Decimal
 import pytest
 from sqlalchemy import select
 
+from core.models.notification import OutboxMessage
 from core.models.session import Session
 from core.services.session import SessionService
 from tests.test_api.conftest import make_init_data
@@ -59,22 +60,22 @@ async def test_settling_twice_returns_the_same_numbers(
     )
 
 
-async def test_only_the_first_settlement_notifies(client, auth_headers, settled_ready):
+async def test_only_the_first_settlement_notifies(client, auth_headers, settled_ready, db_session):
     """The whole point: nobody is told their total twice."""
     session, _items = settled_ready
 
-    # conftest patches api.routes.sessions.NotificationService with a single AsyncMock,
-    # so every construction inside the route returns the same object to count on.
-    from api.routes import sessions as sessions_module
-
-    mock = sessions_module.NotificationService.return_value
+    async def queued() -> list[int]:
+        rows = await db_session.execute(
+            select(OutboxMessage.chat_id).where(OutboxMessage.text.like("Чек рассчитан%"))
+        )
+        return sorted(rows.scalars().all())
 
     await client.post(f"/api/sessions/{session.id}/settle", headers=auth_headers)
-    assert mock.notify_settle.await_count == 1
+    assert await queued() == [ADMIN, GUEST]
 
     await client.post(f"/api/sessions/{session.id}/settle", headers=auth_headers)
     await client.post(f"/api/sessions/{session.id}/settle", headers=auth_headers)
-    assert mock.notify_settle.await_count == 1, "retries re-notified every participant"
+    assert await queued() == [ADMIN, GUEST], "retries re-notified every participant"
 
 
 async def test_settlement_records_when_it_closed(client, auth_headers, settled_ready, db_session):
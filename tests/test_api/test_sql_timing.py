@@ -0,0 +1,80 @@
+"""Per-request SQL statistics (api/sql_timing.py).
+
+N+1 regressions were only caught where a ``count_queries`` test had been written for the
+endpoint. With SQL_INSTRUMENTATION on, every response says how many statements it cost
+and requests over budget are logged with the statement that repeated.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+
+import pytest
+
+from api.sql_timing import fingerprint, instrument_engine
+from core.services.session import SessionService
+
+USER = 12345
+
+
+@pytest.fixture(autouse=True)
+def _instrumented(monkeypatch, db_session):
+    from core.config import get_settings
+
+    monkeypatch.setenv("SQL_INSTRUMENTATION", "true")
+    monkeypatch.setenv("SQL_LOG_MAX_STATEMENTS", "2")
+    get_settings.cache_clear()
+    # What lifespan does for the engine of core/db.py; the tests run on their own.
+    instrument_engine(db_session.get_bind().engine)
+
+
+def _server_timing(resp) -> tuple[int, float]:
+    match = re.fullmatch(
+        r'db;dur=([\d.]+);desc="(\d+) statements", db-slowest;dur=([\d.]+)',
+        resp.headers["server-timing"],
+    )
+    assert match, resp.headers["server-timing"]
+    return int(match[2]), float(match[1])
+
+
+async def test_every_response_reports_its_statements(client, auth_headers, db_session):
+    for _ in range(3):
+        await SessionService(db_session).create_session(USER, "Owner")
+
+    resp = await client.get("/api/sessions/my", headers=auth_headers)
+
+    statements, _ = _server_timing(resp)
+    assert statements == 1, "the same count test_query_counts.py pins"
+    health = await client.get("/api/health")
+    assert _server_timing(health) == (0, 0.0)
+
+
+async def test_a_request_over_the_statement_budget_is_logged_with_its_fingerprint(
+    client, auth_headers, db_session, caplog
+):
+    session = await SessionService(db_session).create_session(USER, "Owner")
+    session_id = session.id
+    # The route would find the session in the shared identity map and query nothing; in
+    # production every request has its own session.
+    db_session.expire_all()
+
+    with caplog.at_level(logging.WARNING, logger="api.sql_timing"):
+        await client.get("/api/health")
+        resp = await client.get(f"/api/sessions/{session_id}", headers=auth_headers)
+
+    statements, _ = _server_timing(resp)
+    assert statements > 2
+    [record] = caplog.records
+    message = record.getMessage()
+    assert message.startswith(f"GET /api/sessions/{{session_id}} over budget: {statements} ")
+    assert "most repeated" in message
+    assert session_id.hex not in message.replace("-", ""), "literals must not reach the log"
+
+
+def test_fingerprints_fold_literals_placeholders_and_in_lists():
+    a = fingerprint("SELECT * FROM votes\n  WHERE item_id IN ($1, $2, $3) AND qty > 2")
+    b = fingerprint("SELECT * FROM votes WHERE item_id IN ($1) AND qty > 17")
+
+    assert a == b == "SELECT * FROM votes WHERE item_id IN (...) AND qty > ?"
+    assert fingerprint("SELECT 'it''s', x::text FROM t") == "SELECT ?, x::text FROM t"
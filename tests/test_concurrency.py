@@ -21,11 +21,11 @@ import asyncio
 import os
 
 import pytest
-from sqlalchemy import select
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
 from core.models.base import Base
-from core.models.session import ItemVote, SessionItem
+from core.models.session import ItemVote, Session, SessionItem, SessionMember
 from core.services.session import SessionService
 
 TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
@@ -146,3 +146,245 @@ async def test_split_equal_does_not_race_against_a_late_voter(pg_sessionmaker):
 
     assert await _total_claimed(pg_sessionmaker, item_id) <= 4
     assert session is not None
+
+
+async def test_concurrent_workers_never_claim_the_same_ocr_job(pg_sessionmaker):
+    """SKIP LOCKED: eight workers, three jobs — three distinct claims, no double work."""
+    from core.services.ocr_jobs import OcrJobService
+
+    for admin in range(3):
+        async with pg_sessionmaker() as db:
+            session = await SessionService(db).create_session(admin, "Admin")
+            assert await OcrJobService(db, 3).enqueue(session.id, admin) is not None
+
+    async def worker():
+        async with pg_sessionmaker() as db:
+            job = await OcrJobService(db, 3).claim(lease_seconds=60)
+            return job.id if job else None
+
+    claimed = [j for j in await asyncio.gather(*(worker() for _ in range(8))) if j]
+    assert len(claimed) == len(set(claimed)) == 3
+
+
+async def test_a_double_tapped_scan_is_queued_and_charged_once(pg_sessionmaker):
+    """Both taps pass the "already queued?" check; the partial unique index stops one."""
+    from core.services.ocr_jobs import OcrJobService
+    from core.services.quota import QuotaService
+
+    async with pg_sessionmaker() as db:
+        session = await SessionService(db).create_session(1, "Admin")
+        await QuotaService(db, 3).get_quota_info(1)  # the quota row exists already
+
+    async def tap():
+        async with pg_sessionmaker() as db:
+            job = await OcrJobService(db, 3).enqueue(session.id, 1)
+            return job.id
+
+    ids = await asyncio.gather(*(tap() for _ in range(5)))
+    assert len(set(ids)) == 1
+
+    async with pg_sessionmaker() as db:
+        free_left, _paid, _reset = await QuotaService(db, 3).get_quota_info(1)
+    assert free_left == 2
+
+
+@pytest.mark.parametrize("existing_row", [True, False])
+async def test_concurrent_scans_never_overspend_the_quota(pg_sessionmaker, existing_row):
+    """Twenty scans at once against 3 free and 2 paid: exactly five are charged.
+
+    The check-then-charge sequence let concurrent scans all see a free scan left. Without
+    a quota row yet, the racing INSERTs must also resolve into charges, not errors.
+    """
+    from core.models.user_quota import UserQuota
+    from core.services.quota import QuotaService
+
+    if existing_row:
+        async with pg_sessionmaker() as db:
+            await QuotaService(db, 3).get_quota_info(1)
+            quota = await db.get(UserQuota, 1)
+            quota.paid_scans = 2
+            await db.commit()
+
+    async def scan():
+        async with pg_sessionmaker() as db:
+            return await QuotaService(db, 3).use_scan(1)
+
+    charges = await asyncio.gather(*(scan() for _ in range(20)))
+
+    paid = 2 if existing_row else 0
+    assert sorted(c for c in charges if c) == ["free"] * 3 + ["paid"] * paid
+    async with pg_sessionmaker() as db:
+        quota = await db.get(UserQuota, 1)
+    assert (quota.free_scans_used, quota.paid_scans) == (3, 0)
+
+
+async def test_concurrent_redeliveries_of_a_payment_credit_it_once(pg_sessionmaker):
+    """Both deliveries used to pass the "seen this charge?" lookup before either wrote."""
+    from core.models.user_quota import UserQuota
+    from core.services.payment import PaymentService
+
+    async def deliver():
+        async with pg_sessionmaker() as db:
+            return await PaymentService(db, 3).credit(1, 150, "charge-1", scans=20)
+
+    credited = await asyncio.gather(*(deliver() for _ in range(5)))
+
+    assert sorted(credited) == [False] * 4 + [True]
+    async with pg_sessionmaker() as db:
+        quota = await db.get(UserQuota, 1)
+    assert quota.paid_scans == 20
+
+
+async def test_reclaiming_a_blob_never_strands_a_concurrent_upload(pg_sessionmaker, tmp_path):
+    """Half the sessions let go of a photo while the other half upload the same bytes.
+
+    The upload finds the blob row present, so it writes nothing; if the release deleted
+    the row and file a moment later, the new photo would point at nothing. The upsert's
+    row lock and the foreign key must leave every uploaded photo readable.
+    """
+    from core.services.photo_store import FsPhotoStore
+
+    store = FsPhotoStore(tmp_path / "photos")
+    data = b"the same receipt"
+
+    for _round in range(5):
+        async with pg_sessionmaker() as db:
+            svc = SessionService(db, store)
+            holders = [(await svc.create_session(1, "A")).id for _ in range(5)]
+            uploaders = [(await svc.create_session(2, "B")).id for _ in range(5)]
+            for session_id in holders:
+                await svc.add_photo(session_id, "held", data=data)
+
+        async def release(session_id):
+            async with pg_sessionmaker() as db:
+                await SessionService(db, store).clear_photo_bytes(session_id)
+
+        async def upload(session_id):
+            async with pg_sessionmaker() as db:
+                await SessionService(db, store).add_photo(session_id, "new", data=data)
+
+        await asyncio.gather(*(release(s) for s in holders), *(upload(s) for s in uploaders))
+
+        async with pg_sessionmaker() as db:
+            svc = SessionService(db, store)
+            for session_id in uploaders:
+                assert await svc.get_photo_bytes(session_id) == [data]
+            for session_id in uploaders:
+                await svc.clear_photo_bytes(session_id)
+
+
+async def test_concurrent_joins_keep_member_count_exact(pg_sessionmaker):
+    """Twenty guests open the invite at once, one of them twice.
+
+    sessions.member_count is what GET /api/sessions/my shows. Each join moves it by one
+    in the join's own transaction; a recount there would miss the joins still in
+    flight, and a lost increment would leave the list wrong for good.
+    """
+    async with pg_sessionmaker() as db:
+        session = await SessionService(db).create_session(1, "Admin")
+
+    async def join(user_id: int):
+        async with pg_sessionmaker() as db:
+            await SessionService(db).join_session(session.invite_code, user_id, f"G{user_id}")
+
+    await asyncio.gather(*(join(uid) for uid in [*range(100, 120), 100]))
+
+    async with pg_sessionmaker() as db:
+        stored = await db.scalar(select(Session.member_count).where(Session.id == session.id))
+        actual = await db.scalar(
+            select(func.count()).where(SessionMember.session_id == session.id)
+        )
+    assert stored == actual == 21
+
+
+async def test_purge_passes_over_a_session_a_live_request_holds(pg_sessionmaker):
+    """SKIP LOCKED: the purge does not wait on a row locked by a request in flight.
+
+    The held session is left for a later batch; the others go. Two purgers running at
+    once split the rest between them without deleting anything twice.
+    """
+    from core.services.retention import RetentionService
+
+    async with pg_sessionmaker() as db:
+        svc = SessionService(db)
+        ids = [(await svc.create_session(1, "Admin")).id for _ in range(5)]
+        await db.execute(Session.__table__.update().values(status="settled"))
+        await db.commit()
+        assert await RetentionService(db).mark_history_deleted(1) == 5
+
+    async with pg_sessionmaker() as holder:
+        await holder.execute(select(Session).where(Session.id == ids[0]).with_for_update())
+
+        async def purge():
+            async with pg_sessionmaker() as db:
+                return await asyncio.wait_for(RetentionService(db).purge_deleted(2), 5)
+
+        deleted = await asyncio.gather(purge(), purge())
+        async with pg_sessionmaker() as db:
+            deleted.append(await asyncio.wait_for(RetentionService(db).purge_deleted(10), 5))
+        await holder.rollback()
+
+    assert sum(deleted) == 4
+    async with pg_sessionmaker() as db:
+        assert (await db.execute(select(Session.id))).scalars().all() == [ids[0]]
+
+
+async def test_a_vote_during_settlement_is_refused_or_in_the_notified_shares(
+    pg_sessionmaker, monkeypatch
+):
+    """A guest taps a dish while the admin's settle request is between claim and shares.
+
+    The vote route checks the committed status. With the claim left uncommitted until
+    the notifications were queued, the vote went through and the settle messages carried
+    amounts that the shares endpoint no longer showed.
+    """
+    import httpx
+
+    from api.app import create_app
+    from api.deps import get_db
+    from core.models.notification import OutboxMessage
+    from tests.test_api.conftest import make_init_data
+
+    session, item_id = await _dish(pg_sessionmaker, quantity=2)
+    async with pg_sessionmaker() as db:
+        svc = SessionService(db)
+        await svc.join_session(session.invite_code, 2, "Guest")
+        await svc.cycle_vote(item_id, 1, 2)
+
+    app = create_app()
+
+    async def per_request_db():
+        async with pg_sessionmaker() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = per_request_db
+    admin = {"Authorization": f"tma {make_init_data(user_id=1)}"}
+    guest = {"Authorization": f"tma {make_init_data(user_id=2)}"}
+    votes = []
+    claim_settlement = SessionService.claim_settlement
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+
+        async def claim_then_vote(self, *args, **kwargs):
+            claimed = await claim_settlement(self, *args, **kwargs)
+            vote = client.post(
+                f"/api/sessions/{session.id}/vote",
+                json={"item_id": str(item_id), "quantity": 1},
+                headers=guest,
+            )
+            votes.append(await asyncio.wait_for(vote, 5))
+            return claimed
+
+        monkeypatch.setattr(SessionService, "claim_settlement", claim_then_vote)
+        settled = await client.post(f"/api/sessions/{session.id}/settle", headers=admin)
+        monkeypatch.undo()
+        shares = await client.get(f"/api/sessions/{session.id}/shares", headers=admin)
+
+    assert settled.status_code == 200
+    assert [v.status_code for v in votes] == [409]
+    assert settled.json() == shares.json()
+    async with pg_sessionmaker() as db:
+        chats = (await db.execute(select(OutboxMessage.chat_id))).scalars().all()
+    assert sorted(chats) == [1, 2]
@@ -229,9 +229,9 @@ async def test_progress_is_reported_for_every_photo():
     with patch.object(OcrService, "_parse_single_photo", fast_parse):
         await svc.parse_receipt([b"a", b"b", b"c"], on_progress=on_progress)
 
-    assert len(seen) == 3
+    assert seen[0] == (0, 3)
     assert {total for _done, total in seen} == {3}
-    assert sorted(done for done, _total in seen) == [1, 2, 3]
+    assert sorted(done for done, _total in seen) == [0, 1, 2, 3]
 
 
 async def test_progress_is_reported_for_a_single_photo():
@@ -0,0 +1,129 @@
+"""OCR provider selection and the local stub backend.
+
+OcrService used to hardcode the Z.AI endpoint, so nothing above the HTTP call could run
+without the network — in particular no load test of the scan pipeline.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import mmap
+import os
+import time
+from decimal import Decimal
+
+import httpx
+import pytest
+
+from core.config import Settings
+from core.services.ocr import OcrService
+from core.services.ocr_providers import (
+    STUB_RECEIPT,
+    SYSTEM_PROMPT,
+    ChatCompletionsProvider,
+    StubOcrProvider,
+    build_ocr_provider,
+)
+from core.services.ocr_resilience import CircuitBreaker, LatencyTracker
+
+
+def _settings(**overrides) -> Settings:
+    return Settings(
+        bot_token="t", zai_api_key="k", database_url="sqlite+aiosqlite://", **overrides
+    )
+
+
+def test_chat_completions_is_the_default():
+    assert isinstance(build_ocr_provider(_settings()), ChatCompletionsProvider)
+
+
+def test_stub_is_selected_by_settings(tmp_path):
+    fixture = tmp_path / "receipt.json"
+    fixture.write_text(json.dumps({"items": [], "total": 0, "currency": "EUR"}))
+
+    provider = build_ocr_provider(
+        _settings(ocr_provider="stub", ocr_stub_fixture=str(fixture), ocr_stub_latency_ms=0)
+    )
+
+    assert isinstance(provider, StubOcrProvider)
+
+
+def test_unknown_provider_is_a_configuration_error():
+    with pytest.raises(ValueError, match="OCR_PROVIDER"):
+        build_ocr_provider(_settings(ocr_provider="tesseract"))
+
+
+async def test_stub_answers_through_the_normal_parse_path():
+    svc = OcrService(provider=StubOcrProvider(latency_ms=0))
+
+    result = await svc.parse_receipt([b"photo"])
+
+    assert [i.name for i in result.items] == [i["name"] for i in STUB_RECEIPT["items"]]
+    assert result.total == Decimal(STUB_RECEIPT["total"])
+
+
+async def test_stub_latency_follows_the_configured_median():
+    provider = StubOcrProvider(latency_ms=50, latency_sigma=0.01)
+
+    started = time.perf_counter()
+    await provider.complete(b"photo")
+
+    assert 0.04 < time.perf_counter() - started < 0.5
+
+
+async def test_stub_failures_are_seeded_and_go_through_retries():
+    """Same seed, same schedule: a benchmark run can be repeated exactly."""
+
+    async def schedule(seed: int) -> list[bool]:
+        provider = StubOcrProvider(latency_ms=0, failure_rate=0.5, seed=seed)
+        outcomes = []
+        for _ in range(20):
+            try:
+                await provider.complete(b"x")
+                outcomes.append(True)
+            except httpx.HTTPStatusError as exc:
+                assert exc.response.status_code == 503
+                outcomes.append(False)
+        return outcomes
+
+    assert await schedule(7) == await schedule(7)
+    assert not all(await schedule(7))
+
+    always_failing = StubOcrProvider(latency_ms=0, failure_rate=1.0)
+    svc = OcrService(
+        provider=always_failing, retries=1, breaker=CircuitBreaker(), latency=LatencyTracker()
+    )
+    with pytest.raises(httpx.HTTPStatusError):
+        await svc.parse_receipt([b"photo"])
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 3, 200_000, 3 * 64 * 1024 + 1])
+async def test_streamed_request_is_the_json_request(tmp_path, size):
+    """The body is streamed around the photo, not serialised whole; it must not differ."""
+    photo = os.urandom(size)
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(photo)
+    seen: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        content = json.dumps(STUB_RECEIPT)
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+    provider = ChatCompletionsProvider("key", "model", transport=httpx.MockTransport(handler))
+    with path.open("rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+    try:
+        await provider.complete(mapped)
+    finally:
+        if size:
+            mapped.close()
+
+    request = seen[0]
+    assert int(request.headers["Content-Length"]) == len(request.content)
+    sent = json.loads(request.content)
+    url = sent["messages"][1]["content"][1]["image_url"]["url"]
+    assert url == "data:image/jpeg;base64," + base64.b64encode(photo).decode()
+    assert sent["model"] == "model"
+    assert sent["messages"][0]["content"] == SYSTEM_PROMPT
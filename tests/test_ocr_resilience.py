@@ -0,0 +1,282 @@
+"""Retries, hedging and the circuit breaker around the OCR provider.
+
+One slow or 5xx answer from the provider used to fail the whole multi-photo scan, and
+an outage made every scan wait out its 120 s timeout before the refund. These tests run
+the real OcrService request path against tests/fake_provider.py.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from decimal import Decimal
+
+import httpx
+import pytest
+
+from core.metrics import metrics
+from core.services import ocr as ocr_module
+from core.services.ocr import OcrService
+from core.services.ocr_resilience import CircuitBreaker, CircuitOpenError, LatencyTracker
+from tests.fake_provider import FakeProvider
+
+
+@pytest.fixture(autouse=True)
+def _fast_backoff(monkeypatch):
+    """Keep real jittered sleeps, but in milliseconds."""
+    monkeypatch.setattr(ocr_module, "_BACKOFF_BASE_SECONDS", 0.001)
+    monkeypatch.setattr(ocr_module, "_BACKOFF_CAP_SECONDS", 0.01)
+    metrics.reset()
+
+
+def _service(provider: FakeProvider, **kwargs) -> OcrService:
+    kwargs.setdefault("breaker", CircuitBreaker())
+    kwargs.setdefault("latency", LatencyTracker())
+    return OcrService("key", "model", transport=provider.transport, **kwargs)
+
+
+# ---------------------------------------------------------------------------
+# Retries
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("transient", [500, 502, 503, 504, 429, "timeout", "connect"])
+async def test_a_transient_failure_is_retried(transient):
+    provider = FakeProvider(transient, 200)
+
+    result = await _service(provider).parse_receipt([b"photo"])
+
+    assert result.total == Decimal("500")
+    assert provider.calls == 2
+    assert metrics.value("ocr_provider_retries_total") == 1
+
+
+async def test_one_flaky_photo_no_longer_fails_the_receipt():
+    """Three photos in parallel, the first call of the batch hits a 502."""
+    provider = FakeProvider(502, 200)
+
+    result = await _service(provider).parse_receipt([b"a", b"b", b"c"])
+
+    assert result.items[0].quantity == 3
+    assert provider.calls == 4
+
+
+async def test_retries_give_up_after_the_configured_attempts():
+    provider = FakeProvider(503)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await _service(provider, retries=2).parse_receipt([b"photo"])
+
+    assert provider.calls == 3
+
+
+async def test_a_client_error_is_not_retried():
+    """A 400 will be a 400 again — retrying only burns the deadline."""
+    provider = FakeProvider(400, 200)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await _service(provider).parse_receipt([b"photo"])
+
+    assert provider.calls == 1
+    assert metrics.value("ocr_provider_requests_total", outcome="rejected") == 1
+
+
+async def test_retry_after_is_honoured_on_429(monkeypatch):
+    monkeypatch.setattr(ocr_module, "_BACKOFF_CAP_SECONDS", 1.0)
+    provider = FakeProvider(429, 200, retry_after="0.2")
+
+    started = time.perf_counter()
+    await _service(provider).parse_receipt([b"photo"])
+
+    assert time.perf_counter() - started >= 0.2
+
+
+# ---------------------------------------------------------------------------
+# Hedging
+# ---------------------------------------------------------------------------
+
+
+def _warm_latency(seconds: float = 0.01) -> LatencyTracker:
+    tracker = LatencyTracker(min_samples=5)
+    for _ in range(20):
+        tracker.record(seconds)
+    return tracker
+
+
+async def test_a_straggler_is_hedged_and_the_fast_copy_wins():
+    provider = FakeProvider((5.0, 200), 200)
+
+    started = time.perf_counter()
+    result = await _service(provider, hedge=True, latency=_warm_latency()).parse_receipt(
+        [b"photo"]
+    )
+
+    assert result.total == Decimal("500")
+    assert time.perf_counter() - started < 1.0, "waited for the straggler"
+    assert metrics.value("ocr_provider_hedges_total") == 1
+    assert metrics.value("ocr_provider_hedge_wins_total") == 1
+
+
+async def test_no_hedge_without_enough_latency_samples():
+    """A p95 from a handful of calls is noise; hedging on it would double the bill."""
+    provider = FakeProvider((0.05, 200))
+
+    await _service(provider, hedge=True).parse_receipt([b"photo"])
+
+    assert provider.calls == 1
+    assert metrics.value("ocr_provider_hedges_total") == 0
+
+
+async def test_hedging_is_off_by_default():
+    provider = FakeProvider((0.1, 200))
+
+    await _service(provider, latency=_warm_latency()).parse_receipt([b"photo"])
+
+    assert provider.calls == 1
+
+
+# ---------------------------------------------------------------------------
+# Circuit breaker
+# ---------------------------------------------------------------------------
+
+
+async def test_the_breaker_opens_and_then_fails_fast():
+    breaker = CircuitBreaker(threshold=0.5, window=4, min_calls=4, cooldown=60)
+    provider = FakeProvider(503)
+    svc = _service(provider, breaker=breaker, retries=1)
+
+    for _ in range(2):
+        with pytest.raises(httpx.HTTPStatusError):
+            await svc.parse_receipt([b"photo"])
+    assert breaker.is_open
+    calls_before = provider.calls
+
+    with pytest.raises(CircuitOpenError):
+        await svc.parse_receipt([b"a", b"b", b"c"])
+
+    assert provider.calls == calls_before, "an open circuit must not reach the provider"
+    assert metrics.value("ocr_circuit_rejections_total", breaker="ocr") == 3
+    assert metrics.value("ocr_circuit_open", breaker="ocr") == 1
+
+
+async def test_a_successful_probe_closes_the_breaker():
+    breaker = CircuitBreaker(threshold=0.5, window=2, min_calls=2, cooldown=0.05)
+    svc = _service(FakeProvider(503, 503, 200), breaker=breaker, retries=1)
+    with pytest.raises(httpx.HTTPStatusError):
+        await svc.parse_receipt([b"photo"])
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    assert breaker.state == "half_open" and not breaker.is_open
+
+    await svc.parse_receipt([b"photo"])
+    assert breaker.state == "closed"
+
+
+async def test_a_failed_probe_reopens_the_breaker():
+    breaker = CircuitBreaker(threshold=0.5, window=2, min_calls=2, cooldown=0.05)
+    svc = _service(FakeProvider(503), breaker=breaker, retries=1)
+    with pytest.raises(httpx.HTTPStatusError):
+        await svc.parse_receipt([b"photo"])
+
+    time.sleep(0.06)
+    # The probe fails and re-opens the circuit, so its own retry is refused.
+    with pytest.raises(CircuitOpenError):
+        await svc.parse_receipt([b"photo"])
+
+    assert breaker.state == "open"
+
+
+async def _half_open(breaker: CircuitBreaker, svc: OcrService) -> None:
+    with pytest.raises(httpx.HTTPStatusError):
+        await svc.parse_receipt([b"photo"])
+    time.sleep(0.06)
+    assert breaker.state == "half_open" and not breaker.is_open
+
+
+async def test_a_cancelled_probe_gives_the_probe_back():
+    """The job deadline cancelling the probe must not leave the circuit shut for good."""
+    breaker = CircuitBreaker(threshold=0.5, window=2, min_calls=2, cooldown=0.05)
+    svc = _service(FakeProvider(503, 503, (5.0, 200), 200), breaker=breaker, retries=1)
+    await _half_open(breaker, svc)
+
+    with pytest.raises(TimeoutError):
+        await asyncio.wait_for(svc.parse_receipt([b"photo"]), 0.05)
+
+    assert not breaker.is_open
+    await svc.parse_receipt([b"photo"])
+    assert breaker.state == "closed"
+
+
+async def test_a_malformed_reply_fails_the_probe():
+    breaker = CircuitBreaker(threshold=0.5, window=2, min_calls=2, cooldown=0.05)
+    svc = _service(FakeProvider(503, 503, "garbage"), breaker=breaker, retries=1)
+    await _half_open(breaker, svc)
+
+    with pytest.raises(json.JSONDecodeError):
+        await svc.parse_receipt([b"photo"])
+
+    assert breaker.state == "open", "the probe failed: another full cool-down"
+    assert metrics.value("ocr_provider_requests_total", outcome="malformed") == 1
+    time.sleep(0.06)
+    assert not breaker.is_open, "the next probe is let through"
+
+
+async def test_malformed_replies_count_towards_tripping():
+    breaker = CircuitBreaker(threshold=0.5, window=2, min_calls=2, cooldown=60)
+    svc = _service(FakeProvider("garbage"), breaker=breaker)
+    for _ in range(2):
+        with pytest.raises(json.JSONDecodeError):
+            await svc.parse_receipt([b"photo"])
+
+    assert breaker.state == "open"
+
+
+async def test_unreadable_photos_do_not_trip_the_breaker():
+    """Provider health is about transport and 5xx, not about what the LLM wrote."""
+    breaker = CircuitBreaker(threshold=0.5, window=2, min_calls=2, cooldown=60)
+    provider = FakeProvider(400)
+    svc = _service(provider, breaker=breaker)
+    for _ in range(4):
+        with pytest.raises(httpx.HTTPStatusError):
+            await svc.parse_receipt([b"photo"])
+
+    assert breaker.state == "closed"
+
+
+# ---------------------------------------------------------------------------
+# Per-photo metrics
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize(
+    ("step", "outcome", "error"),
+    [
+        (200, "success", None),
+        ("timeout", "timeout", httpx.TimeoutException),
+        (400, "provider_error", httpx.HTTPStatusError),
+    ],
+)
+async def test_every_photo_is_timed_and_counted_by_outcome(step, outcome, error):
+    service = _service(FakeProvider(step), retries=0)
+
+    if error is None:
+        await service.parse_receipt([b"a", b"b"])
+    else:
+        with pytest.raises(error):
+            await service.parse_receipt([b"a", b"b"])
+
+    assert metrics.value("ocr_photos_total", outcome=outcome) == 2
+    assert metrics.histogram("ocr_photo_seconds", outcome=outcome).count == 2
+
+
+async def test_an_unreadable_reply_counts_as_a_parse_error(monkeypatch):
+    monkeypatch.setattr(
+        "tests.fake_provider.RECEIPT", {"total": 500, "currency": "RUB"}, raising=True
+    )
+
+    with pytest.raises(KeyError):
+        await _service(FakeProvider(200)).parse_receipt([b"a"])
+
+    assert metrics.value("ocr_photos_total", outcome="parse_error") == 1
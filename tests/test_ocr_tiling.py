@@ -0,0 +1,164 @@
+"""Tiled OCR of very tall receipt photos.
+
+A long receipt in one shot came back truncated at max_tokens or with the small print
+unreadable. OcrService can now cut such a photo into overlapping strips, read them in
+parallel and stitch the strips back together.
+
+The fake provider below cannot read text, so the test receipt encodes its own geometry:
+every pixel row's red channel is proportional to its height in the original photo. The
+provider decodes a strip, recovers which rows it shows, and answers with the receipt
+lines that fit inside them — the way a model sees only the lines on its strip.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+from decimal import Decimal
+
+from PIL import Image
+
+from core.config import Settings
+from core.services.ocr import OcrService
+from core.services.ocr_providers import ProviderReply
+from core.services.ocr_resilience import CircuitBreaker, LatencyTracker
+from core.services.ocr_tiling import Tiling
+
+_WIDTH, _HEIGHT = 300, 3000
+_LINE = 100  # pixel rows per receipt line
+_LINES = [(f"Позиция {n}", 100 + n) for n in range(_HEIGHT // _LINE)]
+
+
+def _tall_receipt(width: int = _WIDTH, height: int = _HEIGHT) -> bytes:
+    image = Image.new("RGB", (width, height))
+    for y in range(height):
+        image.paste((round(y * 255 / (height - 1)), 128, 128), (0, y, width, y + 1))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+class GeometryProvider:
+    """Answers with the receipt lines visible on the strip it is sent."""
+
+    name = "geometry"
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.calls = 0
+        self.in_flight = 0
+        self.peak = 0
+        self._delay = delay
+
+    async def complete(self, photo: bytes) -> ProviderReply:
+        self.calls += 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self._delay)
+        finally:
+            self.in_flight -= 1
+        image = Image.open(io.BytesIO(photo)).convert("RGB")
+        top = image.getpixel((image.width // 2, 0))[0] * (_HEIGHT - 1) / 255
+        bottom = image.getpixel((image.width // 2, image.height - 1))[0] * (_HEIGHT - 1) / 255
+        slack = 20  # one red level is ~12 rows, plus JPEG noise
+        visible = [
+            (name, price)
+            for n, (name, price) in enumerate(_LINES)
+            if n * _LINE >= top - slack and (n + 1) * _LINE <= bottom + slack
+        ]
+        at_bottom = bottom >= _HEIGHT - 1 - slack
+        total = sum(p for _n, p in _LINES) if at_bottom else sum(p for _n, p in visible)
+        content = {
+            "items": [{"name": n, "price": p, "quantity": 1} for n, p in visible],
+            "total": total,
+            "currency": "RUB",
+        }
+        text = json.dumps(content, ensure_ascii=False)
+        return ProviderReply(text, {"choices": [{"message": {"content": text}}]})
+
+
+def _service(provider, tiling: Tiling | None) -> OcrService:
+    return OcrService(
+        provider=provider,
+        retries=0,
+        breaker=CircuitBreaker(),
+        latency=LatencyTracker(),
+        tiling=tiling,
+    )
+
+
+def test_plan_keeps_photos_that_are_not_tall():
+    assert Tiling().plan(1000, 1400) == [(0, 1400)]
+
+
+def test_plan_covers_the_photo_with_overlapping_strips():
+    tiling = Tiling(aspect=1.5, overlap=0.25, max_strips=10)
+
+    spans = tiling.plan(400, 2000)
+
+    assert spans[0][0] == 0 and spans[-1][1] == 2000
+    assert all(bottom - top <= 600 for top, bottom in spans)
+    for (_top, prev_bottom), (top, _bottom) in zip(spans, spans[1:], strict=False):
+        assert prev_bottom - top >= 0.25 * 600 - 1
+
+
+def test_plan_caps_the_strip_count_with_taller_strips():
+    spans = Tiling(aspect=1.5, overlap=0.25, max_strips=5).plan(_WIDTH, _HEIGHT)
+
+    assert len(spans) == 5
+    assert spans[0][0] == 0 and spans[-1][1] == _HEIGHT
+    for (_top, prev_bottom), (top, _bottom) in zip(spans, spans[1:], strict=False):
+        assert prev_bottom > top
+
+
+def test_split_leaves_undecodable_bytes_alone():
+    assert Tiling().split(b"not an image") == [b"not an image"]
+
+
+async def test_tall_photo_is_read_in_strips_and_stitched():
+    provider = GeometryProvider()
+
+    result = await _service(provider, Tiling()).parse_receipt([_tall_receipt()])
+
+    assert provider.calls == 5
+    assert [(i.name, i.price) for i in result.items] == [(n, Decimal(p)) for n, p in _LINES]
+    assert result.total == sum(Decimal(p) for _n, p in _LINES)
+    assert not result.total_mismatch
+
+
+async def test_strips_are_recognised_concurrently():
+    """Wall-clock of a tiled photo is that of one strip: all strips are in flight at once."""
+    provider = GeometryProvider(delay=0.05)
+    progress: list[tuple[int, int]] = []
+
+    async def on_progress(done: int, total: int) -> None:
+        progress.append((done, total))
+
+    await _service(provider, Tiling()).parse_receipt([_tall_receipt()], on_progress=on_progress)
+
+    assert provider.peak == 5
+    # One photo, five strips: the bar counts strips from the first report to the last.
+    assert progress[0] == (0, 5)
+    assert {total for _done, total in progress} == {5}
+    assert progress[-1] == (5, 5)
+
+
+async def test_without_tiling_the_photo_goes_whole():
+    provider = GeometryProvider()
+
+    await _service(provider, None).parse_receipt([_tall_receipt()])
+
+    assert provider.calls == 1
+
+
+def test_tiling_is_configured_from_settings():
+    settings = Settings(
+        bot_token="t",
+        zai_api_key="k",
+        database_url="sqlite+aiosqlite://",
+        ocr_tiling=True,
+        ocr_tile_max_strips=3,
+    )
+
+    assert OcrService.from_settings(settings)._tiling == Tiling(max_strips=3)
@@ -0,0 +1,80 @@
+"""Crediting a Stars payment.
+
+The handler used to check the charge id, add the Payment and then grant the pack one
+scan and one commit at a time: forty statements for a 20-scan pack, and a crash half way
+kept the payment with part of the pack missing. Recording and granting are now one
+transaction, and the insert itself turns a redelivered update away.
+"""
+
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import event, func, select
+
+from core.models.payment import Payment
+from core.models.user_quota import UserQuota
+from core.services.payment import PaymentService
+from core.services.quota import QuotaService
+
+
+@pytest.fixture
+def payments(db_session):
+    return PaymentService(db_session, free_limit=3)
+
+
+@pytest.fixture
+def statements(db_session):
+    engine = db_session.get_bind().engine
+    seen: list[str] = []
+
+    def record(_conn, _cursor, statement, *_args):
+        seen.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield seen
+    event.remove(engine, "before_cursor_execute", record)
+
+
+async def _paid_scans(db_session, user_tg_id: int) -> int:
+    quota = await db_session.get(UserQuota, user_tg_id, populate_existing=True)
+    return quota.paid_scans if quota else 0
+
+
+async def test_a_pack_is_granted_with_its_payment(payments, db_session):
+    assert await payments.credit(111, 150, "charge-1", scans=20) is True
+
+    assert await _paid_scans(db_session, 111) == 20
+    assert await db_session.scalar(select(func.count()).select_from(Payment)) == 1
+
+
+async def test_a_redelivered_payment_grants_nothing(payments, db_session):
+    await payments.credit(111, 50, "charge-1", scans=5)
+
+    assert await payments.credit(111, 50, "charge-1", scans=5) is False
+    assert await _paid_scans(db_session, 111) == 5
+
+
+async def test_a_pack_adds_to_existing_paid_scans(payments, db_session):
+    await QuotaService(db_session, 3).use_scan(111)
+    await payments.credit(111, 50, "charge-1", scans=5)
+    await payments.credit(111, 50, "charge-2", scans=5)
+
+    assert await _paid_scans(db_session, 111) == 10
+
+
+async def test_crediting_costs_the_same_for_any_pack_size(payments, statements):
+    await payments.credit(111, 150, "charge-1", scans=20)
+
+    assert len(statements) == 2, statements
+
+
+async def test_a_failed_grant_does_not_keep_the_payment(payments, db_session):
+    with patch.object(QuotaService, "grant_paid_scans", side_effect=RuntimeError("crash")):
+        with pytest.raises(RuntimeError):
+            await payments.credit(111, 50, "charge-1", scans=5)
+    await db_session.rollback()
+
+    assert await db_session.scalar(select(func.count()).select_from(Payment)) == 0
+    # ...so the redelivery Telegram sends next is credited in full.
+    assert await payments.credit(111, 50, "charge-1", scans=5) is True
+    assert await _paid_scans(db_session, 111) == 5
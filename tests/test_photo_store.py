@@ -0,0 +1,149 @@
+"""Content-addressed photo storage.
+
+Receipt bytes used to be a bytea column on session_photos — through WAL, TOAST and
+every backup. They are blobs named by their SHA-256 now, on disk or in photo_blobs,
+shared between sessions that upload the same picture and reclaimed once no photo row
+references them.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import time
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import select
+
+from core.models.photo_blob import PhotoBlob
+from core.services.photo_store import DbPhotoStore, FsPhotoStore, close_photos, content_key
+from core.services.session import SessionService
+
+
+@pytest.fixture
+def store(tmp_path):
+    return FsPhotoStore(tmp_path / "photos")
+
+
+async def _session(db_session, photos, admin: int = 1):
+    svc = SessionService(db_session, photos)
+    session = await svc.create_session(admin_tg_id=admin, admin_display_name="A")
+    return svc, session.id
+
+
+async def test_bytes_go_to_a_file_named_by_their_hash(db_session, store):
+    svc, session_id = await _session(db_session, store)
+
+    await svc.add_photo(session_id, "p1", data=b"receipt")
+
+    path = store.path(content_key(b"receipt"))
+    assert path.read_bytes() == b"receipt"
+    assert [p.name for p in path.parent.iterdir()] == [path.name], "temporary file left"
+    blob = await db_session.get(PhotoBlob, content_key(b"receipt"))
+    assert blob.size == len(b"receipt")
+    assert await svc.get_photo_bytes(session_id) == [b"receipt"]
+
+
+async def test_the_same_photo_is_stored_once(db_session, store):
+    first, first_id = await _session(db_session, store, admin=1)
+    second, second_id = await _session(db_session, store, admin=2)
+
+    await first.add_photo(first_id, "p1", data=b"forwarded")
+    await second.add_photo(second_id, "p2", data=b"forwarded")
+
+    assert await store.usage(db_session) == (1, len(b"forwarded"))
+    assert await second.get_photo_bytes(second_id) == [b"forwarded"]
+
+
+async def test_a_blob_is_reclaimed_when_its_last_reference_goes(db_session, store):
+    first, first_id = await _session(db_session, store, admin=1)
+    second, second_id = await _session(db_session, store, admin=2)
+    await first.add_photo(first_id, "p1", data=b"shared")
+    await second.add_photo(second_id, "p2", data=b"shared")
+    path = store.path(content_key(b"shared"))
+
+    await first.clear_photo_bytes(first_id)
+    assert path.exists(), "still referenced by the second session"
+    assert await second.get_photo_bytes(second_id) == [b"shared"]
+
+    await second.clear_photos(second_id)
+    assert not path.exists()
+    assert await store.usage(db_session) == (0, 0)
+
+
+async def test_gc_spares_recently_used_blobs(db_session, store):
+    svc, session_id = await _session(db_session, store)
+    await svc.add_photo(session_id, "p1", data=b"pending")
+    # Unreferenced, but used a moment ago — as an upload about to commit would be.
+    await svc.clear_photo_bytes(session_id, commit=False)
+    await db_session.commit()
+
+    assert await store.gc(db_session) == 0
+    assert await store.gc(db_session, grace=timedelta(0)) == 1
+    assert not store.path(content_key(b"pending")).exists()
+
+
+async def test_gc_removes_files_without_a_row(db_session, store):
+    svc, session_id = await _session(db_session, store)
+    await svc.add_photo(session_id, "p1", data=b"kept")
+    orphan = store.path("ab" + "0" * 62)
+    orphan.parent.mkdir(parents=True, exist_ok=True)
+    orphan.write_bytes(b"rolled back upload")
+    half_written = orphan.parent / ".ab000000-x.tmp"
+    half_written.write_bytes(b"crash")
+    an_hour_ago = time.time() - 2 * 3600
+    for path in (orphan, half_written, store.path(content_key(b"kept"))):
+        os.utime(path, (an_hour_ago, an_hour_ago))
+
+    await store.gc(db_session)
+
+    assert not orphan.exists()
+    assert not half_written.exists()
+    assert await svc.get_photo_bytes(session_id) == [b"kept"]
+
+
+async def test_a_missing_file_is_skipped_not_fatal(db_session, store):
+    svc, session_id = await _session(db_session, store)
+    await svc.add_photo(session_id, "p1", data=b"one")
+    await svc.add_photo(session_id, "p2", data=b"two")
+    store.path(content_key(b"one")).unlink()
+
+    assert await svc.get_photo_bytes(session_id) == [b"two"]
+
+
+async def test_db_backend_keeps_bytes_on_the_blob_row(db_session):
+    store = DbPhotoStore()
+    svc, session_id = await _session(db_session, store)
+
+    await svc.add_photo(session_id, "p1", data=b"in the database")
+
+    stored = await db_session.execute(
+        select(PhotoBlob.data).where(PhotoBlob.sha256 == content_key(b"in the database"))
+    )
+    assert stored.scalar_one() == b"in the database"
+    assert await svc.get_photo_bytes(session_id) == [b"in the database"]
+
+    await svc.clear_photo_bytes(session_id)
+    assert await store.usage(db_session) == (0, 0)
+
+
+async def test_open_maps_files_instead_of_reading_them(db_session, store):
+    """OCR holds photos for minutes; mapped, they are not copied onto the heap."""
+    svc, session_id = await _session(db_session, store)
+    await svc.add_photo(session_id, "p1", data=b"first")
+    await svc.add_photo(session_id, "p2", data=b"second")
+
+    photos = await svc.open_photos(session_id)
+
+    assert all(isinstance(photo, mmap.mmap) for photo in photos)
+    assert [photo[:] for photo in photos] == [b"first", b"second"]
+    close_photos(photos)
+    assert all(photo.closed for photo in photos)
+
+
+async def test_open_hands_out_row_bytes_with_the_db_backend(db_session):
+    svc, session_id = await _session(db_session, DbPhotoStore())
+    await svc.add_photo(session_id, "p1", data=b"in the database")
+
+    assert await svc.open_photos(session_id) == [b"in the database"]
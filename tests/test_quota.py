@@ -1,5 +1,8 @@
 import pytest
 from datetime import datetime, timedelta, timezone
+from unittest.mock import ANY
+
+from sqlalchemy import event
 
 from core.models.user_quota import UserQuota
 from core.services.quota import QuotaService
@@ -39,3 +42,94 @@ async def test_quota_resets_monthly(quota_svc, db_session):
 
     can_scan = await quota_svc.can_scan_free(user_tg_id=111)
     assert can_scan is True
+
+
+# use_scan / refund_scan: one statement each. use_scan used to check, reset and charge in
+# separate round trips with their own commits, so two scans could both take the last
+# free one; see also tests/test_concurrency.py for the race itself.
+
+
+@pytest.fixture
+def statements(db_session):
+    engine = db_session.get_bind().engine
+    seen: list[str] = []
+
+    def record(_conn, _cursor, statement, *_args):
+        seen.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield seen
+    event.remove(engine, "before_cursor_execute", record)
+
+
+async def test_use_scan_takes_free_then_paid_then_nothing(quota_svc, db_session):
+    db_session.add(
+        UserQuota(
+            user_tg_id=111,
+            free_scans_used=2,
+            paid_scans=1,
+            quota_reset_at=datetime.now(timezone.utc) + timedelta(days=1),
+        )
+    )
+    await db_session.commit()
+
+    charges = [await quota_svc.use_scan(111) for _ in range(3)]
+
+    assert charges == ["free", "paid", None]
+    assert await quota_svc.get_quota_info(111) == (0, 0, ANY)
+
+
+async def test_use_scan_creates_the_row_for_a_new_user(quota_svc, db_session):
+    assert await quota_svc.use_scan(111) == "free"
+    quota = await db_session.get(UserQuota, 111)
+    assert (quota.free_scans_used, quota.paid_scans) == (1, 0)
+
+
+async def test_use_scan_applies_a_due_monthly_reset(quota_svc, db_session):
+    db_session.add(
+        UserQuota(
+            user_tg_id=111,
+            free_scans_used=3,
+            paid_scans=2,
+            quota_reset_at=datetime.now(timezone.utc) - timedelta(days=1),
+        )
+    )
+    await db_session.commit()
+
+    assert await quota_svc.use_scan(111) == "free"
+    quota = await db_session.get(UserQuota, 111)
+    assert (quota.free_scans_used, quota.paid_scans) == (1, 2)
+    assert quota.quota_reset_at.replace(tzinfo=timezone.utc) > datetime.now(timezone.utc)
+
+
+async def test_use_scan_with_no_free_allowance_charges_nothing(db_session):
+    assert await QuotaService(db_session, free_limit=0).use_scan(111) is None
+
+
+async def test_use_scan_is_a_single_statement(quota_svc, statements):
+    await quota_svc.use_scan(111, commit=False)
+    await quota_svc.use_scan(111, commit=False)
+
+    assert len(statements) == 2
+    assert all("ON CONFLICT" in s for s in statements)
+
+
+async def test_refund_puts_the_scan_back_where_it_came_from(quota_svc, db_session, statements):
+    db_session.add(
+        UserQuota(
+            user_tg_id=111,
+            free_scans_used=1,
+            paid_scans=0,
+            quota_reset_at=datetime.now(timezone.utc) + timedelta(days=1),
+        )
+    )
+    await db_session.commit()
+    statements.clear()
+
+    await quota_svc.refund_scan(111, "free")
+    await quota_svc.refund_scan(111, "free")  # clamps at zero
+    await quota_svc.refund_scan(111, "paid")
+
+    quota = await db_session.get(UserQuota, 111)
+    assert (quota.free_scans_used, quota.paid_scans) == (0, 1)
+    assert sum(s.startswith("UPDATE") for s in statements) == 3
@@ -0,0 +1,105 @@
+"""Stitching multi-photo receipts on their overlap.
+
+The merge used to key lines by exact name across all photos: an overlapping line that
+the LLM spelled differently on the next photo stayed as a duplicate dish, and one it
+spelled the same way was summed, so the overlap was paid for twice. The cases in
+tests/fixtures/receipt_overlap.json are receipts split the way people photograph them.
+"""
+
+import json
+import random
+import time
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+
+from core.services.ocr import OcrItem, OcrResult, OcrService
+from core.services.receipt_merge import find_overlap, names_match, normalize_name, stitch
+
+_CASES = json.loads(
+    (Path(__file__).parent / "fixtures" / "receipt_overlap.json").read_text(encoding="utf-8")
+)
+
+
+def _items(rows: list) -> list[OcrItem]:
+    return [OcrItem(name=n, price=Decimal(str(p)), quantity=q) for n, p, q in rows]
+
+
+def _result(photo: dict) -> OcrResult:
+    items = _items(photo["items"])
+    total = Decimal(str(photo["total"]))
+    return OcrResult(
+        items=items,
+        total=total,
+        currency="RUB",
+        total_mismatch=sum(i.price for i in items) != total,
+    )
+
+
+@pytest.mark.parametrize("case", _CASES, ids=[c["name"] for c in _CASES])
+def test_stitch_recovers_receipt(case):
+    merged, _joined = stitch([_items(photo["items"]) for photo in case["photos"]])
+
+    assert [(i.name, i.price, i.quantity) for i in merged] == [
+        (n, Decimal(str(p)), q) for n, p, q in case["expected"]
+    ]
+
+
+@pytest.mark.parametrize("case", _CASES, ids=[c["name"] for c in _CASES])
+def test_merged_total(case):
+    result = OcrService._merge_results([_result(photo) for photo in case["photos"]])
+
+    assert result.total == Decimal(str(case["expected_total"]))
+    assert sum(i.price for i in result.items) == result.total
+    assert not result.total_mismatch
+
+
+def test_overlapping_photos_are_not_summed():
+    """The overlap, spelled identically on both photos, used to be counted twice."""
+    first = _result({"items": [["Суп", 300, 1], ["Чай", 100, 1], ["Торт", 250, 1]], "total": 650})
+    second = _result({"items": [["Чай", 100, 1], ["Торт", 250, 1], ["Вода", 90, 1]], "total": 740})
+
+    result = OcrService._merge_results([first, second])
+
+    assert [(i.name, i.price) for i in result.items] == [
+        ("Суп", Decimal(300)),
+        ("Чай", Decimal(100)),
+        ("Торт", Decimal(250)),
+        ("Вода", Decimal(90)),
+    ]
+    assert result.total == Decimal(740)
+
+
+def test_names_match_tolerates_ocr_noise():
+    assert names_match(normalize_name("Пицца Маргарита"), normalize_name("Пица Маргарита"))
+    assert names_match(normalize_name("Чай чёрный"), normalize_name("чай черный (?)"))
+    assert not names_match(normalize_name("Капучино"), normalize_name("Какао"))
+
+
+def test_single_shared_line_is_not_an_overlap():
+    before = _items([["Бургер", 550, 1], ["Пиво", 300, 1]])
+    after = _items([["Пиво", 300, 1], ["Крылья", 480, 1]])
+
+    assert find_overlap(before, after) is None
+
+
+def test_long_receipt_stitches_quickly():
+    """Two 120-line halves of a 200-line receipt, overlapping by 40 lines."""
+    rng = random.Random(7)
+    words = ["Салат", "Суп", "Стейк", "Паста", "Пиво", "Вино", "Чай", "Десерт", "Соус", "Хлеб"]
+    receipt = _items(
+        [
+            [f"{rng.choice(words)} {rng.choice(words)} №{n}", rng.randrange(50, 3000), 1]
+            for n in range(200)
+        ]
+    )
+    first, second = receipt[:120], receipt[80:]
+
+    started = time.perf_counter()
+    merged, joined = stitch([first, second])
+    elapsed = time.perf_counter() - started
+
+    assert joined == [True]
+    assert merged == receipt
+    assert elapsed < 0.5
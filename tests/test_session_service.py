@@ -1,5 +1,7 @@
 import pytest
+from sqlalchemy import select
 
+from core.models.session import Session
 from core.services.session import SessionService
 
 
@@ -135,3 +137,33 @@ async def test_set_vote_overflow(svc, db_session):
     # User B takes 1 — ok
     qty, overflow = await svc.set_vote(item_id, user_tg_id=333, quantity=1, max_qty=2)
     assert qty == 1 and not overflow
+
+
+async def _counts(db_session, session_id) -> tuple[int, int]:
+    row = (
+        await db_session.execute(
+            select(Session.member_count, Session.item_count).where(Session.id == session_id)
+        )
+    ).one()
+    return tuple(row)
+
+
+async def test_member_and_item_counts_follow_every_change(svc, db_session):
+    """sessions.member_count/item_count replace counting children in the session list."""
+    session = await svc.create_session(admin_tg_id=111, admin_display_name="Admin")
+    assert await _counts(db_session, session.id) == (1, 0)
+
+    await svc.join_session(session.invite_code, user_tg_id=222, display_name="Bob")
+    await svc.join_session(session.invite_code, user_tg_id=222, display_name="Bob")
+    items = await svc.save_ocr_items(
+        session.id, [{"name": f"Dish {i}", "price": 100, "quantity": 1} for i in range(5)]
+    )
+    assert await _counts(db_session, session.id) == (2, 5)
+
+    await svc.delete_item(items[0].id)
+    await svc.cycle_vote(items[1].id, 222, 1)
+    await svc.delete_unvoted_items(session.id)
+    assert await _counts(db_session, session.id) == (2, 1)
+
+    await svc.clear_items(session.id)
+    assert await _counts(db_session, session.id) == (2, 0)
@@ -8,6 +8,11 @@
 #   clear-all [USER_TG_ID]     — удалить ВСЕ сессии (все или конкретного админа)
 #   show-quotas                — показать текущие квоты
 #   show-sessions              — показать список сессий
+#   show-pending               — сколько помеченных сессий ждёт удаления
+#
+# clear-* не удаляют сами: они помечают сессии (deleted_at), а удаляет их пачками
+# фоновая задача API (api/services/session_purger.py). Один DELETE на тысячи сессий
+# держал блокировки на всём каскаде и мешал живым запросам.
 
 set -euo pipefail
 
@@ -32,24 +37,24 @@ case "${1:-help}" in
 
   clear-history)
     if [ -n "${2:-}" ]; then
-      echo "Удаление settled-сессий для admin_tg_id=$2..."
-      run_sql "DELETE FROM sessions WHERE status = 'settled' AND admin_tg_id = $2;"
+      echo "Пометка на удаление settled-сессий для admin_tg_id=$2..."
+      run_sql "UPDATE sessions SET deleted_at = now() WHERE status = 'settled' AND admin_tg_id = $2 AND deleted_at IS NULL;"
     else
-      echo "Удаление ВСЕХ settled-сессий..."
-      run_sql "DELETE FROM sessions WHERE status = 'settled';"
+      echo "Пометка на удаление ВСЕХ settled-сессий..."
+      run_sql "UPDATE sessions SET deleted_at = now() WHERE status = 'settled' AND deleted_at IS NULL;"
     fi
-    echo "Готово."
+    echo "Готово. Сессии удалит фоновая задача API; прогресс: $0 show-pending."
     ;;
 
   clear-all)
     if [ -n "${2:-}" ]; then
-      echo "Удаление ВСЕХ сессий для admin_tg_id=$2..."
-      run_sql "DELETE FROM sessions WHERE admin_tg_id = $2;"
+      echo "Пометка на удаление ВСЕХ сессий для admin_tg_id=$2..."
+      run_sql "UPDATE sessions SET deleted_at = now() WHERE admin_tg_id = $2 AND deleted_at IS NULL;"
     else
-      echo "Удаление ВСЕХ сессий..."
-      run_sql "DELETE FROM sessions;"
+      echo "Пометка на удаление ВСЕХ сессий..."
+      run_sql "UPDATE sessions SET deleted_at = now() WHERE deleted_at IS NULL;"
     fi
-    echo "Готово."
+    echo "Готово. Сессии удалит фоновая задача API; прогресс: $0 show-pending."
     ;;
 
   show-quotas)
@@ -57,7 +62,11 @@ case "${1:-help}" in
     ;;
 
   show-sessions)
-    run_sql "SELECT id, admin_tg_id, invite_code, status, created_at FROM sessions ORDER BY created_at DESC LIMIT 20;"
+    run_sql "SELECT id, admin_tg_id, invite_code, status, created_at FROM sessions WHERE deleted_at IS NULL ORDER BY created_at DESC LIMIT 20;"
+    ;;
+
+  show-pending)
+    run_sql "SELECT count(*) AS pending, min(deleted_at) AS oldest FROM sessions WHERE deleted_at IS NOT NULL;"
     ;;
 
   *)
@@ -69,6 +78,7 @@ case "${1:-help}" in
     echo "  clear-all [ID]      Удалить ВСЕ сессии"
     echo "  show-quotas         Показать квоты пользователей"
     echo "  show-sessions       Показать последние сессии"
+    echo "  show-pending        Сколько сессий ждёт фонового удаления"
     echo ""
     echo "ID — Telegram user ID (необязательно, без него — для всех)"
     echo ""
@@ -8,7 +8,7 @@
 #   funnel [ДНЕЙ]   — воронка: сессия -> распознано -> проголосовали -> рассчитано
 #   retention       — возврат пользователей по месяцам
 #   money           — платежи, Stars, конверсия в платящих
-#   health          — размер БД, объём фото, самые тяжёлые таблицы
+#   health          — размер БД, хранилище фото, самые тяжёлые таблицы
 #   all             — всё сразу
 #
 # Активность считается по фактическим действиям, а не по открытию приложения:
@@ -18,6 +18,8 @@
 set -euo pipefail
 
 PSQL_CMD="${PSQL_CMD:-docker compose exec -T db psql -U user -d checksplitter}"
+# Размер каталога фото на диске (PHOTO_STORE=fs): du внутри контейнера api.
+PHOTO_DU_CMD="${PHOTO_DU_CMD:-docker compose exec -T api du -sh data/photos}"
 
 run_sql() {
   $PSQL_CMD -v ON_ERROR_STOP=1 -c "$1"
@@ -137,12 +139,25 @@ cmd_health() {
            pg_size_pretty(pg_total_relation_size(relid)) AS \"размер\"
     FROM pg_stat_user_tables ORDER BY pg_total_relation_size(relid) DESC;"
 
-  echo "== Фото чеков (должны обнуляться после распознавания) =="
+  echo "== Фото чеков (ссылки должны обнуляться после распознавания) =="
   run_sql "
     SELECT count(*) AS \"строк с фото\",
-           count(*) FILTER (WHERE data IS NOT NULL) AS \"с байтами\",
-           pg_size_pretty(coalesce(sum(octet_length(data)),0)) AS \"занято байтами\"
+           count(*) FILTER (WHERE blob_sha256 IS NOT NULL) AS \"ждут OCR\"
     FROM session_photos;"
+
+  echo "== Хранилище фото (photo_blobs) =="
+  # «Без ссылок» — кандидаты на ежечасную уборку; если их много и они не уходят,
+  # уборка не работает.
+  run_sql "
+    SELECT count(*) AS \"блобов\",
+           pg_size_pretty(coalesce(sum(size),0)) AS \"объём\",
+           count(*) FILTER (WHERE data IS NOT NULL) AS \"байты в БД\",
+           count(*) FILTER (WHERE NOT EXISTS (
+             SELECT 1 FROM session_photos p WHERE p.blob_sha256 = b.sha256)) AS \"без ссылок\"
+    FROM photo_blobs b;"
+
+  echo "== Каталог фото на диске =="
+  $PHOTO_DU_CMD 2>/dev/null || echo "недоступен (PHOTO_STORE=db или задайте PHOTO_DU_CMD)"
 }
 
 case "${1:-help}" in
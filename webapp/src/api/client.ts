@@ -4,6 +4,56 @@ export function setInitDataProvider(fn: () => string) {
   _getInitData = fn;
 }
 
+// Вместо initData (сотни байт URL-encoded JSON, заново проверяемых сервером на каждом
+// запросе) ходим с коротким подписанным токеном из POST /api/auth/token. Токен берётся
+// один раз и обновляется за минуту до истечения; если выдать его не вышло, запрос
+// уходит по-старому, с `tma <initData>`.
+const TOKEN_REFRESH_MARGIN_MS = 60_000;
+
+let _token: { value: string; expiresAt: number; initData: string } | null = null;
+let _pendingToken: Promise<string | null> | null = null;
+
+async function requestToken(initData: string): Promise<string | null> {
+  try {
+    const res = await fetch("/api/auth/token", {
+      method: "POST",
+      headers: { Authorization: `tma ${initData}` },
+    });
+    if (!res.ok) return null;
+    const { token, expires_in } = (await res.json()) as {
+      token: string;
+      expires_in: number;
+    };
+    _token = { value: token, expiresAt: Date.now() + expires_in * 1000, initData };
+    return token;
+  } catch {
+    return null;
+  }
+}
+
+/** Токен для `Authorization: Bearer` и `?token=` WebSocket; null — только initData. */
+export async function getAuthToken(): Promise<string | null> {
+  const initData = _getInitData?.() ?? "";
+  if (!initData) return null;
+  if (
+    _token &&
+    _token.initData === initData &&
+    _token.expiresAt - TOKEN_REFRESH_MARGIN_MS > Date.now()
+  ) {
+    return _token.value;
+  }
+  // Параллельные запросы при старте страницы ждут один и тот же обмен.
+  _pendingToken ??= requestToken(initData).finally(() => {
+    _pendingToken = null;
+  });
+  return _pendingToken;
+}
+
+async function authorization(): Promise<string> {
+  const token = await getAuthToken();
+  return token ? `Bearer ${token}` : `tma ${_getInitData?.() ?? ""}`;
+}
+
 export class ApiError extends Error {
   constructor(
     public status: number,
@@ -17,12 +67,11 @@ export async function fetchApi<T>(
   url: string,
   options?: RequestInit,
 ): Promise<T> {
-  const initData = _getInitData?.() ?? "";
   const res = await fetch(url, {
     ...options,
     headers: {
       "Content-Type": "application/json",
-      Authorization: `tma ${initData}`,
+      Authorization: await authorization(),
       ...options?.headers,
     },
   });
@@ -33,15 +82,28 @@ export async function fetchApi<T>(
   return res.json();
 }
 
+/** Страница списка и курсор следующей из `X-Next-Cursor`; null — страница последняя. */
+export async function fetchApiPage<T>(
+  url: string,
+): Promise<{ items: T[]; nextCursor: string | null }> {
+  const res = await fetch(url, {
+    headers: { Authorization: await authorization() },
+  });
+  if (!res.ok) {
+    const data = await res.json().catch(() => null);
+    throw new ApiError(res.status, data);
+  }
+  return { items: await res.json(), nextCursor: res.headers.get("X-Next-Cursor") };
+}
+
 export async function fetchApiNoBody(
   url: string,
   options?: RequestInit,
 ): Promise<void> {
-  const initData = _getInitData?.() ?? "";
   const res = await fetch(url, {
     ...options,
     headers: {
-      Authorization: `tma ${initData}`,
+      Authorization: await authorization(),
       ...options?.headers,
     },
   });
@@ -1,5 +1,10 @@
-import { useMutation, useQuery, useQueryClient } from "@tanstack/react-query";
-import { fetchApi, fetchApiNoBody } from "./client";
+import {
+  useInfiniteQuery,
+  useMutation,
+  useQuery,
+  useQueryClient,
+} from "@tanstack/react-query";
+import { ApiError, fetchApi, fetchApiNoBody, fetchApiPage } from "./client";
 import type {
   Session,
   SessionBrief,
@@ -7,6 +12,7 @@ import type {
   Quota,
   Item,
   Member,
+  OcrJob,
   OcrResult,
   VoteResult,
 } from "./types";
@@ -22,10 +28,30 @@ export function useSession(inviteCode: string) {
   });
 }
 
+// Активных сессий у человека единицы — они приходят одним запросом. История растёт
+// без предела и листается страницами по курсору (keyset по created_at, id).
+const HISTORY_PAGE_SIZE = 20;
+
 export function useMySessions() {
   return useQuery({
-    queryKey: ["sessions", "my"],
-    queryFn: () => fetchApi<SessionBrief[]>("/api/sessions/my"),
+    queryKey: ["sessions", "my", "active"],
+    queryFn: () =>
+      fetchApi<SessionBrief[]>(
+        "/api/sessions/my?status=created&status=voting&status=closed&limit=100",
+      ),
+  });
+}
+
+export function useSessionHistory() {
+  return useInfiniteQuery({
+    queryKey: ["sessions", "my", "history"],
+    queryFn: ({ pageParam }) =>
+      fetchApiPage<SessionBrief>(
+        `/api/sessions/my?status=settled&limit=${HISTORY_PAGE_SIZE}` +
+          (pageParam ? `&cursor=${encodeURIComponent(pageParam)}` : ""),
+      ),
+    initialPageParam: null as string | null,
+    getNextPageParam: (lastPage) => lastPage.nextCursor,
   });
 }
 
@@ -144,13 +170,38 @@ export function useUploadPhotos(sessionId: string) {
   });
 }
 
+const OCR_POLL_INTERVAL_MS = 1500;
+// Above the worker's 240 s deadline: by then the job has failed server-side and says so.
+const OCR_POLL_LIMIT_MS = 5 * 60 * 1000;
+
+/**
+ * Wait for a queued OCR job to finish. A failed job is rethrown as the ApiError the
+ * synchronous endpoint used to answer with, so callers keep mapping statuses as before.
+ */
+async function waitForOcrJob(sessionId: string, job: OcrJob): Promise<OcrResult> {
+  const deadline = Date.now() + OCR_POLL_LIMIT_MS;
+  while (job.status === "queued" || job.status === "running") {
+    if (Date.now() > deadline) {
+      throw new ApiError(504, { detail: "Recognition took too long. Try fewer photos." });
+    }
+    await new Promise((resolve) => setTimeout(resolve, OCR_POLL_INTERVAL_MS));
+    job = await fetchApi<OcrJob>(`/api/sessions/${sessionId}/ocr/jobs/${job.id}`);
+  }
+  if (job.status === "failed" || !job.result) {
+    throw new ApiError(job.error_status ?? 500, { detail: job.error });
+  }
+  return job.result;
+}
+
 export function useTriggerOcr(sessionId: string) {
   const qc = useQueryClient();
   return useMutation({
-    mutationFn: () =>
-      fetchApi<OcrResult>(`/api/sessions/${sessionId}/ocr`, {
+    mutationFn: async () => {
+      const job = await fetchApi<OcrJob>(`/api/sessions/${sessionId}/ocr`, {
         method: "POST",
-      }),
+      });
+      return waitForOcrJob(sessionId, job);
+    },
     onSuccess: () =>
       qc.invalidateQueries({ queryKey: ["session"] }),
   });
@@ -219,6 +270,17 @@ export function useRemind(sessionId: string) {
   });
 }
 
+/** One reminder to every member who has not confirmed yet, in a single request. */
+export function useRemindAll(sessionId: string) {
+  return useMutation({
+    mutationFn: () =>
+      fetchApi<{ members: number; queued: number }>(
+        `/api/sessions/${sessionId}/remind`,
+        { method: "POST" },
+      ),
+  });
+}
+
 /**
  * Buy a pack of scans with Telegram Stars.
  *
@@ -64,6 +64,19 @@ export interface OcrResult {
   total_mismatch: boolean;
 }
 
+/** A queued recognition — POST /ocr answers with this and the worker fills it in. */
+export interface OcrJob {
+  id: string;
+  status: "queued" | "running" | "done" | "failed";
+  progress_current: number;
+  progress_total: number;
+  result: OcrResult | null;
+  error_status: number | null;
+  error: string | null;
+  created_at: string;
+  finished_at: string | null;
+}
+
 export interface Share {
   user_tg_id: number;
   display_name: string;
@@ -1,5 +1,6 @@
 import { useEffect, useRef, useState, useCallback } from "react";
 import { useQueryClient } from "@tanstack/react-query";
+import { getAuthToken } from "../api/client";
 import { useRawInitData } from "./useTelegram";
 
 type WsEventType =
@@ -10,7 +11,9 @@ type WsEventType =
   | "tip_changed"
   | "session_status"
   | "items_updated"
-  | "ocr_progress";
+  | "ocr_progress"
+  | "ocr_done"
+  | "ocr_failed";
 
 interface WsEvent {
   type: WsEventType;
@@ -26,12 +29,18 @@ export function useWebSocket(sessionId: string | null) {
   const [isConnected, setIsConnected] = useState(false);
   const [lastEvent, setLastEvent] = useState<WsEvent | null>(null);
 
-  const connect = useCallback(() => {
+  const unmounted = useRef(false);
+
+  const connect = useCallback(async () => {
     if (!sessionId || !initData) return;
 
+    // Короткий токен вместо initData в URL; сервер принимает и то и другое.
+    const token = (await getAuthToken()) ?? initData;
+    if (unmounted.current) return;
+
     const protocol =
       window.location.protocol === "https:" ? "wss:" : "ws:";
-    const wsUrl = `${protocol}//${window.location.host}/ws/${sessionId}?token=${encodeURIComponent(initData)}`;
+    const wsUrl = `${protocol}//${window.location.host}/ws/${sessionId}?token=${encodeURIComponent(token)}`;
 
     const ws = new WebSocket(wsUrl);
     wsRef.current = ws;
@@ -74,7 +83,7 @@ export function useWebSocket(sessionId: string | null) {
           reconnectDelay.current * 2,
           30000,
         );
-        connect();
+        void connect();
       }, reconnectDelay.current);
     };
 
@@ -84,8 +93,10 @@ export function useWebSocket(sessionId: string | null) {
   }, [sessionId, initData, queryClient]);
 
   useEffect(() => {
-    connect();
+    unmounted.current = false;
+    void connect();
     return () => {
+      unmounted.current = true;
       clearTimeout(reconnectTimeout.current);
       wsRef.current?.close();
     };
@@ -1,5 +1,11 @@
 import { useNavigate } from "react-router-dom";
-import { useMySessions, useCreateSession, useClearHistory, useQuota } from "@/api/queries";
+import {
+  useMySessions,
+  useSessionHistory,
+  useCreateSession,
+  useClearHistory,
+  useQuota,
+} from "@/api/queries";
 import { Header, Card, SectionLabel, Separator } from "@/components/ui";
 import SessionCard from "@/components/SessionCard";
 
@@ -12,7 +18,8 @@ const STATUS_ROUTE: Record<string, string> = {
 
 export default function HomePage() {
   const navigate = useNavigate();
-  const { data: sessions, isLoading } = useMySessions();
+  const { data: activeSessions, isLoading: activeLoading } = useMySessions();
+  const historyQuery = useSessionHistory();
   const { data: quota } = useQuota();
   const createSession = useCreateSession();
   const clearHistory = useClearHistory();
@@ -31,10 +38,10 @@ export default function HomePage() {
     navigate(`/session/${inviteCode}/${route}`);
   };
 
-  const active = sessions?.filter((s) => s.status !== "settled")
-    .sort((a, b) => new Date(b.created_at).getTime() - new Date(a.created_at).getTime()) ?? [];
-  const history = sessions?.filter((s) => s.status === "settled")
-    .sort((a, b) => new Date(b.created_at).getTime() - new Date(a.created_at).getTime()) ?? [];
+  // Обе выборки сервер уже отдаёт от новых к старым.
+  const active = activeSessions ?? [];
+  const history = historyQuery.data?.pages.flatMap((page) => page.items) ?? [];
+  const isLoading = activeLoading || historyQuery.isLoading;
 
   return (
     <div className="flex min-h-screen flex-col bg-tg-secondary-bg">
@@ -43,7 +50,7 @@ export default function HomePage() {
       <div className="flex-1 flex flex-col gap-4 p-4">
         {isLoading ? (
           <LoadingSkeleton />
-        ) : sessions && sessions.length > 0 ? (
+        ) : active.length > 0 || history.length > 0 ? (
           <>
             {active.length > 0 && (
               <>
@@ -86,6 +93,16 @@ export default function HomePage() {
                     </div>
                   ))}
                 </Card>
+                {historyQuery.hasNextPage && (
+                  <button
+                    type="button"
+                    onClick={() => historyQuery.fetchNextPage()}
+                    disabled={historyQuery.isFetchingNextPage}
+                    className="text-sm text-tg-link font-medium py-2 active:opacity-70 disabled:opacity-50"
+                  >
+                    {historyQuery.isFetchingNextPage ? "Loading..." : "Show more"}
+                  </button>
+                )}
               </>
             )}
           </>
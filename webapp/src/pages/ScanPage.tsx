@@ -33,6 +33,7 @@ function scanErrorMessage(err: unknown): string {
     case 422:
       return "Не удалось прочитать чек. Снимите его целиком при хорошем свете.";
     case 502:
+    case 503:
       return "Сервис распознавания недоступен. Скан не списан — попробуйте позже.";
     case 504:
       return "Распознавание заняло слишком долго. Скан не списан — попробуйте меньше фото.";
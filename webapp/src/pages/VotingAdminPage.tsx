@@ -1,6 +1,6 @@
 import { useCallback, useState } from "react";
 import { useParams, useNavigate } from "react-router-dom";
-import { useSession, useFinishVoting, useRemind } from "@/api/queries";
+import { useSession, useFinishVoting, useRemind, useRemindAll } from "@/api/queries";
 import { useWebSocket } from "@/hooks/useWebSocket";
 import { useTelegramUser, useHaptic } from "@/hooks/useTelegram";
 import { Header, Card, SectionLabel, Separator, Badge, Button, CtaBar } from "@/components/ui";
@@ -19,6 +19,7 @@ export default function VotingAdminPage() {
 
   const finishMutation = useFinishVoting(sessionId);
   const remindMutation = useRemind(sessionId);
+  const remindAllMutation = useRemindAll(sessionId);
 
   const currentUserId = user?.id ?? 0;
   const [remindedIds, setRemindedIds] = useState<Set<number>>(new Set());
@@ -34,6 +35,17 @@ export default function VotingAdminPage() {
     }
   }, [remindMutation, haptic]);
 
+  const handleRemindAll = useCallback(async (memberTgIds: number[]) => {
+    haptic.impactOccurred("light");
+    try {
+      await remindAllMutation.mutateAsync();
+      setRemindedIds((prev) => new Set([...prev, ...memberTgIds]));
+      haptic.notificationOccurred("success");
+    } catch {
+      haptic.notificationOccurred("error");
+    }
+  }, [remindAllMutation, haptic]);
+
   const handleEndVoting = useCallback(async () => {
     if (!sessionId) return;
     haptic.impactOccurred("medium");
@@ -68,6 +80,7 @@ export default function VotingAdminPage() {
     items.some((it) => it.votes.some((v) => v.user_tg_id === m.user_tg_id && v.quantity > 0)),
   );
   const votedCount = votedMembers.length;
+  const unconfirmed = members.filter((m) => !m.confirmed && m.user_tg_id !== currentUserId);
 
   return (
     <div className="flex min-h-screen flex-col bg-tg-secondary-bg">
@@ -116,6 +129,24 @@ export default function VotingAdminPage() {
 
         {/* Actions */}
         <SectionLabel>Actions</SectionLabel>
+        {/* Сервер напоминает всем, кто не подтвердил выбор, — одним запросом вместо
+            POST /remind/{id} на каждого. */}
+        {unconfirmed.length > 1 && (
+          <Card
+            className="p-4 flex items-center gap-3 cursor-pointer active:opacity-70"
+            onClick={() => handleRemindAll(unconfirmed.map((m) => m.user_tg_id))}
+          >
+            <svg width="20" height="20" viewBox="0 0 24 24" fill="none" stroke="currentColor" strokeWidth="2" strokeLinecap="round" strokeLinejoin="round" className="text-tg-hint shrink-0">
+              <path d="M18 8A6 6 0 006 8c0 7-3 9-3 9h18s-3-2-3-9" />
+              <path d="M13.73 21a2 2 0 01-3.46 0" />
+            </svg>
+            <span className="text-[15px] text-tg-text">
+              {remindAllMutation.isSuccess
+                ? `Reminders sent to ${unconfirmed.length} participants`
+                : `Remind everyone who has not confirmed (${unconfirmed.length})`}
+            </span>
+          </Card>
+        )}
         {members.filter((m) => !items.some((it) => it.votes.some((v) => v.user_tg_id === m.user_tg_id && v.quantity > 0))).map((m) => (
           <Card
             key={m.id}